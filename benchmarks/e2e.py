@@ -0,0 +1,293 @@
+"""
+End-to-end benchmark against the local Discogs and Last.fm stand-ins in benchmarks/fakes.py.
+
+Three scenarios, each on a fresh config dir with the response cache off (`--cache` turns it on):
+
+  album   albums one after another in-process: search, fetch the tracklist, scrobble
+  batch   `scrobble batch`'s path: resolve every album concurrently, submit through the outbox
+  cli     `scrobble album <query> --pick 1 -y` in a fresh interpreter per album
+
+It reports latency percentiles per phase, requests and error answers per album, and throughput.
+Profiles set the fakes' latency, jitter, error and 429 rates and Discogs' per-minute limit; the
+individual flags override them.
+
+  python benchmarks/e2e.py
+  python benchmarks/e2e.py --profile flaky --albums 40 --json bench_output.txt
+  python benchmarks/e2e.py --compare bench_output.txt --tolerance 0.25   # exit 1 on regression
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fakes  # noqa: E402
+
+
+PROFILES: dict[str, tuple[fakes.Profile, fakes.Profile]] = {
+  "local": (fakes.Profile(), fakes.Profile()),
+  "realistic": (fakes.Profile(latency_ms=120, jitter_ms=40), fakes.Profile(latency_ms=200, jitter_ms=60)),
+  "flaky": (
+    fakes.Profile(latency_ms=120, jitter_ms=40, error_rate=0.03, throttle_rate=0.02),
+    fakes.Profile(latency_ms=200, jitter_ms=60, error_rate=0.03, throttle_rate=0.02),
+  ),
+  "throttled": (fakes.Profile(latency_ms=120, jitter_ms=40, per_minute=60), fakes.Profile(latency_ms=200, jitter_ms=60)),
+}
+
+SCENARIOS = ("album", "batch", "cli")
+
+# Wall-clock metrics compared by --compare, per scenario.
+COMPARED = ("album_p50_ms", "album_p90_ms")
+
+
+def percentiles(samples: list[float]) -> dict:
+  if not samples:
+    return {"n": 0}
+  s = sorted(samples)
+
+  def at(q: float) -> float:
+    return s[min(len(s) - 1, max(0, round(q * len(s) + 0.5) - 1))]
+
+  return {"n": len(s), "p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99), "max_ms": s[-1]}
+
+
+def _traffic(server: fakes._Server, albums: int) -> dict:
+  st = server.stats
+  total = sum(st.requests.values())
+  return {
+    "requests": total,
+    "per_album": total / albums if albums else 0.0,
+    "errors_429": st.statuses.get(429, 0),
+    "errors_5xx": sum(n for code, n in st.statuses.items() if code >= 500),
+  }
+
+
+def _client_env(fk: fakes.Fakes, discogs: fakes.Profile, *, cache: bool) -> dict[str, str]:
+  return {
+    **fk.env,
+    "SCROBBLE_CACHE": "1" if cache else "0",
+    "SCROBBLE_DAEMON": "0",
+    "SCROBBLE_HEADLESS": "1",
+    "DISCOGS_OFFLINE_INDEX": "0",
+    "DISCOGS_COLLECTION": "0",
+    # The client bucket matches the server's limit, as it would against the real API.
+    "DISCOGS_REQUESTS_PER_MINUTE": str(discogs.per_minute or 1_000_000),
+  }
+
+
+def run_album(fk: fakes.Fakes, albums: list[fakes.Album]) -> dict:
+  from scrobble_cli import discogs, lastfm
+  from scrobble_cli.config import load_config
+  from scrobble_cli.plan import build_scrobbles, planning_durations
+  from scrobble_cli.timestamps import plan_from_end
+
+  cfg = load_config()
+  phases: dict[str, list[float]] = {"search": [], "fetch": [], "scrobble": [], "album": []}
+  tracks = failed = 0
+  started = time.perf_counter()
+  for a in albums:
+    t0 = time.perf_counter()
+    try:
+      results = discogs.search_query(cfg, query=a.query, vinyl_only=False, limit=10)
+      t1 = time.perf_counter()
+      release = discogs.fetch_release(cfg, kind=results[0].kind, id=results[0].id)
+      t2 = time.perf_counter()
+      scrobbles = build_scrobbles(release, plan_from_end(int(time.time()), planning_durations(release)))
+      lastfm.scrobble_album(cfg, scrobbles)
+      t3 = time.perf_counter()
+    except Exception:
+      failed += 1
+      continue
+    tracks += len(scrobbles)
+    phases["search"].append((t1 - t0) * 1000.0)
+    phases["fetch"].append((t2 - t1) * 1000.0)
+    phases["scrobble"].append((t3 - t2) * 1000.0)
+    phases["album"].append((t3 - t0) * 1000.0)
+  wall = time.perf_counter() - started
+  return {
+    "phases": {k: percentiles(v) for k, v in phases.items()},
+    "albums": len(albums),
+    "failed": failed,
+    "tracks": tracks,
+    "seconds": wall,
+    "albums_per_second": (len(albums) - failed) / wall,
+  }
+
+
+def run_batch(fk: fakes.Fakes, albums: list[fakes.Album], workers: int) -> dict:
+  from scrobble_cli.batch import BatchItem, plan_items, resolve_items
+  from scrobble_cli.config import load_config
+  from scrobble_cli.outbox import get_outbox
+
+  cfg = load_config()
+  items = [BatchItem(line_no=i, query=a.query, pick=1, started_at=None) for i, a in enumerate(albums, start=1)]
+  started = time.perf_counter()
+  resolved = resolve_items(cfg, items, vinyl_only=False, limit=10, workers=workers)
+  resolve_s = time.perf_counter() - started
+  planned = plan_items([r for r in resolved if r.error is None], start_unix=None, now_unix=int(time.time()))
+  outbox = get_outbox()
+  t0 = time.perf_counter()
+  ids = [i for p in planned for i in outbox.enqueue(p.scrobbles)]
+  result = outbox.flush(cfg, ids=ids)
+  submit_s = time.perf_counter() - t0
+  wall = time.perf_counter() - started
+  return {
+    "phases": {"resolve": percentiles([resolve_s * 1000.0]), "submit": percentiles([submit_s * 1000.0])},
+    "albums": len(albums),
+    "failed": len(albums) - len(planned) + (1 if result.errors else 0),
+    "tracks": result.accepted,
+    "seconds": wall,
+    "albums_per_second": len(planned) / wall,
+  }
+
+
+def run_cli(fk: fakes.Fakes, albums: list[fakes.Album], env: dict[str, str]) -> dict:
+  driver = "import sys; from scrobble_cli.main import app; sys.argv[0] = 'scrobble'; app()"
+  walls: list[float] = []
+  failed = 0
+  started = time.perf_counter()
+  for a in albums:
+    t0 = time.perf_counter()
+    p = subprocess.run(
+      [sys.executable, "-c", driver, "album", *a.query.split(), "--any-format", "--pick", "1", "-y", "--allow-duplicates"],
+      env=env,
+      capture_output=True,
+      text=True,
+    )
+    walls.append((time.perf_counter() - t0) * 1000.0)
+    failed += p.returncode != 0
+  wall = time.perf_counter() - started
+  return {
+    "phases": {"album": percentiles(walls)},
+    "albums": len(albums),
+    "failed": failed,
+    "tracks": fk.lastfm.stats.tracks_scrobbled,
+    "seconds": wall,
+    "albums_per_second": (len(albums) - failed) / wall,
+  }
+
+
+def _pick(catalogue: list[fakes.Album], n: int, offset: int) -> list[fakes.Album]:
+  """`n` albums with unique queries, box sets and multi-disc masters included."""
+  seen: set[str] = set()
+  out = []
+  for a in catalogue[offset:] + catalogue[:offset]:
+    if a.query not in seen:
+      seen.add(a.query)
+      out.append(a)
+    if len(out) == n:
+      break
+  return out
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+  parser.add_argument("--latency", type=float, help="Mean response latency in ms (both fakes)")
+  parser.add_argument("--jitter", type=float, help="Uniform +/- jitter in ms (both fakes)")
+  parser.add_argument("--error-rate", type=float, help="Share of requests answered with 503 (both fakes)")
+  parser.add_argument("--throttle-rate", type=float, help="Share of requests answered with 429 (both fakes)")
+  parser.add_argument("--per-minute", type=int, help="Discogs requests allowed per minute (0 = unlimited)")
+  parser.add_argument("--albums", type=int, default=20, help="Albums per scenario")
+  parser.add_argument("--cli-albums", type=int, default=5, help="Albums for the (slower) cli scenario")
+  parser.add_argument("--workers", type=int, default=4, help="Concurrent lookups in the batch scenario")
+  parser.add_argument("--cache", action="store_true", help="Leave the Discogs response cache on")
+  parser.add_argument("--only", action="append", choices=SCENARIOS, help="Run only these scenarios")
+  parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+  parser.add_argument("--compare", help="Baseline JSON from a previous --json run")
+  parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+  ns = parser.parse_args()
+
+  overrides = {
+    k: v
+    for k, v in (("latency_ms", ns.latency), ("jitter_ms", ns.jitter), ("error_rate", ns.error_rate), ("throttle_rate", ns.throttle_rate))
+    if v is not None
+  }
+  discogs_profile, lastfm_profile = (replace(p, **overrides) for p in PROFILES[ns.profile])
+  if ns.per_minute is not None:
+    discogs_profile = replace(discogs_profile, per_minute=ns.per_minute)
+
+  fk = fakes.start(discogs_profile, lastfm_profile)
+  results: dict[str, dict] = {}
+  try:
+    for i, name in enumerate(ns.only or SCENARIOS):
+      fk.reset()
+      albums = _pick(fk.albums, ns.cli_albums if name == "cli" else ns.albums, offset=i * 100)
+      with tempfile.TemporaryDirectory() as config_home:
+        env = {**_client_env(fk, discogs_profile, cache=ns.cache), "XDG_CONFIG_HOME": config_home}
+        saved = {k: os.environ.get(k) for k in env}
+        os.environ.update(env)
+        try:
+          if name == "album":
+            r = run_album(fk, albums)
+          elif name == "batch":
+            r = run_batch(fk, albums, ns.workers)
+          else:
+            r = run_cli(fk, albums, {**os.environ})
+        finally:
+          for k, v in saved.items():
+            if v is None:
+              os.environ.pop(k, None)
+            else:
+              os.environ[k] = v
+          from scrobble_cli import history, outbox
+
+          outbox._outbox = None
+          history._history = None
+      r["discogs"] = _traffic(fk.discogs, len(albums))
+      r["lastfm"] = _traffic(fk.lastfm, len(albums))
+      r["box_sets"] = sum(a.shape == "box-set" for a in albums)
+      r["multi_disc"] = sum(a.shape == "multi-disc" for a in albums)
+      per_album = r["phases"].get("album") or {}
+      r["album_p50_ms"] = per_album.get("p50_ms")
+      r["album_p90_ms"] = per_album.get("p90_ms")
+      results[name] = r
+  finally:
+    fk.close()
+
+  print(f"profile {ns.profile}: discogs {discogs_profile}, lastfm {lastfm_profile}")
+  for name, r in results.items():
+    print(
+      f"\n{name}: {r['albums']} albums ({r['multi_disc']} multi-disc, {r['box_sets']} box sets), {r['tracks']} tracks, "
+      f"{r['failed']} failed, {r['seconds']:.2f}s, {r['albums_per_second']:.2f} albums/s"
+    )
+    print(f"  {'phase':<10} {'n':>4} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for phase, p in r["phases"].items():
+      if p["n"]:
+        print(f"  {phase:<10} {p['n']:>4} {p['p50_ms']:>9.1f} {p['p90_ms']:>9.1f} {p['p99_ms']:>9.1f} {p['max_ms']:>9.1f}")
+    for api in ("discogs", "lastfm"):
+      t = r[api]
+      print(f"  {api:<8} {t['requests']:>4} requests, {t['per_album']:.2f}/album, {t['errors_429']} 429s, {t['errors_5xx']} 5xx")
+
+  if ns.json_path:
+    with open(ns.json_path, "w", encoding="utf-8") as f:
+      json.dump({"profile": ns.profile, "scenarios": results}, f, indent=2)
+
+  if ns.compare:
+    with open(ns.compare, encoding="utf-8") as f:
+      baseline = json.load(f).get("scenarios", {})
+    regressions = []
+    for name, r in results.items():
+      base = baseline.get(name) or {}
+      for metric in COMPARED:
+        if base.get(metric) and r.get(metric) and r[metric] > base[metric] * (1 + ns.tolerance):
+          regressions.append(f"{name} {metric}: {base[metric]:.1f} -> {r[metric]:.1f} ms")
+      if base and r["discogs"]["per_album"] > base["discogs"]["per_album"] + 0.01:
+        regressions.append(f"{name} discogs requests/album: {base['discogs']['per_album']:.2f} -> {r['discogs']['per_album']:.2f}")
+    if regressions:
+      print("\nEnd-to-end regressions:\n  " + "\n  ".join(regressions))
+      return 1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Local stand-ins for the Discogs and Last.fm APIs, for benchmarks that must not touch the network.
+
+Both servers answer from a deterministic catalogue of albums: mostly single LPs, some multi-disc
+masters (with disc headings) and a few 100+ track box sets. A `Profile` adds latency, jitter,
+random 5xx errors, random 429s and a per-minute request limit, and every request is counted so
+callers can report requests per album.
+
+Point a real `scrobble` at them by hand:
+
+  python benchmarks/fakes.py --latency 80 --jitter 30 --per-minute 60
+  DISCOGS_API_URL=http://127.0.0.1:PORT LASTFM_API_URL=http://127.0.0.1:PORT/2.0/ scrobble album ...
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+WORDS = (
+  "blue", "night", "train", "moon", "river", "velvet", "echo", "summer", "glass", "garden", "silver", "fire",
+  "ocean", "paper", "golden", "shadow", "electric", "city", "winter", "dream", "stone", "wild", "sound", "light",
+  "black", "morning", "mountain", "heart", "desert", "radio", "signal", "harbor", "crystal", "thunder", "lonely",
+)
+NAMES = (
+  "Miles", "Nina", "Otis", "Aretha", "Wayne", "Alice", "Herbie", "Joni", "Curtis", "Etta", "Chet", "Dusty",
+  "Sonny", "Carole", "Bill", "Roberta", "Grant", "Sade", "Lee", "Minnie", "Ahmad", "Betty", "Pharoah", "Ella",
+)
+SURNAMES = (
+  "Davis", "Simone", "Redding", "Franklin", "Shorter", "Coltrane", "Hancock", "Mitchell", "Mayfield", "James",
+  "Baker", "Springfield", "Rollins", "King", "Evans", "Flack", "Green", "Adu", "Morgan", "Riperton", "Jamal",
+)
+
+
+@dataclass(frozen=True)
+class Album:
+  master_id: int
+  release_id: int
+  artist: str
+  title: str
+  year: int
+  shape: str  # "lp", "multi-disc" or "box-set"
+  tracklist: list[dict]
+
+  @property
+  def query(self) -> str:
+    return f"{self.artist} {self.title}".lower()
+
+  @property
+  def tracks(self) -> int:
+    return sum(1 for t in self.tracklist if t["type_"] == "track")
+
+
+def _duration(rng: random.Random) -> str:
+  if rng.random() < 0.08:
+    return ""  # Discogs often has no duration
+  seconds = rng.randint(95, 560)
+  return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def _tracklist(shape: str, rng: random.Random) -> list[dict]:
+  def track(position: str) -> dict:
+    title = " ".join(rng.sample(WORDS, rng.randint(1, 4))).title()
+    return {"type_": "track", "position": position, "title": title, "duration": _duration(rng)}
+
+  if shape == "lp":
+    per_side = rng.randint(4, 6)
+    return [track(f"{side}{n}") for side in "AB" for n in range(1, per_side + 1)]
+  if shape == "multi-disc":
+    out = []
+    for disc in range(1, rng.randint(2, 3) + 1):
+      out.append({"type_": "heading", "position": "", "title": f"Disc {disc}", "duration": ""})
+      out.extend(track(f"{disc}-{n}") for n in range(1, rng.randint(8, 14) + 1))
+    return out
+  out = []
+  for disc in range(1, rng.randint(8, 12) + 1):
+    out.append({"type_": "heading", "position": "", "title": f"CD{disc}", "duration": ""})
+    if rng.random() < 0.3:
+      # A suite listed as an index track with sub-tracks; only the sub-tracks are playable.
+      subs = [track(f"CD{disc}-1.{n}") for n in range(1, 4)]
+      out.append({"type_": "index", "position": "", "title": "Suite", "duration": "", "sub_tracks": subs})
+    out.extend(track(f"CD{disc}-{n}") for n in range(1, rng.randint(11, 16) + 1))
+  return out
+
+
+def catalogue(size: int = 500, *, seed: int = 7) -> list[Album]:
+  rng = random.Random(seed)
+  albums = []
+  for i in range(size):
+    roll = rng.random()
+    shape = "lp" if roll < 0.7 else ("multi-disc" if roll < 0.9 else "box-set")
+    title = " ".join(rng.sample(WORDS, rng.randint(1, 3))).title()
+    if shape == "box-set":
+      title = f"The Complete {title} Sessions"
+    albums.append(
+      Album(
+        master_id=10_000 + i,
+        release_id=2_000_000 + i,
+        artist=f"{rng.choice(NAMES)} {rng.choice(SURNAMES)}",
+        title=title,
+        year=rng.randint(1955, 2024),
+        shape=shape,
+        tracklist=_tracklist(shape, rng),
+      )
+    )
+  return albums
+
+
+@dataclass
+class Profile:
+  latency_ms: float = 0.0
+  jitter_ms: float = 0.0
+  error_rate: float = 0.0  # share of requests answered with a 503
+  throttle_rate: float = 0.0  # share of requests answered with a 429 regardless of the limit
+  per_minute: int = 0  # 0 = unlimited; over the limit a request gets 429 + Retry-After
+  retry_after: int = 1
+
+
+@dataclass
+class Stats:
+  requests: Counter = field(default_factory=Counter)  # by endpoint
+  statuses: Counter = field(default_factory=Counter)
+  tracks_scrobbled: int = 0
+
+  def snapshot(self) -> dict:
+    return {
+      "requests": dict(self.requests),
+      "statuses": {str(k): v for k, v in self.statuses.items()},
+      "tracks_scrobbled": self.tracks_scrobbled,
+    }
+
+
+class _Server(ThreadingHTTPServer):
+  daemon_threads = True
+  request_queue_size = 128
+
+  def __init__(self, handler: type, profile: Profile, albums: list[Album], seed: int):
+    super().__init__(("127.0.0.1", 0), handler)
+    self.profile = profile
+    self.albums = albums
+    self.masters = {a.master_id: a for a in albums}
+    self.releases = {a.release_id: a for a in albums}
+    self.stats = Stats()
+    self.lock = threading.Lock()
+    self.rng = random.Random(seed)
+    self.window: deque[float] = deque()
+
+  @property
+  def url(self) -> str:
+    return f"http://127.0.0.1:{self.server_address[1]}"
+
+  def admit(self, endpoint: str) -> int | None:
+    """Counts the request, sleeps for the simulated latency and returns an error status to send, if any."""
+    p = self.profile
+    with self.lock:
+      self.stats.requests[endpoint] += 1
+      now = time.monotonic()
+      while self.window and self.window[0] <= now - 60:
+        self.window.popleft()
+      over_limit = bool(p.per_minute) and len(self.window) >= p.per_minute
+      if not over_limit:
+        self.window.append(now)
+      roll = self.rng.random()
+      delay = max(0.0, p.latency_ms + self.rng.uniform(-p.jitter_ms, p.jitter_ms)) / 1000.0
+    time.sleep(delay)
+    if over_limit or roll < p.throttle_rate:
+      return 429
+    if roll < p.throttle_rate + p.error_rate:
+      return 503
+    return None
+
+  def reset(self) -> None:
+    with self.lock:
+      self.stats = Stats()
+      self.window.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+  server: _Server
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+  def log_message(self, *args) -> None:
+    pass
+
+  def send_json(self, status: int, body: dict, headers: dict[str, str] | None = None, *, counted_as: int | None = None) -> None:
+    raw = json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(raw)))
+    for k, v in (headers or {}).items():
+      self.send_header(k, v)
+    self.end_headers()
+    self.wfile.write(raw)
+    with self.server.lock:
+      self.server.stats.statuses[counted_as or status] += 1
+
+  def send_error_status(self, status: int) -> None:
+    headers = {"Retry-After": str(self.server.profile.retry_after)} if status == 429 else {}
+    self.send_json(status, {"message": "You are making requests too quickly." if status == 429 else "Unavailable"}, headers)
+
+
+class _DiscogsHandler(_Handler):
+  def do_GET(self) -> None:
+    u = urlparse(self.path)
+    q = {k: v[0] for k, v in parse_qs(u.query).items()}
+    parts = [p for p in u.path.split("/") if p]
+    endpoint = "search" if parts[:2] == ["database", "search"] else (parts[0] if parts else "")
+    status = self.server.admit(endpoint)
+    if status is not None:
+      return self.send_error_status(status)
+
+    p = self.server.profile
+    with self.server.lock:
+      used = len(self.server.window)
+    headers = {"ETag": f'"{hashlib.md5(self.path.encode()).hexdigest()}"'}
+    if p.per_minute:
+      headers.update({
+        "X-Discogs-Ratelimit": str(p.per_minute),
+        "X-Discogs-Ratelimit-Used": str(used),
+        "X-Discogs-Ratelimit-Remaining": str(max(0, p.per_minute - used)),
+      })
+
+    if endpoint == "search":
+      return self.send_json(200, self.search(q), headers)
+    if len(parts) == 2 and parts[0] in ("masters", "releases") and parts[1].isdigit():
+      index = self.server.masters if parts[0] == "masters" else self.server.releases
+      album = index.get(int(parts[1]))
+      if album is not None:
+        return self.send_json(200, self.release(album, master=parts[0] == "masters"), headers)
+    self.send_json(404, {"message": "The requested resource was not found."})
+
+  def search(self, q: dict[str, str]) -> dict:
+    words = set((q.get("q") or "").lower().split())
+    kind = q.get("type", "master")
+    per_page = int(q.get("per_page") or 50)
+    hits = [a for a in self.server.albums if words and words <= set(a.query.split())]
+    results = [
+      {
+        "id": a.master_id if kind == "master" else a.release_id,
+        "type": kind,
+        "title": f"{a.artist} - {a.title}",
+        "year": str(a.year),
+        "country": "US",
+        "format": ["Vinyl", "LP", "Album"] if a.shape == "lp" else (["Vinyl", "2xLP"] if a.shape == "multi-disc" else ["CD", "Box Set"]),
+        "label": ["Fake Records"],
+        "catno": f"FR-{a.release_id}",
+        "master_id": a.master_id,
+      }
+      for a in hits[:per_page]
+    ]
+    return {"pagination": {"page": 1, "pages": 1, "per_page": per_page, "items": len(hits)}, "results": results}
+
+  def release(self, a: Album, *, master: bool) -> dict:
+    body = {
+      "id": a.master_id if master else a.release_id,
+      "title": a.title,
+      "artists": [{"name": a.artist, "id": a.master_id + 500_000}],
+      "year": a.year,
+      "tracklist": a.tracklist,
+    }
+    if master:
+      body["main_release"] = a.release_id
+    return body
+
+
+class _LastFmHandler(_Handler):
+  def do_POST(self) -> None:
+    n = int(self.headers.get("Content-Length") or 0)
+    form = {k: v[0] for k, v in parse_qs(self.rfile.read(n).decode()).items()}
+    method = form.get("method", "")
+    status = self.server.admit(method)
+    if status == 429:
+      # Last.fm rate limits with error 29 in a 200 answer; count it as a 429.
+      return self.send_json(200, {"error": 29, "message": "Rate Limit Exceeded"}, counted_as=429)
+    if status is not None:
+      return self.send_error_status(status)
+    if method != "track.scrobble":
+      return self.send_json(200, {"error": 3, "message": "Invalid Method"})
+
+    stamps = sorted((k for k in form if k.startswith("timestamp[")), key=lambda k: int(k[10:-1]))
+    scrobbles = [
+      {
+        "artist": {"corrected": "0", "#text": form.get(f"artist[{k[10:-1]}]", "")},
+        "track": {"corrected": "0", "#text": form.get(f"track[{k[10:-1]}]", "")},
+        "album": {"corrected": "0", "#text": form.get(f"album[{k[10:-1]}]", "")},
+        "timestamp": form[k],
+        "ignoredMessage": {"code": "0", "#text": ""},
+      }
+      for k in stamps
+    ]
+    with self.server.lock:
+      self.server.stats.tracks_scrobbled += len(scrobbles)
+    self.send_json(
+      200,
+      {"scrobbles": {"@attr": {"accepted": len(scrobbles), "ignored": 0}, "scrobble": scrobbles}},
+    )
+
+
+@dataclass
+class Fakes:
+  discogs: _Server
+  lastfm: _Server
+  albums: list[Album]
+
+  @property
+  def env(self) -> dict[str, str]:
+    """Environment that points `scrobble` at these servers."""
+    return {
+      "DISCOGS_API_URL": self.discogs.url,
+      "LASTFM_API_URL": f"{self.lastfm.url}/2.0/",
+      "DISCOGS_TOKEN": "bench",
+      "LASTFM_API_KEY": "bench",
+      "LASTFM_API_SECRET": "bench",
+      "LASTFM_SESSION_KEY": "bench",
+      "LASTFM_USERNAME": "bench",
+    }
+
+  def reset(self) -> None:
+    self.discogs.reset()
+    self.lastfm.reset()
+
+  def close(self) -> None:
+    for s in (self.discogs, self.lastfm):
+      s.shutdown()
+      s.server_close()
+
+
+def start(
+  discogs: Profile | None = None,
+  lastfm: Profile | None = None,
+  *,
+  albums: int = 500,
+  seed: int = 7,
+) -> Fakes:
+  """Starts both servers on ephemeral ports (background threads) and returns them."""
+  cat = catalogue(albums, seed=seed)
+  servers = []
+  for handler, profile, offset in ((_DiscogsHandler, discogs, 1), (_LastFmHandler, lastfm, 2)):
+    s = _Server(handler, profile or Profile(), cat, seed + offset)
+    threading.Thread(target=s.serve_forever, daemon=True).start()
+    servers.append(s)
+  return Fakes(discogs=servers[0], lastfm=servers[1], albums=cat)
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--latency", type=float, default=0.0, help="Mean response latency in ms")
+  parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter in ms")
+  parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+  parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+  parser.add_argument("--per-minute", type=int, default=0, help="Discogs requests allowed per minute (0 = unlimited)")
+  parser.add_argument("--albums", type=int, default=500, help="Catalogue size")
+  ns = parser.parse_args()
+
+  discogs = Profile(ns.latency, ns.jitter, ns.error_rate, ns.throttle_rate, ns.per_minute)
+  lastfm = Profile(ns.latency, ns.jitter, ns.error_rate, ns.throttle_rate)
+  fakes = start(discogs, lastfm, albums=ns.albums)
+  for k, v in fakes.env.items():
+    print(f"export {k}={v}")
+  print("# e.g. scrobble album " + fakes.albums[0].query + " --pick 1 -y", flush=True)
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    fakes.close()
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
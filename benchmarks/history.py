@@ -0,0 +1,98 @@
+"""
+Latency benchmark for the scrobble history in `scrobble_cli.history`.
+
+Fills a throwaway history with years of back-to-back album plays, then times the duplicate check
+`scrobble album` runs before submitting (a fresh album, a retried one, a replay of an album from
+earlier that day) and the range query behind `scrobble history`.
+
+  python benchmarks/history.py
+  python benchmarks/history.py --rows 500000 --json bench_output.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+ALBUM_TRACKS = 10
+TRACK_SECONDS = 240
+
+
+def _album(i: int, start: int):
+  from scrobble_cli.lastfm import ScrobbleTrack
+
+  return [
+    ScrobbleTrack(
+      artist=f"Artist {i % 997}",
+      title=f"Track {n}",
+      album=f"Album {i % 4999}",
+      album_artist=f"Artist {i % 997}",
+      timestamp_unix=start + n * TRACK_SECONDS,
+      duration_seconds=TRACK_SECONDS,
+      discogs_release=f"master/{i % 4999}",
+    )
+    for n in range(ALBUM_TRACKS)
+  ]
+
+
+def _time(fn, repeats: int) -> dict:
+  fn()
+  samples = []
+  for _ in range(repeats):
+    started = time.perf_counter()
+    fn()
+    samples.append((time.perf_counter() - started) * 1000.0)
+  return {"median_ms": statistics.median(samples), "max_ms": max(samples)}
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows", type=int, default=300_000, help="Scrobbles to fill the history with")
+  parser.add_argument("--repeats", type=int, default=200)
+  parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+  ns = parser.parse_args()
+
+  os.environ["XDG_CONFIG_HOME"] = tempfile.mkdtemp(prefix="scrobble-history-bench-")
+  from scrobble_cli.history import History
+
+  history = History()
+  gap = ALBUM_TRACKS * TRACK_SECONDS + 600
+  first = int(time.time()) - (ns.rows // ALBUM_TRACKS) * gap
+  started = time.perf_counter()
+  albums = ns.rows // ALBUM_TRACKS
+  for chunk in range(0, albums, 1000):
+    history.record([t for i in range(chunk, min(albums, chunk + 1000)) for t in _album(i, first + i * gap)])
+  fill = time.perf_counter() - started
+
+  last = albums - 1
+  now = first + albums * gap
+  scenarios = {
+    "check-new": lambda: history.check(_album(albums, now)),
+    "check-retry": lambda: history.check(_album(last, first + last * gap + 30)),
+    "check-replay": lambda: history.check(_album(last - 2, now)),
+    "range-day": lambda: history.between(now - 86_400, now, limit=50),
+    "range-middle": lambda: history.between(first + (albums // 2) * gap, now, limit=50),
+  }
+  assert not history.check(_album(albums, now))
+  assert history.check(_album(last, first + last * gap + 30)).overlapping
+
+  results = {name: _time(fn, ns.repeats) for name, fn in scenarios.items()}
+  print(f"{history.count():,} scrobbles recorded in {fill:.1f}s")
+  print(f"{'scenario':<14} {'median ms':>10} {'max ms':>8}")
+  for name, r in results.items():
+    print(f"{name:<14} {r['median_ms']:>10.3f} {r['max_ms']:>8.3f}")
+
+  if ns.json_path:
+    with open(ns.json_path, "w", encoding="utf-8") as f:
+      json.dump({"rows": history.count(), "fill_seconds": fill, "scenarios": results}, f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
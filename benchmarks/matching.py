@@ -0,0 +1,293 @@
+"""
+Accuracy and throughput benchmark for the candidate ranker in `scrobble_cli.matching`.
+
+Accuracy runs over the labelled search results in benchmarks/matching_cases.jsonl. Each line holds
+a query (or artist/album), the Discogs results as [title, year, format, kind], and the indices of
+the correct results. An empty list means none of them is right, so nothing may be auto-picked.
+The benchmark reports top-1 accuracy, auto-pick coverage and precision, and how well the
+confidences are calibrated. Throughput ranks synthetic result lists of growing size.
+
+The weights in matching.py were fitted on these same cases, so the accuracy of the shipped weights
+is in-sample. The cross-validated figures refit the weights (same procedure, `fit`) without each
+fold and score that fold, which estimates how often auto-pick is wrong on searches it hasn't seen.
+
+  python benchmarks/matching.py
+  python benchmarks/matching.py --candidates 100000 --json bench_output.txt
+  python benchmarks/matching.py --verbose   # print every case the ranker gets wrong
+  python benchmarks/matching.py --fit       # refit the weights on all cases and print them
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from scrobble_cli import matching
+from scrobble_cli.discogs import DiscogsSearchResult
+
+
+CASES = Path(__file__).with_name("matching_cases.jsonl")
+
+# Reliability bins for the calibration table: (low, high) bounds on the top confidence.
+BINS = ((0.0, 0.5), (0.5, 0.8), (0.8, matching.AUTO_PICK_CONFIDENCE), (matching.AUTO_PICK_CONFIDENCE, 1.01))
+
+# Fitting: L2 penalty and gradient-ascent schedule for the conditional logit.
+L2 = 0.01
+ITERATIONS = 3000
+LEARNING_RATE = 0.5
+FOLDS = 5
+
+
+def _result(i: int, title: str, year: int | None, fmt: str | None, kind: str) -> DiscogsSearchResult:
+  return DiscogsSearchResult(id=i, kind=kind, title=title, year=year, country=None, label=None, catno=None, format=fmt)
+
+
+def load_cases(path: Path) -> list[dict]:
+  cases = []
+  for line in path.read_text(encoding="utf-8").splitlines():
+    if line.strip():
+      case = json.loads(line)
+      case["results"] = [_result(i, *r) for i, r in enumerate(case["results"])]
+      cases.append(case)
+  return cases
+
+
+def accuracy(cases: list[dict], *, verbose: bool) -> dict:
+  answerable = top1 = picked = picked_right = 0
+  brier = 0.0
+  bins = [[0, 0] for _ in BINS]  # [cases, correct]
+  for case in cases:
+    kwargs = dict(query=case["query"], artist=case.get("artist"), album=case.get("album"), vinyl_only=True)
+    ranked = matching.rank(case["results"], **kwargs)
+    best = ranked[0]
+    correct = best.result.id in case["answer"]
+    auto = best.result if best.confidence >= matching.AUTO_PICK_CONFIDENCE else None
+
+    if case["answer"]:
+      answerable += 1
+      top1 += correct
+    if auto is not None:
+      picked += 1
+      picked_right += auto.id in case["answer"]
+    brier += (best.confidence - correct) ** 2
+    for b, (lo, hi) in zip(bins, BINS):
+      if lo <= best.confidence < hi:
+        b[0] += 1
+        b[1] += correct
+
+    wrong_pick = auto is not None and auto.id not in case["answer"]
+    if verbose and (wrong_pick or (case["answer"] and not correct)):
+      print(f"  {case['query']!r}: ranked {best.result.title!r} ({best.confidence:.2f}), want {case['answer']}")
+
+  return {
+    "cases": len(cases),
+    "auto_picks": picked,
+    "wrong_auto_picks": picked - picked_right,
+    "top1_accuracy": top1 / answerable if answerable else 0.0,
+    "auto_pick_coverage": picked_right / answerable if answerable else 0.0,
+    "auto_pick_precision": picked_right / picked if picked else 1.0,
+    "brier": brier / len(cases),
+    "reliability": [
+      {"bin": f"{lo:.2f}-{min(hi, 1.0):.2f}", "cases": n, "accuracy": (ok / n) if n else None}
+      for (lo, hi), (n, ok) in zip(BINS, bins)
+    ],
+  }
+
+
+def _case_data(case: dict) -> tuple[list[tuple], list[tuple[float, ...]], tuple | None]:
+  """Album keys, full feature vectors and the wanted album's key (None: nothing is right) of a case."""
+  want = matching._want(case["query"], case.get("artist"), case.get("album"))
+  titles = [matching._title(r.title) for r in case["results"]]
+  keys = matching._album_keys(case["results"], titles)
+  features = [
+    matching._features(
+      want,
+      r,
+      t,
+      vinyl_only=True,
+      trigram=matching._trigram_similarity(want, t),
+      edit=matching._edit_similarity(want, t),
+    )
+    for r, t in zip(case["results"], titles)
+  ]
+  return keys, features, (keys[case["answer"][0]] if case["answer"] else None)
+
+
+def _log_likelihood(data: list, bias: float, weights: tuple[float, ...], *, gradient: bool = False):
+  """Mean log-likelihood of the wanted albums (or "none") under `rank`'s softmax, and its gradient."""
+  n = len(weights)
+  total = 0.0
+  g_bias, g_weights = 0.0, [0.0] * n
+  for keys, features, target in data:
+    best: dict[tuple, tuple[float, tuple[float, ...]]] = {}
+    for key, f in zip(keys, features):
+      z = bias + sum(w * x for w, x in zip(weights, f))
+      if key not in best or z > best[key][0]:
+        best[key] = (z, f)
+    top = max(0.0, *(z for z, _ in best.values()))
+    exps = {key: math.exp(z - top) for key, (z, _) in best.items()}
+    denominator = math.exp(-top) + sum(exps.values())
+    total += (best[target][0] - top if target is not None else -top) - math.log(denominator)
+    if gradient:
+      for key, (_, f) in best.items():
+        p = exps[key] / denominator
+        g_bias -= p
+        for j in range(n):
+          g_weights[j] -= p * f[j]
+      if target is not None:
+        g_bias += 1.0
+        for j, x in enumerate(best[target][1]):
+          g_weights[j] += x
+  m = len(data)
+  return total / m, g_bias / m, [g / m for g in g_weights]
+
+
+def fit(cases: list[dict], *, l2: float = L2, iterations: int = ITERATIONS) -> tuple[float, tuple[float, ...]]:
+  """
+  Fits BIAS and the feature weights the way matching.py's were: a conditional logit over each
+  case's albums plus "none of these" (L2-regularized gradient ascent), then temperature scaling
+  so the confidences are calibrated on the fitting cases.
+  """
+  data = [_case_data(c) for c in cases]
+  bias, weights = -3.0, [1.0] * len(matching._WEIGHTS)
+  for _ in range(iterations):
+    _, g_bias, g_weights = _log_likelihood(data, bias, tuple(weights), gradient=True)
+    bias += LEARNING_RATE * g_bias
+    weights = [w + LEARNING_RATE * (g - l2 * w) for w, g in zip(weights, g_weights)]
+  scale = max(
+    (s / 20 for s in range(10, 80)),
+    key=lambda s: _log_likelihood(data, bias * s, tuple(w * s for w in weights))[0],
+  )
+  return bias * scale, tuple(w * scale for w in weights)
+
+
+@contextmanager
+def _weights(bias: float, weights: tuple[float, ...]) -> Iterator[None]:
+  # `rank` rescores every candidate of a short list with BIAS and _WEIGHTS, so these two are enough
+  # for the labelled cases (the W_* constants only shortlist lists over TRIGRAM_CANDIDATES).
+  saved = matching.BIAS, matching._WEIGHTS
+  matching.BIAS, matching._WEIGHTS = bias, weights
+  try:
+    yield
+  finally:
+    matching.BIAS, matching._WEIGHTS = saved
+
+
+def cross_validate(cases: list[dict], *, folds: int = FOLDS, seed: int = 0, verbose: bool = False) -> dict:
+  """Accuracy on held-out cases: each fold is scored with weights fitted on the other folds only."""
+  order = list(range(len(cases)))
+  random.Random(seed).shuffle(order)
+  held_out = [[cases[i] for i in order[k::folds]] for k in range(folds)]
+  answerable = top1 = picked = wrong = 0
+  brier = 0.0
+  for k, test in enumerate(held_out):
+    train = [c for j, fold in enumerate(held_out) if j != k for c in fold]
+    with _weights(*fit(train)):
+      acc = accuracy(test, verbose=verbose)
+    n_answerable = sum(1 for c in test if c["answer"])
+    answerable += n_answerable
+    top1 += round(acc["top1_accuracy"] * n_answerable)
+    picked += acc["auto_picks"]
+    wrong += acc["wrong_auto_picks"]
+    brier += acc["brier"] * len(test)
+  return {
+    "folds": folds,
+    "cases": len(cases),
+    "auto_picks": picked,
+    "wrong_auto_picks": wrong,
+    "top1_accuracy": top1 / answerable if answerable else 0.0,
+    "auto_pick_coverage": (picked - wrong) / answerable if answerable else 0.0,
+    "auto_pick_precision": (picked - wrong) / picked if picked else 1.0,
+    "brier": brier / len(cases),
+  }
+
+
+def _synthetic(n: int, cases: list[dict], seed: int) -> list[DiscogsSearchResult]:
+  rng = random.Random(seed)
+  words = sorted({w for c in cases for r in c["results"] for w in r.title.replace(" - ", " ").split()})
+  out = []
+  for i in range(n):
+    artist = " ".join(rng.choices(words, k=rng.randint(1, 3)))
+    album = " ".join(rng.choices(words, k=rng.randint(1, 5)))
+    out.append(_result(i, f"{artist} - {album}", rng.randint(1955, 2024), "Vinyl, LP, Album", rng.choice(("master", "release"))))
+  return out
+
+
+def throughput(sizes: list[int], cases: list[dict]) -> dict:
+  out = {}
+  for n in sizes:
+    candidates = _synthetic(n, cases, seed=n)
+    for cache in (matching._norm, matching._title, matching._trigrams):
+      cache.cache_clear()
+    started = time.perf_counter()
+    matching.rank(candidates, query="coltrane a love supreme 1965", vinyl_only=True, limit=25)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    matching.rank(candidates, query="radiohead ok computer", vinyl_only=True, limit=25)
+    warm = time.perf_counter() - started
+    out[str(n)] = {"cold_ms": cold * 1000.0, "warm_ms": warm * 1000.0, "warm_per_second": n / warm}
+  return out
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--cases", type=Path, default=CASES)
+  parser.add_argument("--candidates", type=int, default=100_000, help="Largest synthetic result list to rank")
+  parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+  parser.add_argument("--verbose", action="store_true", help="Print the cases the ranker gets wrong")
+  parser.add_argument("--folds", type=int, default=FOLDS, help="Cross-validation folds")
+  parser.add_argument("--fit", action="store_true", help="Refit the weights on all cases and print them")
+  ns = parser.parse_args()
+
+  cases = load_cases(ns.cases)
+  if ns.fit:
+    bias, weights = fit(cases)
+    print(f"BIAS = {bias:.1f}")
+    names = ("RECALL", "TRIGRAM", "EDIT", "ARTIST_ONLY", "YEAR_MATCH", "YEAR_MISMATCH", "FORMAT", "UNOFFICIAL", "MASTER")
+    for name, w in zip(names, weights):
+      print(f"W_{name} = {w:.1f}")
+    return 0
+
+  acc = accuracy(cases, verbose=ns.verbose)
+  print(f"{acc['cases']} labelled cases, shipped weights (fitted on these cases: in-sample)")
+  print(f"  top-1 accuracy       {acc['top1_accuracy']:.1%}  (answerable cases ranked first)")
+  print(f"  auto-pick coverage   {acc['auto_pick_coverage']:.1%}  (answerable cases picked correctly)")
+  print(f"  auto-pick precision  {acc['auto_pick_precision']:.1%}  ({acc['wrong_auto_picks']} wrong of {acc['auto_picks']})")
+  print(f"  Brier score          {acc['brier']:.3f}")
+  for b in acc["reliability"]:
+    rate = "-" if b["accuracy"] is None else f"{b['accuracy']:.0%}"
+    print(f"    confidence {b['bin']}: {b['cases']:>3} cases, {rate} correct")
+
+  if ns.verbose:
+    print("held-out mistakes:")
+  cv = cross_validate(cases, folds=ns.folds, verbose=ns.verbose)
+  print(f"{cv['folds']}-fold cross-validation (weights refitted without each held-out fold)")
+  print(f"  top-1 accuracy       {cv['top1_accuracy']:.1%}")
+  print(f"  auto-pick coverage   {cv['auto_pick_coverage']:.1%}")
+  print(
+    f"  auto-pick precision  {cv['auto_pick_precision']:.1%}  ({cv['wrong_auto_picks']} wrong of {cv['auto_picks']}"
+    f" at confidence >= {matching.AUTO_PICK_CONFIDENCE})"
+  )
+  print(f"  Brier score          {cv['brier']:.3f}")
+
+  sizes = sorted({n for n in (10, 1_000, 10_000, ns.candidates) if n <= ns.candidates})
+  speed = throughput(sizes, cases)
+  print(f"{'candidates':>10} {'cold ms':>9} {'warm ms':>9} {'warm/s':>10}")
+  for n, s in speed.items():
+    print(f"{int(n):>10,} {s['cold_ms']:>9.1f} {s['warm_ms']:>9.1f} {s['warm_per_second']:>10,.0f}")
+
+  if ns.json_path:
+    with open(ns.json_path, "w", encoding="utf-8") as f:
+      json.dump({"accuracy": acc, "cross_validation": cv, "throughput": speed}, f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
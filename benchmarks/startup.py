@@ -0,0 +1,151 @@
+"""
+Cold-start benchmark for the `scrobble` entry point.
+
+Runs each subcommand in a fresh interpreter with `python -X importtime`, repeating a few times,
+and reports median wall-clock time, total import time and which heavy dependencies got loaded.
+Discogs responses are canned for the `album` scenarios so the benchmark never touches the network.
+
+  python benchmarks/startup.py
+  python benchmarks/startup.py --runs 10 --json bench_output.txt
+  python benchmarks/startup.py --compare baseline.json --tolerance 0.25   # exit 1 on regression
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+SCENARIOS: dict[str, list[str]] = {
+  "help": ["--help"],
+  "status": ["status"],
+  "cache-stats": ["cache", "stats"],
+  "flush-list": ["flush", "--list"],
+  "album-search-only": ["album", "coltrane", "a", "love", "supreme", "--search-only"],
+  "album-pick-dry-run": ["album", "coltrane", "a", "love", "supreme", "--pick", "1", "-y", "--dry-run"],
+}
+
+HEAVY = ("rich", "questionary", "prompt_toolkit", "requests", "httpx")
+
+# Runs the CLI like the console script does; album scenarios get a canned Discogs `_get`.
+DRIVER = r"""
+import sys
+if sys.argv[1] == "album":
+  import scrobble_cli.discogs as d
+  def _get(cfg, path, params=None):
+    if path.startswith("/database/search"):
+      return {"results": [{"id": 1, "type": "master", "title": "John Coltrane - A Love Supreme", "year": "1965",
+                           "format": ["Vinyl", "LP"], "label": ["Impulse!"], "catno": "A-77"}]}
+    return {"title": "A Love Supreme", "artists": [{"name": "John Coltrane"}], "year": 1965,
+            "tracklist": [{"type_": "track", "position": "A1", "title": "Acknowledgement", "duration": "7:47"}]}
+  d._get = _get
+from scrobble_cli.main import app
+sys.argv[0] = "scrobble"
+app()
+"""
+
+
+def _env(config_home: str) -> dict[str, str]:
+  env = dict(os.environ)
+  env.update(
+    {
+      "XDG_CONFIG_HOME": config_home,
+      "SCROBBLE_HEADLESS": "1",
+      "SCROBBLE_CACHE": "0",
+      "DISCOGS_OFFLINE_INDEX": "0",
+      "DISCOGS_TOKEN": "bench",
+      "LASTFM_API_KEY": "bench",
+      "LASTFM_API_SECRET": "bench",
+      "LASTFM_SESSION_KEY": "bench",
+      "LASTFM_USERNAME": "bench",
+    }
+  )
+  return env
+
+
+def _parse_importtime(stderr: str) -> tuple[float, set[str]]:
+  total_us = 0
+  modules: set[str] = set()
+  for line in stderr.splitlines():
+    if not line.startswith("import time:") or "self [us]" in line:
+      continue
+    parts = line[len("import time:") :].split("|")
+    if len(parts) != 3:
+      continue
+    total_us += int(parts[0].strip())
+    modules.add(parts[2].strip().split(".")[0])
+  return total_us / 1000.0, modules
+
+
+def run_scenario(args: list[str], runs: int, env: dict[str, str]) -> dict:
+  walls: list[float] = []
+  imports: list[float] = []
+  loaded: set[str] = set()
+  code = 0
+  for _ in range(runs):
+    started = time.perf_counter()
+    p = subprocess.run(
+      [sys.executable, "-X", "importtime", "-c", DRIVER, *args],
+      env=env,
+      capture_output=True,
+      text=True,
+    )
+    walls.append((time.perf_counter() - started) * 1000.0)
+    import_ms, modules = _parse_importtime(p.stderr)
+    imports.append(import_ms)
+    loaded |= modules
+    code = p.returncode
+  return {
+    "wall_ms": statistics.median(walls),
+    "import_ms": statistics.median(imports),
+    "heavy": sorted(m for m in HEAVY if m in loaded),
+    "exit_code": code,
+  }
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--only", action="append", choices=sorted(SCENARIOS), help="Run only these scenarios")
+  parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+  parser.add_argument("--compare", help="Baseline JSON from a previous --json run")
+  parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+  ns = parser.parse_args()
+
+  results: dict[str, dict] = {}
+  with tempfile.TemporaryDirectory() as config_home:
+    env = _env(config_home)
+    for name in ns.only or SCENARIOS:
+      results[name] = run_scenario(SCENARIOS[name], ns.runs, env)
+
+  print(f"{'scenario':<22} {'wall ms':>9} {'import ms':>10}  exit  heavy deps")
+  for name, r in results.items():
+    heavy = ", ".join(r["heavy"]) or "-"
+    print(f"{name:<22} {r['wall_ms']:>9.1f} {r['import_ms']:>10.1f}  {r['exit_code']:>4}  {heavy}")
+
+  if ns.json_path:
+    with open(ns.json_path, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+
+  if ns.compare:
+    with open(ns.compare, encoding="utf-8") as f:
+      baseline = json.load(f)
+    regressions = []
+    for name, r in results.items():
+      base = baseline.get(name)
+      if base and r["wall_ms"] > base["wall_ms"] * (1 + ns.tolerance):
+        regressions.append(f"{name}: {base['wall_ms']:.1f} -> {r['wall_ms']:.1f} ms")
+    if regressions:
+      print("Startup regressions:\n  " + "\n  ".join(regressions))
+      return 1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
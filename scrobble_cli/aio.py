@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+# The asyncio API: the same calls as `discogs` and `lastfm`, as coroutines. Each runs the flow the
+# sync function runs (see `flow`), with its HTTP round trips on httpx (the `async` extra) and its
+# waits (rate limit, retries, pacing) on the event loop, so many lookups and submissions can be in
+# flight at once without a thread each. Close the loop's connections with `aclose()` when done.
+
+from typing import Callable
+
+from scrobble_cli import discogs, flow, lastfm, transport
+from scrobble_cli.config import AppConfig
+from scrobble_cli.discogs import DiscogsRelease, DiscogsSearchResult
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, ScrobbleTrack
+
+
+async def search(
+  cfg: AppConfig,
+  *,
+  artist: str,
+  album: str,
+  vinyl_only: bool,
+  limit: int,
+  speculative: bool = False,
+  until_confident: bool = False,
+  timings: dict[str, float] | None = None,
+) -> list[DiscogsSearchResult]:
+  """See `discogs.search`."""
+  return await flow.arun(
+    discogs._search_flow(
+      cfg,
+      artist=artist,
+      album=album,
+      vinyl_only=vinyl_only,
+      limit=limit,
+      speculative=speculative,
+      until_confident=until_confident,
+      timings=timings,
+    )
+  )
+
+
+async def search_query(
+  cfg: AppConfig,
+  *,
+  query: str,
+  vinyl_only: bool,
+  limit: int,
+  speculative: bool = False,
+  until_confident: bool = False,
+  timings: dict[str, float] | None = None,
+) -> list[DiscogsSearchResult]:
+  query = (query or "").strip()
+  if not query:
+    return []
+  return await search(
+    cfg,
+    artist=query,
+    album="",
+    vinyl_only=vinyl_only,
+    limit=limit,
+    speculative=speculative,
+    until_confident=until_confident,
+    timings=timings,
+  )
+
+
+async def fetch_release(cfg: AppConfig, *, kind: str, id: int) -> DiscogsRelease:
+  return await flow.arun(discogs._fetch_release_flow(cfg, kind=kind, id=id))
+
+
+async def ensure_session(cfg: AppConfig, *, api_key: str | None, api_secret: str | None) -> AppConfig:
+  """See `lastfm.ensure_session`; the wait for the user's approval runs on a worker thread."""
+  return await flow.arun(lastfm._ensure_session_flow(cfg, api_key=api_key, api_secret=api_secret))
+
+
+async def scrobble_album(
+  cfg: AppConfig,
+  tracks: list[ScrobbleTrack],
+  *,
+  on_batch: Callable[[int, dict], None] | None = None,
+) -> dict:
+  """
+  See `lastfm.scrobble_album`: up to `LASTFM_MAX_IN_FLIGHT` batches in flight, spaced by one shared
+  `Pacer`, and `on_batch(offset, response)` as each is answered. After a failure, batches not yet
+  sent are dropped, those on the wire are still reported, and the first error is raised.
+  """
+  import asyncio
+
+  lastfm._check_scrobble_config(cfg, tracks)
+  batches = lastfm._batches(tracks)
+  results: list[dict] = [{} for _ in batches]
+  pacer = lastfm.Pacer()
+  slots = asyncio.Semaphore(max(1, min(cfg.lastfm.max_in_flight, len(batches))))
+  failed = False
+
+  async def submit(batch: list[ScrobbleTrack]) -> dict | None:
+    nonlocal failed
+    async with slots:
+      if failed:
+        return None
+      try:
+        return await flow.arun(lastfm._submit_flow(cfg, batch, pacer))
+      except BaseException:
+        failed = True
+        raise
+
+  tasks = {asyncio.ensure_future(submit(batch)): i for i, batch in enumerate(batches)}
+  first_error: BaseException | None = None
+  pending = set(tasks)
+  try:
+    while pending:
+      done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        error = task.exception()
+        if error is not None:
+          first_error = first_error or error
+          continue
+        res = task.result()
+        if res is not None:
+          i = tasks[task]
+          results[i] = res
+          if on_batch is not None:
+            on_batch(i * SCROBBLE_BATCH_SIZE, res)
+  finally:
+    for task in pending:
+      task.cancel()
+  if first_error is not None:
+    raise first_error
+  return {"batches": results}
+
+
+async def aclose() -> None:
+  """Closes the HTTP connections this event loop opened."""
+  await transport.aclose_sessions()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+from scrobble_cli.config import AppConfig
+from scrobble_cli.discogs import DiscogsRelease, enrich_durations, fetch_release, search_query
+from scrobble_cli.lastfm import ScrobbleTrack
+from scrobble_cli.matching import auto_pick
+from scrobble_cli.memory import get_memory
+from scrobble_cli.outbox import FlushResult
+from scrobble_cli.plan import build_scrobbles, planning_durations
+from scrobble_cli.timestamps import plan_from_end, plan_from_start
+
+
+@dataclass(frozen=True)
+class BatchItem:
+  line_no: int
+  query: str
+  pick: int | None = None
+  started_at: str | None = None
+  ended_at: str | None = None
+
+
+@dataclass(frozen=True)
+class ResolvedItem:
+  item: BatchItem
+  release: DiscogsRelease | None
+  error: str | None = None
+
+
+@dataclass(frozen=True)
+class PlannedItem:
+  resolved: ResolvedItem
+  scrobbles: list[ScrobbleTrack]
+
+
+def _parse_iso(value: str, *, field: str, line_no: int) -> int:
+  try:
+    return int(datetime.fromisoformat(value).timestamp())
+  except (TypeError, ValueError) as e:
+    raise ValueError(f"line {line_no}: invalid {field} {value!r}") from e
+
+
+def read_items(lines: Iterable[str]) -> list[BatchItem]:
+  """
+  Parses one query per line. Lines starting with `{` are JSON objects:
+  {"query": "...", "pick": 2, "started_at": "...", "ended_at": "..."}.
+  Blank lines and `#` comments are skipped. Bad picks and timestamps are reported here, with their
+  line, before anything is looked up.
+  """
+  items: list[BatchItem] = []
+  for line_no, raw in enumerate(lines, start=1):
+    line = raw.strip()
+    if not line or line.startswith("#"):
+      continue
+    if not line.startswith("{"):
+      items.append(BatchItem(line_no=line_no, query=line))
+      continue
+    try:
+      obj = json.loads(line)
+    except json.JSONDecodeError as e:
+      raise ValueError(f"line {line_no}: invalid JSON ({e.msg})") from e
+    query = str(obj.get("query") or "").strip()
+    if not query:
+      raise ValueError(f"line {line_no}: missing \"query\"")
+    pick = obj.get("pick")
+    try:
+      pick = int(pick) if pick is not None else None
+    except (TypeError, ValueError):
+      raise ValueError(f"line {line_no}: invalid pick {pick!r}") from None
+    started_at, ended_at = obj.get("started_at") or None, obj.get("ended_at") or None
+    if started_at and ended_at:
+      raise ValueError(f"line {line_no}: use either \"started_at\" or \"ended_at\", not both")
+    for field, value in (("started_at", started_at), ("ended_at", ended_at)):
+      if value:
+        _parse_iso(value, field=field, line_no=line_no)
+    items.append(
+      BatchItem(
+        line_no=line_no,
+        query=query,
+        pick=pick,
+        started_at=started_at,
+        ended_at=ended_at,
+      )
+    )
+  return items
+
+
+def _resolve_one(
+  cfg: AppConfig, item: BatchItem, *, vinyl_only: bool, limit: int, speculative: bool = False, memory: bool = True
+) -> ResolvedItem:
+  try:
+    remembered = get_memory().get(item.query, vinyl_only=vinyl_only) if memory and item.pick is None else None
+    # A typo-level match is only a suggestion, and there is nobody to confirm it here: search instead.
+    if remembered is not None and not remembered.close:
+      release = enrich_durations(cfg, fetch_release(cfg, kind=remembered.kind, id=remembered.id))
+      return ResolvedItem(item=item, release=release, error=None if release.tracks else "no tracklist on Discogs")
+    results = search_query(
+      cfg,
+      query=item.query,
+      vinyl_only=vinyl_only,
+      limit=limit,
+      speculative=speculative,
+      until_confident=item.pick is None,
+    )
+    if not results:
+      return ResolvedItem(item=item, release=None, error="no Discogs results")
+    if item.pick is not None:
+      if item.pick < 1 or item.pick > len(results):
+        return ResolvedItem(item=item, release=None, error=f"pick must be between 1 and {len(results)}")
+      selected = results[item.pick - 1]
+      if memory:
+        get_memory().remember(item.query, vinyl_only=vinyl_only, kind=selected.kind, id=selected.id, title=selected.title)
+    else:
+      selected = auto_pick(results, query=item.query, vinyl_only=vinyl_only)
+      if selected is None:
+        return ResolvedItem(item=item, release=None, error="no confident match (add a pick)")
+    release = enrich_durations(cfg, fetch_release(cfg, kind=selected.kind, id=selected.id))
+  except Exception as e:
+    return ResolvedItem(item=item, release=None, error=str(e) or type(e).__name__)
+  if not release.tracks:
+    return ResolvedItem(item=item, release=release, error="no tracklist on Discogs")
+  return ResolvedItem(item=item, release=release)
+
+
+def resolve_items(
+  cfg: AppConfig,
+  items: list[BatchItem],
+  *,
+  vinyl_only: bool,
+  limit: int,
+  workers: int,
+  speculative: bool = False,
+  memory: bool = True,
+) -> list[ResolvedItem]:
+  """
+  Runs search + fetch for every item on a bounded thread pool; results keep input order. With
+  `memory`, queries resolved before skip the search and explicit picks are remembered.
+  """
+
+  def resolve(item: BatchItem) -> ResolvedItem:
+    return _resolve_one(cfg, item, vinyl_only=vinyl_only, limit=limit, speculative=speculative, memory=memory)
+
+  with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+    return list(pool.map(resolve, items))
+
+
+def plan_items(resolved: list[ResolvedItem], *, start_unix: int | None, now_unix: int) -> list[PlannedItem]:
+  """
+  Items with their own `started_at`/`ended_at` are anchored there. All other items are played
+  back-to-back in input order from `start_unix`, which defaults to "the whole run ends now".
+  """
+  ok = [r for r in resolved if r.error is None and r.release is not None]
+  chained = [r for r in ok if not r.item.started_at and not r.item.ended_at]
+  chained_durations = [d for r in chained for d in planning_durations(r.release)]
+  if start_unix is None:
+    start_unix = now_unix - sum(chained_durations)
+  chained_ts = iter(plan_from_start(start_unix, chained_durations))
+
+  planned: list[PlannedItem] = []
+  for r in ok:
+    durations = planning_durations(r.release)
+    if r.item.started_at:
+      timestamps = plan_from_start(_parse_iso(r.item.started_at, field="started_at", line_no=r.item.line_no), durations)
+    elif r.item.ended_at:
+      timestamps = plan_from_end(_parse_iso(r.item.ended_at, field="ended_at", line_no=r.item.line_no), durations)
+    else:
+      timestamps = [next(chained_ts) for _ in durations]
+    planned.append(PlannedItem(resolved=r, scrobbles=build_scrobbles(r.release, timestamps)))
+  return planned
+
+
+@dataclass(frozen=True)
+class ItemReport:
+  resolved: ResolvedItem
+  submitted: int
+  accepted: int
+  ignored: int
+  error: str | None
+
+
+def tally(planned: list[PlannedItem], item_ids: list[list[int]], result: FlushResult) -> list[ItemReport]:
+  """Maps per-row outbox outcomes back to albums; rows without an outcome are still pending."""
+  reports: list[ItemReport] = []
+  for p, ids in zip(planned, item_ids, strict=True):
+    got = [result.outcomes[i] for i in ids if i in result.outcomes]
+    accepted = sum(1 for o in got if o.accepted)
+    error = None
+    if len(got) < len(ids) and result.errors:
+      error = f"{len(ids) - len(got)} track(s) kept in outbox: {result.errors[0]}"
+    reports.append(
+      ItemReport(resolved=p.resolved, submitted=len(ids), accepted=accepted, ignored=len(got) - accepted, error=error)
+    )
+  return reports
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+from scrobble_cli.store import db_path, open_db
+
+
+CACHE_DB = "cache.sqlite3"
+
+# Release/master bodies barely change; search pages drift as people submit new pressings.
+RELEASE_TTL = 30 * 24 * 3600
+SEARCH_TTL = 24 * 3600
+# Collection listings change whenever a record is added; always revalidate (cheap with ETags).
+COLLECTION_TTL = 0
+DEFAULT_TTL = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+  key TEXT PRIMARY KEY,
+  body TEXT NOT NULL,
+  etag TEXT,
+  last_modified TEXT,
+  fetched_at REAL NOT NULL,
+  expires_at REAL NOT NULL,
+  last_used REAL NOT NULL,
+  size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+"""
+
+
+def ttl_for(path: str) -> int:
+  if path.startswith("/releases/") or path.startswith("/masters/"):
+    return RELEASE_TTL
+  if path.startswith("/database/search"):
+    return SEARCH_TTL
+  if path.startswith("/users/"):
+    return COLLECTION_TTL
+  return DEFAULT_TTL
+
+
+def cache_key(path: str, params: dict | None = None, *, base: str = "", user: str | None = None) -> str:
+  """
+  The API `base` URL, path and parameters of a request; `user` (hashed) for responses that depend
+  on whose credentials asked, like collection listings.
+  """
+  key = f"{base.rstrip('/')}{path}"
+  if params:
+    key = f"{key}?{json.dumps(params, sort_keys=True, separators=(',', ':'))}"
+  if user:
+    key = f"{key}#{hashlib.sha256(user.encode('utf-8')).hexdigest()[:16]}"
+  return key
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+  body: dict
+  etag: str | None
+  last_modified: str | None
+  fresh: bool
+
+
+@dataclass(frozen=True)
+class CacheStats:
+  path: str
+  entries: int
+  expired: int
+  size_bytes: int
+  max_bytes: int
+  hits: int
+  revalidated: int
+  misses: int
+
+
+class ResponseCache:
+  """
+  Persistent HTTP response cache (SQLite) with per-entry TTL, ETag/Last-Modified
+  revalidation of stale entries, and LRU eviction once the size cap is exceeded.
+  """
+
+  def __init__(self, max_bytes: int):
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    self._conn = open_db(CACHE_DB, _SCHEMA)
+
+  def _bump(self, name: str) -> None:
+    self._conn.execute(
+      "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+      (name,),
+    )
+
+  def get(self, key: str) -> CachedResponse | None:
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute(
+        "SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+      ).fetchone()
+      if row is None:
+        self._bump("misses")
+        return None
+      self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+      fresh = row[3] > now
+      if fresh:
+        self._bump("hits")
+    return CachedResponse(body=json.loads(row[0]), etag=row[1], last_modified=row[2], fresh=fresh)
+
+  def put(self, key: str, body: dict, *, ttl: int, etag: str | None = None, last_modified: str | None = None) -> None:
+    raw = json.dumps(body, separators=(",", ":"))
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, fetched_at, expires_at, last_used, size)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (key, raw, etag, last_modified, now, now + ttl, now, len(raw)),
+      )
+      self._evict()
+
+  def refresh(self, key: str, *, ttl: int) -> bool:
+    """Marks a stale entry fresh again after a 304 Not Modified; False if it has been evicted since."""
+    now = time.time()
+    with self._lock:
+      updated = self._conn.execute(
+        "UPDATE responses SET fetched_at = ?, expires_at = ?, last_used = ? WHERE key = ?",
+        (now, now + ttl, now, key),
+      ).rowcount
+      self._bump("revalidated")
+    return updated > 0
+
+  def _evict(self) -> int:
+    total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= self.max_bytes:
+      return 0
+    removed = 0
+    rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC").fetchall()
+    for key, size in rows:
+      if total <= self.max_bytes:
+        break
+      self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+      total -= size
+      removed += 1
+    return removed
+
+  def prune(self) -> int:
+    """Drops expired entries, then evicts least-recently-used entries down to the size cap."""
+    with self._lock:
+      removed = self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+      removed += self._evict()
+    self._conn.execute("VACUUM")
+    return removed
+
+  def clear(self) -> int:
+    with self._lock:
+      removed = self._conn.execute("DELETE FROM responses").rowcount
+      self._conn.execute("DELETE FROM counters")
+    self._conn.execute("VACUUM")
+    return removed
+
+  def stats(self) -> CacheStats:
+    now = time.time()
+    with self._lock:
+      entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+      expired = self._conn.execute("SELECT COUNT(*) FROM responses WHERE expires_at <= ?", (now,)).fetchone()[0]
+      counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+    return CacheStats(
+      path=str(db_path(CACHE_DB)),
+      entries=entries,
+      expired=expired,
+      size_bytes=size,
+      max_bytes=self.max_bytes,
+      hits=counters.get("hits", 0),
+      revalidated=counters.get("revalidated", 0),
+      misses=counters.get("misses", 0),
+    )
+
+
+_caches: dict[int, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(max_bytes: int) -> ResponseCache:
+  with _caches_lock:
+    cache = _caches.get(max_bytes)
+    if cache is None:
+      cache = _caches[max_bytes] = ResponseCache(max_bytes)
+    return cache
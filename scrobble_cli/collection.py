@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+from urllib.parse import quote
+
+from scrobble_cli.config import AppConfig, write_config_values
+from scrobble_cli.discogs import (
+  DiscogsRelease,
+  DiscogsSearchResult,
+  DiscogsTrack,
+  _clean_artist_name,
+  _get,
+  _parse_release,
+  _release_path,
+)
+from scrobble_cli.store import db_path, fts_query, open_db
+
+
+COLLECTION_DB = "collection.sqlite3"
+PER_PAGE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS releases (
+  id INTEGER PRIMARY KEY,
+  master_id INTEGER,
+  artist TEXT NOT NULL,
+  title TEXT NOT NULL,
+  year INTEGER,
+  format TEXT,
+  label TEXT,
+  catno TEXT,
+  date_added TEXT NOT NULL,
+  added_unix INTEGER NOT NULL,
+  tracks TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS releases_fts USING fts5(
+  artist, title, label, catno,
+  content='releases', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS releases_ai AFTER INSERT ON releases BEGIN
+  INSERT INTO releases_fts (rowid, artist, title, label, catno)
+  VALUES (new.id, new.artist, new.title, new.label, new.catno);
+END;
+CREATE TRIGGER IF NOT EXISTS releases_ad AFTER DELETE ON releases BEGIN
+  INSERT INTO releases_fts (releases_fts, rowid, artist, title, label, catno)
+  VALUES ('delete', old.id, old.artist, old.title, old.label, old.catno);
+END;
+CREATE TRIGGER IF NOT EXISTS releases_au AFTER UPDATE ON releases BEGIN
+  INSERT INTO releases_fts (releases_fts, rowid, artist, title, label, catno)
+  VALUES ('delete', old.id, old.artist, old.title, old.label, old.catno);
+  INSERT INTO releases_fts (rowid, artist, title, label, catno)
+  VALUES (new.id, new.artist, new.title, new.label, new.catno);
+END;
+CREATE TABLE IF NOT EXISTS sync_state (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class SyncStats:
+  username: str
+  listed: int
+  added: int
+  removed: int
+  tracklists: int
+  failed: int
+  seconds: float
+
+
+@dataclass(frozen=True)
+class CollectionStats:
+  username: str | None
+  releases: int
+  with_tracks: int
+  last_synced: float | None
+
+
+def _added_unix(date_added: str) -> int:
+  return int(datetime.fromisoformat(date_added).timestamp())
+
+
+def _row(item: dict) -> tuple:
+  info = item.get("basic_information") or {}
+  artists = info.get("artists") or []
+  artist = _clean_artist_name(str(artists[0].get("name") or "")) if artists else ""
+  fmt: list[str] = []
+  for f in info.get("formats") or []:
+    if f.get("name"):
+      fmt.append(str(f["name"]))
+    fmt.extend(str(d) for d in f.get("descriptions") or [])
+  labels = info.get("labels") or []
+  date_added = str(item.get("date_added") or "")
+  return (
+    int(info.get("id") or item["id"]),
+    int(info["master_id"]) if info.get("master_id") else None,
+    artist,
+    str(info.get("title") or "").strip(),
+    int(info["year"]) if info.get("year") else None,
+    ", ".join(fmt) or None,
+    str(labels[0].get("name")) if labels and labels[0].get("name") else None,
+    str(labels[0].get("catno")) if labels and labels[0].get("catno") else None,
+    date_added,
+    _added_unix(date_added),
+  )
+
+
+_conn: sqlite3.Connection | None = None
+_conn_lock = threading.Lock()
+
+
+def _writer() -> sqlite3.Connection:
+  """The collection connection, creating the database on first use. Call with `_conn_lock` held."""
+  global _conn
+  if _conn is None:
+    _conn = open_db(COLLECTION_DB, _SCHEMA)
+  return _conn
+
+
+def _reader() -> sqlite3.Connection | None:
+  """The collection connection, or None when nothing has been synced (never creates the file)."""
+  with _conn_lock:
+    if _conn is None and not db_path(COLLECTION_DB).exists():
+      return None
+    return _writer()
+
+
+def resolve_username(cfg: AppConfig) -> str:
+  """DISCOGS_USERNAME, or the token owner's name from /oauth/identity (saved to the config)."""
+  if cfg.discogs.username:
+    return cfg.discogs.username
+  username = str(_get(cfg, "/oauth/identity").get("username") or "")
+  if not username:
+    raise RuntimeError("Couldn't determine your Discogs username. Set DISCOGS_USERNAME.")
+  write_config_values({"DISCOGS_USERNAME": username})
+  return username
+
+
+def _state(conn: sqlite3.Connection, key: str) -> str | None:
+  row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+  return row[0] if row else None
+
+
+def _set_state(conn: sqlite3.Connection, key: str, value: str) -> None:
+  conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+
+def sync(
+  cfg: AppConfig,
+  *,
+  full: bool = False,
+  workers: int = 4,
+  progress: Callable[[str, int, int], None] | None = None,
+) -> SyncStats:
+  """
+  Pulls the user's collection (all folders) into the local store, newest first, stopping at the
+  first record already seen by the previous sync. Tracklists are then fetched for every release
+  that doesn't have one yet, so an interrupted sync picks up where it stopped.
+
+  With `full=True` every page is listed and releases no longer in the collection are removed.
+  `progress(stage, done, total)` is called for the "list" and "tracks" stages.
+  """
+  started = time.perf_counter()
+  username = resolve_username(cfg)
+  path = f"/users/{quote(username)}/collection/folders/0/releases"
+
+  with _conn_lock:
+    conn = _writer()
+    if _state(conn, "username") not in (None, username):
+      conn.execute("DELETE FROM releases")
+      full = True
+    last_seen = None if full else _state(conn, "last_added_unix")
+    since = int(last_seen) if last_seen is not None else None
+
+  listed = added = 0
+  seen: set[int] = set()
+  newest = since or 0
+  page, pages = 1, 1
+  while page <= pages:
+    data = _get(cfg, path, params={"sort": "added", "sort_order": "desc", "per_page": PER_PAGE, "page": page})
+    pages = int((data.get("pagination") or {}).get("pages") or 1)
+    rows = []
+    done = False
+    for item in data.get("releases") or []:
+      row = _row(item)
+      if since is not None and row[9] < since:
+        done = True
+        break
+      rows.append(row)
+    with _conn_lock:
+      conn.execute("BEGIN IMMEDIATE")
+      for row in rows:
+        exists = conn.execute("SELECT 1 FROM releases WHERE id = ?", (row[0],)).fetchone()
+        conn.execute(
+          "INSERT INTO releases (id, master_id, artist, title, year, format, label, catno, date_added, added_unix)"
+          " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+          " ON CONFLICT(id) DO UPDATE SET master_id = excluded.master_id, artist = excluded.artist,"
+          " title = excluded.title, year = excluded.year, format = excluded.format, label = excluded.label,"
+          " catno = excluded.catno, date_added = excluded.date_added, added_unix = excluded.added_unix",
+          row,
+        )
+        added += exists is None
+      conn.execute("COMMIT")
+    for row in rows:
+      seen.add(row[0])
+      newest = max(newest, row[9])
+    listed += len(rows)
+    if progress:
+      progress("list", listed, int((data.get("pagination") or {}).get("items") or listed))
+    if done:
+      break
+    page += 1
+
+  removed = 0
+  with _conn_lock:
+    conn.execute("BEGIN IMMEDIATE")
+    if full:
+      owned = [r[0] for r in conn.execute("SELECT id FROM releases").fetchall()]
+      gone = [(i,) for i in owned if i not in seen]
+      conn.executemany("DELETE FROM releases WHERE id = ?", gone)
+      removed = len(gone)
+    _set_state(conn, "username", username)
+    _set_state(conn, "last_added_unix", str(newest))
+    _set_state(conn, "last_synced", str(time.time()))
+    conn.execute("COMMIT")
+    missing = [r[0] for r in conn.execute("SELECT id FROM releases WHERE tracks IS NULL ORDER BY added_unix DESC")]
+
+  fetched = failed = 0
+
+  def fetch(release_id: int) -> None:
+    nonlocal fetched, failed
+    try:
+      release = _parse_release(_get(cfg, _release_path("release", release_id)), kind="release", id=release_id)
+      tracks = json.dumps([[t.position, t.title, t.duration_seconds] for t in release.tracks])
+    except Exception:
+      release = None
+    with _conn_lock:
+      if release is None:
+        failed += 1
+      else:
+        conn.execute("UPDATE releases SET tracks = ? WHERE id = ?", (tracks, release_id))
+        fetched += 1
+      if progress:
+        progress("tracks", fetched + failed, len(missing))
+
+  if missing:
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="discogs-collection") as pool:
+      list(pool.map(fetch, missing))
+
+  return SyncStats(
+    username=username,
+    listed=listed,
+    added=added,
+    removed=removed,
+    tracklists=fetched,
+    failed=failed,
+    seconds=time.perf_counter() - started,
+  )
+
+
+def search(query: str, *, vinyl_only: bool, limit: int) -> list[DiscogsSearchResult]:
+  """Owned releases matching every word of `query`, in the shape of `discogs.search` results."""
+  conn = _reader()
+  match = fts_query(query)
+  if conn is None or not match:
+    return []
+  sql = (
+    "SELECT r.id, r.artist, r.title, r.year, r.label, r.catno, r.format"
+    " FROM releases_fts JOIN releases AS r ON r.id = releases_fts.rowid"
+    " WHERE releases_fts MATCH ?"
+  )
+  if vinyl_only:
+    sql += " AND (r.format IS NULL OR r.format LIKE '%Vinyl%')"
+  sql += " ORDER BY bm25(releases_fts, 10.0, 10.0, 1.0, 2.0) LIMIT ?"
+  with _conn_lock:
+    rows = conn.execute(sql, (match, limit)).fetchall()
+  return [
+    DiscogsSearchResult(
+      id=r[0],
+      kind="release",
+      title=f"{r[1]} - {r[2]}" if r[1] else r[2],
+      year=r[3],
+      country=None,
+      label=r[4],
+      catno=r[5],
+      format=r[6],
+    )
+    for r in rows
+  ]
+
+
+def fetch_release(id: int) -> DiscogsRelease | None:
+  """An owned release with its tracklist, or None if it isn't in the synced collection."""
+  conn = _reader()
+  if conn is None:
+    return None
+  with _conn_lock:
+    row = conn.execute("SELECT artist, title, year, tracks FROM releases WHERE id = ?", (id,)).fetchone()
+  if row is None or not row[3]:
+    return None
+  tracks = [DiscogsTrack(position=p, title=t, duration_seconds=d) for p, t, d in json.loads(row[3])]
+  if not tracks:
+    return None
+  return DiscogsRelease(id=id, kind="release", artist=row[0], album=row[1], year=row[2], tracks=tracks)
+
+
+def stats() -> CollectionStats | None:
+  conn = _reader()
+  if conn is None:
+    return None
+  with _conn_lock:
+    releases, with_tracks = conn.execute("SELECT COUNT(*), COUNT(tracks) FROM releases").fetchone()
+    username = _state(conn, "username")
+    last_synced = _state(conn, "last_synced")
+  return CollectionStats(
+    username=username,
+    releases=releases,
+    with_tracks=with_tracks,
+    last_synced=float(last_synced) if last_synced else None,
+  )
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+import re
+from dataclasses import dataclass, field, replace
 from pathlib import Path
+from typing import Mapping
 
 from platformdirs import user_config_path
 
@@ -21,17 +23,78 @@ class LastFmConfig:
   api_secret: str | None
   session_key: str | None
   username: str | None
+  max_in_flight: int = 2
+  api_url: str | None = None  # overrides the public API (benchmarks, proxies)
 
 
 @dataclass(frozen=True)
 class DiscogsConfig:
   token: str | None
+  requests_per_minute: int
+  offline_index: bool
+  username: str | None = None
+  collection: bool = True
+  api_url: str | None = None  # overrides the public API (benchmarks, proxies)
+
+
+@dataclass(frozen=True)
+class CacheConfig:
+  enabled: bool
+  max_bytes: int
+
+
+@dataclass(frozen=True)
+class HttpConfig:
+  connect_timeout: float
+  read_timeout: float
+  retries: int
+  backoff: float
 
 
 @dataclass(frozen=True)
 class AppConfig:
   lastfm: LastFmConfig
   discogs: DiscogsConfig
+  cache: CacheConfig
+  http: HttpConfig
+  # Named Last.fm profiles (LASTFM_ACCOUNT_<NAME>_*), sharing the API key/secret of `lastfm`.
+  accounts: dict[str, LastFmConfig] = field(default_factory=dict)
+
+
+# The account configured by LASTFM_SESSION_KEY/LASTFM_USERNAME.
+DEFAULT_ACCOUNT = "default"
+
+_ACCOUNT_KEY = re.compile(r"^LASTFM_ACCOUNT_([A-Z0-9_]+?)_(SESSION_KEY|USERNAME)$")
+
+
+def account_key(name: str, suffix: str) -> str:
+  """The config key holding `suffix` ("SESSION_KEY" or "USERNAME") of account `name`."""
+  return f"LASTFM_ACCOUNT_{name.upper()}_{suffix}"
+
+
+def valid_account_name(name: str) -> bool:
+  return bool(re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9_]*", name)) and name.lower() != DEFAULT_ACCOUNT
+
+
+def account_names(cfg: AppConfig) -> list[str]:
+  """Every configured account: the default one (if it has a session) followed by named profiles."""
+  names = [DEFAULT_ACCOUNT] if cfg.lastfm.session_key else []
+  return names + sorted(cfg.accounts)
+
+
+def for_account(cfg: AppConfig, name: str | None) -> AppConfig:
+  """`cfg` with `lastfm` swapped for the named account's session."""
+  if not name or name.lower() == DEFAULT_ACCOUNT:
+    return cfg
+  account = cfg.accounts.get(name.lower())
+  if account is None:
+    raise ValueError(f"Unknown Last.fm account {name!r}. Add it with `scrobble auth lastfm --account {name}`.")
+  return replace(cfg, lastfm=account)
+
+
+def has_session(lastfm: LastFmConfig) -> bool:
+  """Whether `lastfm` can scrobble without authorizing in the browser first."""
+  return bool(lastfm.api_key and lastfm.api_secret and lastfm.session_key and lastfm.username)
 
 
 def config_dir() -> Path:
@@ -63,10 +126,30 @@ def _maybe_migrate_legacy_config() -> None:
   os.chmod(new_path, 0o600)
 
 
-def load_config() -> AppConfig:
+def _int(value: str | None, default: int) -> int:
+  try:
+    return int(value) if value else default
+  except ValueError:
+    return default
+
+
+def _float(value: str | None, default: float) -> float:
+  try:
+    return float(value) if value else default
+  except ValueError:
+    return default
+
+
+def _flag(value: str | None, default: bool) -> bool:
+  if not value:
+    return default
+  return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+def load_config(env: Mapping[str, str] | None = None) -> AppConfig:
   """
   Loads from:
-  - env vars (preferred for CI / temporary usage)
+  - env vars (preferred for CI / temporary usage); `env` stands in for os.environ when given
   - config file at ~/.config/scrobble-cli/config.env (macOS will differ via platformdirs)
   """
   _maybe_migrate_legacy_config()
@@ -84,19 +167,47 @@ def load_config() -> AppConfig:
       k, v = line.split("=", 1)
       file_values.setdefault(k.strip(), v.strip())
 
+  environ = os.environ if env is None else env
+
   def get(name: str) -> str | None:
-    return os.environ.get(name) or file_values.get(name)
+    return environ.get(name) or file_values.get(name)
+
+  lastfm = LastFmConfig(
+    api_key=get("LASTFM_API_KEY"),
+    api_secret=get("LASTFM_API_SECRET"),
+    session_key=get("LASTFM_SESSION_KEY"),
+    username=get("LASTFM_USERNAME"),
+    max_in_flight=_int(get("LASTFM_MAX_IN_FLIGHT"), 2),
+    api_url=get("LASTFM_API_URL"),
+  )
+  accounts: dict[str, LastFmConfig] = {}
+  for key in sorted({*file_values, *environ}):
+    m = _ACCOUNT_KEY.match(key)
+    if m and m.group(2) == "SESSION_KEY" and get(key):
+      name = m.group(1).lower()
+      accounts[name] = replace(lastfm, session_key=get(key), username=get(account_key(name, "USERNAME")))
 
   return AppConfig(
-    lastfm=LastFmConfig(
-      api_key=get("LASTFM_API_KEY"),
-      api_secret=get("LASTFM_API_SECRET"),
-      session_key=get("LASTFM_SESSION_KEY"),
-      username=get("LASTFM_USERNAME"),
-    ),
+    lastfm=lastfm,
     discogs=DiscogsConfig(
       token=get("DISCOGS_TOKEN"),
+      requests_per_minute=_int(get("DISCOGS_REQUESTS_PER_MINUTE"), 60),
+      offline_index=_flag(get("DISCOGS_OFFLINE_INDEX"), True),
+      username=get("DISCOGS_USERNAME"),
+      collection=_flag(get("DISCOGS_COLLECTION"), True),
+      api_url=get("DISCOGS_API_URL"),
+    ),
+    cache=CacheConfig(
+      enabled=_flag(get("SCROBBLE_CACHE"), True),
+      max_bytes=_int(get("SCROBBLE_CACHE_MAX_MB"), 64) * 1024 * 1024,
+    ),
+    http=HttpConfig(
+      connect_timeout=_float(get("SCROBBLE_CONNECT_TIMEOUT"), 5.0),
+      read_timeout=_float(get("SCROBBLE_READ_TIMEOUT"), 30.0),
+      retries=_int(get("SCROBBLE_HTTP_RETRIES"), 3),
+      backoff=_float(get("SCROBBLE_HTTP_BACKOFF"), 0.5),
     ),
+    accounts=accounts,
   )
 
 
@@ -138,8 +249,23 @@ def config_summary(cfg: AppConfig) -> str:
       f"  LASTFM_API_SECRET={_mask(cfg.lastfm.api_secret)}",
       f"  LASTFM_SESSION_KEY={_mask(cfg.lastfm.session_key)}",
       f"  LASTFM_USERNAME={cfg.lastfm.username or ''}",
+      f"  LASTFM_MAX_IN_FLIGHT={cfg.lastfm.max_in_flight}",
+      *(f"  account {name}: {a.username or '?'} (session {_mask(a.session_key)})" for name, a in sorted(cfg.accounts.items())),
+      *([f"  LASTFM_API_URL={cfg.lastfm.api_url}"] if cfg.lastfm.api_url else []),
       "Discogs:",
       f"  DISCOGS_TOKEN={_mask(cfg.discogs.token)}",
+      f"  DISCOGS_REQUESTS_PER_MINUTE={cfg.discogs.requests_per_minute}",
+      f"  DISCOGS_OFFLINE_INDEX={'on' if cfg.discogs.offline_index else 'off'}",
+      f"  DISCOGS_USERNAME={cfg.discogs.username or ''}",
+      f"  DISCOGS_COLLECTION={'on' if cfg.discogs.collection else 'off'}",
+      *([f"  DISCOGS_API_URL={cfg.discogs.api_url}"] if cfg.discogs.api_url else []),
       f"  Config file={config_path()}",
+      "Cache:",
+      f"  SCROBBLE_CACHE={'on' if cfg.cache.enabled else 'off'}",
+      f"  SCROBBLE_CACHE_MAX_MB={cfg.cache.max_bytes // (1024 * 1024)}",
+      "HTTP:",
+      f"  SCROBBLE_CONNECT_TIMEOUT={cfg.http.connect_timeout:g}",
+      f"  SCROBBLE_READ_TIMEOUT={cfg.http.read_timeout:g}",
+      f"  SCROBBLE_HTTP_RETRIES={cfg.http.retries}",
     ]
   )
@@ -0,0 +1,678 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Protocol
+
+from scrobble_cli import trace
+from scrobble_cli.config import (
+  AppConfig,
+  CacheConfig,
+  DiscogsConfig,
+  HttpConfig,
+  LastFmConfig,
+  config_dir,
+  config_path,
+  load_config,
+)
+
+if TYPE_CHECKING:
+  from scrobble_cli.discogs import DiscogsRelease, DiscogsSearchResult
+  from scrobble_cli.lastfm import ScrobbleTrack
+  from scrobble_cli.outbox import FlushResult
+
+
+SOCKET_NAME = "scrobble.sock"
+
+# Discogs answers kept in daemon memory (on top of the on-disk response cache).
+MEMO_TTL_SECONDS = 10 * 60
+MEMO_MAX_ENTRIES = 1024
+
+CONNECT_TIMEOUT = 0.25
+CALL_TIMEOUT = 300.0
+
+
+def socket_path() -> Path:
+  return config_dir() / SOCKET_NAME
+
+
+class DaemonError(RuntimeError):
+  pass
+
+
+# --- wire format -------------------------------------------------------------
+#
+# The converters import discogs/lastfm/outbox when first used, so a client that only talks to the
+# daemon doesn't load them (or what they import) up front.
+
+# Environment variables `load_config` reads; a client sends its own so the daemon resolves the same
+# config it would.
+CONFIG_ENV_PREFIXES = ("LASTFM_", "DISCOGS_", "SCROBBLE_")
+
+
+def _client_env() -> dict[str, str]:
+  return {k: v for k, v in os.environ.items() if k.startswith(CONFIG_ENV_PREFIXES)}
+
+
+def _result_from_dict(d: dict) -> DiscogsSearchResult:
+  from scrobble_cli.discogs import DiscogsSearchResult
+
+  return DiscogsSearchResult(**d)
+
+
+def _flush_to_dict(result: FlushResult) -> dict:
+  return {
+    "outcomes": {str(k): asdict(v) for k, v in result.outcomes.items()},
+    "errors": result.errors,
+    "remaining": result.remaining,
+  }
+
+
+def _flush_from_dict(res: dict) -> FlushResult:
+  from scrobble_cli.lastfm import ScrobbleOutcome
+  from scrobble_cli.outbox import FlushResult
+
+  return FlushResult(
+    outcomes={int(k): ScrobbleOutcome(**v) for k, v in res["outcomes"].items()},
+    errors=list(res["errors"]),
+    remaining=int(res["remaining"]),
+  )
+
+
+def _release_from_dict(d: dict) -> DiscogsRelease:
+  from scrobble_cli.discogs import DiscogsRelease, DiscogsTrack
+
+  return DiscogsRelease(**{**d, "tracks": [DiscogsTrack(**t) for t in d["tracks"]]})
+
+
+def _tracks_from_dicts(items: list[dict]) -> list[ScrobbleTrack]:
+  from scrobble_cli.lastfm import ScrobbleTrack
+
+  return [ScrobbleTrack(**t) for t in items]
+
+
+def _config_from_dict(d: dict) -> AppConfig:
+  return AppConfig(
+    lastfm=LastFmConfig(**d["lastfm"]),
+    discogs=DiscogsConfig(**d["discogs"]),
+    cache=CacheConfig(**d["cache"]),
+    http=HttpConfig(**d["http"]),
+    accounts={name: LastFmConfig(**a) for name, a in (d.get("accounts") or {}).items()},
+  )
+
+
+def _discogs_key(cfg: AppConfig) -> str:
+  """Tells apart Discogs settings (token, API URL, collection, index) in memo keys."""
+  return hashlib.sha256(json.dumps(asdict(cfg.discogs), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# --- server ------------------------------------------------------------------
+
+
+class _Service:
+  """
+  Request handlers for the daemon. Keeps the HTTP pools (via `transport`) and recent Discogs
+  answers warm, and merges identical concurrent Discogs requests into one. Each request runs with
+  the config its client sent or resolved from the client's environment, falling back to the
+  daemon's own.
+  """
+
+  def __init__(self):
+    self._cfg_lock = threading.Lock()
+    self._cfg_mtime: float | None = None
+    self._cfgs: dict[str, AppConfig] = {}
+    self._memo: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+    self._inflight: dict[str, Future] = {}
+    self._memo_lock = threading.Lock()
+
+  def cfg(self, env: dict[str, str] | None = None) -> AppConfig:
+    """
+    The config for a client environment (the daemon's own without one), re-read only when
+    config.env changes.
+    """
+    try:
+      mtime = config_path().stat().st_mtime
+    except OSError:
+      mtime = None
+    key = "" if env is None else json.dumps(env, sort_keys=True)
+    with self._cfg_lock:
+      if mtime != self._cfg_mtime:
+        self._cfgs.clear()
+        self._cfg_mtime = mtime
+      cfg = self._cfgs.get(key)
+      if cfg is None:
+        cfg = self._cfgs[key] = load_config(env)
+      return cfg
+
+  def _shared(self, key: str, fn: Callable[[], Any]) -> Any:
+    now = time.time()
+    with self._memo_lock:
+      hit = self._memo.get(key)
+      if hit is not None and hit[0] > now:
+        self._memo.move_to_end(key)
+        return hit[1]
+      fut = self._inflight.get(key)
+      owner = fut is None
+      if owner:
+        fut = self._inflight[key] = Future()
+    if not owner:
+      return fut.result()
+
+    try:
+      value = fn()
+    except BaseException as e:
+      with self._memo_lock:
+        self._inflight.pop(key, None)
+      fut.set_exception(e)
+      raise
+    with self._memo_lock:
+      self._inflight.pop(key, None)
+      self._memo[key] = (time.time() + MEMO_TTL_SECONDS, value)
+      while len(self._memo) > MEMO_MAX_ENTRIES:
+        self._memo.popitem(last=False)
+    fut.set_result(value)
+    return value
+
+  def ping(self, cfg: AppConfig) -> dict:
+    return {"pid": os.getpid()}
+
+  def search(
+    self,
+    cfg: AppConfig,
+    *,
+    query: str,
+    vinyl_only: bool,
+    limit: int,
+    speculative: bool = False,
+    until_confident: bool = False,
+  ) -> list[dict]:
+    from scrobble_cli.discogs import search_query
+
+    key = json.dumps(["search", _discogs_key(cfg), query.strip().lower(), vinyl_only, limit, until_confident])
+    results = self._shared(
+      key,
+      lambda: search_query(
+        cfg,
+        query=query,
+        vinyl_only=vinyl_only,
+        limit=limit,
+        speculative=speculative,
+        until_confident=until_confident,
+      ),
+    )
+    return [asdict(r) for r in results]
+
+  def lookup(
+    self,
+    cfg: AppConfig,
+    *,
+    barcode: str | None = None,
+    catno: str | None = None,
+    query: str = "",
+    vinyl_only: bool,
+    limit: int,
+  ) -> dict:
+    from scrobble_cli.discogs import lookup_identifier
+
+    key = json.dumps(["lookup", _discogs_key(cfg), barcode, catno, query.strip().lower(), vinyl_only, limit])
+    match, results = self._shared(
+      key,
+      lambda: lookup_identifier(
+        cfg, barcode=barcode, catno=catno, query=query, vinyl_only=vinyl_only, limit=limit
+      ),
+    )
+    return {"match": asdict(match) if match else None, "results": [asdict(r) for r in results]}
+
+  def fetch(self, cfg: AppConfig, *, kind: str, id: int) -> dict:
+    from scrobble_cli.discogs import fetch_release
+
+    release = self._shared(json.dumps(["fetch", _discogs_key(cfg), kind, id]), lambda: fetch_release(cfg, kind=kind, id=id))
+    return asdict(release)
+
+  def enrich(self, cfg: AppConfig, *, release: dict) -> dict:
+    from scrobble_cli.discogs import enrich_durations
+
+    r = _release_from_dict(release)
+    enriched = self._shared(json.dumps(["enrich", _discogs_key(cfg), r.kind, r.id]), lambda: enrich_durations(cfg, r))
+    return asdict(enriched)
+
+  def plan(self, cfg: AppConfig, *, kind: str, id: int, mode: str, at: int) -> dict:
+    """Fetches and enriches a release and times its tracks: what `scrobble album` submits."""
+    from scrobble_cli.plan import plan_scrobbles
+
+    release = self.enrich(cfg, release=self.fetch(cfg, kind=kind, id=id))
+    tracks = plan_scrobbles(_release_from_dict(release), mode=mode, at=at)
+    return {"release": release, "tracks": [asdict(t) for t in tracks]}
+
+  def scrobble(self, cfg: AppConfig, *, tracks: list[dict]) -> dict:
+    from scrobble_cli.outbox import get_outbox
+
+    outbox = get_outbox()
+    return _flush_to_dict(outbox.flush(cfg, ids=outbox.enqueue(_tracks_from_dicts(tracks))))
+
+  def scrobble_accounts(self, cfg: AppConfig, *, tracks: list[dict], accounts: list[str]) -> dict:
+    from scrobble_cli.outbox import scrobble_accounts
+
+    results = scrobble_accounts(cfg, _tracks_from_dicts(tracks), accounts)
+    return {name: _flush_to_dict(r) for name, r in results.items()}
+
+  def dispatch(self, method: str, params: dict, cfg: AppConfig | None = None) -> Any:
+    handler = {
+      "ping": self.ping,
+      "search": self.search,
+      "lookup": self.lookup,
+      "fetch": self.fetch,
+      "enrich": self.enrich,
+      "plan": self.plan,
+      "scrobble": self.scrobble,
+      "scrobble_accounts": self.scrobble_accounts,
+    }.get(method)
+    if handler is None:
+      raise DaemonError(f"unknown method {method!r}")
+    return handler(cfg or self.cfg(), **params)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+  """
+  Owns one client connection on its own thread. Each request line is handed to the worker pool on
+  its own, so an idle connection (a picker waiting on the user, an open `scan`) holds no worker and
+  one client can have several requests running at once. Replies carry the request's id and are
+  written as each finishes.
+
+  A "config" request sets the config later requests on the connection run with: either a whole
+  config, or the client's environment to resolve one from (the reply then carries the result). It
+  is answered right away, in order.
+
+  A request with "trace" set is run under `trace.collect` and its spans come back with the reply.
+  """
+
+  server: "_Server"
+
+  def setup(self) -> None:
+    super().setup()
+    self._write_lock = threading.Lock()
+    self._cfg: AppConfig | None = None
+
+  def handle(self) -> None:
+    pending: list[Future] = []
+    try:
+      for raw in self.rfile:
+        if not raw.strip():
+          continue
+        try:
+          req = json.loads(raw)
+        except ValueError as e:
+          self._reply(None, {"ok": False, "error": f"bad request: {e}"})
+          continue
+        if req.get("method") == "config":
+          params = dict(req.get("params") or {})
+          try:
+            if "env" in params:
+              self._cfg = self.server.service.cfg({str(k): str(v) for k, v in dict(params["env"]).items()})
+              reply = {"ok": True, "result": asdict(self._cfg)}
+            else:
+              self._cfg = _config_from_dict(dict(params["config"]))
+              reply = {"ok": True, "result": None}
+          except (KeyError, TypeError, ValueError) as e:
+            reply = {"ok": False, "error": f"bad config: {e}"}
+          self._reply(req.get("id"), reply)
+          continue
+        pending = [f for f in pending if not f.done()]
+        pending.append(self.server.pool.submit(self._answer, req, self._cfg))
+    finally:
+      # Let running requests write their replies before the connection is closed.
+      wait(pending)
+
+  def _answer(self, req: dict, cfg: AppConfig | None) -> None:
+    if not req.get("trace"):
+      self._reply(req.get("id"), self._run(req, cfg))
+      return
+    with trace.collect() as recorder:
+      reply = self._run(req, cfg)
+    self._reply(req.get("id"), {**reply, "spans": recorder.to_wire()})
+
+  def _run(self, req: dict, cfg: AppConfig | None) -> dict:
+    try:
+      result = self.server.service.dispatch(str(req.get("method")), dict(req.get("params") or {}), cfg)
+      return {"ok": True, "result": result}
+    except Exception as e:
+      return {"ok": False, "error": str(e) or type(e).__name__}
+
+  def _reply(self, id: Any, reply: dict) -> None:
+    line = json.dumps({"id": id, **reply}).encode("utf-8") + b"\n"
+    with self._write_lock:
+      try:
+        self.wfile.write(line)
+        self.wfile.flush()
+      except OSError:
+        pass  # the client went away
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """Unix-socket server: a thread reads each connection, a bounded worker pool runs the requests."""
+
+  request_queue_size = 128
+  daemon_threads = True
+
+  def __init__(self, path: str, workers: int):
+    self.service = _Service()
+    self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrobble-serve")
+    super().__init__(path, _Handler)
+
+  def server_close(self) -> None:
+    super().server_close()
+    self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _interrupt(signum, frame) -> None:
+  raise KeyboardInterrupt
+
+
+def serve(*, workers: int, on_ready: Callable[[Path], None] | None = None) -> None:
+  path = socket_path()
+  path.parent.mkdir(parents=True, exist_ok=True)
+  if path.exists():
+    if ping():
+      raise DaemonError(f"A daemon is already listening on {path}.")
+    path.unlink()
+
+  # Created owner-only: a chmod after bind would leave a window where other users could connect.
+  umask = os.umask(0o177)
+  try:
+    server = _Server(str(path), workers)
+  finally:
+    os.umask(umask)
+  signal.signal(signal.SIGTERM, _interrupt)
+  try:
+    if on_ready:
+      on_ready(path)
+    server.serve_forever()
+  finally:
+    server.server_close()
+    try:
+      path.unlink()
+    except FileNotFoundError:
+      pass
+
+
+# --- client ------------------------------------------------------------------
+
+
+class _Client:
+  """
+  One connection to the daemon, shared by the CLI's threads. Requests are pipelined with ids and
+  a reader thread hands each reply to its caller, so concurrent calls (the picker's prefetches)
+  run side by side in the daemon instead of queueing behind one another. While tracing is on, the
+  daemon's spans for each call are added to this process's trace.
+  """
+
+  def __init__(self, sock: socket.socket):
+    self._sock = sock
+    self._file = sock.makefile("rwb")
+    self._write_lock = threading.Lock()
+    self._pending: dict[int, Future] = {}
+    self._pending_lock = threading.Lock()
+    self._ids = itertools.count(1)
+    self._broken: DaemonError | None = None
+    threading.Thread(target=self._read, name="scrobble-daemon-client", daemon=True).start()
+
+  def _read(self) -> None:
+    try:
+      for line in self._file:
+        reply = json.loads(line)
+        with self._pending_lock:
+          fut = self._pending.pop(reply.get("id"), None)
+        if fut is not None:
+          fut.set_result(reply)
+      error = DaemonError("daemon closed the connection")
+    except (OSError, ValueError) as e:
+      error = DaemonError(f"daemon connection failed: {e}")
+    with self._pending_lock:
+      self._broken = error
+      waiting = list(self._pending.values())
+      self._pending.clear()
+    for fut in waiting:
+      fut.set_exception(error)
+
+  def call(self, method: str, **params: Any) -> Any:
+    with trace.span(f"daemon.{method}"):
+      fut: Future = Future()
+      with self._pending_lock:
+        if self._broken is not None:
+          raise self._broken
+        id = next(self._ids)
+        self._pending[id] = fut
+      req: dict[str, Any] = {"id": id, "method": method, "params": params}
+      if trace.enabled():
+        req["trace"] = True
+      line = json.dumps(req).encode("utf-8") + b"\n"
+      sent = time.perf_counter()
+      try:
+        with self._write_lock:
+          self._file.write(line)
+          self._file.flush()
+        reply = fut.result(timeout=CALL_TIMEOUT)
+      except (OSError, FutureTimeout) as e:
+        with self._pending_lock:
+          self._pending.pop(id, None)
+        raise DaemonError(f"daemon didn't answer {method}: {e or type(e).__name__}") from e
+      if reply.get("spans"):
+        trace.merge(reply["spans"], sent)
+    if not reply.get("ok"):
+      raise RuntimeError(reply.get("error") or "daemon error")
+    return reply.get("result")
+
+  def close(self) -> None:
+    try:
+      self._sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self._file.close()
+    self._sock.close()
+
+
+def connect(cfg: AppConfig | None = None) -> _Client | None:
+  """
+  A client for the running daemon, or None when none is listening. With `cfg`, the daemon runs this
+  client's requests with it (so env overrides apply as they would in-process); a daemon that can't
+  take it isn't used.
+  """
+  if os.environ.get("SCROBBLE_DAEMON", "").strip().lower() in ("0", "false", "no", "off"):
+    return None
+  path = socket_path()
+  if not path.exists():
+    return None
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.settimeout(CONNECT_TIMEOUT)
+  try:
+    sock.connect(str(path))
+  except OSError:
+    sock.close()
+    return None
+  # Blocking from here on: the reader thread waits for replies, and `call` applies CALL_TIMEOUT.
+  sock.settimeout(None)
+  client = _Client(sock)
+  if cfg is not None:
+    try:
+      client.call("config", config=asdict(cfg))
+    except (OSError, RuntimeError):
+      client.close()
+      return None
+  return client
+
+
+def attach() -> tuple[AppConfig, RemoteBackend] | None:
+  """
+  The running daemon, with the config it resolved from this process's environment, or None when
+  none is listening. Commands that start with this don't read config.env themselves.
+  """
+  client = connect()
+  if client is None:
+    return None
+  try:
+    cfg = _config_from_dict(client.call("config", env=_client_env()))
+  except (OSError, RuntimeError, KeyError, TypeError):
+    client.close()
+    return None
+  return cfg, RemoteBackend(client)
+
+
+def ping() -> bool:
+  client = connect()
+  if client is None:
+    return False
+  try:
+    client.call("ping")
+    return True
+  except (OSError, DaemonError):
+    return False
+  finally:
+    client.close()
+
+
+# --- backends used by the CLI ------------------------------------------------
+
+
+class Backend(Protocol):
+  remote: bool
+
+  def search_query(
+    self, *, query: str, vinyl_only: bool, limit: int, speculative: bool = False, until_confident: bool = False
+  ) -> list[DiscogsSearchResult]: ...
+
+  def lookup_identifier(
+    self, *, barcode: str | None = None, catno: str | None = None, query: str = "", vinyl_only: bool, limit: int
+  ) -> tuple[DiscogsSearchResult | None, list[DiscogsSearchResult]]: ...
+
+  def fetch_release(self, *, kind: str, id: int) -> DiscogsRelease: ...
+
+  def enrich_durations(self, release: DiscogsRelease) -> DiscogsRelease: ...
+
+  def plan(self, *, kind: str, id: int, mode: str, at: int) -> tuple[DiscogsRelease, list[ScrobbleTrack]]: ...
+
+  def scrobble(self, tracks: list[ScrobbleTrack]) -> FlushResult: ...
+
+  def scrobble_accounts(self, tracks: list[ScrobbleTrack], accounts: list[str]) -> dict[str, FlushResult]: ...
+
+
+class LocalBackend:
+  remote = False
+
+  def __init__(self, cfg: AppConfig):
+    self.cfg = cfg
+
+  def search_query(
+    self, *, query: str, vinyl_only: bool, limit: int, speculative: bool = False, until_confident: bool = False
+  ):
+    from scrobble_cli.discogs import search_query
+
+    return search_query(
+      self.cfg,
+      query=query,
+      vinyl_only=vinyl_only,
+      limit=limit,
+      speculative=speculative,
+      until_confident=until_confident,
+    )
+
+  def lookup_identifier(
+    self, *, barcode: str | None = None, catno: str | None = None, query: str = "", vinyl_only: bool, limit: int
+  ):
+    from scrobble_cli.discogs import lookup_identifier
+
+    return lookup_identifier(self.cfg, barcode=barcode, catno=catno, query=query, vinyl_only=vinyl_only, limit=limit)
+
+  def fetch_release(self, *, kind: str, id: int):
+    from scrobble_cli.discogs import fetch_release
+
+    return fetch_release(self.cfg, kind=kind, id=id)
+
+  def enrich_durations(self, release: DiscogsRelease):
+    from scrobble_cli.discogs import enrich_durations
+
+    return enrich_durations(self.cfg, release)
+
+  def plan(self, *, kind: str, id: int, mode: str, at: int):
+    from scrobble_cli.plan import plan_scrobbles
+
+    release = self.enrich_durations(self.fetch_release(kind=kind, id=id))
+    return release, plan_scrobbles(release, mode=mode, at=at)
+
+  def scrobble(self, tracks: list[ScrobbleTrack]):
+    from scrobble_cli.outbox import get_outbox
+
+    outbox = get_outbox()
+    return outbox.flush(self.cfg, ids=outbox.enqueue(tracks))
+
+  def scrobble_accounts(self, tracks: list[ScrobbleTrack], accounts: list[str]):
+    from scrobble_cli.outbox import scrobble_accounts
+
+    return scrobble_accounts(self.cfg, tracks, accounts)
+
+
+class RemoteBackend:
+  remote = True
+
+  def __init__(self, client: _Client):
+    self.client = client
+
+  def search_query(
+    self, *, query: str, vinyl_only: bool, limit: int, speculative: bool = False, until_confident: bool = False
+  ):
+    items = self.client.call(
+      "search",
+      query=query,
+      vinyl_only=vinyl_only,
+      limit=limit,
+      speculative=speculative,
+      until_confident=until_confident,
+    )
+    return [_result_from_dict(d) for d in items]
+
+  def lookup_identifier(
+    self, *, barcode: str | None = None, catno: str | None = None, query: str = "", vinyl_only: bool, limit: int
+  ):
+    res = self.client.call(
+      "lookup", barcode=barcode, catno=catno, query=query, vinyl_only=vinyl_only, limit=limit
+    )
+    match = res.get("match")
+    return (_result_from_dict(match) if match else None), [_result_from_dict(d) for d in res.get("results") or []]
+
+  def fetch_release(self, *, kind: str, id: int):
+    return _release_from_dict(self.client.call("fetch", kind=kind, id=id))
+
+  def enrich_durations(self, release: DiscogsRelease):
+    if all(t.duration_seconds for t in release.tracks):
+      return release
+    return _release_from_dict(self.client.call("enrich", release=asdict(release)))
+
+  def plan(self, *, kind: str, id: int, mode: str, at: int):
+    res = self.client.call("plan", kind=kind, id=id, mode=mode, at=at)
+    return _release_from_dict(res["release"]), _tracks_from_dicts(res["tracks"])
+
+  def scrobble(self, tracks: list[ScrobbleTrack]):
+    return _flush_from_dict(self.client.call("scrobble", tracks=[asdict(t) for t in tracks]))
+
+  def scrobble_accounts(self, tracks: list[ScrobbleTrack], accounts: list[str]):
+    res = self.client.call("scrobble_accounts", tracks=[asdict(t) for t in tracks], accounts=accounts)
+    return {name: _flush_from_dict(r) for name, r in res.items()}
+
+
+def backend(cfg: AppConfig) -> Backend:
+  """The running daemon if there is one, otherwise in-process calls."""
+  client = connect(cfg)
+  if client is not None:
+    return RemoteBackend(client)
+  return LocalBackend(cfg)
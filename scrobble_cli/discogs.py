@@ -1,15 +1,35 @@
 from __future__ import annotations
 
 import re
-from dataclasses import dataclass
-
-import requests
-
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Iterator, TypeVar
+
+from scrobble_cli import flow, metrics, trace, transport
+from scrobble_cli.cache import RELEASE_TTL, cache_key, get_cache, ttl_for
 from scrobble_cli.config import AppConfig
+from scrobble_cli.flow import Flow
+from scrobble_cli.ratelimit import discogs_bucket
 
 
 DISCOGS_API = "https://api.discogs.com"
 
+# With --speculative, the release search is only sent if masters haven't answered within this long.
+SPECULATION_DELAY_SECONDS = 0.25
+
+# A search that isn't confident after its first page reads up to this many pages in total.
+SEARCH_MAX_PAGES = 4
+
+# Missing track durations are filled in from other pressings of the same master, within a budget of
+# Discogs requests (the master lookup, the versions list and the pressings) and a deadline.
+ENRICH_MAX_REQUESTS = 8
+ENRICH_WORKERS = 4
+ENRICH_DEADLINE_SECONDS = 1.5
+
+R = TypeVar("R")
+
 
 def _duration_to_seconds(duration: str) -> int | None:
   if not duration:
@@ -71,7 +91,7 @@ class DiscogsRelease:
 
 def _headers(cfg: AppConfig) -> dict[str, str]:
   h = {
-    "User-Agent": "scrobble-cli/0.1.0",
+    "User-Agent": transport.USER_AGENT,
     "Accept": "application/json",
   }
   if cfg.discogs.token:
@@ -79,63 +99,500 @@ def _headers(cfg: AppConfig) -> dict[str, str]:
   return h
 
 
-def _get(cfg: AppConfig, path: str, params: dict | None = None) -> dict:
+def _endpoint(path: str) -> str:
+  """A low-cardinality name for a Discogs path (the metrics label)."""
+  if path.startswith("/database/search"):
+    return "search"
+  if path.startswith("/masters/"):
+    return "versions" if path.endswith("/versions") else "master"
+  if path.startswith("/releases/"):
+    return "release"
+  if path.startswith("/users/"):
+    return "collection"
+  return "other"
+
+
+def _cache_key(cfg: AppConfig, path: str, params: dict | None = None) -> str:
+  """Keys responses by API URL, and collection listings (which depend on the token) by token too."""
+  user = cfg.discogs.token if path.startswith("/users/") else None
+  return cache_key(path, params, base=cfg.discogs.api_url or DISCOGS_API, user=user)
+
+
+def _get(cfg: AppConfig, path: str, params: dict | None = None, *, deadline: float | None = None) -> dict:
+  return flow.run(_get_flow(cfg, path, params, deadline=deadline))
+
+
+async def _aget(cfg: AppConfig, path: str, params: dict | None = None) -> dict:
+  return await flow.arun(_get_flow(cfg, path, params))
+
+
+@dataclass(frozen=True)
+class _Get:
+  """A Discogs GET as a flow step: `_get` for the sync API, `_aget` for `scrobble_cli.aio`."""
+
+  cfg: AppConfig
+  path: str
+  params: dict | None = None
+
+  def run(self) -> dict:
+    return _get(self.cfg, self.path, self.params)
+
+  async def arun(self) -> dict:
+    return await _aget(self.cfg, self.path, self.params)
+
+
+def _get_flow(cfg: AppConfig, path: str, params: dict | None, *, deadline: float | None = None) -> Flow[dict]:
   if not cfg.discogs.token:
     raise RuntimeError("Missing Discogs token. Set DISCOGS_TOKEN or run `scrobble auth discogs`.")
-  url = f"{DISCOGS_API}{path}"
-  r = requests.get(url, headers=_headers(cfg), params=params, timeout=30)
-  r.raise_for_status()
-  return r.json()
+  started = time.perf_counter()
+  result = "error"
+  try:
+    data, result = yield from _get_json_flow(cfg, path, params, deadline=deadline)
+    return data
+  finally:
+    metrics.observe("discogs_request_seconds", time.perf_counter() - started, endpoint=_endpoint(path), result=result)
+
+
+def _get_json(cfg: AppConfig, path: str, params: dict | None, *, deadline: float | None = None) -> tuple[dict, str]:
+  """The response body and where it came from: "hit", "revalidated", "miss" or "off" (no cache)."""
+  return flow.run(_get_json_flow(cfg, path, params, deadline=deadline))
+
+
+def _get_json_flow(
+  cfg: AppConfig, path: str, params: dict | None, *, deadline: float | None = None
+) -> Flow[tuple[dict, str]]:
+  with trace.span("discogs.get", path=path) as s:
+    url = f"{(cfg.discogs.api_url or DISCOGS_API).rstrip('/')}{path}"
+    headers = _headers(cfg)
+    limiter = discogs_bucket(cfg.discogs.requests_per_minute)
+
+    cache = get_cache(cfg.cache.max_bytes) if cfg.cache.enabled else None
+    key = _cache_key(cfg, path, params)
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+      if cached.fresh:
+        if s:
+          s.set(cache="hit")
+        return cached.body, "hit"
+      if cached.etag:
+        headers["If-None-Match"] = cached.etag
+      if cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
+
+    r = yield transport.Call("GET", url, cfg.http, headers=headers, params=params, limiter=limiter, deadline=deadline)
+    if r.status_code == 304 and cached is not None:
+      if not cache.refresh(key, ttl=ttl_for(path)):
+        cache.put(key, cached.body, ttl=ttl_for(path), etag=cached.etag, last_modified=cached.last_modified)
+      if s:
+        s.set(cache="revalidated")
+      return cached.body, "revalidated"
+    if r.status_code == 304:
+      # Not Modified, but there is nothing here it could refer to: ask again without validators.
+      r = yield transport.Call("GET", url, cfg.http, headers=_headers(cfg), params=params, limiter=limiter, deadline=deadline)
+      if r.status_code == 304:
+        raise RuntimeError(f"Discogs answered 304 Not Modified to an unconditional request for {path}")
+    r.raise_for_status()
+    with trace.span("discogs.json"):
+      data = r.json()
+    result = "miss" if cache is not None else "off"
+    if s:
+      s.set(cache=result)
+    if cache is not None:
+      cache.put(
+        key,
+        data,
+        ttl=ttl_for(path),
+        etag=r.headers.get("ETag"),
+        last_modified=r.headers.get("Last-Modified"),
+      )
+    return data, result
 
 
-def search(cfg: AppConfig, *, artist: str, album: str, vinyl_only: bool, limit: int) -> list[DiscogsSearchResult]:
+def _search_params(*, artist: str, album: str, vinyl_only: bool, limit: int) -> dict[str, str | int]:
   q = f"{artist} {album}".strip()
   base: dict[str, str | int] = {"q": q, "per_page": limit, "page": 1}
   if vinyl_only:
     base["format"] = "Vinyl"
+  return base
 
-  def run(kind: str) -> list[DiscogsSearchResult]:
-    params = dict(base)
-    params["type"] = kind
-    data = _get(cfg, "/database/search", params=params)
-    out: list[DiscogsSearchResult] = []
-    for item in data.get("results") or []:
-      item_kind = item.get("type")
-      if item_kind not in ("master", "release"):
-        continue
-      fmt = None
-      if isinstance(item.get("format"), list) and item.get("format"):
-        fmt = ", ".join(item["format"])
-
-      label = None
-      if isinstance(item.get("label"), list) and item.get("label"):
-        label = item["label"][0]
-
-      out.append(
-        DiscogsSearchResult(
-          id=int(item["id"]),
-          kind=item_kind,
-          title=str(item.get("title") or ""),
-          year=int(item["year"]) if item.get("year") else None,
-          country=str(item["country"]) if item.get("country") else None,
-          label=label,
-          catno=str(item.get("catno")) if item.get("catno") else None,
-          format=fmt,
-        )
-      )
-    return out
 
-  results = run("master")
+def _parse_search(data: dict) -> list[DiscogsSearchResult]:
+  return list(_iter_parse_search(data))
+
+
+def _iter_parse_search(data: dict) -> Iterator[DiscogsSearchResult]:
+  for item in data.get("results") or []:
+    item_kind = item.get("type")
+    if item_kind not in ("master", "release"):
+      continue
+    fmt = None
+    if isinstance(item.get("format"), list) and item.get("format"):
+      fmt = ", ".join(item["format"])
+
+    label = None
+    if isinstance(item.get("label"), list) and item.get("label"):
+      label = item["label"][0]
+
+    yield DiscogsSearchResult(
+      id=int(item["id"]),
+      kind=item_kind,
+      title=str(item.get("title") or ""),
+      year=int(item["year"]) if item.get("year") else None,
+      country=str(item["country"]) if item.get("country") else None,
+      label=label,
+      catno=str(item.get("catno")) if item.get("catno") else None,
+      format=fmt,
+    )
+
+
+def _collection_search(cfg: AppConfig, base: dict[str, str | int]) -> list[DiscogsSearchResult]:
+  if not cfg.discogs.collection:
+    return []
+  from scrobble_cli import collection  # collection imports this module for `_get` and the dataclasses
+
+  return collection.search(str(base["q"]), vinyl_only="format" in base, limit=int(base["per_page"]))
+
+
+def _collection_release(cfg: AppConfig, kind: str, id: int) -> DiscogsRelease | None:
+  if not cfg.discogs.collection or kind != "release":
+    return None
+  from scrobble_cli import collection
+
+  return collection.fetch_release(id)
+
+
+def _offline_search(cfg: AppConfig, base: dict[str, str | int]) -> list[DiscogsSearchResult]:
+  if not cfg.discogs.offline_index:
+    return []
+  from scrobble_cli import index  # index imports this module for the dataclasses
+
+  return index.search(str(base["q"]), vinyl_only="format" in base, limit=int(base["per_page"]))
+
+
+def _offline_release(cfg: AppConfig, kind: str, id: int) -> DiscogsRelease | None:
+  if not cfg.discogs.offline_index:
+    return None
+  from scrobble_cli import index
+
+  return index.fetch_release(kind=kind, id=id)
+
+
+def _timed(timings: dict[str, float] | None, name: str, fn: Callable[[], R]) -> R:
+  started = time.perf_counter()
+  try:
+    with trace.span(f"search.{name}"):
+      return fn()
+  finally:
+    if timings is not None:
+      timings[name] = time.perf_counter() - started
+
+
+def speculation_affordable(cfg: AppConfig) -> bool:
+  """Speculating spends a second request; only do it when the shared bucket has room for both."""
+  return discogs_bucket(cfg.discogs.requests_per_minute).available() >= 2
+
+
+def search(
+  cfg: AppConfig,
+  *,
+  artist: str,
+  album: str,
+  vinyl_only: bool,
+  limit: int,
+  speculative: bool = False,
+  until_confident: bool = False,
+  timings: dict[str, float] | None = None,
+) -> list[DiscogsSearchResult]:
+  """
+  Searches masters first and falls back to releases when there are none.
+
+  With `until_confident=True`, each result is scored as it is parsed and further pages are read
+  (see `_collect_flow`) until the best so far would be auto-picked; if that collected more than
+  `limit`, the best `limit` are returned in ranked order. Otherwise only the first page is read.
+
+  With `speculative=True` the release query is also sent when masters haven't answered within
+  `SPECULATION_DELAY_SECONDS`, so a slow master miss doesn't cost a second full round trip. A quick
+  master answer (the usual case) spends nothing extra; once sent, the release request runs to
+  completion and its answer is discarded if masters were found. Falls back to the sequential path
+  when the rate-limit budget is tight. Per-query seconds go into `timings`.
+
+  Records you own (synced by `scrobble collection sync`) are matched first: an owned record that
+  would be auto-picked is returned without touching the network. Looser owned hits are ranked
+  together with the results of the usual search (the local index built by `scrobble index build`,
+  then the API), so a partial match on something you own can't hide the album asked for.
+  """
+  return flow.run(
+    _search_flow(
+      cfg,
+      artist=artist,
+      album=album,
+      vinyl_only=vinyl_only,
+      limit=limit,
+      speculative=speculative,
+      until_confident=until_confident,
+      timings=timings,
+    )
+  )
+
+
+def _search_flow(
+  cfg: AppConfig,
+  *,
+  artist: str,
+  album: str,
+  vinyl_only: bool,
+  limit: int,
+  speculative: bool,
+  until_confident: bool,
+  timings: dict[str, float] | None,
+) -> Flow[list[DiscogsSearchResult]]:
+  base = _search_params(artist=artist, album=album, vinyl_only=vinyl_only, limit=limit)
+  owned = _timed(timings, "collection", lambda: _collection_search(cfg, base))
+  if not owned:
+    return (yield from _search_remote_flow(cfg, base, speculative=speculative, until_confident=until_confident, timings=timings))
+
+  from scrobble_cli.matching import AUTO_PICK_CONFIDENCE, rank
+
+  def ranked(results: list[DiscogsSearchResult]) -> list[DiscogsSearchResult]:
+    found = rank(results, query=str(base["q"]), artist=artist, album=album or None, vinyl_only=vinyl_only, limit=limit)
+    return [r.result for r in found]
+
+  best = rank(owned, query=str(base["q"]), artist=artist, album=album or None, vinyl_only=vinyl_only, limit=1)
+  if best[0].confidence >= AUTO_PICK_CONFIDENCE:
+    return ranked(owned)
+  mine = {(r.kind, r.id) for r in owned}
+  remote = yield from _search_remote_flow(cfg, base, speculative=speculative, until_confident=until_confident, timings=timings)
+  return ranked(owned + [r for r in remote if (r.kind, r.id) not in mine])
+
+
+def _first_page_flow(
+  cfg: AppConfig, base: dict[str, str | int], kind: str, timings: dict[str, float] | None
+) -> Flow[dict]:
+  started = time.perf_counter()
+  try:
+    with trace.span(f"search.{kind}"):
+      return (yield _Get(cfg, "/database/search", {**base, "type": kind}))
+  finally:
+    if timings is not None:
+      timings[kind] = time.perf_counter() - started
+
+
+@dataclass(frozen=True)
+class _Speculate:
+  """
+  Runs the `masters` flow, and the `releases` one too if masters haven't answered within
+  `SPECULATION_DELAY_SECONDS` and the budget allows. Returns the masters' page, and the releases'
+  page if it was sent and masters found nothing.
+  """
+
+  cfg: AppConfig
+  masters: Flow[dict]
+  releases: Flow[dict]
+
+  def run(self) -> tuple[dict, dict | None]:
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="discogs-search")
+    try:
+      masters = pool.submit(trace.bind(flow.run), self.masters)
+      done, _ = wait([masters], timeout=SPECULATION_DELAY_SECONDS)
+      releases = pool.submit(trace.bind(flow.run), self.releases) if not done and speculation_affordable(self.cfg) else None
+      data = masters.result()
+      if data.get("results") or releases is None:
+        return data, None
+      return data, releases.result()
+    finally:
+      pool.shutdown(wait=False)
+
+  async def arun(self) -> tuple[dict, dict | None]:
+    import asyncio
+
+    masters = asyncio.ensure_future(flow.arun(self.masters))
+    done, _ = await asyncio.wait([masters], timeout=SPECULATION_DELAY_SECONDS)
+    releases = None
+    if not done and speculation_affordable(self.cfg):
+      releases = asyncio.ensure_future(flow.arun(self.releases))
+      # Nobody may read its answer; don't let an error in it be reported as never retrieved.
+      releases.add_done_callback(lambda f: f.cancelled() or f.exception())
+    data = await masters
+    if data.get("results") or releases is None:
+      return data, None
+    return data, await releases
+
+
+def _search_remote_flow(
+  cfg: AppConfig,
+  base: dict[str, str | int],
+  *,
+  speculative: bool,
+  until_confident: bool,
+  timings: dict[str, float] | None,
+) -> Flow[list[DiscogsSearchResult]]:
+  """`search` past the collection: the offline index if it has a match, otherwise the API."""
+  local = _timed(timings, "index", lambda: _offline_search(cfg, base))
+  if local:
+    return local
+
+  if speculative and speculation_affordable(cfg):
+    masters, releases = yield _Speculate(
+      cfg, _first_page_flow(cfg, base, "master", timings), _first_page_flow(cfg, base, "release", timings)
+    )
+    if masters.get("results"):
+      return (yield from _collect_flow(cfg, base, "master", masters, until_confident=until_confident))
+    if releases is None:
+      releases = yield from _first_page_flow(cfg, base, "release", timings)
+    return (yield from _collect_flow(cfg, base, "release", releases, until_confident=until_confident))
+
+  data = yield from _first_page_flow(cfg, base, "master", timings)
+  results = yield from _collect_flow(cfg, base, "master", data, until_confident=until_confident)
   if not results:
-    results = run("release")
+    data = yield from _first_page_flow(cfg, base, "release", timings)
+    results = yield from _collect_flow(cfg, base, "release", data, until_confident=until_confident)
   return results
 
 
-def search_query(cfg: AppConfig, *, query: str, vinyl_only: bool, limit: int) -> list[DiscogsSearchResult]:
+def _collect_flow(
+  cfg: AppConfig, base: dict[str, str | int], kind: str, data: dict, *, until_confident: bool
+) -> Flow[list[DiscogsSearchResult]]:
+  """
+  One search type's results, from its first page `data`. With `until_confident`, each result is
+  scored as it is parsed (`matching.RunningBest`) and the next page is requested only while the
+  best so far wouldn't be auto-picked, Discogs has another page, `SEARCH_MAX_PAGES` isn't reached
+  and the shared rate limit has a request to spare; more than `limit` results come back ranked.
+  Otherwise only the first page is read.
+  """
+  if not until_confident:
+    return _parse_search(data)
+  from scrobble_cli.matching import AUTO_PICK_CONFIDENCE, RunningBest, rank
+
+  vinyl_only = "format" in base
+  limit = int(base["per_page"])
+  running: RunningBest[DiscogsSearchResult] = RunningBest(query=str(base["q"]), vinyl_only=vinyl_only)
+  results: list[DiscogsSearchResult] = []
+  page = 1
+  while True:
+    for r in _iter_parse_search(data):
+      results.append(r)
+      running.add(r)
+    pages = int((data.get("pagination") or {}).get("pages") or 1)
+    if not data.get("results") or page >= min(pages, SEARCH_MAX_PAGES):
+      break
+    best = running.best()
+    if discogs_bucket(cfg.discogs.requests_per_minute).available() < 1 or (
+      best is not None and best.confidence >= AUTO_PICK_CONFIDENCE
+    ):
+      break
+    page += 1
+    with trace.span("search.page", kind=kind, page=page):
+      data = yield _Get(cfg, "/database/search", {**base, "type": kind, "page": page})
+  if len(results) > limit:
+    results = [r.result for r in rank(results, query=str(base["q"]), vinyl_only=vinyl_only, limit=limit)]
+  return results
+
+
+def search_query(
+  cfg: AppConfig,
+  *,
+  query: str,
+  vinyl_only: bool,
+  limit: int,
+  speculative: bool = False,
+  until_confident: bool = False,
+  timings: dict[str, float] | None = None,
+) -> list[DiscogsSearchResult]:
   query = (query or "").strip()
   if not query:
     return []
-  return search(cfg, artist=query, album="", vinyl_only=vinyl_only, limit=limit)
+  return search(
+    cfg,
+    artist=query,
+    album="",
+    vinyl_only=vinyl_only,
+    limit=limit,
+    speculative=speculative,
+    until_confident=until_confident,
+    timings=timings,
+  )
+
+
+def _digits(value: str) -> str:
+  return re.sub(r"\D", "", value or "")
+
+
+def _catno_key(value: str) -> str:
+  """Catalog numbers compare without case, spaces and punctuation ("CL 1355" == "cl-1355")."""
+  return re.sub(r"[\W_]+", "", value or "").lower()
+
+
+def _identifier_key(cfg: AppConfig, *, barcode: str | None, catno: str | None) -> str:
+  if _digits(barcode):
+    return _cache_key(cfg, f"/identifiers/barcode/{_digits(barcode)}")
+  return _cache_key(cfg, f"/identifiers/catno/{_catno_key(catno or '')}")
+
+
+def lookup_identifier(
+  cfg: AppConfig,
+  *,
+  barcode: str | None = None,
+  catno: str | None = None,
+  query: str = "",
+  vinyl_only: bool,
+  limit: int,
+) -> tuple[DiscogsSearchResult | None, list[DiscogsSearchResult]]:
+  """
+  Finds releases by barcode or catalog number with Discogs' structured search (one request; the
+  free-text `query`, if any, narrows it further). Returns the exact match, when exactly one release
+  carries that identifier, and the candidates. Matches (and picks recorded with
+  `remember_identifier`) are cached, so a repeat scan resolves without searching.
+  """
+  # A barcode without digits (a stray scan, "n/a") doesn't count; fall back to the catalog number.
+  barcode = _digits(barcode) or None
+  if not barcode and not _catno_key(catno):
+    return None, []
+  cache = get_cache(cfg.cache.max_bytes) if cfg.cache.enabled else None
+  key = _identifier_key(cfg, barcode=barcode, catno=catno)
+  cached = cache.get(key) if cache else None
+  if cached is not None and cached.fresh:
+    hit = DiscogsSearchResult(**cached.body["result"])
+    return hit, [hit]
+
+  params: dict[str, str | int] = {"type": "release", "per_page": limit, "page": 1}
+  if barcode:
+    params["barcode"] = barcode
+  else:
+    params["catno"] = catno.strip()
+    if vinyl_only:
+      # Labels reuse catalog numbers across formats; a barcode already names one pressing.
+      params["format"] = "Vinyl"
+  if query.strip():
+    params["q"] = query.strip()
+  with trace.span("discogs.identifier", by="barcode" if barcode else "catno") as s:
+    data = _get(cfg, "/database/search", params=params)
+    results = _parse_search(data)
+    if barcode:
+      exact_ids = {
+        int(item["id"])
+        for item in data.get("results") or []
+        if barcode in {_digits(str(b)) for b in item.get("barcode") or []}
+      }
+    else:
+      exact_ids = {r.id for r in results if r.catno and _catno_key(r.catno) == _catno_key(catno)}
+    exact = [r for r in results if r.id in exact_ids] or (results if len(results) == 1 else [])
+    match = exact[0] if len(exact) == 1 else None
+    if s:
+      s.set(results=len(results), exact=len(exact))
+  if match is not None:
+    remember_identifier(cfg, match, barcode=barcode, catno=catno)
+  return match, exact or results
+
+
+def remember_identifier(
+  cfg: AppConfig, result: DiscogsSearchResult, *, barcode: str | None = None, catno: str | None = None
+) -> None:
+  """Caches which release a barcode or catalog number stands for (e.g. after picking among several)."""
+  if not cfg.cache.enabled or not (_digits(barcode) or _catno_key(catno)):
+    return
+  get_cache(cfg.cache.max_bytes).put(
+    _identifier_key(cfg, barcode=barcode, catno=catno), {"result": asdict(result)}, ttl=RELEASE_TTL
+  )
 
 
 def _split_title(title: str) -> tuple[str, str]:
@@ -145,14 +602,15 @@ def _split_title(title: str) -> tuple[str, str]:
   return title.strip(), title.strip()
 
 
-def fetch_release(cfg: AppConfig, *, kind: str, id: int) -> DiscogsRelease:
+def _release_path(kind: str, id: int) -> str:
   if kind == "master":
-    data = _get(cfg, f"/masters/{id}")
-  elif kind == "release":
-    data = _get(cfg, f"/releases/{id}")
-  else:
-    raise ValueError("kind must be 'master' or 'release'")
+    return f"/masters/{id}"
+  if kind == "release":
+    return f"/releases/{id}"
+  raise ValueError("kind must be 'master' or 'release'")
+
 
+def _parse_release(data: dict, *, kind: str, id: int) -> DiscogsRelease:
   artist, album = _split_title(str(data.get("title") or ""))
 
   artists = data.get("artists") or []
@@ -186,3 +644,163 @@ def fetch_release(cfg: AppConfig, *, kind: str, id: int) -> DiscogsRelease:
     year=int(data["year"]) if data.get("year") else None,
     tracks=tracks,
   )
+
+
+def fetch_release(cfg: AppConfig, *, kind: str, id: int) -> DiscogsRelease:
+  return flow.run(_fetch_release_flow(cfg, kind=kind, id=id))
+
+
+def _fetch_release_flow(cfg: AppConfig, *, kind: str, id: int) -> Flow[DiscogsRelease]:
+  with trace.span("fetch.local"):
+    local = _collection_release(cfg, kind, id) or _offline_release(cfg, kind, id)
+  if local is not None:
+    return local
+  data = yield _Get(cfg, _release_path(kind, id))
+  with trace.span("discogs.parse"):
+    return _parse_release(data, kind=kind, id=id)
+
+
+_re_non_word = re.compile(r"[^\w]+")
+
+
+def _norm(text: str | None) -> str:
+  return _re_non_word.sub(" ", (text or "").lower()).strip()
+
+
+def _version_duration(track: DiscogsTrack, index: int, count: int, version: list[DiscogsTrack]) -> int | None:
+  """The duration another pressing gives this track: same title, else same position, else same slot."""
+  title = _norm(track.title)
+  for v in version:
+    if v.duration_seconds and _norm(v.title) == title:
+      return v.duration_seconds
+  position = _norm(track.position)
+  if position:
+    for v in version:
+      if v.duration_seconds and _norm(v.position) == position:
+        return v.duration_seconds
+  if len(version) == count:
+    return version[index].duration_seconds
+  return None
+
+
+def _consensus_durations(tracks: list[DiscogsTrack], versions: list[list[DiscogsTrack]]) -> list[int | None]:
+  """Per track: its own duration, or the median of what the other pressings give it."""
+  out: list[int | None] = []
+  for i, t in enumerate(tracks):
+    if t.duration_seconds:
+      out.append(t.duration_seconds)
+      continue
+    found = [d for v in versions if (d := _version_duration(t, i, len(tracks), v))]
+    out.append(int(statistics.median(found)) if found else None)
+  return out
+
+
+def _with_durations(release: DiscogsRelease, durations: list) -> DiscogsRelease:
+  if len(durations) != len(release.tracks):
+    return release
+  tracks = [t if t.duration_seconds or not d else replace(t, duration_seconds=int(d)) for t, d in zip(release.tracks, durations)]
+  return replace(release, tracks=tracks)
+
+
+def enrich_durations(cfg: AppConfig, release: DiscogsRelease) -> DiscogsRelease:
+  """
+  Fills in tracks without a duration from other pressings of the same master: the main release and
+  the first versions listed, fetched concurrently. Each missing duration becomes the median of the
+  pressings that have it. Stays within `ENRICH_MAX_REQUESTS` (and what the shared rate limit has to
+  spare) and gives up at `ENRICH_DEADLINE_SECONDS`, returning whatever was found by then. Every
+  request runs against that deadline (rate-limit waits and timeouts included, no retries) and
+  answers that arrive after it are dropped, so the call returns on time. Complete results are cached.
+  """
+  if all(t.duration_seconds for t in release.tracks) or not release.tracks or not cfg.discogs.token:
+    return release
+  cache = get_cache(cfg.cache.max_bytes) if cfg.cache.enabled else None
+  key = _cache_key(cfg, f"/enriched/{release.kind}/{release.id}")
+  cached = cache.get(key) if cache else None
+  if cached is not None and cached.fresh:
+    return _with_durations(release, cached.body.get("durations") or [])
+
+  budget = min(ENRICH_MAX_REQUESTS, int(discogs_bucket(cfg.discogs.requests_per_minute).available()))
+  with trace.span("discogs.enrich", missing=sum(1 for t in release.tracks if not t.duration_seconds)) as s:
+    if budget < 3:
+      if s:
+        s.set(skipped="rate limit")
+      return release
+    deadline = time.monotonic() + ENRICH_DEADLINE_SECONDS
+    versions: list[list[DiscogsTrack]] = []
+    complete = False
+    pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="discogs-enrich")
+    try:
+      complete = _fetch_versions(cfg, release, pool, budget, deadline, versions)
+    except Exception as e:
+      if s:
+        s.set(error=type(e).__name__)
+    finally:
+      # Queued requests are dropped; running ones end by the deadline and nothing waits for them.
+      pool.shutdown(wait=False, cancel_futures=True)
+    durations = _consensus_durations(release.tracks, versions)
+    if s:
+      s.set(versions=len(versions), filled=sum(1 for t, d in zip(release.tracks, durations) if d and not t.duration_seconds))
+  if cache is not None and complete:
+    cache.put(key, {"durations": durations}, ttl=RELEASE_TTL)
+  return _with_durations(release, durations)
+
+
+def _fetch_versions(
+  cfg: AppConfig,
+  release: DiscogsRelease,
+  pool: ThreadPoolExecutor,
+  budget: int,
+  deadline: float,
+  out: list[list[DiscogsTrack]],
+) -> bool:
+  """Appends the tracklists of other pressings to `out`; returns False if the deadline cut it short."""
+
+  def remaining() -> float:
+    return max(0.0, deadline - time.monotonic())
+
+  once = replace(cfg, http=replace(cfg.http, retries=0))
+
+  def get(path: str, params: dict | None = None) -> dict:
+    return _get(once, path, params, deadline=deadline)
+
+  def tracklist(release_id: int) -> list[DiscogsTrack]:
+    return _parse_release(get(f"/releases/{release_id}"), kind="release", id=release_id).tracks
+
+  get, tracklist = trace.bind(get), trace.bind(tracklist)
+
+  # The body fetch_release just parsed is normally a fresh cache hit.
+  data = pool.submit(get, _release_path(release.kind, release.id)).result(timeout=remaining())
+  budget -= 1
+  master_id = release.id if release.kind == "master" else data.get("master_id")
+  if not master_id:
+    return True
+
+  # A release names its master but not the master's main release: look that up alongside the list.
+  master = pool.submit(get, f"/masters/{master_id}") if release.kind == "release" else None
+  budget -= master is not None
+  listing = pool.submit(get, f"/masters/{master_id}/versions", {"per_page": budget, "page": 1})
+  budget -= 1
+  try:
+    main_release = (master.result(timeout=remaining()) if master is not None else data).get("main_release")
+  except Exception:
+    main_release = None  # the versions list still has pressings to offer
+  pending = []
+  seen = {release.id} if release.kind == "release" else set()
+  if main_release and main_release not in seen:
+    pending.append(pool.submit(tracklist, main_release))
+    seen.add(main_release)
+    budget -= 1
+  for v in listing.result(timeout=remaining()).get("versions") or []:
+    if budget <= 0:
+      break
+    if v.get("id") and v["id"] not in seen:
+      pending.append(pool.submit(tracklist, v["id"]))
+      seen.add(v["id"])
+      budget -= 1
+
+  done, not_done = wait(pending, timeout=remaining())
+  for f in done:
+    if f.exception() is None:
+      out.append(f.result())
+  return not not_done
+
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+# The Discogs and Last.fm calls are written once, as generators ("flows") that yield each step
+# needing I/O (an HTTP round trip, a pause) and get its result sent back. `run` carries the steps
+# out with blocking calls for the sync API; `arun` awaits them on the running event loop for
+# `scrobble_cli.aio`. Request building, caching, retry policy and parsing stay in the flow, shared
+# by both. A flow hands another flow's work on with `yield from`.
+
+import time
+from dataclasses import dataclass
+from typing import Any, Generator, Protocol, TypeVar
+
+T = TypeVar("T")
+
+
+class Step(Protocol):
+  def run(self) -> Any: ...
+
+  async def arun(self) -> Any: ...
+
+
+Flow = Generator[Step, Any, T]
+
+
+def run(flow: Flow[T]) -> T:
+  """Runs `flow` to completion on this thread; a step that fails raises inside the flow."""
+  value: Any = None
+  error: BaseException | None = None
+  while True:
+    try:
+      step = flow.send(value) if error is None else flow.throw(error)
+    except StopIteration as stop:
+      return stop.value
+    try:
+      value, error = step.run(), None
+    except BaseException as e:  # interrupts too, so the flow's `finally` blocks see what happened
+      value, error = None, e
+
+
+async def arun(flow: Flow[T]) -> T:
+  """`run`, awaiting each step instead of blocking on it."""
+  value: Any = None
+  error: BaseException | None = None
+  while True:
+    try:
+      step = flow.send(value) if error is None else flow.throw(error)
+    except StopIteration as stop:
+      return stop.value
+    try:
+      value, error = await step.arun(), None
+    except BaseException as e:  # cancellation too
+      value, error = None, e
+
+
+@dataclass(frozen=True)
+class Sleep:
+  seconds: float
+
+  def run(self) -> None:
+    time.sleep(self.seconds)
+
+  async def arun(self) -> None:
+    import asyncio
+
+    await asyncio.sleep(self.seconds)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+
+from scrobble_cli.config import DEFAULT_ACCOUNT
+from scrobble_cli.lastfm import ScrobbleTrack
+from scrobble_cli.plan import DEFAULT_DURATION
+from scrobble_cli.store import account_db, open_db
+
+
+HISTORY_DB = "history.sqlite3"
+
+# Plays longer than this are treated as this long when looking for overlaps (bounds the index scan).
+MAX_PLAY_SECONDS = 60 * 60
+# Overlaps shorter than this are ignored: estimated durations make back-to-back albums touch.
+OVERLAP_GRACE_SECONDS = 60
+# The same album submitted again within this long of a planned play counts as a replay.
+REPLAY_WINDOW_SECONDS = 3 * 60 * 60
+# At most this many conflicting plays are returned per check.
+CHECK_LIMIT = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+  id INTEGER PRIMARY KEY,
+  artist TEXT NOT NULL,
+  title TEXT NOT NULL,
+  album TEXT NOT NULL,
+  album_artist TEXT NOT NULL,
+  timestamp_unix INTEGER NOT NULL,
+  duration_seconds INTEGER,
+  discogs_release TEXT,
+  submitted_at REAL NOT NULL,
+  UNIQUE (artist, title, timestamp_unix)
+);
+CREATE INDEX IF NOT EXISTS history_time ON history (timestamp_unix);
+CREATE INDEX IF NOT EXISTS history_release ON history (discogs_release, timestamp_unix);
+CREATE INDEX IF NOT EXISTS history_album ON history (album_artist, album, timestamp_unix);
+"""
+
+_COLUMNS = "id, artist, title, album, album_artist, timestamp_unix, duration_seconds, discogs_release, submitted_at"
+
+
+@dataclass(frozen=True)
+class HistoryEntry:
+  id: int
+  track: ScrobbleTrack
+  submitted_at: float
+
+
+@dataclass(frozen=True)
+class Duplicates:
+  overlapping: list[HistoryEntry]  # submitted plays whose time overlaps the planned ones
+  replays: list[HistoryEntry]  # the same album (or Discogs release) submitted around the same time
+
+  def __bool__(self) -> bool:
+    return bool(self.overlapping or self.replays)
+
+
+class History:
+  """
+  Every scrobble Last.fm has accepted (SQLite in WAL mode), used to catch duplicate submissions.
+
+  Rows are keyed by artist/title/timestamp like Last.fm itself, and indexed by time, by Discogs
+  release and by album so overlap checks and range queries touch only the rows they return.
+  """
+
+  def __init__(self, account: str | None = None):
+    self._lock = threading.Lock()
+    self._conn = open_db(account_db(HISTORY_DB, account), _SCHEMA)
+
+  def record(self, tracks: list[ScrobbleTrack]) -> None:
+    if not tracks:
+      return
+    now = time.time()
+    with self._lock:
+      self._conn.execute("BEGIN IMMEDIATE")
+      try:
+        self._conn.executemany(
+          "INSERT OR IGNORE INTO history"
+          " (artist, title, album, album_artist, timestamp_unix, duration_seconds, discogs_release, submitted_at)"
+          " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+          [
+            (t.artist, t.title, t.album, t.album_artist, int(t.timestamp_unix), t.duration_seconds, t.discogs_release, now)
+            for t in tracks
+          ],
+        )
+        self._conn.execute("COMMIT")
+      except BaseException:
+        self._conn.execute("ROLLBACK")
+        raise
+
+  def check(self, tracks: list[ScrobbleTrack]) -> Duplicates:
+    """
+    Finds submitted plays that the planned `tracks` would duplicate: any play overlapping their
+    time span (you can't listen to two records at once), and earlier plays of the same albums
+    within `REPLAY_WINDOW_SECONDS`.
+    """
+    if not tracks:
+      return Duplicates(overlapping=[], replays=[])
+    start = min(int(t.timestamp_unix) for t in tracks)
+    end = max(int(t.timestamp_unix) + (t.duration_seconds or DEFAULT_DURATION) for t in tracks)
+    albums = {(t.album_artist, t.album) for t in tracks}
+    releases = {t.discogs_release for t in tracks if t.discogs_release}
+
+    lo, hi = start + OVERLAP_GRACE_SECONDS, end - OVERLAP_GRACE_SECONDS
+    replay_lo, replay_hi = start - REPLAY_WINDOW_SECONDS, end + REPLAY_WINDOW_SECONDS
+    with self._lock:
+      overlapping = self._conn.execute(
+        f"SELECT {_COLUMNS} FROM history"
+        " WHERE timestamp_unix >= ? AND timestamp_unix < ? AND timestamp_unix + COALESCE(duration_seconds, ?) > ?"
+        " ORDER BY timestamp_unix LIMIT ?",
+        (lo - MAX_PLAY_SECONDS, hi, DEFAULT_DURATION, lo, CHECK_LIMIT),
+      ).fetchall()
+      replays: dict[int, tuple] = {}
+      for album_artist, album in albums:
+        for row in self._conn.execute(
+          f"SELECT {_COLUMNS} FROM history"
+          " WHERE album_artist = ? AND album = ? AND timestamp_unix BETWEEN ? AND ? ORDER BY timestamp_unix LIMIT ?",
+          (album_artist, album, replay_lo, replay_hi, CHECK_LIMIT),
+        ):
+          replays[row[0]] = row
+      for release in releases:
+        for row in self._conn.execute(
+          f"SELECT {_COLUMNS} FROM history"
+          " WHERE discogs_release = ? AND timestamp_unix BETWEEN ? AND ? ORDER BY timestamp_unix LIMIT ?",
+          (release, replay_lo, replay_hi, CHECK_LIMIT),
+        ):
+          replays[row[0]] = row
+
+    seen = {row[0] for row in overlapping}
+    return Duplicates(
+      overlapping=[_entry(r) for r in overlapping],
+      replays=[_entry(r) for r in sorted(replays.values(), key=lambda r: r[5]) if r[0] not in seen][:CHECK_LIMIT],
+    )
+
+  def recorded(self, tracks: list[ScrobbleTrack]) -> set[tuple[str, str, int]]:
+    """The artist/title/timestamp keys of those `tracks` that are already in the history."""
+    with self._lock:
+      return {
+        key
+        for key in {(t.artist, t.title, int(t.timestamp_unix)) for t in tracks}
+        if self._conn.execute(
+          "SELECT 1 FROM history WHERE artist = ? AND title = ? AND timestamp_unix = ?", key
+        ).fetchone()
+      }
+
+  def between(self, start_unix: int | None, end_unix: int | None, *, limit: int) -> list[HistoryEntry]:
+    """Plays with `start_unix <= timestamp < end_unix` (either bound optional), newest first."""
+    with self._lock:
+      rows = self._conn.execute(
+        f"SELECT {_COLUMNS} FROM history WHERE timestamp_unix >= ? AND timestamp_unix < ?"
+        " ORDER BY timestamp_unix DESC LIMIT ?",
+        (start_unix if start_unix is not None else -(2**62), end_unix if end_unix is not None else 2**62, limit),
+      ).fetchall()
+    return [_entry(r) for r in rows]
+
+  def count(self) -> int:
+    with self._lock:
+      return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+def _entry(row: tuple) -> HistoryEntry:
+  return HistoryEntry(
+    id=row[0],
+    track=ScrobbleTrack(
+      artist=row[1],
+      title=row[2],
+      album=row[3],
+      album_artist=row[4],
+      timestamp_unix=row[5],
+      duration_seconds=row[6],
+      discogs_release=row[7],
+    ),
+    submitted_at=row[8],
+  )
+
+
+_histories: dict[str, History] = {}
+_history_lock = threading.Lock()
+
+
+def get_history(account: str | None = None) -> History:
+  """The history of a Last.fm account (duplicates are per account)."""
+  key = (account or DEFAULT_ACCOUNT).lower()
+  with _history_lock:
+    if key not in _histories:
+      _histories[key] = History(None if key == DEFAULT_ACCOUNT else key)
+    return _histories[key]
@@ -0,0 +1,448 @@
+from __future__ import annotations
+
+# `scrobble import`: plays that are already resolved (turntable logger exports, old spreadsheets)
+# go straight to Last.fm without Discogs. Rows flow through generators, so memory stays flat however
+# long the file is, and a checkpoint lets an interrupted import resume after the last acknowledged row.
+
+import csv
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from itertools import dropwhile
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, TextIO
+
+from scrobble_cli.config import DEFAULT_ACCOUNT, AppConfig
+from scrobble_cli.history import get_history
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, Pacer, ScrobbleTrack, scrobble_outcomes, submit_batch
+from scrobble_cli.store import db_path, open_db
+
+
+IMPORTS_DB = "imports.sqlite3"
+
+# Last.fm ignores plays older than this ("timestamp too old").
+MAX_AGE_SECONDS = 14 * 24 * 60 * 60
+# Plays further in the future than this can't have happened (a little clock skew is tolerated).
+MAX_FUTURE_SECONDS = 10 * 60
+# Last.fm only counts tracks longer than 30 seconds (checked when the row has a duration).
+MIN_DURATION_SECONDS = 30
+# ignoredMessage code for "daily scrobble limit exceeded": everything after it is ignored too.
+DAILY_LIMIT_CODE = "5"
+# A checkpoint applies to the same file (or a longer copy of it): its first bytes must still match.
+FINGERPRINT_BYTES = 4096
+
+FORMATS = ("csv", "tsv", "jsonl")
+
+# Accepted column names (lowercase, spaces and dashes as underscores), first match wins.
+_ARTIST = ("artist", "artist_name", "track_artist")
+_TITLE = ("track", "title", "track_name", "track_title", "song", "name")
+_ALBUM = ("album", "album_name", "album_title", "release")
+_ALBUM_ARTIST = ("album_artist", "albumartist")
+_TIMESTAMP = ("timestamp", "timestamp_unix", "uts", "played_at", "played", "time", "date", "datetime", "ts")
+_DURATION = ("duration", "duration_seconds", "length", "seconds")
+_DURATION_MS = ("duration_ms", "ms_played", "length_ms")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS imports (
+  path TEXT NOT NULL,
+  account TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  row INTEGER NOT NULL,
+  accepted INTEGER NOT NULL,
+  ignored INTEGER NOT NULL,
+  skipped INTEGER NOT NULL,
+  duplicates INTEGER NOT NULL,
+  updated_at REAL NOT NULL,
+  PRIMARY KEY (path, account)
+);
+"""
+
+
+@dataclass(frozen=True)
+class ImportRow:
+  row: int  # 1-based data row (CSV rows after the header, non-blank JSONL lines)
+  track: ScrobbleTrack | None
+  skip_reason: str | None = None
+
+
+@dataclass
+class ImportProgress:
+  resumed_from: int = 0  # rows a previous run had already acknowledged
+  row: int = 0  # every row up to this one is acknowledged (or skipped)
+  read: int = 0  # rows read by this run
+  valid: int = 0  # rows of this run that pass the checks
+  sent: int = 0  # tracks this run got an answer for
+  accepted: int = 0
+  ignored: int = 0
+  skipped: int = 0
+  skipped_at_row: int = 0  # of the skipped rows, those up to `row` (what the checkpoint keeps)
+  duplicates: int = 0  # already in this account's scrobble history, not sent again
+  skip_reasons: Counter = field(default_factory=Counter)
+  ignore_reasons: Counter = field(default_factory=Counter)
+  error: str | None = None  # why the import stopped before the end of the file
+  started: float = field(default_factory=time.monotonic)
+
+  @property
+  def seconds(self) -> float:
+    return time.monotonic() - self.started
+
+  @property
+  def rows_per_second(self) -> float:
+    return self.read / self.seconds if self.seconds > 0 else 0.0
+
+  @property
+  def scrobbles_per_second(self) -> float:
+    return self.sent / self.seconds if self.seconds > 0 else 0.0
+
+
+def detect_format(path: Path) -> str:
+  suffix = path.suffix.lower()
+  if suffix in (".jsonl", ".ndjson", ".json"):
+    return "jsonl"
+  if suffix in (".tsv", ".tab"):
+    return "tsv"
+  return "csv"
+
+
+def _key(name: str) -> str:
+  return re.sub(r"[\s\-]+", "_", name.strip().lower())
+
+
+def _records(f: TextIO, fmt: str) -> Iterator[dict | str]:
+  """Each data row as a dict with normalized keys, or a string saying why it couldn't be read."""
+  if fmt == "jsonl":
+    for line in f:
+      if not line.strip():
+        continue
+      try:
+        obj = json.loads(line)
+      except json.JSONDecodeError as e:
+        yield f"invalid JSON ({e.msg})"
+        continue
+      yield {_key(str(k)): v for k, v in obj.items()} if isinstance(obj, dict) else "not a JSON object"
+    return
+  for rec in csv.DictReader(f, delimiter="\t" if fmt == "tsv" else ","):
+    yield {_key(k): v for k, v in rec.items() if k is not None}
+
+
+def _first(rec: dict, names: tuple[str, ...]) -> str:
+  for name in names:
+    value = rec.get(name)
+    if value is not None and str(value).strip():
+      return str(value).strip()
+  return ""
+
+
+def _parse_timestamp(value: str) -> int:
+  try:
+    ts = int(float(value))
+  except ValueError:
+    return int(datetime.fromisoformat(value).timestamp())
+  return ts // 1000 if ts > 100_000_000_000 else ts  # milliseconds
+
+
+def _parse_duration(rec: dict) -> int | None:
+  ms = _first(rec, _DURATION_MS)
+  if ms:
+    return round(float(ms) / 1000)
+  value = _first(rec, _DURATION)
+  if not value:
+    return None
+  if ":" in value:
+    seconds = 0
+    for part in value.split(":"):
+      seconds = seconds * 60 + int(part)
+    return seconds
+  return round(float(value))
+
+
+def _check(track: ScrobbleTrack, *, now_unix: int) -> str | None:
+  """Why Last.fm would ignore this play, if it would."""
+  if track.timestamp_unix < now_unix - MAX_AGE_SECONDS:
+    return "older than 14 days"
+  if track.timestamp_unix > now_unix + MAX_FUTURE_SECONDS:
+    return "in the future"
+  if track.duration_seconds is not None and track.duration_seconds <= MIN_DURATION_SECONDS:
+    return "30 seconds or shorter"
+  return None
+
+
+def read_rows(f: TextIO, fmt: str, *, now_unix: int) -> Iterator[ImportRow]:
+  """Parses and checks rows one at a time; rows that can't be scrobbled carry a skip reason."""
+  for row, rec in enumerate(_records(f, fmt), start=1):
+    if isinstance(rec, str):
+      yield ImportRow(row=row, track=None, skip_reason=rec)
+      continue
+    artist, title = _first(rec, _ARTIST), _first(rec, _TITLE)
+    stamp = _first(rec, _TIMESTAMP)
+    if not artist or not title or not stamp:
+      yield ImportRow(row=row, track=None, skip_reason="missing artist, track or timestamp")
+      continue
+    try:
+      timestamp = _parse_timestamp(stamp)
+    except (ValueError, OverflowError, OSError):
+      yield ImportRow(row=row, track=None, skip_reason="invalid timestamp")
+      continue
+    try:
+      duration = _parse_duration(rec)
+    except ValueError:
+      duration = None
+    album = _first(rec, _ALBUM)
+    track = ScrobbleTrack(
+      artist=artist,
+      title=title,
+      album=album,
+      album_artist=_first(rec, _ALBUM_ARTIST) or (artist if album else ""),
+      timestamp_unix=timestamp,
+      duration_seconds=duration or None,
+    )
+    yield ImportRow(row=row, track=track, skip_reason=_check(track, now_unix=now_unix))
+
+
+@dataclass(frozen=True)
+class _Batch:
+  rows: list[int]
+  tracks: list[ScrobbleTrack]
+  skipped: list[int]  # rows skipped so far, as of each track
+  end_row: int  # the last row read when the batch was cut (skipped rows before it included)
+  end_skipped: int
+
+
+def _batches(rows: Iterable[ImportRow], progress: ImportProgress) -> Iterator[_Batch]:
+  """Groups scrobbleable rows into full batches, counting skipped rows on the way."""
+  nums: list[int] = []
+  tracks: list[ScrobbleTrack] = []
+  skips: list[int] = []
+  last = progress.row
+  for r in rows:
+    progress.read += 1
+    last = r.row
+    if r.track is None or r.skip_reason:
+      progress.skipped += 1
+      progress.skip_reasons[r.skip_reason or "unreadable"] += 1
+      continue
+    progress.valid += 1
+    nums.append(r.row)
+    tracks.append(r.track)
+    skips.append(progress.skipped)
+    if len(tracks) == SCROBBLE_BATCH_SIZE:
+      yield _Batch(rows=nums, tracks=tracks, skipped=skips, end_row=last, end_skipped=progress.skipped)
+      nums, tracks, skips = [], [], []
+  if tracks or last > progress.row:
+    yield _Batch(rows=nums, tracks=tracks, skipped=skips, end_row=last, end_skipped=progress.skipped)
+
+
+# --- checkpoints ---------------------------------------------------------------
+
+_conn: sqlite3.Connection | None = None
+_conn_lock = threading.Lock()
+
+
+def _writer() -> sqlite3.Connection:
+  """The checkpoints connection, creating the database on first use. Call with `_conn_lock` held."""
+  global _conn
+  if _conn is None:
+    _conn = open_db(IMPORTS_DB, _SCHEMA)
+  return _conn
+
+
+def fingerprint(path: Path) -> str:
+  with path.open("rb") as f:
+    head = f.read(FINGERPRINT_BYTES)
+  return f"{len(head)}:{hashlib.sha256(head).hexdigest()}"
+
+
+def _matches(path: Path, saved: str) -> bool:
+  size, _, _ = saved.partition(":")
+  with path.open("rb") as f:
+    head = f.read(int(size))
+  return len(head) == int(size) and f"{size}:{hashlib.sha256(head).hexdigest()}" == saved
+
+
+def load_checkpoint(path: Path, account: str) -> ImportProgress | None:
+  """Where an earlier import of this file into `account` stopped, if the file still starts the same."""
+  with _conn_lock:
+    if _conn is None and not db_path(IMPORTS_DB).exists():
+      return None
+    row = _writer().execute(
+      "SELECT fingerprint, row, accepted, ignored, skipped, duplicates FROM imports WHERE path = ? AND account = ?",
+      (str(path.resolve()), account),
+    ).fetchone()
+  if row is None or not _matches(path, row[0]):
+    return None
+  return ImportProgress(
+    resumed_from=row[1],
+    row=row[1],
+    accepted=row[2],
+    ignored=row[3],
+    skipped=row[4],
+    skipped_at_row=row[4],
+    duplicates=row[5],
+  )
+
+
+def save_checkpoint(path: Path, account: str, mark: str, progress: ImportProgress) -> None:
+  with _conn_lock:
+    _writer().execute(
+      "INSERT OR REPLACE INTO imports"
+      " (path, account, fingerprint, row, accepted, ignored, skipped, duplicates, updated_at)"
+      " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+      (
+        str(path.resolve()),
+        account,
+        mark,
+        progress.row,
+        progress.accepted,
+        progress.ignored,
+        progress.skipped_at_row,
+        progress.duplicates,
+        time.time(),
+      ),
+    )
+
+
+def clear_checkpoint(path: Path, account: str) -> None:
+  with _conn_lock:
+    if _conn is None and not db_path(IMPORTS_DB).exists():
+      return
+    _writer().execute("DELETE FROM imports WHERE path = ? AND account = ?", (str(path.resolve()), account))
+
+
+# --- the import ------------------------------------------------------------------
+
+
+def run_import(
+  cfg: AppConfig,
+  path: Path,
+  *,
+  fmt: str | None = None,
+  account: str = DEFAULT_ACCOUNT,
+  restart: bool = False,
+  dry_run: bool = False,
+  on_progress: Callable[[ImportProgress], None] | None = None,
+) -> ImportProgress:
+  """
+  Streams `path` (CSV, TSV or JSONL) to Last.fm in 50-track batches, up to
+  `LASTFM_MAX_IN_FLIGHT` at a time with the usual adaptive pacing. Batches are acknowledged in file
+  order; after each one the checkpoint moves past it, so a rerun continues after the last
+  acknowledged row (`restart=True` starts over), and a file that has grown since continues with
+  its new rows. Plays already in the account's history are not sent again. Stops at the first
+  failed batch or when Last.fm reports the daily scrobble limit. `on_progress` runs after every
+  acknowledged batch. With `dry_run=True` the whole file is only read and checked.
+  """
+  if not dry_run and not (cfg.lastfm.api_key and cfg.lastfm.api_secret and cfg.lastfm.session_key):
+    raise RuntimeError("Missing Last.fm config. Run `scrobble auth lastfm` first.")
+  fmt = fmt or detect_format(path)
+  mark = fingerprint(path)
+  if restart:
+    clear_checkpoint(path, account)
+  progress = (None if restart or dry_run else load_checkpoint(path, account)) or ImportProgress()
+  resume_after = progress.row
+  history = get_history(account)
+  pacer = Pacer()
+
+  def ack(batch: _Batch, response: dict | None) -> bool:
+    """Applies one answered batch in file order; False when the import has to stop here."""
+    if response is not None and "error" in response:
+      progress.error = str(response.get("message") or response.get("error"))
+      return False
+    outcomes = scrobble_outcomes({"batches": [response]}) if response is not None else []
+    progress.sent += len(outcomes)
+    accepted: list[ScrobbleTrack] = []
+    for i, (track, o) in enumerate(zip(batch.tracks, outcomes)):
+      if o.ignored_code == DAILY_LIMIT_CODE:
+        # Everything from here on was refused; resume from this row once the limit resets.
+        if i:
+          progress.row, progress.skipped_at_row = batch.rows[i - 1], batch.skipped[i - 1]
+        progress.error = "Last.fm's daily scrobble limit was reached"
+        history.record(accepted)
+        return False
+      if o.accepted:
+        progress.accepted += 1
+        accepted.append(track)
+      else:
+        progress.ignored += 1
+        progress.ignore_reasons[o.ignored_reason] += 1
+    history.record(accepted)
+    progress.row, progress.skipped_at_row = batch.end_row, batch.end_skipped
+    return True
+
+  def send(batch: _Batch) -> dict | None:
+    return submit_batch(cfg, batch.tracks, pacer) if batch.tracks else None
+
+  with path.open(encoding="utf-8-sig", newline="") as f:
+    rows = dropwhile(lambda r: r.row <= resume_after, read_rows(f, fmt, now_unix=int(time.time())))
+    batches = _batches(rows, progress)
+    if dry_run:
+      for batch in batches:
+        progress.row = batch.end_row
+        if on_progress is not None:
+          on_progress(progress)
+      return progress
+
+    in_flight = max(1, cfg.lastfm.max_in_flight)
+    window: deque[tuple[_Batch, Future]] = deque()
+    pool = ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="lastfm-import")
+
+    def settle() -> bool:
+      batch, fut = window.popleft()
+      try:
+        ok = ack(batch, fut.result())
+      except Exception as e:
+        progress.error = str(e) or type(e).__name__
+        ok = False
+      save_checkpoint(path, account, mark, progress)
+      if on_progress is not None:
+        on_progress(progress)
+      if not ok:
+        drain()
+        # Rows read ahead of the checkpoint are read (and counted) again on the next run.
+        progress.skipped = progress.skipped_at_row
+      return ok
+
+    def drain() -> None:
+      """After a stop, records what later in-flight batches got accepted so a resume skips them."""
+      while window:
+        batch, fut = window.popleft()
+        if fut.cancel():
+          continue
+        try:
+          res = fut.result()
+        except Exception:
+          continue
+        if res is not None and "error" not in res:
+          outcomes = scrobble_outcomes({"batches": [res]})
+          history.record([t for t, o in zip(batch.tracks, outcomes) if o.accepted])
+
+    try:
+      for batch in batches:
+        if batch.tracks:
+          seen = history.recorded(batch.tracks)
+          if seen:
+            keep = [
+              i for i, t in enumerate(batch.tracks) if (t.artist, t.title, int(t.timestamp_unix)) not in seen
+            ]
+            progress.duplicates += len(batch.tracks) - len(keep)
+            batch = replace(
+              batch,
+              rows=[batch.rows[i] for i in keep],
+              tracks=[batch.tracks[i] for i in keep],
+              skipped=[batch.skipped[i] for i in keep],
+            )
+        window.append((batch, pool.submit(send, batch)))
+        if len(window) >= in_flight and not settle():
+          return progress
+      while window:
+        if not settle():
+          return progress
+    finally:
+      pool.shutdown(wait=False, cancel_futures=True)
+  # The checkpoint stays at the end of the file: a logger export that grows is imported from there.
+  return progress
@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import gzip
+import json
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Callable, Iterable, Iterator
+
+from scrobble_cli.discogs import (
+  DiscogsRelease,
+  DiscogsSearchResult,
+  DiscogsTrack,
+  _clean_artist_name,
+  _duration_to_seconds,
+)
+from scrobble_cli.store import db_path, fts_query, open_db
+
+
+INDEX_DB = "discogs-index.sqlite3"
+
+# Decompressed bytes handed to a worker at a time. Memory stays bounded by roughly
+# CHUNK_BYTES * (2 * workers) no matter how large the dump is.
+CHUNK_BYTES = 8 * 1024 * 1024
+INSERT_BATCH = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+  kind TEXT NOT NULL,
+  id INTEGER NOT NULL,
+  artist TEXT NOT NULL,
+  title TEXT NOT NULL,
+  year INTEGER,
+  country TEXT,
+  format TEXT,
+  label TEXT,
+  catno TEXT,
+  main_release INTEGER,
+  tracks TEXT,
+  UNIQUE (kind, id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+  artist, title, label, catno,
+  content='entries', content_rowid='rowid'
+);
+"""
+
+# (kind, id, artist, title, year, country, format, label, catno, main_release, tracks_json)
+Row = tuple
+
+
+@dataclass(frozen=True)
+class BuildStats:
+  path: str
+  records: int
+  seconds: float
+
+
+def _text(elem: ET.Element | None, tag: str) -> str:
+  if elem is None:
+    return ""
+  child = elem.find(tag)
+  return (child.text or "").strip() if child is not None else ""
+
+
+def _year(value: str) -> int | None:
+  m = re.match(r"^(\d{4})", value or "")
+  if not m or m.group(1) == "0000":
+    return None
+  return int(m.group(1))
+
+
+def _first_artist(elem: ET.Element) -> str:
+  artist = elem.find("artists/artist")
+  return _clean_artist_name(_text(artist, "name"))
+
+
+def _tracks(elem: ET.Element) -> list[list]:
+  raw = []
+  for t in elem.iterfind("tracklist/track"):
+    title = _text(t, "title")
+    if not title:
+      continue
+    raw.append([_text(t, "position") or None, title, _duration_to_seconds(_text(t, "duration"))])
+  # Headings ("Side A") have no position; only keep them when nothing has one.
+  if any(p for p, _, _ in raw):
+    raw = [t for t in raw if t[0]]
+  return raw
+
+
+def _release_row(elem: ET.Element) -> Row:
+  fmt_parts: list[str] = []
+  for f in elem.iterfind("formats/format"):
+    name = (f.get("name") or "").strip()
+    if name:
+      fmt_parts.append(name)
+    fmt_parts.extend((d.text or "").strip() for d in f.iterfind("descriptions/description") if d.text)
+  label = elem.find("labels/label")
+  master_id = _text(elem, "master_id")
+  return (
+    "release",
+    int(elem.get("id") or 0),
+    _first_artist(elem),
+    _text(elem, "title"),
+    _year(_text(elem, "released")),
+    _text(elem, "country") or None,
+    ", ".join(fmt_parts) or None,
+    (label.get("name") or None) if label is not None else None,
+    (label.get("catno") or None) if label is not None else None,
+    int(master_id) if master_id.isdigit() else None,
+    json.dumps(_tracks(elem)),
+  )
+
+
+def _master_row(elem: ET.Element) -> Row:
+  main_release = _text(elem, "main_release")
+  tracks = _tracks(elem)
+  return (
+    "master",
+    int(elem.get("id") or 0),
+    _first_artist(elem),
+    _text(elem, "title"),
+    _year(_text(elem, "year")),
+    None,
+    None,
+    None,
+    None,
+    int(main_release) if main_release.isdigit() else None,
+    json.dumps(tracks) if tracks else None,
+  )
+
+
+def _iter_rows(source: IO[bytes]) -> Iterator[Row]:
+  """Stream-parses a releases or masters dump, clearing each record once it has been turned into a row."""
+  root = None
+  for event, elem in ET.iterparse(source, events=("start", "end")):
+    if root is None:
+      root = elem
+      continue
+    if event != "end" or elem.tag not in ("release", "master"):
+      continue
+    yield _release_row(elem) if elem.tag == "release" else _master_row(elem)
+    root.clear()
+
+
+def _parse_chunk(chunk: bytes) -> list[Row]:
+  return list(_iter_rows(BytesIO(b"<root>" + chunk + b"</root>")))
+
+
+def _record_chunks(stream: IO[bytes], chunk_bytes: int) -> Iterator[bytes]:
+  """
+  Splits a dump into byte chunks that hold whole <release>/<master> records, without parsing it.
+  Records never nest, so the last closing tag in the buffer is a safe cut point.
+  """
+  buf = b""
+  kind: bytes | None = None
+  while True:
+    block = stream.read(chunk_bytes)
+    buf += block
+    if kind is None:
+      m = re.search(rb"<(release|master)[\s>]", buf)
+      if m is None:
+        if not block:
+          return
+        continue
+      kind = m.group(1)
+      buf = buf[m.start() :]
+    end_tag = b"</" + kind + b">"
+    cut = buf.rfind(end_tag)
+    if cut >= 0:
+      cut += len(end_tag)
+      yield buf[:cut]
+      buf = buf[cut:]
+    if not block:
+      return
+
+
+def _parallel_rows(stream: IO[bytes], workers: int, chunk_bytes: int) -> Iterator[Row]:
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    pending: deque[Future[list[Row]]] = deque()
+    for chunk in _record_chunks(stream, chunk_bytes):
+      pending.append(pool.submit(_parse_chunk, chunk))
+      if len(pending) >= workers * 2:
+        yield from pending.popleft().result()
+    while pending:
+      yield from pending.popleft().result()
+
+
+def _open_dump(path: Path) -> IO[bytes]:
+  if path.suffix == ".gz":
+    return gzip.open(path, "rb")
+  return path.open("rb")
+
+
+def _open_index() -> sqlite3.Connection:
+  return open_db(INDEX_DB, _SCHEMA)
+
+
+def build(
+  paths: Iterable[Path],
+  *,
+  workers: int,
+  chunk_bytes: int = CHUNK_BYTES,
+  progress: Callable[[int], None] | None = None,
+) -> list[BuildStats]:
+  """
+  Loads one or more Discogs monthly dumps (masters and/or releases, .xml or .xml.gz) into the
+  local index. Re-running with a newer dump replaces existing entries.
+  """
+  conn = _open_index()
+  conn.execute("PRAGMA synchronous=OFF")
+  out: list[BuildStats] = []
+  for path in paths:
+    started = time.perf_counter()
+    count = 0
+    with _open_dump(path) as f:
+      rows = _iter_rows(f) if workers <= 1 else _parallel_rows(f, workers, chunk_bytes)
+      batch: list[Row] = []
+      for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH:
+          _insert(conn, batch)
+          count += len(batch)
+          batch = []
+          if progress:
+            progress(count)
+      if batch:
+        _insert(conn, batch)
+        count += len(batch)
+    out.append(BuildStats(path=str(path), records=count, seconds=time.perf_counter() - started))
+
+  # Masters in the dump have no formats/labels/tracklists; borrow them from the main release.
+  conn.execute("BEGIN")
+  conn.execute(
+    """
+    UPDATE entries AS m SET
+      format = COALESCE(m.format, r.format),
+      label = COALESCE(m.label, r.label),
+      catno = COALESCE(m.catno, r.catno),
+      country = COALESCE(m.country, r.country),
+      tracks = COALESCE(m.tracks, r.tracks)
+    FROM entries AS r
+    WHERE m.kind = 'master' AND r.kind = 'release' AND r.id = m.main_release
+    """
+  )
+  conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+  conn.execute("COMMIT")
+  conn.execute("PRAGMA synchronous=NORMAL")
+  return out
+
+
+def _insert(conn: sqlite3.Connection, rows: list[Row]) -> None:
+  conn.execute("BEGIN")
+  conn.executemany(
+    "INSERT OR REPLACE INTO entries"
+    " (kind, id, artist, title, year, country, format, label, catno, main_release, tracks)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    rows,
+  )
+  conn.execute("COMMIT")
+
+
+_conn: sqlite3.Connection | None = None
+_conn_lock = threading.Lock()
+
+
+def _reader() -> sqlite3.Connection | None:
+  """The index connection, or None when no index has been built (never creates the file)."""
+  global _conn
+  with _conn_lock:
+    if _conn is None and db_path(INDEX_DB).exists():
+      _conn = _open_index()
+    return _conn
+
+
+def exists() -> bool:
+  return db_path(INDEX_DB).exists()
+
+
+def search(query: str, *, vinyl_only: bool, limit: int) -> list[DiscogsSearchResult]:
+  """Same shape and master-then-release order as `discogs.search`, answered from the local index."""
+  conn = _reader()
+  match = fts_query(query)
+  if conn is None or not match:
+    return []
+
+  sql = (
+    "SELECT e.kind, e.id, e.artist, e.title, e.year, e.country, e.label, e.catno, e.format"
+    " FROM entries_fts JOIN entries AS e ON e.rowid = entries_fts.rowid"
+    " WHERE entries_fts MATCH ? AND e.kind = ?"
+  )
+  if vinyl_only:
+    sql += " AND (e.format IS NULL OR e.format LIKE '%Vinyl%')"
+  sql += " ORDER BY bm25(entries_fts, 10.0, 10.0, 1.0, 2.0) LIMIT ?"
+
+  for kind in ("master", "release"):
+    with _conn_lock:
+      rows = conn.execute(sql, (match, kind, limit)).fetchall()
+    if rows:
+      return [
+        DiscogsSearchResult(
+          id=r[1],
+          kind=r[0],
+          title=f"{r[2]} - {r[3]}" if r[2] else r[3],
+          year=r[4],
+          country=r[5],
+          label=r[6],
+          catno=r[7],
+          format=r[8],
+        )
+        for r in rows
+      ]
+  return []
+
+
+def fetch_release(*, kind: str, id: int) -> DiscogsRelease | None:
+  """The indexed release/master with its tracklist, or None if it isn't indexed with tracks."""
+  conn = _reader()
+  if conn is None:
+    return None
+  with _conn_lock:
+    row = conn.execute(
+      "SELECT artist, title, year, tracks FROM entries WHERE kind = ? AND id = ?", (kind, id)
+    ).fetchone()
+  if row is None or not row[3]:
+    return None
+  tracks = [DiscogsTrack(position=p, title=t, duration_seconds=d) for p, t, d in json.loads(row[3])]
+  if not tracks:
+    return None
+  return DiscogsRelease(id=id, kind=kind, artist=row[0], album=row[1], year=row[2], tracks=tracks)
+
+
+def stats() -> dict[str, int]:
+  conn = _reader()
+  if conn is None:
+    return {}
+  with _conn_lock:
+    return dict(conn.execute("SELECT kind, COUNT(*) FROM entries GROUP BY kind").fetchall())
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
 import hashlib
+import threading
 import time
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
+from typing import Callable
 
-import requests
-
-from scrobble_cli.config import AppConfig, load_config, write_config_values
+from scrobble_cli import flow, metrics, trace, transport
+from scrobble_cli.config import AppConfig, account_key, load_config, write_config_values
+from scrobble_cli.flow import Flow
 
 
 LASTFM_API = "https://ws.audioscrobbler.com/2.0/"
 
+# Last.fm track.scrobble supports up to 50 tracks per request.
+SCROBBLE_BATCH_SIZE = 50
+
 
 def _sig(params: dict[str, str], api_secret: str) -> str:
   """
@@ -29,10 +35,34 @@ def _sig(params: dict[str, str], api_secret: str) -> str:
   return hashlib.md5(raw).hexdigest()
 
 
-def _post(params: dict[str, str]) -> dict:
-  r = requests.post(LASTFM_API, data=params, timeout=30)
-  r.raise_for_status()
-  return r.json()
+def _post(cfg: AppConfig, params: dict[str, str]) -> dict:
+  return flow.run(_post_flow(cfg, params))
+
+
+def _post_flow(cfg: AppConfig, params: dict[str, str]) -> Flow[dict]:
+  started = time.perf_counter()
+  result = "error"
+  try:
+    r = yield transport.Call("POST", cfg.lastfm.api_url or LASTFM_API, cfg.http, data=params, idempotent=False)
+    # Last.fm sends its errors (rate limiting included) with 4xx/5xx statuses too: read the code
+    # before treating the status as the error.
+    try:
+      res = r.json()
+    except ValueError:
+      res = None
+    if not (isinstance(res, dict) and "error" in res):
+      r.raise_for_status()
+      if not isinstance(res, dict):
+        raise RuntimeError(f"Last.fm sent a response that isn't JSON (HTTP {r.status_code}).")
+    result = f"error {res['error']}" if "error" in res else "ok"
+    return res
+  finally:
+    method = params.get("method", "")
+    metrics.observe("lastfm_request_seconds", time.perf_counter() - started, method=method, result=result)
+    if result == "ok" and method == "track.scrobble":
+      counts = (res.get("scrobbles") or {}).get("@attr") or {}
+      metrics.inc("lastfm_tracks_total", int(counts.get("accepted") or 0), result="accepted")
+      metrics.inc("lastfm_tracks_total", int(counts.get("ignored") or 0), result="ignored")
 
 
 @dataclass(frozen=True)
@@ -43,6 +73,59 @@ class ScrobbleTrack:
   album_artist: str
   timestamp_unix: int
   duration_seconds: int | None = None
+  # Discogs "master/123" or "release/456" the track came from. Kept in the local history, not sent.
+  discogs_release: str | None = None
+
+
+@dataclass(frozen=True)
+class ScrobbleOutcome:
+  timestamp_unix: int | None
+  title: str
+  ignored_code: str
+  ignored_reason: str
+
+  @property
+  def accepted(self) -> bool:
+    return self.ignored_code == "0"
+
+
+def batch_errors(res: dict) -> list[str]:
+  return [str(b.get("message") or b.get("error")) for b in res.get("batches") or [] if "error" in b]
+
+
+def scrobble_outcomes(res: dict) -> list[ScrobbleOutcome]:
+  """Flattens the per-track results of every track.scrobble batch in a `scrobble_album` response."""
+  out: list[ScrobbleOutcome] = []
+  for b in res.get("batches") or []:
+    if "error" in b:
+      continue
+    scrobbles_obj = (b.get("scrobbles") or {}).get("scrobble")
+    if isinstance(scrobbles_obj, dict):
+      scrobbles_obj = [scrobbles_obj]
+    for s in scrobbles_obj or []:
+      ignored_msg = s.get("ignoredMessage") or {}
+      code = str(ignored_msg.get("code") or "0")
+
+      try:
+        ts = int(s.get("timestamp"))
+      except Exception:
+        ts = None
+
+      track_obj = s.get("track")
+      if isinstance(track_obj, dict):
+        title = str(track_obj.get("#text") or "")
+      else:
+        title = str(track_obj or "")
+
+      reason = str(ignored_msg.get("#text") or "").strip() or f"ignoredMessage.code={code}"
+      out.append(ScrobbleOutcome(timestamp_unix=ts, title=title, ignored_code=code, ignored_reason=reason))
+  return out
+
+
+def _has_session(cfg: AppConfig, key: str, secret: str) -> bool:
+  return bool(
+    cfg.lastfm.session_key and cfg.lastfm.username and (cfg.lastfm.api_key == key) and (cfg.lastfm.api_secret == secret)
+  )
 
 
 def ensure_session(cfg: AppConfig, *, api_key: str | None, api_secret: str | None) -> AppConfig:
@@ -50,76 +133,275 @@ def ensure_session(cfg: AppConfig, *, api_key: str | None, api_secret: str | Non
   Ensures we have a Last.fm session key without ever asking for a Last.fm password.
   Uses auth.getToken + user authorizes in browser + auth.getSession.
   """
+  return flow.run(_ensure_session_flow(cfg, api_key=api_key, api_secret=api_secret))
+
+
+def _ensure_session_flow(cfg: AppConfig, *, api_key: str | None, api_secret: str | None) -> Flow[AppConfig]:
   key = api_key or cfg.lastfm.api_key
   secret = api_secret or cfg.lastfm.api_secret
   if not key or not secret:
     raise RuntimeError("Missing Last.fm API key/secret. Set LASTFM_API_KEY and LASTFM_API_SECRET.")
 
-  if cfg.lastfm.session_key and cfg.lastfm.username and (cfg.lastfm.api_key == key) and (cfg.lastfm.api_secret == secret):
+  if _has_session(cfg, key, secret):
     return cfg
 
+  username, session_key = yield from _authorize_flow(cfg, key=key, secret=secret)
+  write_config_values(
+    {
+      "LASTFM_API_KEY": key,
+      "LASTFM_API_SECRET": secret,
+      "LASTFM_SESSION_KEY": session_key,
+      "LASTFM_USERNAME": username,
+    }
+  )
+  return load_config()
+
+
+def add_account(cfg: AppConfig, name: str, *, api_key: str | None, api_secret: str | None) -> str:
+  """
+  Authorizes another Last.fm user (whoever is logged in to last.fm in the browser) as the named
+  account and saves its session. Returns the Last.fm username.
+  """
+  key = api_key or cfg.lastfm.api_key
+  secret = api_secret or cfg.lastfm.api_secret
+  if not key or not secret:
+    raise RuntimeError("Missing Last.fm API key/secret. Set LASTFM_API_KEY and LASTFM_API_SECRET.")
+  username, session_key = authorize(cfg, key=key, secret=secret)
+  write_config_values(
+    {
+      "LASTFM_API_KEY": key,
+      "LASTFM_API_SECRET": secret,
+      account_key(name, "SESSION_KEY"): session_key,
+      account_key(name, "USERNAME"): username,
+    }
+  )
+  return username
+
+
+def authorize(cfg: AppConfig, *, key: str, secret: str) -> tuple[str, str]:
+  """Runs the browser token flow (auth.getToken, user approves, auth.getSession); returns (username, session key)."""
+  return flow.run(_authorize_flow(cfg, key=key, secret=secret))
+
+
+@dataclass(frozen=True)
+class _Approval:
+  """Opens the authorization page and waits for the user to confirm (on a worker thread under asyncio)."""
+
+  url: str
+
+  def run(self) -> None:
+    webbrowser.open(self.url)
+    input(f"Authorize in your browser, then press Enter to continue:\n{self.url}\n> ")
+
+  async def arun(self) -> None:
+    import asyncio
+
+    await asyncio.to_thread(self.run)
+
+
+def _authorize_flow(cfg: AppConfig, *, key: str, secret: str) -> Flow[tuple[str, str]]:
   token_params = {"method": "auth.getToken", "api_key": key, "format": "json"}
   token_params["api_sig"] = _sig(token_params, secret)
-  token = _post(token_params).get("token")
+  token = (yield from _post_flow(cfg, token_params)).get("token")
   if not token:
     raise RuntimeError("Failed to obtain Last.fm token.")
 
-  auth_url = f"https://www.last.fm/api/auth/?api_key={key}&token={token}"
-  webbrowser.open(auth_url)
-  input(f"Authorize in your browser, then press Enter to continue:\n{auth_url}\n> ")
+  yield _Approval(f"https://www.last.fm/api/auth/?api_key={key}&token={token}")
 
   session_params = {"method": "auth.getSession", "api_key": key, "token": token, "format": "json"}
   session_params["api_sig"] = _sig(session_params, secret)
-  session_data = _post(session_params)
+  session_data = yield from _post_flow(cfg, session_params)
   session = session_data.get("session") or {}
   username = session.get("name")
   session_key = session.get("key")
   if not username or not session_key:
     msg = session_data.get("message") or "Last.fm authentication failed."
     raise RuntimeError(msg)
-
-  write_config_values(
-    {
-      "LASTFM_API_KEY": key,
-      "LASTFM_API_SECRET": secret,
-      "LASTFM_SESSION_KEY": session_key,
-      "LASTFM_USERNAME": username,
-    }
-  )
-  return load_config()
+  return username, session_key
 
 
-def scrobble_album(cfg: AppConfig, tracks: list[ScrobbleTrack]) -> dict:
+def _check_scrobble_config(cfg: AppConfig, tracks: list[ScrobbleTrack]) -> None:
   if not cfg.lastfm.api_key or not cfg.lastfm.api_secret or not cfg.lastfm.session_key:
     raise RuntimeError("Missing Last.fm config. Run `scrobble auth lastfm` first.")
 
   if not tracks:
     raise RuntimeError("No tracks to scrobble.")
 
-  # Last.fm track.scrobble supports up to 50 tracks per request.
-  results: list[dict] = []
-  for offset in range(0, len(tracks), 50):
-    batch = tracks[offset : offset + 50]
-    params: dict[str, str] = {
-      "method": "track.scrobble",
-      "api_key": cfg.lastfm.api_key,
-      "sk": cfg.lastfm.session_key,
-      "format": "json",
-    }
-    for i, t in enumerate(batch):
-      params[f"artist[{i}]"] = t.artist
-      params[f"track[{i}]"] = t.title
-      params[f"album[{i}]"] = t.album
-      params[f"albumArtist[{i}]"] = t.album_artist
-      params[f"timestamp[{i}]"] = str(int(t.timestamp_unix))
-      if t.duration_seconds:
-        params[f"duration[{i}]"] = str(int(t.duration_seconds))
 
+def _batches(tracks: list[ScrobbleTrack]) -> list[list[ScrobbleTrack]]:
+  return [tracks[offset : offset + SCROBBLE_BATCH_SIZE] for offset in range(0, len(tracks), SCROBBLE_BATCH_SIZE)]
+
+
+def _scrobble_params(cfg: AppConfig, batch: list[ScrobbleTrack]) -> dict[str, str]:
+  params: dict[str, str] = {
+    "method": "track.scrobble",
+    "api_key": cfg.lastfm.api_key,
+    "sk": cfg.lastfm.session_key,
+    "format": "json",
+  }
+  for i, t in enumerate(batch):
+    params[f"artist[{i}]"] = t.artist
+    params[f"track[{i}]"] = t.title
+    params[f"album[{i}]"] = t.album
+    params[f"albumArtist[{i}]"] = t.album_artist
+    params[f"timestamp[{i}]"] = str(int(t.timestamp_unix))
+    if t.duration_seconds:
+      params[f"duration[{i}]"] = str(int(t.duration_seconds))
+
+  with trace.span("lastfm.sig"):
     params["api_sig"] = _sig(params, cfg.lastfm.api_secret)
-    res = _post(params)
-    results.append(res)
+  return params
 
-    time.sleep(0.2)
 
-  return {"batches": results}
+# Error codes Last.fm documents as "try again later": the batch was not processed.
+RETRYABLE_ERRORS = frozenset({11, 16, 29})
+RATE_LIMITED = 29
+MAX_BATCH_RETRIES = 4
+
+
+class Pacer:
+  """
+  Spaces out batch submissions adaptively: the gap between requests shrinks while Last.fm answers
+  cleanly and doubles on rate limiting (code 29) or server errors. The first request never waits
+  and nothing sleeps after the last one.
+  """
+
+  MIN_INTERVAL = 0.05
+  START_INTERVAL = 0.2
+  MAX_INTERVAL = 16.0
 
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.interval = self.START_INTERVAL
+    self._next_at = 0.0
+
+  def reserve(self) -> float:
+    """Books the next slot; returns how long to wait for it."""
+    with self._lock:
+      now = time.monotonic()
+      at = max(now, self._next_at)
+      self._next_at = at + self.interval
+    return at - now
+
+  def wait(self) -> None:
+    delay = self.reserve()
+    if delay > 0:
+      time.sleep(delay)
+
+  def ok(self) -> None:
+    with self._lock:
+      self.interval = max(self.MIN_INTERVAL, self.interval * 0.75)
+
+  def back_off(self) -> None:
+    with self._lock:
+      self.interval = min(self.MAX_INTERVAL, max(self.interval * 2, 1.0))
+      self._next_at = max(self._next_at, time.monotonic() + self.interval)
+
+
+@dataclass(frozen=True)
+class _Pace:
+  pacer: Pacer
+
+  def run(self) -> None:
+    self.pacer.wait()
+
+  async def arun(self) -> None:
+    import asyncio
+
+    delay = self.pacer.reserve()
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+
+def submit_batch(
+  cfg: AppConfig, batch: list[ScrobbleTrack], pacer: Pacer, *, params: dict[str, str] | None = None
+) -> dict:
+  """
+  Sends one batch of at most `SCROBBLE_BATCH_SIZE` tracks, waiting on `pacer` first and retrying
+  the "try again later" errors. Callers that submit several batches share one `Pacer` between them.
+  `params` is the batch already signed with `_scrobble_params`, if the caller did that ahead.
+  """
+  return flow.run(_submit_flow(cfg, batch, pacer, params=params))
+
+
+def _submit_flow(
+  cfg: AppConfig, batch: list[ScrobbleTrack], pacer: Pacer, *, params: dict[str, str] | None = None
+) -> Flow[dict]:
+  if params is None:
+    params = _scrobble_params(cfg, batch)
+  attempt = 0
+  with trace.span("lastfm.batch", tracks=len(batch)) as s:
+    while True:
+      with trace.span("lastfm.pacing"):
+        yield _Pace(pacer)
+      try:
+        res = yield from _post_flow(cfg, params)
+      except Exception as e:
+        # requests.HTTPError or, under asyncio, httpx.HTTPStatusError
+        response = getattr(e, "response", None)
+        if response is not None and response.status_code >= 500:
+          pacer.back_off()
+        raise
+      if res.get("error") in RETRYABLE_ERRORS and attempt < MAX_BATCH_RETRIES:
+        pacer.back_off()
+        attempt += 1
+        continue
+      pacer.ok()
+      if s:
+        s.set(retries=attempt)
+      return res
+
+
+def scrobble_album(
+  cfg: AppConfig,
+  tracks: list[ScrobbleTrack],
+  *,
+  on_batch: Callable[[int, dict], None] | None = None,
+) -> dict:
+  """
+  Submits `tracks` in 50-track batches, with up to `LASTFM_MAX_IN_FLIGHT` batches in flight and
+  adaptive spacing between requests. `on_batch(offset, response)` runs (on the calling thread) as
+  soon as each batch is answered, so callers can persist progress before anything else goes out.
+  """
+  _check_scrobble_config(cfg, tracks)
+
+  batches = _batches(tracks)
+  results: list[dict] = [{} for _ in batches]
+  pacer = Pacer()
+
+  def done(i: int, res: dict) -> None:
+    results[i] = res
+    if on_batch is not None:
+      on_batch(i * SCROBBLE_BATCH_SIZE, res)
+
+  in_flight = max(1, min(cfg.lastfm.max_in_flight, len(batches)))
+  if len(batches) == 1:
+    done(0, submit_batch(cfg, batches[0], pacer))
+    return {"batches": results}
+  if in_flight == 1:
+    # One request at a time, but each batch is signed while the one before it is on the wire.
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="lastfm-sign") as signer:
+      signed = signer.submit(trace.bind(_scrobble_params), cfg, batches[0])
+      for i, batch in enumerate(batches):
+        params = signed.result()
+        if i + 1 < len(batches):
+          signed = signer.submit(trace.bind(_scrobble_params), cfg, batches[i + 1])
+        done(i, submit_batch(cfg, batch, pacer, params=params))
+    return {"batches": results}
+
+  first_error: BaseException | None = None
+  with ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="lastfm-scrobble") as pool:
+    futures = {pool.submit(trace.bind(submit_batch), cfg, batch, pacer): i for i, batch in enumerate(batches)}
+    for fut in as_completed(futures):
+      try:
+        res = fut.result()
+      except BaseException as e:
+        if first_error is None:
+          first_error = e
+          for other in futures:
+            other.cancel()
+        continue
+      done(futures[fut], res)
+  if first_error is not None:
+    raise first_error
+  return {"batches": results}
@@ -1,32 +1,65 @@
 from __future__ import annotations
 
+# Startup time matters here: the agent wrapper and scripts run one short command per process.
+# Only typer and config are imported up front; HTTP, storage, prompt and rich-rendering modules
+# are imported inside the commands that use them (see benchmarks/startup.py).
+
 import json
+import os
+import sys
 from datetime import datetime
+from pathlib import Path
 
-import questionary
 import typer
-from rich.console import Console
-from rich.table import Table
 
-from scrobble_cli.config import config_summary, load_config, write_config_values
-from scrobble_cli.discogs import fetch_release, search_query
-from scrobble_cli.lastfm import ScrobbleTrack, ensure_session, scrobble_album
-from scrobble_cli.matching import discogs_query_confidence, discogs_title_confidence
-from scrobble_cli.timestamps import plan_from_end, plan_from_start
+from scrobble_cli import metrics, trace
+from scrobble_cli.config import (
+  DEFAULT_ACCOUNT,
+  account_names,
+  config_summary,
+  for_account,
+  has_session,
+  load_config,
+  write_config_values,
+)
+from scrobble_cli.output import LazyConsole, new_table
 
 
 app = typer.Typer(no_args_is_help=True, add_completion=False)
 auth_app = typer.Typer(no_args_is_help=True)
 app.add_typer(auth_app, name="auth")
+cache_app = typer.Typer(no_args_is_help=True)
+app.add_typer(cache_app, name="cache")
+index_app = typer.Typer(no_args_is_help=True)
+app.add_typer(index_app, name="index")
+collection_app = typer.Typer(no_args_is_help=True)
+app.add_typer(collection_app, name="collection")
+memory_app = typer.Typer(no_args_is_help=True)
+app.add_typer(memory_app, name="memory")
+
+console = LazyConsole()
+
+# While the release picker is open, the top candidates' tracklists are fetched in the background
+# so the picked one loads instantly. The table waits this long for them before showing without.
+PREFETCH_CANDIDATES = 5
+PREFETCH_WORKERS = 3
+PREFETCH_TABLE_WAIT_SECONDS = 1.0
 
-console = Console()
+
+@app.callback()
+def _root() -> None:
+  trace.enable_from_env()
 
 
 @app.command()
 def status():
   """Show config status (masked)."""
+  from scrobble_cli.ratelimit import discogs_bucket
+
   cfg = load_config()
   console.print(config_summary(cfg))
+  bucket = discogs_bucket(cfg.discogs.requests_per_minute)
+  console.print(f"Discogs rate limit: {bucket.available():.1f}/{bucket.capacity} burst tokens available")
 
 
 @auth_app.command("discogs")
@@ -42,8 +75,18 @@ def auth_discogs(token: str = typer.Option(None, help="Discogs personal access t
 def auth_lastfm(
   api_key: str = typer.Option(None, help="Last.fm API key (or set LASTFM_API_KEY)"),
   api_secret: str = typer.Option(None, help="Last.fm API secret (or set LASTFM_API_SECRET)"),
+  account: str | None = typer.Option(
+    None, "--account", help="Save the session as another named account (log in to last.fm as that user first)"
+  ),
 ):
   """Authorize with Last.fm (token flow, no password)."""
+  from scrobble_cli.config import valid_account_name
+  from scrobble_cli.lastfm import add_account, ensure_session
+
+  if account and not valid_account_name(account):
+    console.print('Account names use letters, digits and underscores (and "default" is taken).')
+    raise typer.Exit(code=2)
+
   cfg = load_config()
   if not api_key:
     api_key = cfg.lastfm.api_key or typer.prompt("Last.fm API key", hide_input=True)
@@ -51,16 +94,445 @@ def auth_lastfm(
     api_secret = cfg.lastfm.api_secret or typer.prompt("Last.fm API secret", hide_input=True)
 
   try:
-    ensure_session(cfg, api_key=api_key, api_secret=api_secret)
+    if account:
+      username = add_account(cfg, account, api_key=api_key, api_secret=api_secret)
+    else:
+      ensure_session(cfg, api_key=api_key, api_secret=api_secret)
   except RuntimeError as e:
     console.print(str(e))
     raise typer.Exit(code=2)
 
-  console.print("Last.fm auth complete.")
+  if account:
+    console.print(f"Last.fm account {account.lower()} ({username}) added. Use it with `--account {account.lower()}`.")
+  else:
+    console.print("Last.fm auth complete.")
+
+
+def _format_bytes(n: int) -> str:
+  size = float(n)
+  for unit in ("B", "KB", "MB"):
+    if size < 1024:
+      return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+    size /= 1024
+  return f"{size:.1f} GB"
+
+
+@cache_app.command("stats")
+def cache_stats():
+  """Show Discogs response cache size and hit rate."""
+  from scrobble_cli.cache import get_cache
+
+  cfg = load_config()
+  st = get_cache(cfg.cache.max_bytes).stats()
+  lookups = st.hits + st.revalidated + st.misses
+  hit_rate = f"{(st.hits + st.revalidated) / lookups:.0%}" if lookups else "-"
+  console.print(
+    "\n".join(
+      [
+        f"Cache file={st.path}",
+        f"  enabled={'yes' if cfg.cache.enabled else 'no'}",
+        f"  entries={st.entries} (expired={st.expired})",
+        f"  size={_format_bytes(st.size_bytes)} / {_format_bytes(st.max_bytes)}",
+        f"  hits={st.hits} revalidated={st.revalidated} misses={st.misses} hit_rate={hit_rate}",
+      ]
+    )
+  )
+
+
+@cache_app.command("prune")
+def cache_prune():
+  """Drop expired entries and evict least-recently-used ones down to the size cap."""
+  from scrobble_cli.cache import get_cache
+
+  cfg = load_config()
+  removed = get_cache(cfg.cache.max_bytes).prune()
+  console.print(f"Removed {removed} cache entries.")
+
+
+@cache_app.command("clear")
+def cache_clear():
+  """Remove every cached Discogs response."""
+  from scrobble_cli.cache import get_cache
+
+  cfg = load_config()
+  removed = get_cache(cfg.cache.max_bytes).clear()
+  console.print(f"Removed {removed} cache entries.")
+
+
+@memory_app.command("stats")
+def memory_stats():
+  """Show how many queries are remembered and how often they were reused."""
+  from scrobble_cli.memory import get_memory
+
+  st = get_memory().stats()
+  lookups = st.hits + st.close_hits + st.misses
+  hit_rate = f"{(st.hits + st.close_hits) / lookups:.0%}" if lookups else "-"
+  console.print(
+    "\n".join(
+      [
+        f"Memory file={st.path}",
+        f"  entries={st.entries} / {st.max_entries}",
+        f"  hits={st.hits} close_hits={st.close_hits} misses={st.misses} hit_rate={hit_rate}",
+      ]
+    )
+  )
+
+
+@memory_app.command("forget")
+def memory_forget(query: list[str] = typer.Argument(..., help="The query whose remembered release to drop")):
+  """Forget the release remembered for one query."""
+  from scrobble_cli.memory import get_memory
+
+  removed = get_memory().forget(" ".join(query))
+  console.print(f"Forgot {removed} remembered release(s).")
+
+
+@memory_app.command("clear")
+def memory_clear():
+  """Forget every remembered query."""
+  from scrobble_cli.memory import get_memory
+
+  console.print(f"Forgot {get_memory().clear()} remembered release(s).")
+
+
+@index_app.command("build")
+def index_build(
+  dumps: list[Path] = typer.Argument(..., help="Discogs monthly dumps (discogs_*_masters.xml.gz, discogs_*_releases.xml.gz)"),
+  workers: int = typer.Option(os.cpu_count() or 1, "--workers", min=1, help="Parser processes (1 = parse in-process)"),
+):
+  """Build the offline Discogs index used before the online search."""
+  from scrobble_cli import index
+
+  missing = [p for p in dumps if not p.exists()]
+  if missing:
+    console.print(f"No such file: {missing[0]}")
+    raise typer.Exit(code=2)
+
+  def progress(count: int) -> None:
+    if count % 100_000 < index.INSERT_BATCH:
+      console.print(f"  {count:,} records…")
+
+  for st in index.build(dumps, workers=workers, progress=progress):
+    rate = st.records / st.seconds if st.seconds else 0
+    console.print(f"Indexed {st.records:,} records from {st.path} in {st.seconds:.1f}s ({rate:,.0f}/s).")
+
+
+@index_app.command("stats")
+def index_stats():
+  """Show how many masters/releases the offline index holds."""
+  from scrobble_cli import index
+
+  counts = index.stats()
+  if not counts:
+    console.print("No offline index. Build one with `scrobble index build <dump.xml.gz>`.")
+    return
+  console.print(", ".join(f"{kind}s={n:,}" for kind, n in sorted(counts.items())))
+
+
+@collection_app.command("sync")
+def collection_sync(
+  full: bool = typer.Option(False, "--full", help="Re-list the whole collection and drop records you no longer own"),
+  workers: int = typer.Option(4, "--workers", min=1, max=16, help="Tracklists fetched concurrently"),
+):
+  """Copy your Discogs collection (with tracklists) locally so owned records match without the network."""
+  from scrobble_cli import collection
+
+  cfg = load_config()
+  if not cfg.discogs.token:
+    console.print("Missing DISCOGS_TOKEN. Run `scrobble auth discogs` first.")
+    raise typer.Exit(code=2)
+
+  def progress(stage: str, done: int, total: int) -> None:
+    if done == total or done % collection.PER_PAGE == 0:
+      label = "Listed" if stage == "list" else "Tracklists"
+      console.print(f"  {label} {done:,}/{total:,}…")
+
+  try:
+    st = collection.sync(cfg, full=full, workers=workers, progress=progress)
+  except Exception as e:
+    console.print(f"Collection sync failed: {e}")
+    raise typer.Exit(code=1) from e
+  console.print(
+    f"Synced {st.username}'s collection in {st.seconds:.1f}s: {st.added:,} new, {st.removed:,} removed, "
+    f"{st.tracklists:,} tracklists fetched."
+  )
+  if st.failed:
+    console.print(f"{st.failed:,} tracklists couldn't be fetched; they'll be retried on the next sync.")
+
+
+@collection_app.command("stats")
+def collection_stats():
+  """Show how much of your collection is synced locally."""
+  from scrobble_cli import collection
 
+  st = collection.stats()
+  if st is None:
+    console.print("No local collection. Sync it with `scrobble collection sync`.")
+    return
+  synced = datetime.fromtimestamp(st.last_synced).strftime("%Y-%m-%d %H:%M") if st.last_synced else "never"
+  console.print(f"{st.username or '?'}: {st.releases:,} releases ({st.with_tracks:,} with tracklists), last synced {synced}.")
 
-def _render_results(results):
-  table = Table(title="Discogs matches", show_lines=False)
+
+def _ms(seconds: float | None) -> str:
+  if seconds is None:
+    return ""
+  ms = seconds * 1000
+  return f"{ms:.1f}" if ms < 10 else f"{ms:,.0f}"
+
+
+def _share(part: float, whole: float) -> str:
+  return f"{100 * part / whole:.1f}%" if whole else "–"
+
+
+@app.command("stats")
+def stats_command(
+  prometheus: str | None = typer.Option(
+    None, "--prometheus", help='Write the metrics in Prometheus textfile format to this path ("-" for stdout)'
+  ),
+  reset: bool = typer.Option(False, "--reset", help="Delete the recorded metrics"),
+):
+  """Show latency percentiles, request counts, auto-pick and error rates recorded across runs."""
+  if reset:
+    metrics.reset()
+    console.print("Metrics cleared.")
+    return
+  snap = metrics.snapshot()
+  if prometheus:
+    text = metrics.prometheus_text(snap)
+    if prometheus == "-":
+      sys.stdout.write(text)
+      return
+    # Written next to the target and renamed, so node_exporter never reads a half-written file.
+    target = Path(prometheus).expanduser()
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+      tmp.write_text(text, encoding="utf-8")
+      os.replace(tmp, target)
+    except OSError as e:
+      tmp.unlink(missing_ok=True)
+      console.print(f"Can't write {target}: {e}")
+      raise typer.Exit(code=1)
+    console.print(f"Wrote {len(snap.counters) + len(snap.histograms)} series to {target}.")
+    return
+  if not snap.histograms and not snap.counters:
+    state = "" if metrics.enabled() else " (SCROBBLE_METRICS is off)"
+    console.print(f"No metrics recorded yet{state}.")
+    return
+
+  table = new_table("Latency", show_lines=False)
+  table.add_column("Call")
+  table.add_column("Count", justify="right")
+  table.add_column("Errors", justify="right")
+  table.add_column("p50 ms", justify="right")
+  table.add_column("p95 ms", justify="right")
+  table.add_column("p99 ms", justify="right")
+
+  def row(label: str, h, errors: float) -> None:
+    if h.count:
+      table.add_row(label, f"{h.count:,}", _share(errors, h.count), _ms(h.quantile(0.5)), _ms(h.quantile(0.95)), _ms(h.quantile(0.99)))
+
+  network = ("miss", "revalidated", "off", "error")
+  for endpoint in snap.label_values("discogs_request_seconds", "endpoint"):
+    row(
+      f"Discogs {endpoint}",
+      snap.histogram("discogs_request_seconds", endpoint=endpoint, result=network),
+      snap.histogram("discogs_request_seconds", endpoint=endpoint, result="error").count,
+    )
+  row("Discogs cache hits", snap.histogram("discogs_request_seconds", result="hit"), 0)
+  for method in snap.label_values("lastfm_request_seconds", "method"):
+    h = snap.histogram("lastfm_request_seconds", method=method)
+    ok = snap.histogram("lastfm_request_seconds", method=method, result="ok")
+    row(f"Last.fm {method}", h, h.count - ok.count)
+  row("Auto-pick match", snap.histogram("match_seconds", matcher="auto_pick"), 0)
+  album = snap.histogram("album_command_seconds")
+  row("scrobble album", album, album.count - snap.histogram("album_command_seconds", exit="0").count)
+  console.print(table)
+
+  since = datetime.fromtimestamp(snap.since).strftime("%Y-%m-%d %H:%M") if snap.since else "?"
+  console.print(f"Recorded since {since} in {snap.path}.")
+  discogs = snap.histogram("discogs_request_seconds")
+  if discogs.count:
+    hits = snap.histogram("discogs_request_seconds", result=("hit", "revalidated")).count
+    console.print(f"Discogs: {discogs.count:,} requests, {_share(hits, discogs.count)} answered from the cache.")
+  picks = snap.counter("auto_pick_total")
+  if picks:
+    fired = snap.counter("auto_pick_total", result="picked")
+    console.print(f"Auto-pick: fired for {fired:,.0f} of {picks:,.0f} searches ({_share(fired, picks)}).")
+  via = {v: snap.counter("album_resolution_total", via=v) for v in snap.label_values("album_resolution_total", "via")}
+  if via:
+    console.print("Albums resolved by: " + ", ".join(f"{v} {n:,.0f}" for v, n in sorted(via.items(), key=lambda x: -x[1])) + ".")
+  tracks = snap.counter("lastfm_tracks_total")
+  if tracks:
+    ignored = snap.counter("lastfm_tracks_total", result="ignored")
+    console.print(f"Last.fm: {tracks:,.0f} tracks submitted, {ignored:,.0f} ignored ({_share(ignored, tracks)}).")
+  headroom = snap.histogram("ratelimit_headroom_tokens")
+  if headroom.count:
+    waits = snap.histogram("ratelimit_wait_seconds")
+    wait = f", p95 {waits.quantile(0.95):.1f}s" if waits.count else ""
+    console.print(
+      f"Discogs rate limit: median {headroom.quantile(0.5):.0f} requests to spare (5th percentile "
+      f"{headroom.quantile(0.05):.0f}); waited {waits.count:,} times{wait}."
+    )
+
+
+@app.command("serve")
+def serve(
+  workers: int = typer.Option(8, "--workers", min=1, max=64, help="Requests handled concurrently"),
+):
+  """
+  Run a local daemon that keeps HTTP connections, caches and config warm. While it is running,
+  `scrobble album` sends its Discogs and Last.fm work here instead of doing it in-process.
+  """
+  from scrobble_cli import daemon
+
+  try:
+    daemon.serve(workers=workers, on_ready=lambda path: console.print(f"Listening on {path} (Ctrl-C to stop)."))
+  except daemon.DaemonError as e:
+    console.print(str(e))
+    raise typer.Exit(code=2)
+  except KeyboardInterrupt:
+    pass
+
+
+def _report_rate_limit_wait(cfg) -> None:
+  from scrobble_cli.ratelimit import discogs_bucket
+
+  bucket = discogs_bucket(cfg.discogs.requests_per_minute)
+  if bucket.waited_seconds >= 0.5:
+    console.print(
+      f"Waited {bucket.waited_seconds:.1f}s across {bucket.waits} Discogs request(s) for the shared rate limit."
+    )
+
+
+def _render_plays(title: str, entries) -> None:
+  table = new_table(title, show_lines=False)
+  table.add_column("When")
+  table.add_column("Artist")
+  table.add_column("Title")
+  table.add_column("Album")
+  for e in entries:
+    t = e.track
+    when = datetime.fromtimestamp(t.timestamp_unix).strftime("%Y-%m-%d %H:%M")
+    table.add_row(when, t.artist, t.title, t.album)
+  console.print(table)
+
+
+def _select_accounts(cfg, account: str | None, all_accounts: bool) -> list[str]:
+  """The Last.fm accounts to submit to: `--account a,b`, `--all-accounts`, or the default one."""
+  if account and all_accounts:
+    console.print("Use either `--account` or `--all-accounts`, not both.")
+    raise typer.Exit(code=2)
+  if all_accounts:
+    names = account_names(cfg)
+    if not names:
+      console.print("No Last.fm accounts configured. Run `scrobble auth lastfm` first.")
+      raise typer.Exit(code=2)
+    return names
+  names: list[str] = []
+  for name in (n.strip().lower() for n in (account or "").split(",")):
+    if not name or name in names:
+      continue
+    try:
+      for_account(cfg, name)
+    except ValueError as e:
+      console.print(str(e))
+      raise typer.Exit(code=2)
+    names.append(name)
+  return names or [DEFAULT_ACCOUNT]
+
+
+def _check_duplicates(scrobbles, accounts: list[str], *, allow: bool, yes: bool, dry_run: bool) -> tuple[list[str], bool]:
+  """
+  Warns when the planned scrobbles duplicate plays already submitted to any of `accounts`. Under
+  `--yes` (a retried script) those accounts are skipped, exiting with code 5 when none is left;
+  otherwise the user is asked. Returns the accounts to submit to and whether the user confirmed.
+  """
+  from scrobble_cli.history import get_history
+
+  with trace.span("album.duplicates", accounts=len(accounts)):
+    dupes = {a: d for a in accounts if (d := get_history(a).check(scrobbles))}
+  if not dupes:
+    return accounts, False
+  multi = len(accounts) > 1
+  for name, d in dupes.items():
+    suffix = f" ({name})" if multi else ""
+    if d.overlapping:
+      _render_plays(f"Already scrobbled at overlapping times{suffix}", d.overlapping)
+    if d.replays:
+      _render_plays(f"Same album scrobbled recently{suffix}", d.replays)
+  if allow or dry_run:
+    return accounts, False
+  rest = [a for a in accounts if a not in dupes]
+  if yes:
+    if not rest:
+      console.print("Not scrobbling duplicates (use `--allow-duplicates` to submit anyway).")
+      raise typer.Exit(code=5)
+    console.print(f"Skipping {', '.join(dupes)}: already scrobbled there (use `--allow-duplicates` to submit anyway).")
+    return rest, False
+  import questionary
+
+  question = "This looks like a duplicate. Scrobble anyway?"
+  if multi:
+    question = f"This looks like a duplicate for {', '.join(dupes)}. Scrobble there anyway?"
+  if questionary.confirm(question, default=False).ask():
+    return accounts, True
+  if not rest:
+    raise typer.Exit(code=1)
+  return rest, False
+
+
+def _render_account_results(cfg, results) -> None:
+  table = new_table("Last.fm accounts", show_lines=False)
+  table.add_column("Account")
+  table.add_column("User")
+  table.add_column("Accepted", justify="right")
+  table.add_column("Ignored", justify="right")
+  table.add_column("Pending", justify="right")
+  table.add_column("Status", overflow="fold")
+  for name, r in results.items():
+    status = f"error: {r.errors[0]}" if r.errors else ("ok" if r.outcomes else "already submitted")
+    user = for_account(cfg, name).lastfm.username or ""
+    table.add_row(name, user, str(r.accepted), str(r.ignored), str(r.remaining), status)
+  console.print(table)
+
+
+def _flush_hint(account: str) -> str:
+  return "scrobble flush" if account == DEFAULT_ACCOUNT else f"scrobble flush --account {account}"
+
+
+def _remember(query: str, selected, *, vinyl_only: bool) -> None:
+  from scrobble_cli.memory import get_memory
+
+  get_memory().remember(query, vinyl_only=vinyl_only, kind=selected.kind, id=selected.id, title=selected.title)
+
+
+def _runtime(release) -> str:
+  known = [t.duration_seconds for t in release.tracks if t.duration_seconds]
+  if not known:
+    return ""
+  total = sum(known)
+  text = f"{total // 60}:{total % 60:02d}"
+  return text if len(known) == len(release.tracks) else f"≥{text}"
+
+
+def _prefetch_releases(be, results):
+  """
+  Starts fetching the top candidates' tracklists in the background while the picker is open.
+  Returns the pool (shut it down once a release is picked) and the futures by result index.
+  """
+  from concurrent.futures import ThreadPoolExecutor
+
+  def fetch(r):
+    with trace.span("album.prefetch", kind=r.kind):
+      return be.fetch_release(kind=r.kind, id=r.id)
+
+  pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+  return pool, {i: pool.submit(fetch, r) for i, r in enumerate(results[:PREFETCH_CANDIDATES])}
+
+
+def _render_results(results, releases=None):
+  """The picker table; `releases` (by result index) adds track counts and runtimes where known."""
+  table = new_table("Discogs matches", show_lines=False)
   table.add_column("#", justify="right", style="bold")
   table.add_column("Title")
   table.add_column("Year", justify="right")
@@ -68,23 +540,23 @@ def _render_results(results):
   table.add_column("Label")
   table.add_column("Cat#", overflow="fold")
   table.add_column("Type", justify="center")
+  if releases is not None:
+    table.add_column("Tracks", justify="right")
+    table.add_column("Time", justify="right")
   for i, r in enumerate(results, start=1):
-    table.add_row(
-      str(i),
-      r.title,
-      str(r.year or ""),
-      r.format or "",
-      r.label or "",
-      r.catno or "",
-      r.kind,
-    )
+    row = [str(i), r.title, str(r.year or ""), r.format or "", r.label or "", r.catno or "", r.kind]
+    if releases is not None:
+      release = releases.get(i - 1)
+      row += ["", ""] if release is None else [str(len(release.tracks)), _runtime(release)]
+    table.add_row(*row)
   console.print(table)
 
 
 @app.command("album")
+@metrics.timed("album_command_seconds")
 def scrobble_album_command(
-  query: list[str] = typer.Argument(
-    ...,
+  query: list[str] | None = typer.Argument(
+    None,
     help='Album query. Prefix with "ended" to scrobble as if you finished listening (e.g. `scrobble album ended barney wilen moshi`).',
   ),
   artist: str | None = typer.Option(None, "--artist", help="Optional artist (improves auto-match confidence)"),
@@ -101,6 +573,9 @@ def scrobble_album_command(
   ),
   vinyl_only: bool = typer.Option(True, "--vinyl/--any-format", help="Prefer vinyl matches on Discogs"),
   limit: int = typer.Option(10, "--max-results", min=1, max=25),
+  speculative: bool = typer.Option(
+    False, "--speculative", help="Also send the Discogs release search when masters are slow to answer (saves a round trip on a master miss)"
+  ),
   auto: bool = typer.Option(True, "--auto/--no-auto", help="Auto-pick only when extremely confident"),
   yes: bool = typer.Option(False, "-y", "--yes", help="Skip confirmation prompt"),
   dry_run: bool = typer.Option(False, "--dry-run", help="Print what would be scrobbled, but do not call Last.fm"),
@@ -109,20 +584,59 @@ def scrobble_album_command(
   ),
   search_only: bool = typer.Option(False, "--search-only", help="Print search results as JSON and exit"),
   pick: int | None = typer.Option(None, "--pick", help="Select result by number (1-indexed), skipping interactive selection"),
+  handle: str | None = typer.Option(
+    None, "--handle", help="Use the results `--search-only` saved under this handle instead of searching again"
+  ),
+  release_id: int | None = typer.Option(None, "--release-id", help="Scrobble this Discogs release (skips the search)"),
+  master_id: int | None = typer.Option(None, "--master-id", help="Scrobble this Discogs master (skips the search)"),
+  barcode: str | None = typer.Option(
+    None, "--barcode", help="Find the release by the barcode on the sleeve (an exact match is used without asking)"
+  ),
+  catno: str | None = typer.Option(
+    None, "--catno", help="Find the release by its catalog number (an exact match is used without asking)"
+  ),
+  use_memory: bool = typer.Option(
+    True, "--memory/--no-memory", help="Reuse the release picked for this query before (and remember this pick)"
+  ),
+  allow_duplicates: bool = typer.Option(
+    False, "--allow-duplicates", help="Submit even if the history shows these plays were already scrobbled"
+  ),
+  account: str | None = typer.Option(
+    None, "--account", help="Comma-separated Last.fm accounts to scrobble to (see `scrobble auth lastfm --account`)"
+  ),
+  all_accounts: bool = typer.Option(False, "--all-accounts", help="Scrobble to every configured Last.fm account"),
+  timings: bool = typer.Option(False, "--timings", help="Print how long each phase and HTTP call took (stderr)"),
 ):
   """
   Scrobble an album by looking up its tracklist on Discogs, then submitting a single batch to Last.fm.
   Defaults to "started now" timestamping (prefix the query with `ended` to use the previous behavior).
   """
-  cfg = load_config()
+  from scrobble_cli.daemon import attach, backend
+
+  if timings:
+    trace.enable("summary")
+  with trace.span("album.config") as s:
+    # A running daemon hands back the config it already parsed.
+    attached = attach()
+    cfg, be = attached if attached is not None else (load_config(), None)
+    accounts = _select_accounts(cfg, account, all_accounts)
+    if s:
+      s.set(backend="daemon" if be is not None else "local")
   try:
-    cfg = ensure_session(cfg, api_key=None, api_secret=None)
+    if DEFAULT_ACCOUNT in accounts and not has_session(cfg.lastfm):
+      from scrobble_cli.lastfm import ensure_session
+
+      with trace.span("album.session"):
+        cfg = ensure_session(cfg, api_key=None, api_secret=None)
+      if be is not None:
+        be.client.close()  # its config predates the new session
+        be = None
   except RuntimeError as e:
     console.print(str(e))
     console.print("Run `scrobble auth lastfm` first.")
     raise typer.Exit(code=2)
 
-  tokens = [t for t in query if t is not None]
+  tokens = [t for t in query or [] if t is not None]
   mode = "started"
   if tokens and tokens[0].lower() in ("ended", "end", "finish", "finished"):
     mode = "ended"
@@ -132,19 +646,114 @@ def scrobble_album_command(
     tokens = tokens[1:]
 
   query_str = " ".join(tokens).strip()
-  if not query_str:
+  if release_id is not None and master_id is not None:
+    console.print("Use either `--release-id` or `--master-id`, not both.")
+    raise typer.Exit(code=2)
+  direct = ("release", release_id) if release_id is not None else ("master", master_id) if master_id is not None else None
+  if direct is not None and (search_only or handle or pick is not None):
+    console.print("`--release-id`/`--master-id` can't be combined with `--search-only`, `--handle` or `--pick`.")
+    raise typer.Exit(code=2)
+  if barcode and catno:
+    console.print("Use either `--barcode` or `--catno`, not both.")
+    raise typer.Exit(code=2)
+  identifier = barcode or catno
+  if identifier and (direct is not None or handle):
+    console.print("`--barcode`/`--catno` can't be combined with `--release-id`, `--master-id` or `--handle`.")
+    raise typer.Exit(code=2)
+  if not query_str and direct is None and not handle and not identifier:
     console.print("Missing query.")
     raise typer.Exit(code=2)
 
-  results = search_query(cfg, query=query_str, vinyl_only=vinyl_only, limit=limit)
-  if not results:
+  # Where the plan starts (or ends, for `album ended ...`); checked before anything is looked up.
+  if mode == "ended" and started_at:
+    console.print("`--started-at` can't be used with `album ended ...`.")
+    raise typer.Exit(code=2)
+  if mode == "started" and ended_at:
+    console.print("`--ended-at` can't be used unless you prefix the query with `ended`.")
     raise typer.Exit(code=2)
+  anchor_unix = int(datetime.now().timestamp())
+  if started_at or ended_at:
+    flag = "--started-at" if started_at else "--ended-at"
+    try:
+      anchor_unix = int(datetime.fromisoformat(started_at or ended_at).timestamp())
+    except ValueError:
+      console.print(f'Invalid `{flag}`. Use ISO format like "2026-01-31T19:32:00".')
+      raise typer.Exit(code=2)
+
+  from scrobble_cli import searches
+  from scrobble_cli.discogs import DiscogsSearchResult
+
+  if be is None:
+    be = backend(cfg)
+  results = []
+  selected = None
+  remembered = None
+  suggested = None
+  exact = False
+  if use_memory and direct is None and not (search_only or handle or pick is not None or identifier):
+    from scrobble_cli.memory import get_memory
+
+    with trace.span("album.memory") as s:
+      remembered = get_memory().get(query_str, vinyl_only=vinyl_only)
+      if s:
+        s.set(hit=remembered is not None, close=remembered is not None and remembered.close)
+    if remembered is not None and remembered.close:
+      # Only the same query (or its words reordered) is trusted; a near miss is offered in the picker.
+      remembered, suggested = None, remembered
+  if direct is not None:
+    kind, id = direct
+    selected = DiscogsSearchResult(id=id, kind=kind, title="", year=None, country=None, label=None, catno=None, format=None)
+  elif remembered is not None:
+    selected = DiscogsSearchResult(
+      id=remembered.id, kind=remembered.kind, title=remembered.title, year=None, country=None, label=None, catno=None, format=None
+    )
+    console.print(f"Using your earlier pick for this query: {remembered.title} (`--no-memory` to search again).")
+  elif identifier:
+    label = "barcode" if barcode else "catalog number"
+    with trace.span("album.lookup", backend="daemon" if be.remote else "local", by=label) as s:
+      match, results = be.lookup_identifier(
+        barcode=barcode, catno=catno, query=query_str, vinyl_only=vinyl_only, limit=limit
+      )
+      if s:
+        s.set(results=len(results), exact=match is not None)
+    if not results:
+      console.print(f"No Discogs release found for {label} {identifier!r}.")
+      raise typer.Exit(code=2)
+    if match is not None and not search_only and pick is None:
+      selected, exact = match, True
+      console.print(f"Exact {label} match: {match.title}")
+  else:
+    with trace.span("album.search", backend="daemon" if be.remote else "local") as s:
+      source = "discogs"
+      if handle:
+        results = searches.load(handle)
+        if results is None:
+          console.print(f"Search handle {handle!r} is unknown or expired. Run `--search-only` again.")
+          raise typer.Exit(code=2)
+        source = "handle"
+      elif pick is not None and (saved := searches.latest(query_str, vinyl_only=vinyl_only, limit=limit)):
+        # The list a `--search-only` run just showed for this query, so N is the release that was seen.
+        results, source = saved, "saved"
+      else:
+        results = be.search_query(
+          query=query_str,
+          vinyl_only=vinyl_only,
+          limit=limit,
+          speculative=speculative,
+          # Only an auto-pick benefits from reading past the first page.
+          until_confident=auto and pick is None and not search_only,
+        )
+      if s:
+        s.set(results=len(results), source=source)
+    if not results:
+      raise typer.Exit(code=2)
 
   if search_only:
     items = []
     for i, r in enumerate(results, start=1):
       items.append({
         "number": i,
+        "id": r.id,
         "title": r.title,
         "year": r.year,
         "format": r.format,
@@ -152,85 +761,101 @@ def scrobble_album_command(
         "catno": r.catno,
         "type": r.kind,
       })
-    console.print_json(json.dumps(items))
+    saved_handle = searches.save(query_str, results, vinyl_only=vinyl_only, limit=limit)
+    console.print_json(json.dumps({"handle": saved_handle, "results": items}))
     raise typer.Exit(code=0)
 
-  selected = None
+  picked = False
   if pick is not None:
     if pick < 1 or pick > len(results):
       console.print(f"--pick must be between 1 and {len(results)}.")
       raise typer.Exit(code=2)
     selected = results[pick - 1]
-  elif auto:
-    top = results[0]
-    if artist and album:
-      confidence = discogs_title_confidence(artist=artist, album=album, discogs_title=top.title)
-    else:
-      confidence = discogs_query_confidence(query=query_str, discogs_title=top.title)
-    if confidence >= 0.92:
-      selected = top
+    picked = True
+  elif auto and selected is None and query_str:
+    from scrobble_cli.matching import auto_pick
 
+    with trace.span("album.match"):
+      selected = auto_pick(results, query=query_str, artist=artist, album=album, vinyl_only=vinyl_only)
+
+  prefetched = {}
   if not selected:
-    _render_results(results)
-    choices = [f"{i}. {r.title} [{r.kind}] {r.year or ''}".strip() for i, r in enumerate(results, start=1)]
-    picked_choice = questionary.select("Pick the correct release:", choices=choices).ask()
-    if not picked_choice:
-      raise typer.Exit(code=1)
-    idx = int(picked_choice.split(".", 1)[0]) - 1
-    selected = results[idx]
+    from concurrent.futures import wait
 
-  release = fetch_release(cfg, kind=selected.kind, id=selected.id)
-  if not release.tracks:
-    console.print("No tracklist found on Discogs for that selection.")
-    raise typer.Exit(code=2)
+    import questionary
 
-  default_duration = 240
-  durations = [(t.duration_seconds or default_duration) for t in release.tracks]
-  now_unix = int(datetime.now().timestamp())
+    default = None
+    if suggested is not None:
+      at = next((i for i, r in enumerate(results) if (r.kind, r.id) == (suggested.kind, suggested.id)), None)
+      if at is None:
+        results = [
+          DiscogsSearchResult(
+            id=suggested.id, kind=suggested.kind, title=suggested.title, year=None, country=None, label=None, catno=None, format=None
+          ),
+          *results,
+        ]
+        at = 0
+      default = at
+      console.print(f"You picked {suggested.title} for the similar query {suggested.query!r}; it is preselected.")
+    pool, prefetched = _prefetch_releases(be, results)
+    try:
+      wait(prefetched.values(), timeout=PREFETCH_TABLE_WAIT_SECONDS)
+      ready = {i: f.result() for i, f in prefetched.items() if f.done() and f.exception() is None}
+      _render_results(results, ready)
+      choices = [f"{i}. {r.title} [{r.kind}] {r.year or ''}".strip() for i, r in enumerate(results, start=1)]
+      picked_choice = questionary.select(
+        "Pick the correct release:", choices=choices, default=None if default is None else choices[default]
+      ).ask()
+      if not picked_choice:
+        raise typer.Exit(code=1)
+      idx = int(picked_choice.split(".", 1)[0]) - 1
+      selected = results[idx]
+      picked = True
+      prefetched = {idx: prefetched[idx]} if idx in prefetched else {}
+    finally:
+      # Drop the queued prefetches; the picked one (if already running) is awaited below.
+      pool.shutdown(wait=False, cancel_futures=True)
+  if picked and use_memory and identifier:
+    from scrobble_cli.discogs import remember_identifier
 
-  if mode == "ended":
-    if started_at:
-      console.print("`--started-at` can't be used with `album ended ...`.")
-      raise typer.Exit(code=2)
-    if ended_at:
-      try:
-        dt = datetime.fromisoformat(ended_at)
-      except ValueError:
-        console.print('Invalid `--ended-at`. Use ISO format like "2026-01-31T19:32:00".')
-        raise typer.Exit(code=2)
-      end_unix = int(dt.timestamp())
-    else:
-      end_unix = now_unix
-    timestamps = plan_from_end(end_unix, durations)
+    remember_identifier(cfg, selected, barcode=barcode, catno=catno)
+  elif picked and use_memory and query_str:
+    _remember(query_str, selected, vinyl_only=vinyl_only)
+  if direct is not None:
+    how = "direct"
+  elif remembered is not None:
+    how = "memory"
+  elif exact:
+    how = "identifier"
+  elif picked:
+    how = "pick" if pick is not None else "picker"
   else:
-    if ended_at:
-      console.print("`--ended-at` can't be used unless you prefix the query with `ended`.")
-      raise typer.Exit(code=2)
-    if started_at:
-      try:
-        dt = datetime.fromisoformat(started_at)
-      except ValueError:
-        console.print('Invalid `--started-at`. Use ISO format like "2026-01-31T19:32:00".')
-        raise typer.Exit(code=2)
-      start_unix = int(dt.timestamp())
-    else:
-      start_unix = now_unix
-    timestamps = plan_from_start(start_unix, durations)
-
-  scrobbles: list[ScrobbleTrack] = []
-  for t, ts in zip(release.tracks, timestamps, strict=True):
-    scrobbles.append(
-      ScrobbleTrack(
-        artist=release.artist,
-        title=t.title,
-        album=release.album,
-        album_artist=release.artist,
-        timestamp_unix=ts,
-        duration_seconds=t.duration_seconds,
-      )
-    )
+    how = "auto"
+  metrics.inc("album_resolution_total", via=how)
+
+  release = None
+  for future in prefetched.values():
+    if not future.cancelled() and future.exception() is None:
+      release = future.result()
+  if release is None:
+    # Fetch, enrich and timing in one call (one round trip when the daemon runs it).
+    with trace.span("album.plan", kind=selected.kind) as s:
+      release, scrobbles = be.plan(kind=selected.kind, id=selected.id, mode=mode, at=anchor_unix)
+      if s:
+        s.set(tracks=len(release.tracks))
+  else:
+    from scrobble_cli.plan import plan_scrobbles
 
-  preview = Table(title=f"{release.artist} — {release.album}", show_lines=False)
+    with trace.span("album.enrich", prefetched=True):
+      release = be.enrich_durations(release)
+    scrobbles = plan_scrobbles(release, mode=mode, at=anchor_unix)
+  if not be.remote:
+    _report_rate_limit_wait(cfg)
+  if not release.tracks:
+    console.print("No tracklist found on Discogs for that selection.")
+    raise typer.Exit(code=2)
+
+  preview = new_table(f"{release.artist} — {release.album}", show_lines=False)
   preview.add_column("#", justify="right")
   preview.add_column("Pos", justify="right")
   preview.add_column("Title")
@@ -241,73 +866,540 @@ def scrobble_album_command(
     preview.add_row(str(i), t.position or "", t.title, dur)
   console.print(preview)
 
-  if not yes and not (auto and selected == results[0]):
-    ok = questionary.confirm(f"Scrobble {len(scrobbles)} tracks to Last.fm now?").ask()
+  accounts, confirmed = _check_duplicates(scrobbles, accounts, allow=allow_duplicates, yes=yes, dry_run=dry_run)
+  confident = remembered is not None or exact or (results and selected == results[0])
+  if not yes and not confirmed and not (auto and confident):
+    import questionary
+
+    where = "Last.fm" if accounts == [DEFAULT_ACCOUNT] else ", ".join(accounts)
+    ok = questionary.confirm(f"Scrobble {len(scrobbles)} tracks to {where} now?").ask()
     if not ok:
       raise typer.Exit(code=1)
 
   if dry_run:
     console.print("Dry run: not calling Last.fm.")
     raise typer.Exit(code=0)
+  if use_memory and query_str and results and not picked and not identifier:
+    # An auto-pick that is being submitted counts as confirmed.
+    _remember(query_str, selected, vinyl_only=vinyl_only)
 
-  res = scrobble_album(cfg, scrobbles)
-  console.print("Submitted to Last.fm.")
+  # The release is resolved and the tracks planned once; every account gets the same submission.
+  with trace.span("album.submit", tracks=len(scrobbles), accounts=len(accounts)):
+    if accounts == [DEFAULT_ACCOUNT]:
+      flushed = {DEFAULT_ACCOUNT: be.scrobble(scrobbles)}
+    else:
+      flushed = be.scrobble_accounts(scrobbles, accounts)
+  multi = len(flushed) > 1
+  failed = {name: r for name, r in flushed.items() if r.errors}
+  if multi:
+    _render_account_results(cfg, flushed)
+  else:
+    [(name, result)] = flushed.items()
+    if result.errors:
+      console.print(f"Last.fm error: {result.errors[0]}")
+      if result.remaining:
+        console.print(f"{result.remaining} track(s) are kept in the outbox; run `{_flush_hint(name)}` to retry.")
+      raise typer.Exit(code=3)
+    if not result.outcomes:
+      console.print("These tracks were already submitted; nothing sent.")
+      raise typer.Exit(code=0)
+    console.print("Submitted to Last.fm.")
 
-  ignored_items: list[tuple[str, str, str]] = []
+  ignored_items: list[tuple[str, str, str, str]] = []
   ts_to_discogs = {}
-  for i, (t, ts) in enumerate(zip(release.tracks, timestamps, strict=True), start=1):
-    ts_to_discogs[int(ts)] = (t.position or str(i), t.title, t.duration_seconds)
+  for i, (t, scrobble) in enumerate(zip(release.tracks, scrobbles, strict=True), start=1):
+    ts_to_discogs[scrobble.timestamp_unix] = (t.position or str(i), t.title, t.duration_seconds)
 
-  for b in res.get("batches") or []:
-    if "error" in b:
-      console.print(f"Last.fm error: {b.get('message')}")
-      raise typer.Exit(code=3)
-    scrobbles_obj = (b.get("scrobbles") or {}).get("scrobble")
-    if isinstance(scrobbles_obj, dict):
-      scrobbles_obj = [scrobbles_obj]
-    for s in scrobbles_obj or []:
-      ignored_msg = s.get("ignoredMessage") or {}
-      code = str(ignored_msg.get("code") or "0")
-      if code == "0":
+  for name, result in flushed.items():
+    for o in result.outcomes.values():
+      if o.accepted:
         continue
-
-      try:
-        ts = int(s.get("timestamp"))
-      except Exception:
-        ts = None
-
-      track_obj = s.get("track")
-      if isinstance(track_obj, dict):
-        title = str(track_obj.get("#text") or "")
-      else:
-        title = str(track_obj or "")
-
-      reason = str(ignored_msg.get("#text") or "").strip() or f"ignoredMessage.code={code}"
-
-      if ts is not None and ts in ts_to_discogs:
-        pos, discogs_title, discogs_dur = ts_to_discogs[ts]
+      title = o.title
+      reason = o.ignored_reason
+      if o.timestamp_unix is not None and o.timestamp_unix in ts_to_discogs:
+        pos, discogs_title, discogs_dur = ts_to_discogs[o.timestamp_unix]
         title = discogs_title or title
         if discogs_dur is not None and discogs_dur < 30:
           reason = f"{reason} (likely too short for Last.fm)"
       else:
         pos = ""
 
-      ignored_items.append((pos, title, reason))
+      ignored_items.append((name, pos, title, reason))
 
   if ignored_items:
-    table = Table(title="Ignored by Last.fm", show_lines=False)
+    table = new_table("Ignored by Last.fm", show_lines=False)
+    if multi:
+      table.add_column("Account")
     table.add_column("Pos", justify="right")
     table.add_column("Title")
     table.add_column("Reason", overflow="fold")
-    for pos, title, reason in ignored_items:
-      table.add_row(pos, title, reason)
+    for name, pos, title, reason in ignored_items:
+      table.add_row(*((name,) if multi else ()), pos, title, reason)
     console.print(table)
     console.print(f"{len(ignored_items)} track(s) were ignored by Last.fm.")
+  if failed:
+    for name, r in failed.items():
+      if r.remaining:
+        console.print(f"{name}: {r.remaining} track(s) are kept in the outbox; run `{_flush_hint(name)}` to retry.")
+    raise typer.Exit(code=3)
+  if ignored_items:
     if not allow_ignored:
       console.print("Treating as failure (use `--allow-ignored` to ignore this).")
       raise typer.Exit(code=4)
 
 
+def _is_barcode(code: str) -> bool:
+  """Scanners send the digits of an EAN/UPC; anything else typed at the prompt is a catalog number."""
+  compact = code.replace(" ", "").replace("-", "")
+  return compact.isdigit() and len(compact) >= 8
+
+
+@app.command("scan")
+def scan_command(
+  vinyl_only: bool = typer.Option(True, "--vinyl/--any-format", help="Prefer vinyl when matching catalog numbers"),
+  limit: int = typer.Option(10, "--max-results", min=1, max=25),
+  dry_run: bool = typer.Option(False, "--dry-run", help="Resolve each scan, but do not call Last.fm"),
+  allow_duplicates: bool = typer.Option(
+    False, "--allow-duplicates", help="Submit even if the history shows a record was just scrobbled"
+  ),
+  account: str | None = typer.Option(
+    None, "--account", help="Comma-separated Last.fm accounts to scrobble to (see `scrobble auth lastfm --account`)"
+  ),
+  all_accounts: bool = typer.Option(False, "--all-accounts", help="Scrobble to every configured Last.fm account"),
+):
+  """
+  Scrobble records as you scan them: reads one barcode (or catalog number) per line from stdin, e.g.
+  a USB barcode scanner, and scrobbles each exact match as started now. Codes that match several
+  releases are listed instead; pick one with `scrobble album --barcode ... --pick N`.
+  """
+  import time
+
+  from scrobble_cli.daemon import attach, backend
+
+  attached = attach()
+  cfg, be = attached if attached is not None else (load_config(), None)
+  accounts = _select_accounts(cfg, account, all_accounts)
+  try:
+    if DEFAULT_ACCOUNT in accounts and not dry_run and not has_session(cfg.lastfm):
+      from scrobble_cli.lastfm import ensure_session
+
+      cfg = ensure_session(cfg, api_key=None, api_secret=None)
+      if be is not None:
+        be.client.close()  # its config predates the new session
+        be = None
+  except RuntimeError as e:
+    console.print(str(e))
+    console.print("Run `scrobble auth lastfm` first.")
+    raise typer.Exit(code=2)
+
+  # One backend for the whole session keeps connections (or the daemon socket) warm between scans.
+  if be is None:
+    be = backend(cfg)
+  if sys.stdin.isatty():
+    console.print("Scan a barcode (or type a catalog number) and press Enter. Ctrl-D to stop.")
+  missed = 0
+  try:
+    for line in sys.stdin:
+      code = line.strip()
+      if not code:
+        continue
+      started = time.perf_counter()
+      flag = "--barcode" if _is_barcode(code) else "--catno"
+      with trace.span("scan.lookup", by=flag[2:]):
+        try:
+          match, results = be.lookup_identifier(
+            barcode=code if flag == "--barcode" else None,
+            catno=None if flag == "--barcode" else code,
+            vinyl_only=vinyl_only,
+            limit=limit,
+          )
+          release, scrobbles = (
+            be.plan(kind=match.kind, id=match.id, mode="started", at=int(datetime.now().timestamp()))
+            if match is not None
+            else (None, [])
+          )
+        except Exception as e:
+          console.print(f"{code}: Discogs lookup failed: {e}")
+          missed += 1
+          continue
+      if release is None:
+        missed += 1
+        if not results:
+          console.print(f"{code}: no Discogs release found.")
+          continue
+        console.print(f"{code}: {len(results)} releases match. Pick one with `scrobble album {flag} {code} --pick N`:")
+        for i, r in enumerate(results, start=1):
+          console.print(f"  {i}. {r.title} ({r.year or '?'}, {r.label or '?'} {r.catno or ''})".rstrip())
+        continue
+      if not release.tracks:
+        console.print(f"{code}: {release.artist} — {release.album} has no tracklist on Discogs.")
+        missed += 1
+        continue
+
+      try:
+        targets, _ = _check_duplicates(scrobbles, accounts, allow=allow_duplicates, yes=True, dry_run=dry_run)
+      except typer.Exit:
+        missed += 1
+        continue
+      name = f"{release.artist} — {release.album}"
+      if dry_run:
+        console.print(f"{code}: {name}, {len(scrobbles)} tracks (dry run, {time.perf_counter() - started:.2f}s).")
+        continue
+      with trace.span("scan.submit", tracks=len(scrobbles), accounts=len(targets)):
+        if targets == [DEFAULT_ACCOUNT]:
+          flushed = {DEFAULT_ACCOUNT: be.scrobble(scrobbles)}
+        else:
+          flushed = be.scrobble_accounts(scrobbles, targets)
+      accepted = sum(r.accepted for r in flushed.values())
+      console.print(
+        f"{code}: scrobbled {name}, {accepted}/{len(scrobbles) * len(flushed)} tracks accepted "
+        f"({time.perf_counter() - started:.2f}s)."
+      )
+      for target, r in flushed.items():
+        if r.errors:
+          missed += 1
+          console.print(f"  {target}: Last.fm error: {r.errors[0]}. Kept in the outbox; run `{_flush_hint(target)}`.")
+  except KeyboardInterrupt:
+    pass
+  if missed:
+    raise typer.Exit(code=3)
+
+
+@app.command("flush")
+def flush_command(
+  list_only: bool = typer.Option(False, "--list", help="Show pending tracks without submitting"),
+  discard: bool = typer.Option(False, "--discard", help="Drop every pending track without submitting"),
+  account: str | None = typer.Option(None, "--account", help="Comma-separated Last.fm accounts whose outbox to use"),
+  all_accounts: bool = typer.Option(False, "--all-accounts", help="Use the outbox of every configured Last.fm account"),
+):
+  """Submit tracks left in the outbox by an interrupted or failed scrobble."""
+  from scrobble_cli.outbox import get_outbox, map_accounts
+
+  cfg = load_config()
+  accounts = _select_accounts(cfg, account, all_accounts)
+  multi = len(accounts) > 1
+  if discard:
+    for name in accounts:
+      prefix = f"{name}: " if multi else ""
+      console.print(f"{prefix}Discarded {get_outbox(name).discard_pending()} pending track(s).")
+    return
+
+  pending = {name: get_outbox(name).pending() for name in accounts}
+  if list_only or not any(pending.values()):
+    if not any(pending.values()):
+      console.print("Outbox is empty.")
+      return
+    table = new_table("Outbox", show_lines=False)
+    if multi:
+      table.add_column("Account")
+    table.add_column("When")
+    table.add_column("Artist")
+    table.add_column("Title")
+    table.add_column("Album")
+    table.add_column("Status")
+    for name, entries in pending.items():
+      for e in entries:
+        table.add_row(
+          *((name,) if multi else ()),
+          datetime.fromtimestamp(e.track.timestamp_unix).strftime("%Y-%m-%d %H:%M"),
+          e.track.artist,
+          e.track.title,
+          e.track.album,
+          e.status,
+        )
+    console.print(table)
+    return
+
+  from scrobble_cli.lastfm import ensure_session
+
+  if DEFAULT_ACCOUNT in accounts and pending[DEFAULT_ACCOUNT]:
+    try:
+      cfg = ensure_session(cfg, api_key=None, api_secret=None)
+    except RuntimeError as e:
+      console.print(str(e))
+      console.print("Run `scrobble auth lastfm` first.")
+      raise typer.Exit(code=2)
+
+  results = map_accounts(
+    [name for name in accounts if pending[name]], lambda name: get_outbox(name).flush(for_account(cfg, name))
+  )
+  for name, result in results.items():
+    prefix = f"{name}: " if multi else ""
+    console.print(f"{prefix}Accepted {result.accepted}, ignored {result.ignored}, still pending {result.remaining}.")
+    if result.errors:
+      console.print(f"{prefix}Last.fm error: {result.errors[0]}")
+  if any(r.errors for r in results.values()):
+    raise typer.Exit(code=3)
+
+
+@app.command("history")
+def history_command(
+  since: str | None = typer.Option(None, "--since", help='ISO timestamp or date (e.g. "2026-01-31")'),
+  until: str | None = typer.Option(None, "--until", help="ISO timestamp or date (exclusive)"),
+  limit: int = typer.Option(50, "--limit", min=1, help="Most recent plays to show"),
+  account: str | None = typer.Option(None, "--account", help="Show another Last.fm account's history"),
+):
+  """Show scrobbles submitted from this machine, newest first."""
+  from scrobble_cli.history import get_history
+
+  bounds = []
+  for flag, value in (("--since", since), ("--until", until)):
+    try:
+      bounds.append(int(datetime.fromisoformat(value).timestamp()) if value else None)
+    except ValueError:
+      console.print(f'Invalid `{flag}`. Use ISO format like "2026-01-31" or "2026-01-31T19:32:00".')
+      raise typer.Exit(code=2)
+
+  [name] = _select_accounts(load_config(), account and account.split(",", 1)[0], False)
+  history = get_history(name)
+  entries = history.between(bounds[0], bounds[1], limit=limit)
+  if not entries:
+    console.print("No scrobbles in the history for that range.")
+    return
+  _render_plays("Scrobble history", entries)
+  console.print(f"Showing {len(entries)} of {history.count():,} recorded scrobbles.")
+
+
+@app.command("batch")
+def batch_command(
+  file: Path | None = typer.Argument(
+    None,
+    help='File with one album query per line, or JSONL like {"query": "...", "pick": 2, "started_at": "..."}. Reads stdin if omitted or "-".',
+  ),
+  started_at: str | None = typer.Option(
+    None,
+    "--started-at",
+    help="ISO timestamp when the first album started. Defaults to back-to-back plays that end now.",
+  ),
+  vinyl_only: bool = typer.Option(True, "--vinyl/--any-format", help="Prefer vinyl matches on Discogs"),
+  limit: int = typer.Option(10, "--max-results", min=1, max=25),
+  workers: int = typer.Option(4, "--workers", min=1, max=16, help="Concurrent Discogs lookups"),
+  use_memory: bool = typer.Option(
+    True, "--memory/--no-memory", help="Reuse releases picked for these queries before (and remember explicit picks)"
+  ),
+  speculative: bool = typer.Option(
+    False, "--speculative", help="Also send the Discogs release search when masters are slow to answer (saves a round trip on a master miss)"
+  ),
+  yes: bool = typer.Option(False, "-y", "--yes", help="Skip confirmation prompt"),
+  dry_run: bool = typer.Option(False, "--dry-run", help="Resolve and plan, but do not call Last.fm"),
+  allow_ignored: bool = typer.Option(
+    False, "--allow-ignored", help="Exit 0 even if Last.fm ignores some tracks (still prints details)"
+  ),
+  allow_duplicates: bool = typer.Option(
+    False, "--allow-duplicates", help="Submit even if the history shows these plays were already scrobbled"
+  ),
+  account: str | None = typer.Option(
+    None, "--account", help="Comma-separated Last.fm accounts to scrobble to (see `scrobble auth lastfm --account`)"
+  ),
+  all_accounts: bool = typer.Option(False, "--all-accounts", help="Scrobble to every configured Last.fm account"),
+  timings: bool = typer.Option(False, "--timings", help="Print how long each phase and HTTP call took (stderr)"),
+):
+  """
+  Scrobble many albums at once: resolve every query on Discogs concurrently, play them back-to-back,
+  and submit all tracks in full 50-track batches. Queries without a confident match need a `pick`.
+  """
+  from scrobble_cli.batch import plan_items, read_items, resolve_items, tally
+  from scrobble_cli.lastfm import ensure_session
+
+  if timings:
+    trace.enable("summary")
+  cfg = load_config()
+  accounts = _select_accounts(cfg, account, all_accounts)
+  try:
+    if DEFAULT_ACCOUNT in accounts:
+      cfg = ensure_session(cfg, api_key=None, api_secret=None)
+  except RuntimeError as e:
+    console.print(str(e))
+    console.print("Run `scrobble auth lastfm` first.")
+    raise typer.Exit(code=2)
+
+  try:
+    if file is None or str(file) == "-":
+      items = read_items(sys.stdin)
+    else:
+      with file.open(encoding="utf-8") as f:
+        items = read_items(f)
+  except (OSError, ValueError) as e:
+    console.print(f"Can't read batch input: {e}")
+    raise typer.Exit(code=2)
+  if not items:
+    console.print("No queries to scrobble.")
+    raise typer.Exit(code=2)
+
+  start_unix = None
+  if started_at:
+    try:
+      start_unix = int(datetime.fromisoformat(started_at).timestamp())
+    except ValueError:
+      console.print('Invalid `--started-at`. Use ISO format like "2026-01-31T19:32:00".')
+      raise typer.Exit(code=2)
+
+  with trace.span("batch.resolve", albums=len(items)):
+    resolved = resolve_items(
+      cfg, items, vinyl_only=vinyl_only, limit=limit, workers=workers, speculative=speculative, memory=use_memory
+    )
+  _report_rate_limit_wait(cfg)
+  try:
+    planned = plan_items(resolved, start_unix=start_unix, now_unix=int(datetime.now().timestamp()))
+  except ValueError as e:
+    console.print(str(e))
+    raise typer.Exit(code=2)
+
+  scrobbles = [t for p in planned for t in p.scrobbles]
+  failed = [r for r in resolved if r.error is not None]
+  console.print(f"Resolved {len(planned)}/{len(resolved)} album(s), {len(scrobbles)} track(s).")
+
+  reports = {}
+  confirmed = False
+  if scrobbles:
+    accounts, confirmed = _check_duplicates(scrobbles, accounts, allow=allow_duplicates, yes=yes, dry_run=dry_run)
+  if scrobbles and not dry_run:
+    if not yes and not confirmed:
+      import questionary
+
+      where = "Last.fm" if accounts == [DEFAULT_ACCOUNT] else ", ".join(accounts)
+      ok = questionary.confirm(f"Scrobble {len(scrobbles)} tracks from {len(planned)} album(s) to {where} now?").ask()
+      if not ok:
+        raise typer.Exit(code=1)
+    from scrobble_cli.outbox import get_outbox, map_accounts
+
+    def submit(name: str):
+      outbox = get_outbox(name)
+      item_ids = [outbox.enqueue(p.scrobbles) for p in planned]
+      return tally(planned, item_ids, outbox.flush(for_account(cfg, name), ids=[i for ids in item_ids for i in ids]))
+
+    with trace.span("batch.submit", tracks=len(scrobbles), accounts=len(accounts)):
+      reports = map_accounts(accounts, submit)
+  elif dry_run:
+    console.print("Dry run: not calling Last.fm.")
+
+  multi = len(accounts) > 1
+  table = new_table("Batch results", show_lines=False)
+  if multi:
+    table.add_column("Account")
+  table.add_column("Line", justify="right")
+  table.add_column("Query")
+  table.add_column("Release")
+  table.add_column("Tracks", justify="right")
+  table.add_column("Accepted", justify="right")
+  table.add_column("Ignored", justify="right")
+  table.add_column("Status", overflow="fold")
+  for name in accounts:
+    by_line = {r.resolved.item.line_no: r for r in reports.get(name, [])}
+    for p in planned:
+      rel = p.resolved.release
+      rep = by_line.get(p.resolved.item.line_no)
+      status = "planned" if rep is None else (rep.error or "ok")
+      table.add_row(
+        *((name,) if multi else ()),
+        str(p.resolved.item.line_no),
+        p.resolved.item.query,
+        f"{rel.artist} — {rel.album}",
+        str(len(p.scrobbles)),
+        "" if rep is None else str(rep.accepted),
+        "" if rep is None else str(rep.ignored),
+        status,
+      )
+  for r in failed:
+    rel = r.release
+    table.add_row(
+      *(("",) if multi else ()),
+      str(r.item.line_no),
+      r.item.query,
+      "" if rel is None else f"{rel.artist} — {rel.album}",
+      "",
+      "",
+      "",
+      r.error,
+    )
+  console.print(table)
+
+  all_reports = [r for rs in reports.values() for r in rs]
+  if failed or any(r.error for r in all_reports):
+    raise typer.Exit(code=3)
+  if any(r.ignored for r in all_reports) and not allow_ignored:
+    console.print("Some tracks were ignored by Last.fm (use `--allow-ignored` to exit 0).")
+    raise typer.Exit(code=4)
+
+
+@app.command("import")
+def import_command(
+  file: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV, TSV or JSONL with artist, track, timestamp (album, duration optional)"),
+  fmt: str | None = typer.Option(None, "--format", help="csv, tsv or jsonl (default: from the file extension)"),
+  account: str | None = typer.Option(None, "--account", help="Import into another Last.fm account"),
+  restart: bool = typer.Option(False, "--restart", help="Ignore the checkpoint and start from the first row"),
+  dry_run: bool = typer.Option(False, "--dry-run", help="Read and check every row, but do not call Last.fm"),
+  allow_ignored: bool = typer.Option(
+    False, "--allow-ignored", help="Exit 0 even if Last.fm ignores some tracks (still prints details)"
+  ),
+):
+  """
+  Scrobble plays that need no Discogs lookup (logger exports, spreadsheets), streaming the file in
+  50-track batches. An interrupted import continues from the last acknowledged row when run again.
+  """
+  from scrobble_cli import importer
+  from scrobble_cli.lastfm import ensure_session
+
+  if fmt is not None and fmt.lower() not in importer.FORMATS:
+    console.print(f"`--format` must be one of: {', '.join(importer.FORMATS)}.")
+    raise typer.Exit(code=2)
+  cfg = load_config()
+  [name] = _select_accounts(cfg, account and account.split(",", 1)[0], False)
+  if not dry_run:
+    try:
+      cfg = ensure_session(cfg, api_key=None, api_secret=None) if name == DEFAULT_ACCOUNT else for_account(cfg, name)
+    except RuntimeError as e:
+      console.print(str(e))
+      console.print("Run `scrobble auth lastfm` first.")
+      raise typer.Exit(code=2)
+
+  last_report = [0.0]
+
+  def on_progress(p) -> None:
+    now = p.seconds
+    if now - last_report[0] >= 2.0:
+      last_report[0] = now
+      console.print(
+        f"  Row {p.row:,}: {p.accepted:,} accepted, {p.ignored:,} ignored, {p.skipped:,} skipped "
+        f"({p.rows_per_second:,.0f} rows/s)…"
+      )
+
+  try:
+    with trace.span("import.run", dry_run=dry_run) as s:
+      p = importer.run_import(
+        cfg, file, fmt=fmt and fmt.lower(), account=name, restart=restart, dry_run=dry_run, on_progress=on_progress
+      )
+      if s:
+        s.set(rows=p.read, accepted=p.accepted)
+  except (OSError, UnicodeDecodeError, RuntimeError) as e:
+    console.print(f"Can't import {file}: {e}")
+    raise typer.Exit(code=2)
+  except KeyboardInterrupt:
+    console.print("Interrupted. Run the same command again to continue after the last acknowledged batch.")
+    raise typer.Exit(code=1)
+
+  if p.resumed_from:
+    console.print(f"Resumed after row {p.resumed_from:,} (`--restart` to start over).")
+  rate = f"{p.seconds:.1f}s, {p.rows_per_second:,.0f} rows/s"
+  if dry_run:
+    console.print(f"Dry run: {p.read:,} rows read in {rate}; {p.valid:,} can be scrobbled, {p.skipped:,} would be skipped.")
+  else:
+    console.print(
+      f"Read {p.read:,} rows in {rate} ({p.scrobbles_per_second:,.0f} scrobbles/s). In total: "
+      f"{p.accepted:,} accepted, {p.ignored:,} ignored, {p.duplicates:,} already scrobbled, {p.skipped:,} skipped."
+    )
+  for label, reasons in (("Skipped", p.skip_reasons), ("Ignored by Last.fm", p.ignore_reasons)):
+    for reason, n in reasons.most_common(3):
+      console.print(f"  {label}: {n:,} × {reason}")
+
+  if p.error:
+    console.print(f"Stopped after row {p.row:,}: {p.error}. Run the same command again to continue.")
+    raise typer.Exit(code=3)
+  if p.ignored and not allow_ignored and not dry_run:
+    console.print("Some tracks were ignored by Last.fm (use `--allow-ignored` to exit 0).")
+    raise typer.Exit(code=4)
+
+
 if __name__ == "__main__":
   app()
 
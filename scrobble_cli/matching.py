@@ -1,47 +1,403 @@
 from __future__ import annotations
 
+import heapq
+import math
 import re
+import time
+import unicodedata
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Generic, Protocol, Sequence, TypeVar
 
+from scrobble_cli import metrics
 
+
+# Only auto-pick when we're extremely confident; anything below goes to the picker.
+AUTO_PICK_CONFIDENCE = 0.92
+
+# Feature weights, fitted on benchmarks/matching_cases.jsonl (see benchmarks/matching.py, which also
+# reports the cross-validated precision: the in-sample figure overstates it).
+# Confidence is a softmax over the candidate albums plus a "none of these" option scored 0,
+# so BIAS sets how good a match has to be before it beats "none".
+BIAS = -8.9
+W_RECALL = 3.6  # share of the wanted tokens present in the title
+W_TRIGRAM = 3.9  # character-trigram overlap: typos, extra words ("Live", "Deluxe", tributes)
+W_EDIT = 4.5  # edit-distance similarity
+W_ARTIST_ONLY = -2.8  # the query names only the artist, not which of their albums
+W_YEAR_MATCH = 2.2
+W_YEAR_MISMATCH = -0.2
+W_FORMAT = 0.6  # a vinyl result when vinyl was asked for
+W_UNOFFICIAL = -2.4
+W_MASTER = 0.8  # masters stand for the album as a whole; small, so release-only lists can auto-pick
+
+# Features are computed as a cascade so large candidate lists (the offline index) stay cheap:
+# token overlap for every candidate, trigrams for the best TRIGRAM_CANDIDATES by that, and edit
+# distance for the best EDIT_CANDIDATES. Skipped features fall back to the token Dice overlap.
+# Only the TRIGRAM_CANDIDATES shortlist competes for the confidence.
+TRIGRAM_CANDIDATES = 1024
+EDIT_CANDIDATES = 64
+
+_STOPWORDS = frozenset({"a", "an", "the", "and", "&", "of", "+", "lp", "vinyl"})
+_DISAMBIGUATION = re.compile(r"\s*\(\d+\)")  # "John Coltrane (2)"
+_APOSTROPHE = re.compile(r"['\u2019`]")  # "What's" matches "whats"
+_PUNCTUATION = re.compile(r"[^a-z0-9&+]+")  # "MM..Food", "Wu-Tang", "85-92" split into words
+_YEAR = re.compile(r"(19|20)\d\d")
+
+
+class _Candidate(Protocol):
+  title: str
+  year: int | None
+  format: str | None
+  kind: str
+
+
+T = TypeVar("T", bound=_Candidate)
+
+
+@dataclass(frozen=True)
+class Ranked(Generic[T]):
+  result: T
+  confidence: float
+
+
+@lru_cache(maxsize=1 << 18)
 def _norm(s: str) -> str:
-  s = (s or "").strip().lower()
-  s = re.sub(r"\s+", " ", s)
-  s = re.sub(r"[^a-z0-9 &/+'-]", "", s)
-  return s
+  s = unicodedata.normalize("NFKD", _DISAMBIGUATION.sub("", s or "")).encode("ascii", "ignore").decode("ascii")
+  return _PUNCTUATION.sub(" ", _APOSTROPHE.sub("", s.lower())).strip()
 
 
-def discogs_title_confidence(*, artist: str, album: str, discogs_title: str) -> float:
-  want_artist = _norm(artist)
-  want_album = _norm(album)
-  title = _norm(discogs_title)
+def _tokens(s: str) -> frozenset[str]:
+  return frozenset(s.split()) - _STOPWORDS
 
-  if " - " in title:
-    got_artist, got_album = title.split(" - ", 1)
-  else:
-    got_artist, got_album = title, title
 
-  if got_artist == want_artist and got_album == want_album:
-    return 1.0
-  if got_album == want_album and (got_artist.startswith(want_artist) or want_artist.startswith(got_artist)):
-    return 0.92
+@lru_cache(maxsize=4096)
+def _trigrams(s: str) -> frozenset[str]:
+  s = f" {s} "
+  return frozenset({s[i : i + 3] for i in range(len(s) - 2)})
 
-  want_tokens = set((want_artist + " " + want_album).split())
-  got_tokens = set(title.split())
-  if not want_tokens or not got_tokens:
-    return 0.0
-  overlap = len(want_tokens & got_tokens) / len(want_tokens)
-  return min(0.8, overlap)
 
+@dataclass(frozen=True)
+class _Title:
+  """A normalized Discogs title, split into artist and album, with its token sets."""
 
-def discogs_query_confidence(*, query: str, discogs_title: str) -> float:
-  want = _norm(query)
-  got = _norm(discogs_title)
-  want_tokens = set(want.split())
-  got_tokens = set(got.split())
-  if not want_tokens or not got_tokens:
+  norm: str
+  artist: str
+  album: str
+  tokens: frozenset[str]
+  artist_tokens: frozenset[str]
+
+
+@lru_cache(maxsize=1 << 18)
+def _title(title: str) -> _Title:
+  artist, sep, album = title.partition(" - ")
+  artist = _norm(artist)
+  album = _norm(album) if sep else artist
+  norm = f"{artist} {album}" if sep else artist
+  return _Title(norm, artist, album, _tokens(norm), _tokens(artist))
+
+
+@dataclass(frozen=True)
+class _Want:
+  text: str
+  tokens: frozenset[str]
+  artist: str | None  # set when artist and album were given separately
+  album: str | None
+  year: int | None
+
+
+def _want(query: str, artist: str | None, album: str | None, *, title_words: frozenset[str] = frozenset()) -> _Want:
+  explicit = bool(artist and album)
+  text = f"{_norm(artist or '')} {_norm(album or '')}" if explicit else _norm(query)
+  # A year in a free-text query ("weezer 1994") picks between same-titled albums, unless it is
+  # part of a title ("prince 1999").
+  year = None
+  words = []
+  for w in text.split():
+    if not explicit and _YEAR.fullmatch(w) and w not in title_words:
+      year = int(w)
+    else:
+      words.append(w)
+  text = " ".join(words)
+  return _Want(
+    text=text,
+    tokens=_tokens(text),
+    artist=_norm(artist or "") if explicit else None,
+    album=_norm(album or "") if explicit else None,
+    year=year,
+  )
+
+
+def _similarity(a: str, b: str) -> float:
+  """1 - Levenshtein(a, b) / max(len): 1.0 for equal strings."""
+  if a == b:
+    return 1.0
+  if not a or not b:
     return 0.0
-  overlap = len(want_tokens & got_tokens) / len(want_tokens)
-  if overlap >= 0.95:
-    return 0.92
-  return min(0.8, overlap)
+  if len(a) < len(b):
+    a, b = b, a
+  prev = list(range(len(b) + 1))
+  for i, ca in enumerate(a, start=1):
+    cur = [i]
+    for j, cb in enumerate(b, start=1):
+      cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+    prev = cur
+  return 1.0 - prev[-1] / len(a)
+
+
+def _trigram_similarity(want: _Want, got: _Title) -> float:
+  a = _trigrams(want.text)
+  b = _trigrams(got.norm)
+  common = len(a & b)
+  return 2.0 * common / (len(a) + len(b)) if common else 0.0
+
+
+def _edit_similarity(want: _Want, got: _Title) -> float:
+  if want.album is not None:
+    return 0.6 * _similarity(want.album, got.album) + 0.4 * _similarity(want.artist or "", got.artist)
+  return _similarity(" ".join(sorted(want.tokens)), " ".join(sorted(got.tokens)))
+
+
+def _features(
+  want: _Want, r: _Candidate, got: _Title, *, vinyl_only: bool, trigram: float | None = None, edit: float | None = None
+) -> tuple[float, ...]:
+  """Feature vector in `_WEIGHTS` order. Missing trigram/edit scores fall back to the token Dice overlap."""
+  common = len(want.tokens & got.tokens)
+  recall = common / len(want.tokens) if want.tokens else 0.0
+  if trigram is None or edit is None:
+    dice = 2.0 * common / (len(want.tokens) + len(got.tokens)) if common else 0.0
+    trigram = dice if trigram is None else trigram
+    edit = trigram if edit is None else edit
+  artist_only = want.album is None and bool(want.tokens) and want.tokens <= got.artist_tokens
+  has_year = want.year is not None and bool(r.year)
+  fmt = (r.format or "").lower()
+  return (
+    recall,
+    trigram,
+    edit,
+    float(artist_only),
+    float(has_year and r.year == want.year),
+    float(has_year and r.year != want.year),
+    float(vinyl_only and "vinyl" in fmt),
+    float("unofficial" in fmt),
+    float(r.kind == "master"),
+  )
 
+
+_WEIGHTS = (
+  W_RECALL,
+  W_TRIGRAM,
+  W_EDIT,
+  W_ARTIST_ONLY,
+  W_YEAR_MATCH,
+  W_YEAR_MISMATCH,
+  W_FORMAT,
+  W_UNOFFICIAL,
+  W_MASTER,
+)
+
+
+def _score(features: tuple[float, ...]) -> float:
+  return BIAS + sum(w * f for w, f in zip(_WEIGHTS, features))
+
+
+def _album_keys(results: Sequence[_Candidate], titles: list[_Title]) -> list[tuple[str, int | None]]:
+  """
+  Which album each candidate stands for. Same-titled masters from different years are different
+  albums (self-titled records); a release belongs with its title's master when that is unambiguous.
+  """
+  master_years: dict[str, set[int | None]] = {}
+  for r, t in zip(results, titles):
+    if r.kind == "master":
+      master_years.setdefault(t.norm, set()).add(r.year)
+  keys = []
+  for r, t in zip(results, titles):
+    years = master_years.get(t.norm)
+    if r.kind == "master":
+      keys.append((t.norm, r.year))
+    elif years and len(years) == 1:
+      keys.append((t.norm, next(iter(years))))
+    else:
+      keys.append((t.norm, None))
+  return keys
+
+
+def _token_scores(want: _Want, results: Sequence[_Candidate], titles: list[_Title], *, vinyl_only: bool) -> list[float]:
+  """
+  `_score(_features(...))` without trigram/edit scores, computed a column at a time: this is the
+  pass that sees every candidate, so it avoids per-candidate calls and tuples. It is plain Python
+  rather than NumPy arrays (NumPy isn't a dependency, and the token sets don't fit a dense array).
+  """
+  wanted = want.tokens
+  n_wanted = len(wanted)
+  common = [len(wanted & t.tokens) for t in titles]
+  dice = [2.0 * c / (n_wanted + len(t.tokens)) if c else 0.0 for c, t in zip(common, titles)]
+  text = [
+    (W_RECALL * c / n_wanted if n_wanted else 0.0) + (W_TRIGRAM + W_EDIT) * d for c, d in zip(common, dice)
+  ]
+  if want.album is None and wanted:
+    text = [z + W_ARTIST_ONLY if wanted <= t.artist_tokens else z for z, t in zip(text, titles)]
+
+  meta = [BIAS + (W_MASTER if r.kind == "master" else 0.0) for r in results]
+  if want.year is not None:
+    meta = [
+      z + (W_YEAR_MATCH if r.year == want.year else W_YEAR_MISMATCH) if r.year else z for z, r in zip(meta, results)
+    ]
+  formats = [(r.format or "").lower() for r in results]
+  if vinyl_only:
+    meta = [z + W_FORMAT if "vinyl" in f else z for z, f in zip(meta, formats)]
+  meta = [z + W_UNOFFICIAL if "unofficial" in f else z for z, f in zip(meta, formats)]
+  return [a + b for a, b in zip(text, meta)]
+
+
+def rank(
+  results: Sequence[T],
+  *,
+  query: str,
+  artist: str | None = None,
+  album: str | None = None,
+  vinyl_only: bool = False,
+  limit: int | None = None,
+) -> list[Ranked[T]]:
+  """
+  Scores every candidate against the query (or the explicit artist/album) and returns the best
+  `limit` (default all), each with a calibrated confidence that it is the album asked for.
+  Ties keep Discogs' order.
+  """
+  if not results:
+    return []
+  titles = [_title(r.title) for r in results]
+  want = _want(query, artist, album)
+  if want.year is not None and any(str(want.year) in t.tokens for t in titles):
+    want = _want(query, artist, album, title_words=frozenset({str(want.year)}))
+
+  # Cascade: cheap token features for all, then the costlier ones for the best few.
+  scores = _token_scores(want, results, titles, vinyl_only=vinyl_only)
+  trigram: dict[int, float] = {}
+  for i in heapq.nlargest(TRIGRAM_CANDIDATES, range(len(results)), key=scores.__getitem__):
+    trigram[i] = _trigram_similarity(want, titles[i])
+    scores[i] = _score(_features(want, results[i], titles[i], vinyl_only=vinyl_only, trigram=trigram[i]))
+  for i in heapq.nlargest(EDIT_CANDIDATES, trigram, key=scores.__getitem__):
+    edit = _edit_similarity(want, titles[i])
+    scores[i] = _score(_features(want, results[i], titles[i], vinyl_only=vinyl_only, trigram=trigram[i], edit=edit))
+
+  # Pressings of one album share its probability; different albums (and "none") compete.
+  # Only the shortlist competes, so the long tail of a huge candidate list can't dilute it.
+  shortlist = sorted(sorted(trigram), key=scores.__getitem__, reverse=True)
+  best: dict[tuple[str, int | None], float] = {}
+  for i, key in zip(shortlist, _album_keys([results[i] for i in shortlist], [titles[i] for i in shortlist])):
+    if scores[i] > best.get(key, -math.inf):
+      best[key] = scores[i]
+  top = max(0.0, *best.values())
+  total = math.exp(-top) + sum(math.exp(z - top) for z in best.values())
+
+  out = [Ranked(result=results[i], confidence=math.exp(scores[i] - top) / total) for i in shortlist]
+  if limit is not None and limit <= len(out):
+    return out[:limit]
+  rest = sorted((i for i in range(len(results)) if i not in trigram), key=scores.__getitem__, reverse=True)
+  out.extend(Ranked(result=results[i], confidence=0.0) for i in rest)
+  return out if limit is None else out[:limit]
+
+
+class RunningBest(Generic[T]):
+  """
+  The best candidate so far, and its confidence, for results that arrive one at a time (a streamed
+  search). Each candidate is scored once, when added; nothing seen earlier is rescored. Confidences
+  follow `rank` (pressings of one album share a probability, "none of these" competes), except
+  that every candidate gets the trigram and edit features instead of `rank`'s cascade.
+  """
+
+  def __init__(self, *, query: str, artist: str | None = None, album: str | None = None, vinyl_only: bool = False):
+    self._query, self._artist, self._album = query, artist, album
+    self._vinyl_only = vinyl_only
+    self._want = _want(query, artist, album)
+    self._seen: list[tuple[T, _Title]] = []
+    self._reset()
+
+  def _reset(self) -> None:
+    self._masters: dict[tuple[str, int | None], float] = {}
+    self._master_years: dict[str, set[int | None]] = {}
+    self._releases: dict[str, float] = {}
+    self._best: tuple[float, T] | None = None
+
+  def add(self, result: T) -> None:
+    title = _title(result.title)
+    self._seen.append((result, title))
+    year = self._want.year
+    if year is not None and str(year) in title.tokens:
+      # The year in the query is part of a title ("prince 1999"), as `rank` decides for the whole
+      # list: score the query without it, once.
+      self._want = _want(self._query, self._artist, self._album, title_words=frozenset({str(year)}))
+      self._reset()
+      for r, t in self._seen:
+        self._score(r, t)
+      return
+    self._score(result, title)
+
+  def _score(self, r: T, t: _Title) -> None:
+    want = self._want
+    z = _score(
+      _features(
+        want, r, t, vinyl_only=self._vinyl_only, trigram=_trigram_similarity(want, t), edit=_edit_similarity(want, t)
+      )
+    )
+    if r.kind == "master":
+      key = (t.norm, r.year)
+      self._masters[key] = max(z, self._masters.get(key, -math.inf))
+      self._master_years.setdefault(t.norm, set()).add(r.year)
+    else:
+      self._releases[t.norm] = max(z, self._releases.get(t.norm, -math.inf))
+    if self._best is None or z > self._best[0]:
+      self._best = (z, r)
+
+  def best(self) -> Ranked[T] | None:
+    """The best candidate so far with its confidence (O(albums seen)), or None before any."""
+    if self._best is None:
+      return None
+    albums = dict(self._masters)
+    for norm, z in self._releases.items():
+      years = self._master_years.get(norm)
+      key = (norm, next(iter(years))) if years and len(years) == 1 else (norm, None)
+      albums[key] = max(z, albums.get(key, -math.inf))
+    top = max(0.0, *albums.values())
+    total = math.exp(-top) + sum(math.exp(z - top) for z in albums.values())
+    return Ranked(result=self._best[1], confidence=math.exp(self._best[0] - top) / total)
+
+
+def auto_pick(
+  results: Sequence[T],
+  *,
+  query: str,
+  artist: str | None = None,
+  album: str | None = None,
+  vinyl_only: bool = False,
+) -> T | None:
+  """Returns the best-ranked result if it clears `AUTO_PICK_CONFIDENCE`, else None."""
+  started = time.perf_counter()
+  ranked = rank(results, query=query, artist=artist, album=album, vinyl_only=vinyl_only, limit=1)
+  picked = ranked[0].result if ranked and ranked[0].confidence >= AUTO_PICK_CONFIDENCE else None
+  metrics.observe("match_seconds", time.perf_counter() - started, matcher="auto_pick")
+  metrics.inc("auto_pick_total", result="picked" if picked is not None else "none")
+  return picked
+
+
+@dataclass(frozen=True)
+class _Bare:
+  """A title with nothing else known about it, for the confidence functions below."""
+
+  title: str
+  year: int | None = None
+  format: str | None = None
+  kind: str = "master"  # a bare title stands for the album as a whole
+
+
+def discogs_title_confidence(*, artist: str, album: str, discogs_title: str) -> float:
+  """Deprecated: use `rank` (which scores all candidates together). Confidence that one title is artist/album."""
+  warnings.warn("discogs_title_confidence is deprecated; use matching.rank", DeprecationWarning, stacklevel=2)
+  return rank([_Bare(discogs_title)], query=f"{artist} {album}", artist=artist, album=album)[0].confidence
+
+
+def discogs_query_confidence(*, query: str, discogs_title: str) -> float:
+  """Deprecated: use `rank` (which scores all candidates together). Confidence that one title is what `query` asks for."""
+  warnings.warn("discogs_query_confidence is deprecated; use matching.rank", DeprecationWarning, stacklevel=2)
+  return rank([_Bare(discogs_title)], query=query)[0].confidence
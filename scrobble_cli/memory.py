@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import difflib
+import threading
+import time
+from dataclasses import dataclass
+
+from scrobble_cli.matching import _norm, _tokens
+from scrobble_cli.store import db_path, open_db
+
+
+MEMORY_DB = "resolutions.sqlite3"
+
+# Least-recently-used resolutions beyond this many are forgotten.
+MAX_ENTRIES = 1000
+# Queries this similar (difflib ratio) are compared word by word for typos.
+CLOSE_MATCH_CUTOFF = 0.85
+# A word only counts as a typo of another when both are at least this long: "ii" is not "iii".
+TYPO_MIN_LENGTH = 5
+TYPO_SIMILARITY = 0.8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resolutions (
+  query TEXT NOT NULL,
+  vinyl_only INTEGER NOT NULL,
+  words TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  id INTEGER NOT NULL,
+  title TEXT NOT NULL,
+  picks INTEGER NOT NULL,
+  created_at REAL NOT NULL,
+  last_used REAL NOT NULL,
+  PRIMARY KEY (query, vinyl_only)
+);
+CREATE INDEX IF NOT EXISTS resolutions_words ON resolutions (words, vinyl_only);
+CREATE INDEX IF NOT EXISTS resolutions_last_used ON resolutions (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class Resolution:
+  query: str
+  kind: str
+  id: int
+  title: str
+  picks: int
+  # Found through a typo-level match rather than the same query or the same words: only a
+  # suggestion, since "vol 1" and "vol 2" are close too.
+  close: bool = False
+
+
+@dataclass(frozen=True)
+class MemoryStats:
+  path: str
+  entries: int
+  max_entries: int
+  hits: int
+  close_hits: int
+  misses: int
+
+
+def _words(query: str) -> str:
+  """Order-, punctuation- and stopword-insensitive form of a normalized query."""
+  return " ".join(sorted(_tokens(query)))
+
+
+def _close(a: str, b: str) -> bool:
+  """Same words up to typos in long words; numbers and short words must match exactly."""
+  wa, wb = _tokens(a), _tokens(b)
+  if len(wa) != len(wb):
+    return False
+  only_a, only_b = sorted(wa - wb), sorted(wb - wa)
+  for x in only_a:
+    match = next(
+      (
+        y
+        for y in only_b
+        if min(len(x), len(y)) >= TYPO_MIN_LENGTH
+        and not (x.isdigit() or y.isdigit())
+        and difflib.SequenceMatcher(None, x, y).ratio() >= TYPO_SIMILARITY
+      ),
+      None,
+    )
+    if match is None:
+      return False
+    only_b.remove(match)
+  return True
+
+
+class ResolutionMemory:
+  """
+  Which release each query ended up resolving to (SQLite), so a repeated query skips the Discogs
+  search and the picker. Keyed by the normalized query; close variants (word order, stopwords,
+  punctuation, small typos) resolve the same way. Least-recently-used entries are evicted past
+  `MAX_ENTRIES`.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._conn = open_db(MEMORY_DB, _SCHEMA)
+
+  def _bump(self, name: str) -> None:
+    self._conn.execute(
+      "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+      (name,),
+    )
+
+  def get(self, query: str, *, vinyl_only: bool) -> Resolution | None:
+    norm = _norm(query)
+    if not norm:
+      return None
+    columns = "query, kind, id, title, picks"
+    with self._lock:
+      row = self._conn.execute(
+        f"SELECT {columns} FROM resolutions WHERE query = ? AND vinyl_only = ?", (norm, int(vinyl_only))
+      ).fetchone()
+      counter = "hits"
+      if row is None:
+        row = self._conn.execute(
+          f"SELECT {columns} FROM resolutions WHERE words = ? AND vinyl_only = ? ORDER BY last_used DESC LIMIT 1",
+          (_words(norm), int(vinyl_only)),
+        ).fetchone()
+        counter = "close_hits"
+      close = False
+      if row is None:
+        known = {
+          r[0]: r for r in self._conn.execute(f"SELECT {columns} FROM resolutions WHERE vinyl_only = ?", (int(vinyl_only),))
+        }
+        for candidate in difflib.get_close_matches(norm, known, n=3, cutoff=CLOSE_MATCH_CUTOFF):
+          if _close(norm, candidate):
+            row = known[candidate]
+            close = True
+            break
+      if row is None:
+        self._bump("misses")
+        return None
+      self._bump(counter)
+      self._conn.execute(
+        "UPDATE resolutions SET last_used = ? WHERE query = ? AND vinyl_only = ?", (time.time(), row[0], int(vinyl_only))
+      )
+    return Resolution(query=row[0], kind=row[1], id=row[2], title=row[3], picks=row[4], close=close)
+
+  def remember(self, query: str, *, vinyl_only: bool, kind: str, id: int, title: str) -> None:
+    """Records that `query` resolved to this release (counting repeat picks of the same one)."""
+    norm = _norm(query)
+    if not norm:
+      return
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        "INSERT INTO resolutions (query, vinyl_only, words, kind, id, title, picks, created_at, last_used)"
+        " VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)"
+        " ON CONFLICT(query, vinyl_only) DO UPDATE SET"
+        " picks = CASE WHEN kind = excluded.kind AND id = excluded.id THEN picks + 1 ELSE 1 END,"
+        " kind = excluded.kind, id = excluded.id, title = excluded.title, last_used = excluded.last_used",
+        (norm, int(vinyl_only), _words(norm), kind, id, title, now, now),
+      )
+      self._evict()
+
+  def forget(self, query: str) -> int:
+    with self._lock:
+      return self._conn.execute("DELETE FROM resolutions WHERE query = ?", (_norm(query),)).rowcount
+
+  def _evict(self) -> int:
+    count = self._conn.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+    if count <= MAX_ENTRIES:
+      return 0
+    return self._conn.execute(
+      "DELETE FROM resolutions WHERE rowid IN (SELECT rowid FROM resolutions ORDER BY last_used ASC LIMIT ?)",
+      (count - MAX_ENTRIES,),
+    ).rowcount
+
+  def clear(self) -> int:
+    with self._lock:
+      removed = self._conn.execute("DELETE FROM resolutions").rowcount
+      self._conn.execute("DELETE FROM counters")
+    return removed
+
+  def stats(self) -> MemoryStats:
+    with self._lock:
+      entries = self._conn.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+      counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+    return MemoryStats(
+      path=str(db_path(MEMORY_DB)),
+      entries=entries,
+      max_entries=MAX_ENTRIES,
+      hits=counters.get("hits", 0),
+      close_hits=counters.get("close_hits", 0),
+      misses=counters.get("misses", 0),
+    )
+
+
+_memory: ResolutionMemory | None = None
+_memory_lock = threading.Lock()
+
+
+def get_memory() -> ResolutionMemory:
+  global _memory
+  with _memory_lock:
+    if _memory is None:
+      _memory = ResolutionMemory()
+    return _memory
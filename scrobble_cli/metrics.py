@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+# Cumulative counters and histograms across runs (Discogs/Last.fm latency, cache and auto-pick
+# rates, rate-limit headroom), on unless SCROBBLE_METRICS=0. Recording only touches in-process
+# dicts; at exit (and every `FLUSH_SECONDS` in long-lived processes like the daemon) they are added
+# to a small SQLite store in one transaction, so any number of processes can merge into it.
+
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, TypeVar
+
+
+METRICS_DB = "metrics.sqlite3"
+FLUSH_SECONDS = 30.0
+PREFIX = "scrobble_"
+
+# Histogram bucket upper bounds. Latencies run from 1 ms to ~3 minutes, each bucket 1.5x the last,
+# so a percentile read off the buckets is within about 25% of the true value.
+SECONDS = tuple(round(0.001 * 1.5**i, 6) for i in range(30))
+TOKENS = (0, 1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+  name TEXT NOT NULL,
+  labels TEXT NOT NULL,
+  value REAL NOT NULL,
+  PRIMARY KEY (name, labels)
+);
+CREATE TABLE IF NOT EXISTS buckets (
+  name TEXT NOT NULL,
+  labels TEXT NOT NULL,
+  le REAL NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (name, labels, le)
+);
+CREATE TABLE IF NOT EXISTS sums (
+  name TEXT NOT NULL,
+  labels TEXT NOT NULL,
+  sum REAL NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (name, labels)
+);
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value REAL NOT NULL
+);
+"""
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_enabled = (os.environ.get("SCROBBLE_METRICS") or "1").strip().lower() not in ("0", "false", "no", "off")
+_lock = threading.Lock()
+_counters: dict[tuple[str, str], float] = {}
+# (name, labels) -> [per-bucket counts (last one is +Inf), bucket bounds, sum, count]
+_hists: dict[tuple[str, str], list] = {}
+_last_flush = time.monotonic()
+_registered = False
+
+
+def enabled() -> bool:
+  return _enabled
+
+
+def _labels(labels: dict[str, Any]) -> str:
+  return json.dumps({k: str(v) for k, v in labels.items()}, sort_keys=True)
+
+
+def _touched() -> None:
+  """Registers the exit flush on first use, and flushes long-lived processes now and then. Lock held."""
+  global _registered, _last_flush
+  if not _registered:
+    _registered = True
+    atexit.register(flush)
+  if time.monotonic() - _last_flush >= FLUSH_SECONDS:
+    _last_flush = time.monotonic()
+    threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+  if not _enabled or not value:
+    return
+  key = (name, _labels(labels))
+  with _lock:
+    _counters[key] = _counters.get(key, 0) + value
+    _touched()
+
+
+def observe(name: str, value: float, *, buckets: tuple[float, ...] = SECONDS, **labels: Any) -> None:
+  if not _enabled:
+    return
+  key = (name, _labels(labels))
+  i = next((i for i, le in enumerate(buckets) if value <= le), len(buckets))
+  with _lock:
+    h = _hists.get(key)
+    if h is None:
+      h = _hists[key] = [[0] * (len(buckets) + 1), buckets, 0.0, 0]
+    h[0][i] += 1
+    h[2] += value
+    h[3] += 1
+    _touched()
+
+
+def timed(name: str, **labels: Any) -> Callable[[F], F]:
+  """Records how long each call takes, labelled with its exit code (for CLI commands) or exception."""
+
+  def wrap(fn: F) -> F:
+    @functools.wraps(fn)
+    def run(*args: Any, **kwargs: Any) -> Any:
+      started = time.perf_counter()
+      status = "0"
+      try:
+        return fn(*args, **kwargs)
+      except BaseException as e:
+        code = getattr(e, "exit_code", None)
+        status = str(code) if code is not None else type(e).__name__
+        raise
+      finally:
+        observe(name, time.perf_counter() - started, exit=status, **labels)
+
+    return run  # type: ignore[return-value]
+
+  return wrap
+
+
+def flush() -> None:
+  """Adds everything recorded since the last flush to the store. Never raises: metrics are best effort."""
+  global _last_flush
+  with _lock:
+    counters, hists = dict(_counters), {k: [list(h[0]), h[1], h[2], h[3]] for k, h in _hists.items()}
+    _counters.clear()
+    _hists.clear()
+    _last_flush = time.monotonic()
+  if not counters and not hists:
+    return
+  try:
+    from scrobble_cli.store import open_db
+
+    conn = open_db(METRICS_DB, _SCHEMA)
+    try:
+      conn.execute("BEGIN IMMEDIATE")
+      conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('since', ?)", (time.time(),))
+      conn.executemany(
+        "INSERT INTO counters (name, labels, value) VALUES (?, ?, ?)"
+        " ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+        [(name, labels, value) for (name, labels), value in counters.items()],
+      )
+      for (name, labels), (counts, bounds, total, count) in hists.items():
+        conn.executemany(
+          "INSERT INTO buckets (name, labels, le, count) VALUES (?, ?, ?, ?)"
+          " ON CONFLICT(name, labels, le) DO UPDATE SET count = count + excluded.count",
+          [(name, labels, le, n) for le, n in zip((*bounds, math.inf), counts) if n],
+        )
+        conn.execute(
+          "INSERT INTO sums (name, labels, sum, count) VALUES (?, ?, ?, ?)"
+          " ON CONFLICT(name, labels) DO UPDATE SET sum = sum + excluded.sum, count = count + excluded.count",
+          (name, labels, total, count),
+        )
+      conn.execute("COMMIT")
+    finally:
+      conn.close()
+  except Exception:
+    pass
+
+
+# --- reading -----------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Histogram:
+  name: str
+  labels: dict[str, str]
+  buckets: list[tuple[float, int]]  # (upper bound, observations in that bucket), ascending
+  sum: float
+  count: int
+
+  def quantile(self, q: float) -> float | None:
+    """Estimated `q` quantile, interpolating linearly inside the bucket it falls in."""
+    if not self.count:
+      return None
+    rank = q * self.count
+    seen = 0
+    lower = 0.0
+    for le, n in self.buckets:
+      if n and seen + n >= rank:
+        if math.isinf(le):
+          return lower
+        return lower + (le - lower) * max(0.0, rank - seen) / n
+      seen += n
+      if not math.isinf(le):
+        lower = le
+    return lower
+
+
+@dataclass(frozen=True)
+class CounterValue:
+  name: str
+  labels: dict[str, str]
+  value: float
+
+
+@dataclass(frozen=True)
+class Snapshot:
+  path: str
+  since: float | None
+  counters: list[CounterValue]
+  histograms: list[Histogram]
+
+  def counter(self, name: str, **where: str) -> float:
+    return sum(c.value for c in self.counters if c.name == name and _matches(c.labels, where))
+
+  def histogram(self, name: str, **where: str | tuple[str, ...]) -> Histogram:
+    """Every series of `name` whose labels match `where` (a value or a tuple of accepted values), merged."""
+    return merge(name, [h for h in self.histograms if h.name == name and _matches(h.labels, where)])
+
+  def label_values(self, name: str, label: str) -> list[str]:
+    values = {h.labels.get(label, "") for h in self.histograms if h.name == name}
+    values |= {c.labels.get(label, "") for c in self.counters if c.name == name}
+    return sorted(values)
+
+
+def _matches(labels: dict[str, str], where: dict[str, Any]) -> bool:
+  for k, v in where.items():
+    got = labels.get(k, "")
+    if got not in v if isinstance(v, tuple) else got != v:
+      return False
+  return True
+
+
+def merge(name: str, hists: Iterable[Histogram]) -> Histogram:
+  counts: dict[float, int] = {}
+  total, count = 0.0, 0
+  for h in hists:
+    for le, n in h.buckets:
+      counts[le] = counts.get(le, 0) + n
+    total += h.sum
+    count += h.count
+  return Histogram(name=name, labels={}, buckets=sorted(counts.items()), sum=total, count=count)
+
+
+def snapshot() -> Snapshot:
+  """Everything recorded so far, this process included."""
+  from scrobble_cli.store import db_path, open_db
+
+  flush()
+  path = db_path(METRICS_DB)
+  if not path.exists():
+    return Snapshot(path=str(path), since=None, counters=[], histograms=[])
+  conn = open_db(METRICS_DB, _SCHEMA)
+  try:
+    since = conn.execute("SELECT value FROM meta WHERE key = 'since'").fetchone()
+    counters = [
+      CounterValue(name=name, labels=json.loads(labels), value=value)
+      for name, labels, value in conn.execute("SELECT name, labels, value FROM counters ORDER BY name, labels")
+    ]
+    buckets: dict[tuple[str, str], list[tuple[float, int]]] = {}
+    for name, labels, le, n in conn.execute("SELECT name, labels, le, count FROM buckets ORDER BY name, labels, le"):
+      buckets.setdefault((name, labels), []).append((le, n))
+    histograms = [
+      Histogram(name=name, labels=json.loads(labels), buckets=buckets.get((name, labels), []), sum=total, count=count)
+      for name, labels, total, count in conn.execute("SELECT name, labels, sum, count FROM sums ORDER BY name, labels")
+    ]
+  finally:
+    conn.close()
+  return Snapshot(path=str(path), since=since[0] if since else None, counters=counters, histograms=histograms)
+
+
+def reset() -> None:
+  from scrobble_cli.store import db_path
+
+  with _lock:
+    _counters.clear()
+    _hists.clear()
+  for suffix in ("", "-wal", "-shm"):
+    db_path(METRICS_DB + suffix).unlink(missing_ok=True)
+
+
+def _fmt(value: float) -> str:
+  if math.isinf(value):
+    return "+Inf"
+  return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _prom_labels(labels: dict[str, str], **extra: str) -> str:
+  """`{endpoint="search",le="0.5"}`, or "" without labels."""
+  items = {**labels, **extra}
+  if not items:
+    return ""
+  escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in items.values())
+  return "{" + ",".join(f'{k}="{v}"' for k, v in zip(items, escaped)) + "}"
+
+
+def prometheus_text(snap: Snapshot) -> str:
+  """The snapshot in Prometheus' text exposition format (for node_exporter's textfile collector)."""
+  lines: list[str] = []
+  typed: set[str] = set()
+  for c in snap.counters:
+    name = PREFIX + c.name
+    if name not in typed:
+      typed.add(name)
+      lines.append(f"# TYPE {name} counter")
+    lines.append(f"{name}{_prom_labels(c.labels)} {_fmt(c.value)}")
+  for h in snap.histograms:
+    name = PREFIX + h.name
+    if name not in typed:
+      typed.add(name)
+      lines.append(f"# TYPE {name} histogram")
+    cumulative = 0
+    observed = dict(h.buckets)
+    bounds = sorted(set(SECONDS if h.name.endswith("_seconds") else TOKENS) | set(observed) | {math.inf})
+    for le in bounds:
+      cumulative += observed.get(le, 0)
+      lines.append(f"{name}_bucket{_prom_labels(h.labels, le=_fmt(le))} {cumulative}")
+    lines.append(f"{name}_sum{_prom_labels(h.labels)} {_fmt(h.sum)}")
+    lines.append(f"{name}_count{_prom_labels(h.labels)} {h.count}")
+  return "\n".join(lines) + "\n"
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, TypeVar
+
+from scrobble_cli import trace
+from scrobble_cli.config import DEFAULT_ACCOUNT, AppConfig, for_account
+from scrobble_cli.history import get_history
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, ScrobbleOutcome, ScrobbleTrack, scrobble_album, scrobble_outcomes
+from scrobble_cli.store import account_db, open_db
+
+
+OUTBOX_DB = "outbox.sqlite3"
+
+# Rows claimed by a process that has since died go straight back to pending. When the owner can't
+# be checked (claims made before owners were recorded, or no signal-0 probe on Windows), a claim
+# older than this is treated as abandoned instead.
+STALE_CLAIM_SECONDS = 15 * 60
+# Row ids per `IN (...)` list, well under SQLite's bound-variable limit.
+IDS_PER_STATEMENT = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY,
+  artist TEXT NOT NULL,
+  title TEXT NOT NULL,
+  album TEXT NOT NULL,
+  album_artist TEXT NOT NULL,
+  timestamp_unix INTEGER NOT NULL,
+  duration_seconds INTEGER,
+  discogs_release TEXT,
+  status TEXT NOT NULL DEFAULT 'pending',
+  claim TEXT,
+  claimed_at REAL,
+  claim_pid INTEGER,
+  claim_started TEXT,
+  ignored_code TEXT,
+  ignored_reason TEXT,
+  created_at REAL NOT NULL,
+  acked_at REAL,
+  UNIQUE (artist, title, timestamp_unix)
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, timestamp_unix);
+"""
+
+_COLUMNS = "id, artist, title, album, album_artist, timestamp_unix, duration_seconds, discogs_release"
+
+# pending -> sending (claimed by one flusher) -> accepted | ignored, or unknown when Last.fm
+# answered the batch without a result for the row. Unknown rows are looked up in the history before
+# the next flush: found means accepted, otherwise they are sent again.
+PENDING = "pending"
+SENDING = "sending"
+ACCEPTED = "accepted"
+IGNORED = "ignored"
+UNKNOWN = "unknown"
+
+
+def _process_started(pid: int) -> str | None:
+  """When process `pid` started (Linux), which tells it apart from a later process reusing the pid."""
+  try:
+    stat = Path(f"/proc/{pid}/stat").read_text()
+  except OSError:
+    return None
+  fields = stat.rsplit(")", 1)[-1].split()
+  return fields[19] if len(fields) > 19 else None  # field 22, starttime
+
+
+def _alive(pid: int, started: str | None) -> bool | None:
+  """Whether the process that made a claim is still running; None when that can't be told."""
+  if pid == os.getpid():
+    return True
+  if os.name == "nt":
+    return None  # os.kill(pid, 0) would terminate the process there
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass  # exists, owned by someone else
+  except OSError:
+    return None
+  if started is not None:
+    current = _process_started(pid)
+    if current is not None and current != started:
+      return False
+  return True
+
+
+_OWNER = (os.getpid(), _process_started(os.getpid()))
+
+
+@dataclass(frozen=True)
+class OutboxEntry:
+  id: int
+  track: ScrobbleTrack
+  status: str
+
+
+@dataclass(frozen=True)
+class FlushResult:
+  outcomes: dict[int, ScrobbleOutcome]
+  errors: list[str]
+  remaining: int
+
+  @property
+  def accepted(self) -> int:
+    return sum(1 for o in self.outcomes.values() if o.accepted)
+
+  @property
+  def ignored(self) -> int:
+    return sum(1 for o in self.outcomes.values() if not o.accepted)
+
+
+class Outbox:
+  """
+  Crash-safe queue of planned scrobbles (SQLite in WAL mode).
+
+  Tracks are written here before anything is sent. A flush claims pending rows, submits them in
+  full 50-track batches and records each track's acknowledgement as soon as its batch is answered,
+  so an interrupted run resumes with exactly the rows Last.fm hasn't confirmed. Accepted tracks are
+  also added to the scrobble history.
+  """
+
+  def __init__(self, account: str | None = None):
+    self.account = account
+    self._lock = threading.Lock()
+    self._conn = open_db(account_db(OUTBOX_DB, account), _SCHEMA)
+    # Outboxes created before the history store have no release column, and older ones no claim owner.
+    for column in ("discogs_release TEXT", "claim_pid INTEGER", "claim_started TEXT"):
+      try:
+        self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column}")
+      except sqlite3.OperationalError:
+        pass
+
+  @contextmanager
+  def _transaction(self) -> Iterator[sqlite3.Connection]:
+    """The connection inside `BEGIN IMMEDIATE`, committed on success and rolled back on any error."""
+    with self._lock:
+      self._conn.execute("BEGIN IMMEDIATE")
+      try:
+        yield self._conn
+      except BaseException:
+        self._conn.execute("ROLLBACK")
+        raise
+      self._conn.execute("COMMIT")
+
+  def enqueue(self, tracks: list[ScrobbleTrack]) -> list[int]:
+    """Adds tracks (idempotently, keyed by artist/title/timestamp) and returns their row ids in order."""
+    now = time.time()
+    ids: list[int] = []
+    with self._transaction() as conn:
+      for t in tracks:
+        conn.execute(
+          "INSERT OR IGNORE INTO outbox"
+          " (artist, title, album, album_artist, timestamp_unix, duration_seconds, discogs_release, created_at)"
+          " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+          (t.artist, t.title, t.album, t.album_artist, int(t.timestamp_unix), t.duration_seconds, t.discogs_release, now),
+        )
+        row = conn.execute(
+          "SELECT id FROM outbox WHERE artist = ? AND title = ? AND timestamp_unix = ?",
+          (t.artist, t.title, int(t.timestamp_unix)),
+        ).fetchone()
+        ids.append(row[0])
+    return ids
+
+  def _reclaim_abandoned(self, conn: sqlite3.Connection, now: float) -> None:
+    """Puts rows claimed by flushes that died (killed, crashed) back to pending."""
+    stale = now - STALE_CLAIM_SECONDS
+    reset = (
+      "UPDATE outbox SET status = ?, claim = NULL, claimed_at = NULL, claim_pid = NULL, claim_started = NULL"
+      " WHERE status = ?"
+    )
+    conn.execute(f"{reset} AND claim_pid IS NULL AND COALESCE(claimed_at, 0) < ?", (PENDING, SENDING, stale))
+    owners = conn.execute(
+      "SELECT DISTINCT claim_pid, claim_started FROM outbox WHERE status = ? AND claim_pid IS NOT NULL", (SENDING,)
+    ).fetchall()
+    for pid, started in owners:
+      alive = _alive(pid, started)
+      if alive is None:
+        conn.execute(f"{reset} AND claim_pid = ? AND claimed_at < ?", (PENDING, SENDING, pid, stale))
+      elif not alive:
+        conn.execute(f"{reset} AND claim_pid = ? AND claim_started IS ?", (PENDING, SENDING, pid, started))
+
+  def _settle_unknown(self, conn: sqlite3.Connection, ids: list[int] | None, now: float) -> None:
+    """Unknown rows (of `ids`, or all) the history has are accepted; the others go back to pending."""
+    rows = conn.execute(f"SELECT {_COLUMNS} FROM outbox WHERE status = ?", (UNKNOWN,)).fetchall()
+    if ids is not None:
+      wanted = set(ids)
+      rows = [r for r in rows if r[0] in wanted]
+    if not rows:
+      return
+    entries = [_entry(r, UNKNOWN) for r in rows]
+    recorded = get_history(self.account).recorded([e.track for e in entries])
+    for e in entries:
+      if (e.track.artist, e.track.title, int(e.track.timestamp_unix)) in recorded:
+        conn.execute("UPDATE outbox SET status = ?, acked_at = ? WHERE id = ?", (ACCEPTED, now, e.id))
+      else:
+        conn.execute("UPDATE outbox SET status = ? WHERE id = ?", (PENDING, e.id))
+
+  def _claim(self, ids: list[int] | None) -> tuple[str, list[OutboxEntry]]:
+    claim = uuid.uuid4().hex
+    now = time.time()
+    pid, started = _OWNER
+    update = "UPDATE outbox SET status = ?, claim = ?, claimed_at = ?, claim_pid = ?, claim_started = ? WHERE status = ?"
+    with self._transaction() as conn:
+      self._reclaim_abandoned(conn, now)
+      self._settle_unknown(conn, ids, now)
+      if ids is None:
+        conn.execute(update, (SENDING, claim, now, pid, started, PENDING))
+      for i in range(0, len(ids or []), IDS_PER_STATEMENT):
+        chunk = ids[i : i + IDS_PER_STATEMENT]
+        conn.execute(
+          f"{update} AND id IN ({','.join('?' * len(chunk))})", (SENDING, claim, now, pid, started, PENDING, *chunk)
+        )
+      rows = conn.execute(
+        f"SELECT {_COLUMNS} FROM outbox WHERE claim = ? ORDER BY timestamp_unix, id",
+        (claim,),
+      ).fetchall()
+    return claim, [_entry(r, SENDING) for r in rows]
+
+  def _ack(self, batch: list[OutboxEntry], response: dict) -> dict[int, ScrobbleOutcome]:
+    """
+    Marks each row of an answered batch, matching Last.fm's per-track results by timestamp. Rows
+    left without a result may or may not have been scrobbled: they become unknown, not pending.
+    """
+    by_ts: dict[int, deque[int]] = defaultdict(deque)
+    for e in batch:
+      by_ts[int(e.track.timestamp_unix)].append(e.id)
+    unmatched = deque(e.id for e in batch)
+
+    outcomes: dict[int, ScrobbleOutcome] = {}
+    for o in scrobble_outcomes({"batches": [response]}):
+      queue = by_ts.get(o.timestamp_unix) if o.timestamp_unix is not None else None
+      row_id = queue.popleft() if queue else (unmatched[0] if unmatched else None)
+      if row_id is None:
+        continue
+      if row_id in unmatched:
+        unmatched.remove(row_id)
+      outcomes[row_id] = o
+
+    now = time.time()
+    with self._transaction() as conn:
+      for row_id, o in outcomes.items():
+        conn.execute(
+          "UPDATE outbox SET status = ?, claim = NULL, ignored_code = ?, ignored_reason = ?, acked_at = ? WHERE id = ?",
+          (ACCEPTED if o.accepted else IGNORED, o.ignored_code, None if o.accepted else o.ignored_reason, now, row_id),
+        )
+      for row_id in unmatched:
+        conn.execute("UPDATE outbox SET status = ?, claim = NULL WHERE id = ?", (UNKNOWN, row_id))
+    get_history(self.account).record([e.track for e in batch if e.id in outcomes and outcomes[e.id].accepted])
+    return outcomes
+
+  def _release(self, claim: str) -> None:
+    with self._lock:
+      self._conn.execute(
+        "UPDATE outbox SET status = ?, claim = NULL, claimed_at = NULL, claim_pid = NULL, claim_started = NULL"
+        " WHERE claim = ? AND status = ?",
+        (PENDING, claim, SENDING),
+      )
+
+  def flush(self, cfg: AppConfig, *, ids: list[int] | None = None) -> FlushResult:
+    """
+    Submits pending rows (all of them, or only `ids`) in full 50-track batches. Rows whose batch
+    failed, or that were never sent because an earlier batch failed, stay pending. Unknown rows
+    are checked against the history first and only sent again if it doesn't have them.
+    """
+    claim, entries = self._claim(ids)
+    outcomes: dict[int, ScrobbleOutcome] = {}
+    errors: list[str] = []
+
+    def on_batch(offset: int, response: dict) -> None:
+      batch = entries[offset : offset + SCROBBLE_BATCH_SIZE]
+      if "error" in response:
+        errors.append(str(response.get("message") or response.get("error")))
+        return
+      outcomes.update(self._ack(batch, response))
+
+    try:
+      if entries:
+        scrobble_album(cfg, [e.track for e in entries], on_batch=on_batch)
+    except Exception as e:
+      errors.append(str(e) or type(e).__name__)
+    finally:
+      self._release(claim)
+    return FlushResult(outcomes=outcomes, errors=errors, remaining=self.count(PENDING) + self.count(UNKNOWN))
+
+  def count(self, status: str) -> int:
+    with self._lock:
+      return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (status,)).fetchone()[0]
+
+  def pending(self) -> list[OutboxEntry]:
+    with self._lock:
+      rows = self._conn.execute(
+        f"SELECT {_COLUMNS}, status FROM outbox WHERE status IN (?, ?, ?) ORDER BY timestamp_unix, id",
+        (PENDING, SENDING, UNKNOWN),
+      ).fetchall()
+    return [_entry(r[:-1], r[-1]) for r in rows]
+
+  def discard_pending(self) -> int:
+    with self._lock:
+      return self._conn.execute("DELETE FROM outbox WHERE status IN (?, ?)", (PENDING, UNKNOWN)).rowcount
+
+
+def _entry(row: tuple, status: str) -> OutboxEntry:
+  return OutboxEntry(
+    id=row[0],
+    track=ScrobbleTrack(
+      artist=row[1],
+      title=row[2],
+      album=row[3],
+      album_artist=row[4],
+      timestamp_unix=row[5],
+      duration_seconds=row[6],
+      discogs_release=row[7],
+    ),
+    status=status,
+  )
+
+
+_outboxes: dict[str, Outbox] = {}
+_outbox_lock = threading.Lock()
+
+
+def get_outbox(account: str | None = None) -> Outbox:
+  """The outbox of a Last.fm account (each account queues and acknowledges its own plays)."""
+  key = (account or DEFAULT_ACCOUNT).lower()
+  with _outbox_lock:
+    if key not in _outboxes:
+      _outboxes[key] = Outbox(None if key == DEFAULT_ACCOUNT else key)
+    return _outboxes[key]
+
+
+T = TypeVar("T")
+
+
+def map_accounts(accounts: list[str], fn: Callable[[str], T]) -> dict[str, T]:
+  """Runs `fn` for every account concurrently (one thread each) and returns the results by account."""
+  if len(accounts) == 1:
+    return {accounts[0]: fn(accounts[0])}
+  with ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix="lastfm-account") as pool:
+    return dict(zip(accounts, pool.map(trace.bind(fn), accounts)))
+
+
+def scrobble_accounts(cfg: AppConfig, tracks: list[ScrobbleTrack], accounts: list[str]) -> dict[str, FlushResult]:
+  """
+  Queues the same tracks in every account's outbox and flushes them concurrently. An account that
+  fails (bad session, Last.fm down) keeps its tracks queued and reports the error without
+  affecting the others.
+  """
+
+  def submit(account: str) -> FlushResult:
+    try:
+      account_cfg = for_account(cfg, account)
+      outbox = get_outbox(account)
+      return outbox.flush(account_cfg, ids=outbox.enqueue(tracks))
+    except Exception as e:
+      return FlushResult(outcomes={}, errors=[str(e) or type(e).__name__], remaining=len(tracks))
+
+  return map_accounts(accounts, submit)
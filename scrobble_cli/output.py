@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+from typing import Any
+
+
+def headless() -> bool:
+  """
+  Plain output (no rich) when SCROBBLE_HEADLESS is set, or when stdout isn't a terminal
+  (scripts, the agent wrapper). Set SCROBBLE_HEADLESS=0 to force rich output.
+  """
+  value = os.environ.get("SCROBBLE_HEADLESS")
+  if value:
+    return value.strip().lower() not in ("0", "false", "no", "off")
+  return not sys.stdout.isatty()
+
+
+class PlainTable:
+  """Just enough of `rich.table.Table` for our tables, rendered as aligned plain text."""
+
+  def __init__(self, title: str | None = None, **_: Any):
+    self.title = title
+    self.columns: list[tuple[str, str]] = []
+    self.rows: list[list[str]] = []
+
+  def add_column(self, header: str, justify: str = "left", **_: Any) -> None:
+    self.columns.append((header, justify))
+
+  def add_row(self, *cells: str | None) -> None:
+    self.rows.append(["" if c is None else str(c) for c in cells])
+
+  def render(self) -> str:
+    headers = [h for h, _ in self.columns]
+    widths = [len(h) for h in headers]
+    for row in self.rows:
+      for i, cell in enumerate(row):
+        widths[i] = max(widths[i], len(cell))
+
+    def line(cells: list[str]) -> str:
+      out = []
+      for (_, justify), width, cell in zip(self.columns, widths, cells):
+        out.append(cell.rjust(width) if justify == "right" else cell.ljust(width))
+      return "  ".join(out).rstrip()
+
+    lines = [self.title] if self.title else []
+    lines.append(line(headers))
+    lines.extend(line(r) for r in self.rows)
+    return "\n".join(lines)
+
+
+class PlainConsole:
+  def __init__(self, *, stderr: bool = False):
+    self.stderr = stderr
+
+  def print(self, *objects: Any) -> None:
+    parts = [o.render() if isinstance(o, PlainTable) else str(o) for o in objects]
+    (sys.stderr if self.stderr else sys.stdout).write(" ".join(parts) + "\n")
+
+  def print_json(self, data: str) -> None:
+    sys.stdout.write(json.dumps(json.loads(data), indent=2, ensure_ascii=False) + "\n")
+
+
+class LazyConsole:
+  """Picks rich or plain output on first use, so commands that print nothing never import rich."""
+
+  def __init__(self, *, stderr: bool = False):
+    self._impl: Any = None
+    self._stderr = stderr
+
+  def _get(self) -> Any:
+    if self._impl is None:
+      if headless():
+        self._impl = PlainConsole(stderr=self._stderr)
+      else:
+        from rich.console import Console
+
+        self._impl = Console(stderr=self._stderr)
+    return self._impl
+
+  def __getattr__(self, name: str) -> Any:
+    return getattr(self._get(), name)
+
+
+def new_table(title: str | None = None, **kwargs: Any) -> Any:
+  if headless():
+    return PlainTable(title, **kwargs)
+  from rich.table import Table
+
+  return Table(title=title, **kwargs)
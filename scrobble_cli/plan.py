@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from scrobble_cli.discogs import DiscogsRelease
+from scrobble_cli.lastfm import ScrobbleTrack
+from scrobble_cli.timestamps import plan_from_end, plan_from_start
+
+
+# Used for timestamp planning when Discogs has no duration for a track.
+DEFAULT_DURATION = 240
+
+
+def planning_durations(release: DiscogsRelease, default: int = DEFAULT_DURATION) -> list[int]:
+  return [(t.duration_seconds or default) for t in release.tracks]
+
+
+def build_scrobbles(release: DiscogsRelease, timestamps: list[int]) -> list[ScrobbleTrack]:
+  return [
+    ScrobbleTrack(
+      artist=release.artist,
+      title=t.title,
+      album=release.album,
+      album_artist=release.artist,
+      timestamp_unix=ts,
+      duration_seconds=t.duration_seconds,
+      discogs_release=f"{release.kind}/{release.id}",
+    )
+    for t, ts in zip(release.tracks, timestamps, strict=True)
+  ]
+
+
+def plan_scrobbles(release: DiscogsRelease, *, mode: str, at: int) -> list[ScrobbleTrack]:
+  """The release's tracks timed back-to-back, starting at `at` ("started" mode) or ending there ("ended")."""
+  durations = planning_durations(release)
+  timestamps = plan_from_end(at, durations) if mode == "ended" else plan_from_start(at, durations)
+  return build_scrobbles(release, timestamps)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+from scrobble_cli import metrics
+from scrobble_cli.config import config_dir
+
+try:
+  import fcntl
+except ImportError:  # pragma: no cover - Windows
+  fcntl = None
+
+
+DISCOGS_BUCKET = "discogs-ratelimit.json"
+
+
+class TokenBucket:
+  """
+  Token bucket shared by every `scrobble` process on the machine.
+
+  State lives in a small JSON file under the config dir and is updated under an
+  exclusive `flock`, so concurrent CLI runs, scripts and the agent integration all
+  draw from one budget instead of each assuming they own the whole quota.
+
+  Burst + refill are sized so that no 60s window can exceed `per_minute` requests,
+  which matches Discogs' moving-window accounting.
+  """
+
+  def __init__(self, filename: str, per_minute: int):
+    per_minute = max(1, per_minute)
+    self.path = config_dir() / filename
+    self.capacity = max(1, per_minute // 6)
+    self.refill_per_second = max(per_minute - self.capacity, 1) / 60.0
+    self._local = threading.Lock()
+    self._stats_lock = threading.Lock()
+    self.waited_seconds = 0.0
+    self.waits = 0
+
+  @contextmanager
+  def _locked(self) -> Iterator[IO[str]]:
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+    with self._local, os.fdopen(fd, "r+", encoding="utf-8") as f:
+      if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+      try:
+        yield f
+      finally:
+        if fcntl is not None:
+          fcntl.flock(f, fcntl.LOCK_UN)
+
+  def _read(self, f: IO[str], now: float) -> float:
+    f.seek(0)
+    try:
+      state = json.loads(f.read() or "{}")
+      tokens = float(state["tokens"])
+      updated = float(state["updated_at"])
+    except (ValueError, KeyError, TypeError):
+      return float(self.capacity)
+    elapsed = max(0.0, now - updated)
+    return min(float(self.capacity), tokens + elapsed * self.refill_per_second)
+
+  def _write(self, f: IO[str], tokens: float, now: float) -> None:
+    f.seek(0)
+    f.truncate()
+    f.write(json.dumps({"tokens": tokens, "updated_at": now}))
+    f.flush()
+
+  def try_acquire(self) -> float:
+    """Takes a token if one is available. Returns 0.0 on success, otherwise seconds until one will be."""
+    now = time.time()
+    with self._locked() as f:
+      tokens = self._read(f, now)
+      if tokens < 1.0:
+        return (1.0 - tokens) / self.refill_per_second
+      self._write(f, tokens - 1.0, now)
+    # Recorded once the flock is released: the metrics store has its own lock and I/O.
+    metrics.observe("ratelimit_headroom_tokens", tokens - 1.0, buckets=metrics.TOKENS, bucket=self.path.stem)
+    return 0.0
+
+  def acquire(self, timeout: float | None = None) -> float:
+    """
+    Blocks until a token is available; returns how long this call waited. With `timeout`, raises
+    TimeoutError as soon as it is clear no token will be free within that many seconds.
+    """
+    started = time.monotonic()
+    while True:
+      wait = self.try_acquire()
+      if wait <= 0:
+        break
+      if timeout is not None and wait > timeout - (time.monotonic() - started):
+        raise TimeoutError("no rate-limit token within the timeout")
+      # Re-check at least once a second so tokens refilled for other processes are noticed promptly.
+      time.sleep(min(wait, 1.0))
+    return self._waited(started)
+
+  async def aacquire(self, timeout: float | None = None) -> float:
+    """`acquire` for coroutines: waits on the event loop instead of blocking the thread."""
+    import asyncio
+
+    started = time.monotonic()
+    while True:
+      wait = self.try_acquire()
+      if wait <= 0:
+        break
+      if timeout is not None and wait > timeout - (time.monotonic() - started):
+        raise TimeoutError("no rate-limit token within the timeout")
+      await asyncio.sleep(min(wait, 1.0))
+    return self._waited(started)
+
+  def _waited(self, started: float) -> float:
+    waited = time.monotonic() - started
+    if waited > 0.001:
+      metrics.observe("ratelimit_wait_seconds", waited, bucket=self.path.stem)
+      with self._stats_lock:
+        self.waited_seconds += waited
+        self.waits += 1
+    return waited
+
+  def available(self) -> float:
+    now = time.time()
+    with self._locked() as f:
+      return self._read(f, now)
+
+  def drain(self) -> None:
+    """Empties the bucket for every process (e.g. after the server answered 429)."""
+    now = time.time()
+    with self._locked() as f:
+      self._write(f, 0.0, now)
+
+
+_buckets: dict[tuple[str, int], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def discogs_bucket(per_minute: int) -> TokenBucket:
+  with _buckets_lock:
+    key = (DISCOGS_BUCKET, per_minute)
+    bucket = _buckets.get(key)
+    if bucket is None:
+      bucket = _buckets[key] = TokenBucket(DISCOGS_BUCKET, per_minute)
+    return bucket
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+# Saved search results, so `album --search-only` followed by `album --pick N` (the agent flow) picks
+# from exactly the list that was shown, without searching Discogs a second time.
+
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+
+from scrobble_cli.discogs import DiscogsSearchResult
+from scrobble_cli.store import db_path, open_db
+
+
+SEARCHES_DB = "searches.sqlite3"
+
+# Handles expire after this long; a pick made later searches again.
+HANDLE_TTL_SECONDS = 60 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+  handle TEXT PRIMARY KEY,
+  params TEXT NOT NULL,
+  results TEXT NOT NULL,
+  created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_params ON searches (params, created_at);
+"""
+
+
+_conn: sqlite3.Connection | None = None
+_conn_lock = threading.Lock()
+
+
+def _writer() -> sqlite3.Connection:
+  """The searches connection, creating the database on first use. Call with `_conn_lock` held."""
+  global _conn
+  if _conn is None:
+    _conn = open_db(SEARCHES_DB, _SCHEMA)
+  return _conn
+
+
+def _reader() -> sqlite3.Connection | None:
+  """The searches connection, or None when nothing was ever saved (never creates the file)."""
+  with _conn_lock:
+    if _conn is None and not db_path(SEARCHES_DB).exists():
+      return None
+    return _writer()
+
+
+def _params(query: str, *, vinyl_only: bool, limit: int) -> str:
+  return json.dumps({"query": " ".join(query.lower().split()), "vinyl_only": vinyl_only, "limit": limit}, sort_keys=True)
+
+
+def _results(raw: str) -> list[DiscogsSearchResult]:
+  return [DiscogsSearchResult(**d) for d in json.loads(raw)]
+
+
+def save(query: str, results: list[DiscogsSearchResult], *, vinyl_only: bool, limit: int) -> str:
+  """Stores `results` and returns a short handle for them (expired handles are dropped)."""
+  now = time.time()
+  raw = json.dumps([asdict(r) for r in results])
+  with _conn_lock:
+    conn = _writer()
+    conn.execute("DELETE FROM searches WHERE created_at < ?", (now - HANDLE_TTL_SECONDS,))
+    while True:
+      handle = secrets.token_hex(3)
+      try:
+        conn.execute(
+          "INSERT INTO searches (handle, params, results, created_at) VALUES (?, ?, ?, ?)",
+          (handle, _params(query, vinyl_only=vinyl_only, limit=limit), raw, now),
+        )
+        return handle
+      except sqlite3.IntegrityError:
+        continue
+
+
+def load(handle: str) -> list[DiscogsSearchResult] | None:
+  """The results saved under `handle`, or None if it is unknown or expired."""
+  conn = _reader()
+  if conn is None:
+    return None
+  with _conn_lock:
+    row = conn.execute(
+      "SELECT results FROM searches WHERE handle = ? AND created_at >= ?",
+      (handle.strip().lower(), time.time() - HANDLE_TTL_SECONDS),
+    ).fetchone()
+  return _results(row[0]) if row else None
+
+
+def latest(query: str, *, vinyl_only: bool, limit: int) -> list[DiscogsSearchResult] | None:
+  """The most recent unexpired results saved for the same query and options, if any."""
+  conn = _reader()
+  if conn is None:
+    return None
+  with _conn_lock:
+    row = conn.execute(
+      "SELECT results FROM searches WHERE params = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+      (_params(query, vinyl_only=vinyl_only, limit=limit), time.time() - HANDLE_TTL_SECONDS),
+    ).fetchone()
+  return _results(row[0]) if row else None
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+from pathlib import Path
+
+from scrobble_cli.config import DEFAULT_ACCOUNT, config_dir
+
+
+def db_path(filename: str) -> Path:
+  return config_dir() / filename
+
+
+def account_db(filename: str, account: str | None) -> str:
+  """The database file of a Last.fm account: "outbox.sqlite3" -> "outbox-<account>.sqlite3"."""
+  if not account or account == DEFAULT_ACCOUNT:
+    return filename
+  stem, dot, ext = filename.partition(".")
+  return f"{stem}-{account.lower()}{dot}{ext}"
+
+
+def open_db(filename: str, schema: str) -> sqlite3.Connection:
+  """
+  Opens (and creates) a SQLite database under the config dir.
+  WAL + busy timeout so several `scrobble` processes can share the same file.
+  """
+  config_dir().mkdir(parents=True, exist_ok=True)
+  conn = sqlite3.connect(
+    str(db_path(filename)),
+    timeout=10,
+    isolation_level=None,
+    check_same_thread=False,
+  )
+  conn.execute("PRAGMA journal_mode=WAL")
+  conn.execute("PRAGMA synchronous=NORMAL")
+  conn.executescript(schema)
+  return conn
+
+
+def fts_query(query: str) -> str:
+  """An FTS5 MATCH expression requiring every word of `query` (quoted, so no operator syntax leaks in)."""
+  tokens = re.findall(r"\w+", (query or "").lower())
+  return " ".join(f'"{t}"' for t in tokens)
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+# Opt-in tracing of command phases and HTTP calls. When nothing enabled it, `span()` returns a
+# shared no-op object, so instrumented code pays two cheap lookups per span. The no-op is falsy:
+# guard attribute work that costs anything with `if s:`.
+#
+# The daemon records the spans of a single request with `collect()` and sends them back with the
+# reply; the client adds them to its own trace with `merge()`.
+
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class _NoSpan:
+  def __enter__(self) -> _NoSpan:
+    return self
+
+  def __exit__(self, *exc: object) -> None:
+    return None
+
+  def __bool__(self) -> bool:
+    return False
+
+  def set(self, **attrs: Any) -> None:
+    pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+  __slots__ = ("tracer", "name", "attrs", "start", "duration", "tid")
+
+  def __init__(self, tracer: Tracer | Recorder, name: str, attrs: dict[str, Any]):
+    self.tracer = tracer
+    self.name = name
+    self.attrs = attrs
+    self.start = 0.0
+    self.duration = 0.0
+    self.tid = 0
+
+  def __enter__(self) -> Span:
+    self.tid = threading.get_ident()
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type: type | None, exc: BaseException | None, tb: object) -> None:
+    self.duration = time.perf_counter() - self.start
+    if exc_type is not None and "error" not in self.attrs:
+      self.attrs["error"] = exc_type.__name__
+    self.tracer._finish(self)
+
+  def set(self, **attrs: Any) -> None:
+    self.attrs.update(attrs)
+
+
+class Tracer:
+  def __init__(self):
+    self.origin = time.perf_counter()
+    self.wall_origin = time.time()
+    self.sinks: list[str] = []
+    self._spans: list[Span] = []
+    self._lock = threading.Lock()
+
+  def _finish(self, span: Span) -> None:
+    with self._lock:
+      self._spans.append(span)
+
+  def spans(self) -> list[Span]:
+    with self._lock:
+      return sorted(self._spans, key=lambda s: s.start)
+
+  def summary(self) -> list[dict]:
+    """One row per span name, in order of first appearance: calls, total/max ms and rolled-up attrs."""
+    rows: dict[str, dict] = {}
+    for s in self.spans():
+      row = rows.setdefault(s.name, {"name": s.name, "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "sums": Counter(), "counts": defaultdict(Counter)})
+      ms = s.duration * 1000.0
+      row["calls"] += 1
+      row["total_ms"] += ms
+      row["max_ms"] = max(row["max_ms"], ms)
+      for k, v in s.attrs.items():
+        if isinstance(v, (int, float)) and not isinstance(v, bool) and k != "status":
+          row["sums"][k] += v
+        else:
+          row["counts"][k][str(v)] += 1
+    return list(rows.values())
+
+  def to_json(self) -> dict:
+    return {
+      "started_at": self.wall_origin,
+      "argv": sys.argv[1:],
+      "spans": [
+        {
+          "name": s.name,
+          "start_ms": round((s.start - self.origin) * 1000.0, 3),
+          "duration_ms": round(s.duration * 1000.0, 3),
+          "thread": s.tid,
+          **({"attrs": s.attrs} if s.attrs else {}),
+        }
+        for s in self.spans()
+      ],
+    }
+
+  def to_chrome(self) -> dict:
+    """Chrome trace-event format (load in chrome://tracing or https://ui.perfetto.dev)."""
+    pid = os.getpid()
+    return {
+      "traceEvents": [
+        {
+          "name": s.name,
+          "cat": s.name.split(".", 1)[0],
+          "ph": "X",
+          "ts": round((s.start - self.origin) * 1e6, 1),
+          "dur": round(s.duration * 1e6, 1),
+          "pid": pid,
+          "tid": s.tid,
+          "args": s.attrs,
+        }
+        for s in self.spans()
+      ],
+      "displayTimeUnit": "ms",
+      "otherData": {"argv": sys.argv[1:], "started_at": self.wall_origin},
+    }
+
+
+class Recorder:
+  """The spans of one daemon request (see `collect`), also passed on to the daemon's own tracer."""
+
+  def __init__(self, forward: Tracer | None):
+    self.origin = time.perf_counter()
+    self.forward = forward
+    self._spans: list[Span] = []
+    self._lock = threading.Lock()
+
+  def _finish(self, span: Span) -> None:
+    with self._lock:
+      self._spans.append(span)
+    if self.forward is not None:
+      self.forward._finish(span)
+
+  def to_wire(self) -> list[dict]:
+    """The spans as JSON, with start times in seconds since the request began."""
+    with self._lock:
+      spans = list(self._spans)
+    return [
+      {"name": s.name, "start": s.start - self.origin, "duration": s.duration, "thread": s.tid, "attrs": s.attrs}
+      for s in spans
+    ]
+
+
+_tracer: Tracer | None = None
+_tracer_lock = threading.Lock()
+_recorder: contextvars.ContextVar[Recorder | None] = contextvars.ContextVar("scrobble_trace_recorder", default=None)
+
+
+def span(name: str, **attrs: Any) -> Span | _NoSpan:
+  recorder = _recorder.get()
+  if recorder is not None:
+    return Span(recorder, name, attrs)
+  tracer = _tracer
+  if tracer is None:
+    return _NO_SPAN
+  return Span(tracer, name, attrs)
+
+
+@contextmanager
+def collect() -> Iterator[Recorder]:
+  """Records the spans made in this context (and in functions wrapped with `bind`) until it exits."""
+  recorder = Recorder(_tracer)
+  token = _recorder.set(recorder)
+  try:
+    yield recorder
+  finally:
+    _recorder.reset(token)
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+  """`fn`, run in the current context wherever it is called: lets pool threads report to `collect`."""
+  if _recorder.get() is None:
+    return fn
+  ctx = contextvars.copy_context()
+  return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+def merge(spans: list[dict], origin: float) -> None:
+  """Adds spans recorded elsewhere (a daemon request that began at perf_counter `origin`)."""
+  tracer = _tracer
+  if tracer is None:
+    return
+  for d in spans:
+    s = Span(tracer, str(d.get("name") or "?"), dict(d.get("attrs") or {}))
+    s.start = origin + float(d.get("start") or 0.0)
+    s.duration = float(d.get("duration") or 0.0)
+    s.tid = int(d.get("thread") or 0)
+    tracer._finish(s)
+
+
+def enabled() -> bool:
+  return _tracer is not None
+
+
+def enable(sink: str) -> None:
+  """
+  Starts tracing (once per process) and adds an output written at exit: "summary" prints a table to
+  stderr, "json:PATH" writes the spans, "chrome:PATH" writes a Chrome trace-event file. A bare path
+  means JSON. A PATH that is a directory gets a timestamped file per process.
+  """
+  global _tracer
+  with _tracer_lock:
+    if _tracer is None:
+      _tracer = Tracer()
+      atexit.register(_write)
+    if sink not in _tracer.sinks:
+      _tracer.sinks.append(sink)
+
+
+def enable_from_env() -> None:
+  value = (os.environ.get("SCROBBLE_TRACE") or "").strip()
+  if not value or value.lower() in ("0", "false", "no", "off"):
+    return
+  enable("summary" if value.lower() in ("1", "true", "yes", "on", "summary") else value)
+
+
+def _target(path: str, suffix: str) -> Path:
+  p = Path(path).expanduser()
+  if p.is_dir():
+    p = p / f"scrobble-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{suffix}"
+  return p
+
+
+def _write() -> None:
+  tracer = _tracer
+  if tracer is None:
+    return
+  for sink in tracer.sinks:
+    kind, sep, path = sink.partition(":")
+    if not sep or kind not in ("json", "chrome"):
+      kind, path = ("summary", "") if sink == "summary" else ("json", sink)
+    try:
+      if kind == "summary":
+        _print_summary(tracer)
+      elif kind == "chrome":
+        _target(path, ".trace.json").write_text(json.dumps(tracer.to_chrome()), encoding="utf-8")
+      else:
+        _target(path, ".json").write_text(json.dumps(tracer.to_json(), indent=2), encoding="utf-8")
+    except OSError as e:
+      sys.stderr.write(f"Couldn't write trace to {path}: {e}\n")
+
+
+def _details(row: dict) -> str:
+  parts = [f"{k}={v:,.0f}" if isinstance(v, float) else f"{k}={v:,}" for k, v in sorted(row["sums"].items())]
+  for k, counts in sorted(row["counts"].items()):
+    if k in ("path", "url"):
+      continue
+    parts.append(f"{k} " + " ".join(f"{v}×{n}" for v, n in counts.most_common()))
+  return ", ".join(parts)
+
+
+def _print_summary(tracer: Tracer) -> None:
+  from scrobble_cli.output import LazyConsole, new_table
+
+  table = new_table("Timings", show_lines=False)
+  table.add_column("Phase")
+  table.add_column("Calls", justify="right")
+  table.add_column("Total ms", justify="right")
+  table.add_column("Max ms", justify="right")
+  table.add_column("Details", overflow="fold")
+  for row in tracer.summary():
+    table.add_row(row["name"], str(row["calls"]), f"{row['total_ms']:.1f}", f"{row['max_ms']:.1f}", _details(row))
+  LazyConsole(stderr=True).print(table)
@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from scrobble_cli import __version__, flow, trace
+from scrobble_cli.config import HttpConfig
+from scrobble_cli.flow import Flow, Sleep
+from scrobble_cli.ratelimit import TokenBucket
+
+# `requests` is imported on first use: clients that only talk to the daemon or the local
+# caches never pay for it. `httpx` (the `async` extra) is only needed by `scrobble_cli.aio`.
+if TYPE_CHECKING:
+  import asyncio
+
+  import httpx
+  import requests
+
+
+USER_AGENT = f"scrobble-cli/{__version__}"
+
+# 429 + the 5xx codes that usually mean "try again in a moment".
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# For non-idempotent calls (Last.fm POSTs) only retry when the server clearly didn't process the request.
+RETRY_STATUSES_UNSAFE = frozenset({429, 503})
+
+MAX_BACKOFF_SECONDS = 30.0
+MAX_RETRY_AFTER_SECONDS = 120.0
+
+
+@dataclass(frozen=True)
+class RateLimitStatus:
+  limit: int | None
+  used: int | None
+  remaining: int | None
+  observed_at: float
+
+
+_sessions: dict[str, requests.Session] = {}
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]] = weakref.WeakKeyDictionary()
+_rate_limits: dict[str, RateLimitStatus] = {}
+_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+  return urlsplit(url).netloc
+
+
+def session_for(url: str) -> requests.Session:
+  """One keep-alive session (and connection pool) per host, shared by the whole process."""
+  import requests
+  from requests.adapters import HTTPAdapter
+
+  host = _host(url)
+  with _lock:
+    s = _sessions.get(host)
+    if s is None:
+      s = requests.Session()
+      adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+      s.mount("https://", adapter)
+      s.mount("http://", adapter)
+      s.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+      _sessions[host] = s
+    return s
+
+
+def close_sessions() -> None:
+  with _lock:
+    for s in _sessions.values():
+      s.close()
+    _sessions.clear()
+
+
+def _httpx():
+  try:
+    import httpx
+  except ImportError as e:
+    raise RuntimeError("The asyncio API needs httpx: pip install 'scrobble-cli[async]'.") from e
+  return httpx
+
+
+def async_client_for(url: str) -> httpx.AsyncClient:
+  """`session_for` on the running event loop: one pooled client per host and loop (a client can't change loops)."""
+  import asyncio
+
+  httpx = _httpx()
+  loop = asyncio.get_running_loop()
+  host = _host(url)
+  with _lock:
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(host)
+    if client is None:
+      client = clients[host] = httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"},
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+        follow_redirects=True,
+      )
+    return client
+
+
+async def aclose_sessions() -> None:
+  """Closes the running event loop's clients."""
+  import asyncio
+
+  with _lock:
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+  for client in clients.values():
+    await client.aclose()
+
+
+def _header_int(r: requests.Response | httpx.Response, name: str) -> int | None:
+  value = r.headers.get(name)
+  if value is None:
+    return None
+  try:
+    return int(value)
+  except ValueError:
+    return None
+
+
+def _record_rate_limit(host: str, r: requests.Response | httpx.Response) -> None:
+  remaining = _header_int(r, "X-Discogs-Ratelimit-Remaining")
+  if remaining is None:
+    return
+  with _lock:
+    _rate_limits[host] = RateLimitStatus(
+      limit=_header_int(r, "X-Discogs-Ratelimit"),
+      used=_header_int(r, "X-Discogs-Ratelimit-Used"),
+      remaining=remaining,
+      observed_at=time.time(),
+    )
+
+
+def rate_limit_status(url: str) -> RateLimitStatus | None:
+  with _lock:
+    return _rate_limits.get(_host(url))
+
+
+def _retry_after(r: requests.Response | httpx.Response) -> float | None:
+  value = r.headers.get("Retry-After")
+  if not value:
+    return None
+  value = value.strip()
+  if value.isdigit():
+    return min(float(value), MAX_RETRY_AFTER_SECONDS)
+  try:
+    when = parsedate_to_datetime(value)
+  except (TypeError, ValueError):
+    return None
+  return max(0.0, min(when.timestamp() - time.time(), MAX_RETRY_AFTER_SECONDS))
+
+
+def _backoff(attempt: int, base: float) -> float:
+  # "Full jitter": spreads retries from several processes instead of having them retry in lockstep.
+  return random.uniform(0, min(MAX_BACKOFF_SECONDS, base * (2**attempt)))
+
+
+def _throttle(host: str) -> float:
+  """
+  Discogs uses a moving 60s window. If the last response said we're out of budget, the next
+  request should wait roughly one slot instead of firing a request that will just get a 429.
+  Returns how long.
+  """
+  with _lock:
+    st = _rate_limits.get(host)
+  if st is None or st.remaining is None or st.remaining > 0:
+    return 0.0
+  slot = 60.0 / (st.limit or 60)
+  return max(0.0, slot - (time.time() - st.observed_at))
+
+
+def _within(seconds: float, deadline: float | None, what: str) -> float:
+  if deadline is not None and time.monotonic() + seconds > deadline:
+    raise TimeoutError(f"{what} after the deadline")
+  return seconds
+
+
+def _left(deadline: float) -> float:
+  left = deadline - time.monotonic()
+  if left <= 0:
+    raise TimeoutError("deadline passed")
+  return left
+
+
+def _sent_bytes(r: requests.Response | httpx.Response) -> int:
+  request = r.request
+  body = request.body if hasattr(request, "body") else request.content  # requests / httpx
+  return len(body) if body else 0
+
+
+@dataclass(frozen=True)
+class _Acquire:
+  limiter: TokenBucket
+  timeout: float | None
+
+  def run(self) -> float:
+    return self.limiter.acquire(timeout=self.timeout)
+
+  async def arun(self) -> float:
+    return await self.limiter.aacquire(timeout=self.timeout)
+
+
+@dataclass(frozen=True)
+class _Failed:
+  """A request that got no response; `connect` if no connection was made, so even a POST can be retried."""
+
+  error: Exception
+  connect: bool
+
+
+@dataclass(frozen=True)
+class _Send:
+  method: str
+  url: str
+  headers: dict[str, str] | None
+  params: dict | None
+  data: dict | None
+  timeout: tuple[float, float]
+
+  def run(self) -> requests.Response | _Failed:
+    import requests
+
+    try:
+      return session_for(self.url).request(
+        self.method, self.url, headers=self.headers, params=self.params, data=self.data, timeout=self.timeout
+      )
+    except (requests.ConnectionError, requests.Timeout) as e:
+      return _Failed(e, connect=isinstance(e, requests.ConnectTimeout))
+
+  async def arun(self) -> httpx.Response | _Failed:
+    httpx = _httpx()
+    connect, read = self.timeout
+    try:
+      return await async_client_for(self.url).request(
+        self.method,
+        self.url,
+        headers=self.headers,
+        params=self.params,
+        data=self.data,
+        timeout=httpx.Timeout(read, connect=connect),
+      )
+    except (httpx.NetworkError, httpx.TimeoutException) as e:
+      return _Failed(e, connect=isinstance(e, httpx.ConnectTimeout))
+
+
+def _request_flow(
+  method: str,
+  url: str,
+  http: HttpConfig,
+  *,
+  headers: dict[str, str] | None,
+  params: dict | None,
+  data: dict | None,
+  idempotent: bool,
+  limiter: TokenBucket | None,
+  deadline: float | None,
+) -> Flow[requests.Response | httpx.Response]:
+  host = _host(url)
+  retry_statuses = RETRY_STATUSES if idempotent else RETRY_STATUSES_UNSAFE
+  with trace.span("http", method=method, host=host) as s:
+    attempt = 0
+    while True:
+      if limiter is not None:
+        with trace.span("ratelimit.wait", host=host):
+          yield _Acquire(limiter, None if deadline is None else _left(deadline))
+      wait = _throttle(host)
+      if wait > 0:
+        yield Sleep(_within(wait, deadline, "rate-limit slot opens"))
+      timeout = (http.connect_timeout, http.read_timeout)
+      if deadline is not None:
+        left = _left(deadline)
+        timeout = (min(timeout[0], left), min(timeout[1], left))
+      r = yield _Send(method, url, headers, params, data, timeout)
+      if isinstance(r, _Failed):
+        if not (idempotent or r.connect) or attempt >= http.retries:
+          if s:
+            s.set(retries=attempt)
+          raise r.error
+        yield Sleep(_within(_backoff(attempt, http.backoff), deadline, "retry would start"))
+        attempt += 1
+        continue
+
+      _record_rate_limit(host, r)
+      if r.status_code == 429 and limiter is not None:
+        limiter.drain()
+      if r.status_code in retry_statuses and attempt < http.retries:
+        wait = _retry_after(r)
+        yield Sleep(_within(wait if wait is not None else _backoff(attempt, http.backoff), deadline, "retry would start"))
+        attempt += 1
+        continue
+      if s:
+        s.set(status=r.status_code, bytes_in=len(r.content), bytes_out=_sent_bytes(r), retries=attempt)
+      return r
+
+
+def request(
+  method: str,
+  url: str,
+  http: HttpConfig,
+  *,
+  headers: dict[str, str] | None = None,
+  params: dict | None = None,
+  data: dict | None = None,
+  idempotent: bool = True,
+  limiter: TokenBucket | None = None,
+  deadline: float | None = None,
+) -> requests.Response:
+  """
+  Sends a request through the shared per-host session, retrying transient failures
+  (connection errors, 429, 5xx) with jittered exponential backoff and honoring Retry-After.
+  The final response is returned as-is; callers decide whether to `raise_for_status()`.
+
+  With a `limiter`, every attempt (retries included) first takes a token from the shared bucket,
+  and a 429 drains the bucket so other processes back off too.
+
+  With a `deadline` (a `time.monotonic()` value), waiting for a token or a rate-limit slot, the
+  connect and read timeouts and retry sleeps are all cut to the time left, and TimeoutError is
+  raised once it is up.
+  """
+  return flow.run(
+    _request_flow(
+      method,
+      url,
+      http,
+      headers=headers,
+      params=params,
+      data=data,
+      idempotent=idempotent,
+      limiter=limiter,
+      deadline=deadline,
+    )
+  )
+
+
+async def arequest(
+  method: str,
+  url: str,
+  http: HttpConfig,
+  *,
+  headers: dict[str, str] | None = None,
+  params: dict | None = None,
+  data: dict | None = None,
+  idempotent: bool = True,
+  limiter: TokenBucket | None = None,
+  deadline: float | None = None,
+) -> httpx.Response:
+  """`request` on the running event loop, through `async_client_for` (needs httpx)."""
+  return await flow.arun(
+    _request_flow(
+      method,
+      url,
+      http,
+      headers=headers,
+      params=params,
+      data=data,
+      idempotent=idempotent,
+      limiter=limiter,
+      deadline=deadline,
+    )
+  )
+
+
+@dataclass(frozen=True)
+class Call:
+  """One `request`, as a flow step: the Discogs and Last.fm flows yield these."""
+
+  method: str
+  url: str
+  http: HttpConfig
+  headers: dict[str, str] | None = None
+  params: dict | None = None
+  data: dict | None = None
+  idempotent: bool = True
+  limiter: TokenBucket | None = None
+  deadline: float | None = None
+
+  def _kwargs(self) -> dict:
+    return {
+      "headers": self.headers,
+      "params": self.params,
+      "data": self.data,
+      "idempotent": self.idempotent,
+      "limiter": self.limiter,
+      "deadline": self.deadline,
+    }
+
+  def run(self) -> requests.Response:
+    return request(self.method, self.url, self.http, **self._kwargs())
+
+  async def arun(self) -> httpx.Response:
+    return await arequest(self.method, self.url, self.http, **self._kwargs())
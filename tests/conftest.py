@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import pytest
+
+from scrobble_cli import cache, collection, config, history, importer, metrics, outbox, ratelimit
+
+
+@pytest.fixture(autouse=True)
+def config_home(tmp_path, monkeypatch):
+  """Every test gets its own config dir (and so its own SQLite stores), with no daemon or metrics."""
+  monkeypatch.setattr(config, "user_config_path", lambda name: tmp_path / name)
+  monkeypatch.setenv("SCROBBLE_DAEMON", "0")
+  monkeypatch.setattr(metrics, "_enabled", False)
+  for module, name in (
+    (outbox, "_outboxes"),
+    (history, "_histories"),
+    (cache, "_caches"),
+    (ratelimit, "_buckets"),
+  ):
+    monkeypatch.setattr(module, name, {})
+  for module in (importer, collection):
+    monkeypatch.setattr(module, "_conn", None)
+  return tmp_path / "scrobble-cli"
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from dataclasses import replace
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from scrobble_cli import aio, discogs, lastfm, transport
+from scrobble_cli.config import load_config
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, ScrobbleTrack
+
+httpx = pytest.importorskip("httpx")
+
+
+class Server:
+  """Stands in for Discogs and Last.fm behind httpx: `answer(request)` replies after `delay(request)` seconds."""
+
+  def __init__(self, answer, delay=lambda request: 0.0):
+    self.answer = answer
+    self.delay = delay
+    self.requests: list[httpx.Request] = []
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.max_threads = 0
+
+  async def handle(self, request: httpx.Request) -> httpx.Response:
+    self.requests.append(request)
+    self.in_flight += 1
+    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    self.max_threads = max(self.max_threads, threading.active_count())
+    try:
+      await asyncio.sleep(self.delay(request))
+      return self.answer(request)
+    finally:
+      self.in_flight -= 1
+
+
+def _serve(monkeypatch, server: Server) -> Server:
+  clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+  def client_for(url: str) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    if loop not in clients:
+      clients[loop] = httpx.AsyncClient(transport=httpx.MockTransport(server.handle))
+    return clients[loop]
+
+  monkeypatch.setattr(transport, "async_client_for", client_for)
+  return server
+
+
+def _release(request: httpx.Request) -> httpx.Response:
+  id = int(request.url.path.rsplit("/", 1)[1])
+  tracklist = [{"position": "A1", "title": "Side A", "duration": "20:00", "type_": "track"}]
+  return httpx.Response(200, json={"id": id, "title": f"Artist - Album {id}", "tracklist": tracklist})
+
+
+def _item(id: int, title: str, kind: str) -> dict:
+  return {"id": id, "type": kind, "title": title, "year": "1970", "format": ["Vinyl", "LP"], "label": ["X"]}
+
+
+def _filler(page: int, kind: str) -> list[dict]:
+  return [_item(page * 10 + i, f"Someone Else - Other Record {page}{i}", kind) for i in range(5)]
+
+
+def _search(pages: dict[str, list[list[dict]]]):
+  def answer(request: httpx.Request) -> httpx.Response:
+    kind, page = request.url.params["type"], int(request.url.params.get("page", 1))
+    found = pages.get(kind) or []
+    results = found[page - 1] if page <= len(found) else []
+    return httpx.Response(200, json={"results": results, "pagination": {"page": page, "pages": max(1, len(found))}})
+
+  return answer
+
+
+def _searched(server: Server) -> list[tuple[str, int]]:
+  return [(r.url.params["type"], int(r.url.params["page"])) for r in server.requests]
+
+
+@pytest.fixture
+def cfg():
+  cfg = load_config()
+  discogs_cfg = replace(
+    cfg.discogs,
+    token="token",
+    api_url="http://discogs.test",
+    collection=False,
+    offline_index=False,
+    requests_per_minute=60_000,
+  )
+  lastfm_cfg = replace(cfg.lastfm, api_key="key", api_secret="secret", session_key="sk", api_url="http://lastfm.test/2.0/")
+  return replace(cfg, discogs=discogs_cfg, lastfm=lastfm_cfg, cache=replace(cfg.cache, enabled=False))
+
+
+def test_hundreds_of_lookups_share_one_loop_instead_of_a_thread_each(cfg, monkeypatch):
+  server = _serve(monkeypatch, Server(_release, delay=lambda request: 0.2))
+  threads = threading.active_count()
+
+  async def main():
+    return await asyncio.gather(*(aio.fetch_release(cfg, kind="release", id=i) for i in range(200)))
+
+  started = time.monotonic()
+  releases = asyncio.run(main())
+  assert time.monotonic() - started < 2.0  # one after another would take 40s
+  assert [r.album for r in releases] == [f"Album {i}" for i in range(200)]
+  assert server.max_in_flight == 200
+  assert server.max_threads <= threads + 1
+
+
+def test_a_release_fetched_async_is_a_cache_hit_for_the_sync_api(cfg, monkeypatch):
+  cfg = replace(cfg, cache=replace(cfg.cache, enabled=True))
+  server = _serve(monkeypatch, Server(_release))
+  asyncio.run(aio.fetch_release(cfg, kind="release", id=7))
+  monkeypatch.setattr(transport, "session_for", lambda url: pytest.fail("the sync API went to the network"))
+  assert discogs.fetch_release(cfg, kind="release", id=7).album == "Album 7"
+  assert len(server.requests) == 1
+
+
+def test_retry_after_is_honored_without_blocking_the_loop(cfg, monkeypatch):
+  answers = [httpx.Response(429, headers={"Retry-After": "1"})]
+  server = _serve(monkeypatch, Server(lambda request: answers.pop() if answers else _release(request)))
+  ticks = []
+
+  async def tick():
+    while True:
+      ticks.append(time.monotonic())
+      await asyncio.sleep(0.05)
+
+  async def main():
+    ticker = asyncio.ensure_future(tick())
+    try:
+      return await aio.fetch_release(cfg, kind="release", id=1)
+    finally:
+      ticker.cancel()
+
+  started = time.monotonic()
+  assert asyncio.run(main()).id == 1
+  assert time.monotonic() - started >= 1.0
+  assert len(server.requests) == 2
+  assert len(ticks) >= 15
+
+
+def test_search_reads_pages_until_confident(cfg, monkeypatch):
+  pages = [_filler(p, "master") for p in range(1, 6)]
+  pages[1][3] = _item(999, "John Coltrane - A Love Supreme", "master")
+  server = _serve(monkeypatch, Server(_search({"master": pages})))
+  results = asyncio.run(
+    aio.search_query(cfg, query="john coltrane a love supreme", vinyl_only=False, limit=5, until_confident=True)
+  )
+  assert _searched(server) == [("master", 1), ("master", 2)]
+  assert results[0].id == 999
+
+
+def test_a_slow_master_miss_sends_the_release_query_alongside(cfg, monkeypatch):
+  server = _serve(
+    monkeypatch,
+    Server(_search({"release": [_filler(1, "release")]}), delay=lambda request: 0.6),
+  )
+  started = time.monotonic()
+  results = asyncio.run(aio.search_query(cfg, query="someone else", vinyl_only=False, limit=5, speculative=True))
+  assert [r.kind for r in results] == ["release"] * 5
+  assert sorted(_searched(server)) == [("master", 1), ("release", 1)]
+  assert time.monotonic() - started < 0.6 + discogs.SPECULATION_DELAY_SECONDS + 0.3
+
+
+def _tracks(n: int) -> list[ScrobbleTrack]:
+  return [
+    ScrobbleTrack(artist="Artist", title=f"Track {i}", album="Album", album_artist="Artist", timestamp_unix=1_700_000_000 + 300 * i)
+    for i in range(n)
+  ]
+
+
+def _scrobbled(request: httpx.Request) -> httpx.Response:
+  params = dict(parse_qsl(request.content.decode()))
+  signature = params.pop("api_sig")
+  assert signature == lastfm._sig(params, "secret")
+  count = sum(1 for k in params if k.startswith("track["))
+  return httpx.Response(200, json={"scrobbles": {"@attr": {"accepted": count, "ignored": 0}, "scrobble": []}})
+
+
+def test_scrobble_album_keeps_batches_in_flight_and_reports_each(cfg, monkeypatch):
+  monkeypatch.setattr(lastfm.Pacer, "reserve", lambda self: 0.0)
+  server = _serve(monkeypatch, Server(_scrobbled, delay=lambda request: 0.1))
+  offsets = []
+  res = asyncio.run(
+    aio.scrobble_album(
+      replace(cfg, lastfm=replace(cfg.lastfm, max_in_flight=2)),
+      _tracks(2 * SCROBBLE_BATCH_SIZE + 20),
+      on_batch=lambda offset, res: offsets.append(offset),
+    )
+  )
+  assert [b["scrobbles"]["@attr"]["accepted"] for b in res["batches"]] == [50, 50, 20]
+  assert sorted(offsets) == [0, 50, 100]
+  assert server.max_in_flight == 2
+
+
+def test_batches_not_yet_sent_are_dropped_after_a_failure(cfg, monkeypatch):
+  monkeypatch.setattr(lastfm.Pacer, "reserve", lambda self: 0.0)
+  server = _serve(monkeypatch, Server(lambda request: httpx.Response(502)))
+  with pytest.raises(httpx.HTTPStatusError):
+    asyncio.run(aio.scrobble_album(replace(cfg, lastfm=replace(cfg.lastfm, max_in_flight=1)), _tracks(2 * SCROBBLE_BATCH_SIZE)))
+  assert len(server.requests) == 1
+
+
+def test_ensure_session_saves_the_session_it_was_given(cfg, monkeypatch):
+  def answer(request: httpx.Request) -> httpx.Response:
+    method = dict(parse_qsl(request.content.decode()))["method"]
+    if method == "auth.getToken":
+      return httpx.Response(200, json={"token": "tok"})
+    return httpx.Response(200, json={"session": {"name": "me", "key": "new-sk"}})
+
+  server = _serve(monkeypatch, Server(answer))
+  opened = []
+  monkeypatch.setattr(lastfm.webbrowser, "open", opened.append)
+  monkeypatch.setattr("builtins.input", lambda prompt: "")
+  new = asyncio.run(aio.ensure_session(replace(cfg, lastfm=replace(cfg.lastfm, session_key=None)), api_key="key", api_secret="secret"))
+  assert (new.lastfm.username, new.lastfm.session_key) == ("me", "new-sk")
+  assert urlsplit(opened[0]).query == "api_key=key&token=tok"
+  assert len(server.requests) == 2
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import pytest
+
+from scrobble_cli.batch import ResolvedItem, plan_items, read_items
+from scrobble_cli.discogs import DiscogsRelease, DiscogsTrack
+
+
+def _release(id: int, *durations: int) -> DiscogsRelease:
+  tracks = [DiscogsTrack(position=f"A{i}", title=f"Track {i}", duration_seconds=d) for i, d in enumerate(durations, start=1)]
+  return DiscogsRelease(id=id, kind="release", artist="Artist", album=f"Album {id}", year=None, tracks=tracks)
+
+
+@pytest.mark.parametrize(
+  "line, error",
+  [
+    ('{"query": "a", "started_at": "last tuesday"}', "line 2: invalid started_at 'last tuesday'"),
+    ('{"query": "a", "ended_at": 5}', "line 2: invalid ended_at 5"),
+    ('{"query": "a", "pick": "second"}', "line 2: invalid pick 'second'"),
+    ('{"query": "a", "started_at": "2026-01-01T10:00", "ended_at": "2026-01-01T11:00"}', "line 2: use either"),
+  ],
+)
+def test_bad_items_are_reported_with_their_line_before_any_lookup(line, error):
+  with pytest.raises(ValueError, match=error):
+    read_items(["radiohead ok computer", line])
+
+
+def test_items_are_chained_to_end_now_unless_anchored():
+  items = read_items(['{"query": "a"}', '{"query": "b", "started_at": "2026-01-01T10:00:00+00:00"}', "c"])
+  resolved = [
+    ResolvedItem(item=items[0], release=_release(1, 100, 200)),
+    ResolvedItem(item=items[1], release=_release(2, 60)),
+    ResolvedItem(item=items[2], release=_release(3, 50)),
+  ]
+  planned = plan_items(resolved, start_unix=None, now_unix=10_000)
+  assert [[t.timestamp_unix for t in p.scrobbles] for p in planned] == [[9_650, 9_750], [1_767_261_600], [9_950]]
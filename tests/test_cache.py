@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pytest
+
+from scrobble_cli import cache, discogs, transport
+from scrobble_cli.cache import RELEASE_TTL, get_cache
+from scrobble_cli.config import load_config
+
+
+class Response:
+  def __init__(self, status_code: int, body: dict | None = None, headers: dict | None = None):
+    self.status_code = status_code
+    self._body = body
+    self.headers = headers or {}
+
+  def json(self) -> dict:
+    return self._body
+
+  def raise_for_status(self) -> None:
+    if self.status_code >= 400:
+      raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeDiscogs:
+  """Stands in for `transport.request`: answers with `body` and its ETag, or 304 when it still matches."""
+
+  def __init__(self, body: dict, etag: str = '"v1"'):
+    self.body = body
+    self.etag = etag
+    self.requests: list[dict] = []
+
+  def __call__(self, method, url, http, *, headers=None, params=None, limiter=None, **kw):
+    self.requests.append(dict(headers or {}))
+    if (headers or {}).get("If-None-Match") == self.etag:
+      return Response(304)
+    return Response(200, self.body, {"ETag": self.etag, "Last-Modified": "Mon, 05 Oct 2026 10:00:00 GMT"})
+
+
+class Clock:
+  def __init__(self, now: float = 1_800_000_000.0):
+    self.now = now
+
+  def time(self) -> float:
+    return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(cache, "time", clock)
+  return clock
+
+
+@pytest.fixture
+def cfg():
+  cfg = load_config()
+  return replace(cfg, cache=replace(cfg.cache, enabled=True, max_bytes=1 << 20))
+
+
+def test_fresh_hit_makes_no_request(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"id": 1, "title": "A Love Supreme"})
+  monkeypatch.setattr(transport, "request", fake)
+  assert discogs._get_json(cfg, "/releases/1", None) == (fake.body, "miss")
+  assert discogs._get_json(cfg, "/releases/1", None) == (fake.body, "hit")
+  assert len(fake.requests) == 1
+
+
+def test_stale_entry_is_revalidated_with_its_validators(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"id": 1, "title": "A Love Supreme"})
+  monkeypatch.setattr(transport, "request", fake)
+  discogs._get_json(cfg, "/releases/1", None)
+
+  clock.now += RELEASE_TTL + 1
+  assert discogs._get_json(cfg, "/releases/1", None) == (fake.body, "revalidated")
+  assert fake.requests[-1]["If-None-Match"] == '"v1"'
+  assert fake.requests[-1]["If-Modified-Since"] == "Mon, 05 Oct 2026 10:00:00 GMT"
+
+  # The 304 made the entry fresh again.
+  assert discogs._get_json(cfg, "/releases/1", None)[1] == "hit"
+  stats = get_cache(cfg.cache.max_bytes).stats()
+  assert (stats.hits, stats.revalidated, stats.misses) == (1, 1, 1)
+
+
+def test_changed_resource_replaces_the_stale_entry(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"id": 1, "title": "A Love Supreme"})
+  monkeypatch.setattr(transport, "request", fake)
+  discogs._get_json(cfg, "/releases/1", None)
+
+  clock.now += RELEASE_TTL + 1
+  fake.body, fake.etag = {"id": 1, "title": "A Love Supreme (Deluxe)"}, '"v2"'
+  assert discogs._get_json(cfg, "/releases/1", None) == (fake.body, "miss")
+  assert discogs._get_json(cfg, "/releases/1", None) == (fake.body, "hit")
+
+
+def test_collection_listings_always_revalidate(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"releases": []})
+  monkeypatch.setattr(transport, "request", fake)
+  discogs._get_json(cfg, "/users/me/collection/folders/0/releases", {"page": 1})
+  assert discogs._get_json(cfg, "/users/me/collection/folders/0/releases", {"page": 1})[1] == "revalidated"
+  assert len(fake.requests) == 2
+
+
+def test_least_recently_used_entries_are_evicted_past_the_cap(clock):
+  responses = cache.ResponseCache(max_bytes=100)
+  body = {"x": "y" * 30}  # 40 bytes of JSON
+  responses.put("a", body, ttl=60)
+  clock.now += 1
+  responses.put("b", body, ttl=60)
+  clock.now += 1
+  assert responses.get("a") is not None  # now "b" is the least recently used
+  clock.now += 1
+  responses.put("c", body, ttl=60)
+  assert responses.get("b") is None
+  assert responses.get("a") is not None and responses.get("c") is not None
+
+
+def test_prune_drops_expired_entries(clock):
+  responses = cache.ResponseCache(max_bytes=1 << 20)
+  responses.put("short", {}, ttl=10)
+  responses.put("long", {}, ttl=1000)
+  clock.now += 100
+  assert responses.prune() == 1
+  assert responses.stats().entries == 1
+
+
+def test_entries_are_kept_apart_per_api_url(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"id": 1, "title": "A Love Supreme"})
+  monkeypatch.setattr(transport, "request", fake)
+  proxy = replace(cfg, discogs=replace(cfg.discogs, api_url="http://127.0.0.1:8080"))
+  discogs._get_json(cfg, "/releases/1", None)
+  assert discogs._get_json(proxy, "/releases/1", None)[1] == "miss"
+  assert len(fake.requests) == 2
+
+
+def test_collection_listings_are_kept_apart_per_token(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"releases": []})
+  monkeypatch.setattr(transport, "request", fake)
+  path = "/users/me/collection/folders/0/releases"
+  discogs._get_json(replace(cfg, discogs=replace(cfg.discogs, token="mine")), path, {"page": 1})
+  discogs._get_json(replace(cfg, discogs=replace(cfg.discogs, token="theirs")), path, {"page": 1})
+  assert "If-None-Match" not in fake.requests[1]
+
+
+def test_a_304_with_nothing_cached_is_asked_again_without_validators(cfg, clock, monkeypatch):
+  answers = [Response(304), Response(200, {"id": 1}, {"ETag": '"v1"'})]
+  requests = []
+
+  def request(method, url, http, *, headers=None, **kw):
+    requests.append(dict(headers or {}))
+    return answers.pop(0)
+
+  monkeypatch.setattr(transport, "request", request)
+  assert discogs._get_json(cfg, "/releases/1", None) == ({"id": 1}, "miss")
+  assert len(requests) == 2 and "If-None-Match" not in requests[1]
+
+
+def test_an_entry_evicted_during_revalidation_is_stored_again(cfg, clock, monkeypatch):
+  fake = FakeDiscogs({"id": 1, "title": "A Love Supreme"})
+  monkeypatch.setattr(transport, "request", fake)
+  discogs._get_json(cfg, "/releases/1", None)
+  clock.now += RELEASE_TTL + 1
+
+  responses = get_cache(cfg.cache.max_bytes)
+  real_get = responses.get
+
+  def get_then_evict(key):
+    cached = real_get(key)
+    responses.clear()
+    return cached
+
+  monkeypatch.setattr(responses, "get", get_then_evict)
+  assert discogs._get_json(cfg, "/releases/1", None)[1] == "revalidated"
+  monkeypatch.setattr(responses, "get", real_get)
+  assert discogs._get_json(cfg, "/releases/1", None)[1] == "hit"
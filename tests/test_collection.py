@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pytest
+
+from scrobble_cli import collection, discogs
+from scrobble_cli.config import load_config
+from scrobble_cli.discogs import search
+
+
+def _owned(id: int, artist: str, title: str, added: str, year: int = 1970) -> dict:
+  return {
+    "id": id,
+    "date_added": added,
+    "basic_information": {
+      "id": id,
+      "master_id": id + 1000,
+      "title": title,
+      "year": year,
+      "artists": [{"name": artist}],
+      "formats": [{"name": "Vinyl", "descriptions": ["LP", "Album"]}],
+      "labels": [{"name": "Label", "catno": f"CAT-{id}"}],
+    },
+  }
+
+
+class FakeDiscogs:
+  """Stands in for `discogs._get`: the collection listing (newest first), release pages and search."""
+
+  def __init__(self, owned: list[dict], search: list[dict] | None = None):
+    self.owned = owned
+    self.search = search or []
+    self.requests: list[str] = []
+
+  def __call__(self, cfg, path, params=None):
+    self.requests.append(path)
+    if path.endswith("/collection/folders/0/releases"):
+      items = sorted(self.owned, key=lambda i: i["date_added"], reverse=True)
+      page, per_page = int(params["page"]), int(params["per_page"])
+      pages = max(1, -(-len(items) // per_page))
+      return {"releases": items[(page - 1) * per_page : page * per_page], "pagination": {"pages": pages, "items": len(items)}}
+    if path.startswith("/releases/"):
+      id = int(path.rsplit("/", 1)[1])
+      tracklist = [
+        {"position": "A1", "title": "Side A", "duration": "20:00", "type_": "track"},
+        {"position": "B1", "title": "Side B", "duration": "19:00", "type_": "track"},
+      ]
+      return {"id": id, "title": "Album", "artists": [{"name": "Artist"}], "tracklist": tracklist}
+    if path == "/database/search":
+      return {"results": self.search if params["type"] == "master" else [], "pagination": {"pages": 1}}
+    raise AssertionError(f"unexpected request {path}")
+
+
+@pytest.fixture
+def cfg():
+  cfg = load_config()
+  return replace(cfg, discogs=replace(cfg.discogs, token="token", username="me", collection=True, offline_index=False))
+
+
+def _install(monkeypatch, fake: FakeDiscogs) -> None:
+  monkeypatch.setattr(collection, "_get", fake)
+  monkeypatch.setattr(discogs, "_get", fake)
+
+
+def test_incremental_sync_only_lists_what_was_added(cfg, monkeypatch):
+  owned = [_owned(i, "Artist", f"Record {i}", f"2026-01-{i:02d}T10:00:00-00:00") for i in range(1, 6)]
+  fake = FakeDiscogs(owned)
+  _install(monkeypatch, fake)
+  monkeypatch.setattr(collection, "PER_PAGE", 2)
+
+  st = collection.sync(cfg)
+  assert (st.listed, st.added, st.tracklists) == (5, 5, 5)
+  assert collection.fetch_release(3).tracks[0].duration_seconds == 20 * 60
+
+  fake.owned.append(_owned(6, "Artist", "Record 6", "2026-02-01T10:00:00-00:00"))
+  fake.requests.clear()
+  st = collection.sync(cfg)
+  # Listing stops at the first record older than the newest one seen before: page 2 of 3.
+  assert (st.added, st.tracklists) == (1, 1)
+  assert fake.requests.count("/users/me/collection/folders/0/releases") == 2
+  assert collection.stats().releases == 6
+
+
+def test_full_sync_drops_records_no_longer_owned(cfg, monkeypatch):
+  fake = FakeDiscogs([_owned(i, "Artist", f"Record {i}", f"2026-01-{i:02d}T10:00:00-00:00") for i in range(1, 4)])
+  _install(monkeypatch, fake)
+  collection.sync(cfg)
+  del fake.owned[0]
+  assert collection.sync(cfg, full=True).removed == 1
+  assert collection.fetch_release(1) is None
+
+
+def test_an_owned_exact_match_resolves_without_the_api(cfg, monkeypatch):
+  fake = FakeDiscogs([_owned(1, "John Coltrane", "A Love Supreme", "2026-01-01T10:00:00-00:00", 1965)])
+  _install(monkeypatch, fake)
+  collection.sync(cfg)
+  fake.requests.clear()
+
+  results = search(cfg, artist="John Coltrane", album="A Love Supreme", vinyl_only=True, limit=5)
+  assert [(r.kind, r.id) for r in results] == [("release", 1)]
+  assert fake.requests == []
+
+
+def test_a_loose_owned_hit_is_ranked_with_the_search(cfg, monkeypatch):
+  master = {"id": 77, "type": "master", "title": "John Coltrane - Blue Train", "year": "1958", "format": ["Vinyl"]}
+  fake = FakeDiscogs(
+    [_owned(1, "John Coltrane", "Blue Train: The Complete Masters", "2026-01-01T10:00:00-00:00", 2022)],
+    search=[master],
+  )
+  _install(monkeypatch, fake)
+  collection.sync(cfg)
+  fake.requests.clear()
+
+  results = search(cfg, artist="John Coltrane", album="Blue Train", vinyl_only=True, limit=5)
+  assert fake.requests == ["/database/search"]
+  assert [(r.kind, r.id) for r in results] == [("master", 77), ("release", 1)]
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import pytest
+
+from scrobble_cli.config import DEFAULT_ACCOUNT, account_names, for_account, has_session, load_config, valid_account_name
+from scrobble_cli.store import account_db
+
+ENV = {
+  "LASTFM_API_KEY": "key",
+  "LASTFM_API_SECRET": "secret",
+  "LASTFM_SESSION_KEY": "sk-default",
+  "LASTFM_USERNAME": "owner",
+  "LASTFM_ACCOUNT_GUEST_1_SESSION_KEY": "sk-guest",
+  "LASTFM_ACCOUNT_GUEST_1_USERNAME": "guest",
+  "LASTFM_ACCOUNT_STAFF_SESSION_KEY": "sk-staff",
+  "LASTFM_ACCOUNT_GONE_USERNAME": "left-without-a-session",
+}
+
+
+def test_named_accounts_share_the_api_key_and_keep_their_own_session():
+  cfg = load_config(ENV)
+  assert account_names(cfg) == [DEFAULT_ACCOUNT, "guest_1", "staff"]
+  guest = for_account(cfg, "GUEST_1").lastfm
+  assert (guest.api_key, guest.session_key, guest.username) == ("key", "sk-guest", "guest")
+  assert has_session(guest)
+  # Without a username the session can't be used until it is authorized again.
+  assert not has_session(for_account(cfg, "staff").lastfm)
+  assert for_account(cfg, None) is cfg
+
+
+def test_an_unknown_account_is_an_error():
+  with pytest.raises(ValueError, match="scrobble auth lastfm --account nobody"):
+    for_account(load_config(ENV), "nobody")
+
+
+@pytest.mark.parametrize("name, ok", [("staff", True), ("guest_2", True), ("default", False), ("_x", False), ("a-b", False)])
+def test_account_names(name, ok):
+  assert valid_account_name(name) is ok
+
+
+def test_each_account_gets_its_own_stores():
+  assert account_db("outbox.sqlite3", None) == "outbox.sqlite3"
+  assert account_db("outbox.sqlite3", DEFAULT_ACCOUNT) == "outbox.sqlite3"
+  assert account_db("history.sqlite3", "Staff") == "history-staff.sqlite3"
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import pytest
+
+from scrobble_cli import daemon, discogs, trace
+from scrobble_cli.config import load_config
+from scrobble_cli.daemon import RemoteBackend, attach, connect, socket_path
+from scrobble_cli.discogs import DiscogsRelease, DiscogsTrack
+
+FETCH_SECONDS = 0.3
+
+
+class FakeFetch:
+  """Stands in for `discogs.fetch_release`: slow, and records the token each request ran with."""
+
+  def __init__(self):
+    self.calls: list[tuple[str, str, int]] = []
+    self._lock = threading.Lock()
+
+  def __call__(self, cfg, *, kind, id):
+    with self._lock:
+      self.calls.append((cfg.discogs.token, kind, id))
+    time.sleep(FETCH_SECONDS)
+    track = DiscogsTrack(position="A1", title="Track", duration_seconds=200)
+    return DiscogsRelease(id=id, kind=kind, artist="Artist", album=f"Album {id}", year=None, tracks=[track])
+
+
+@pytest.fixture
+def fetch(monkeypatch):
+  fake = FakeFetch()
+  monkeypatch.setattr(discogs, "fetch_release", fake)
+  return fake
+
+
+@pytest.fixture
+def serve(config_home, monkeypatch):
+  """Starts a daemon server (without `serve`'s signal handling, which needs the main thread)."""
+  monkeypatch.delenv("SCROBBLE_DAEMON")
+  config_home.mkdir(parents=True, exist_ok=True)
+  servers = []
+
+  def start(workers: int = 4) -> daemon._Server:
+    srv = daemon._Server(str(socket_path()), workers)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    servers.append(srv)
+    return srv
+
+  yield start
+  for srv in servers:
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def server(serve):
+  return serve()
+
+
+def _cfg(token: str):
+  cfg = load_config()
+  return replace(cfg, discogs=replace(cfg.discogs, token=token))
+
+
+def test_identical_concurrent_requests_are_merged(server, fetch):
+  clients = [connect(_cfg("token")) for _ in range(4)]
+  with ThreadPoolExecutor(max_workers=4) as pool:
+    releases = list(pool.map(lambda c: RemoteBackend(c).fetch_release(kind="release", id=1), clients))
+  assert fetch.calls == [("token", "release", 1)]
+  assert {r.album for r in releases} == {"Album 1"}
+
+  # Answered from the daemon's memo from now on.
+  assert RemoteBackend(clients[0]).fetch_release(kind="release", id=1) == releases[0]
+  assert len(fetch.calls) == 1
+  for c in clients:
+    c.close()
+
+
+def test_requests_run_with_their_clients_config(server, fetch):
+  one, other = connect(_cfg("one")), connect(_cfg("other"))
+  RemoteBackend(one).fetch_release(kind="release", id=1)
+  RemoteBackend(other).fetch_release(kind="release", id=1)
+  assert fetch.calls == [("one", "release", 1), ("other", "release", 1)]
+  one.close()
+  other.close()
+
+
+def test_one_connection_pipelines_its_calls(server, fetch):
+  client = connect(_cfg("token"))
+  remote = RemoteBackend(client)
+  started = time.monotonic()
+  with ThreadPoolExecutor(max_workers=3) as pool:
+    albums = list(pool.map(lambda id: remote.fetch_release(kind="master", id=id).album, (1, 2, 3)))
+  assert albums == ["Album 1", "Album 2", "Album 3"]
+  assert time.monotonic() - started < 2 * FETCH_SECONDS
+  client.close()
+
+
+def test_idle_connection_holds_no_worker(serve, fetch):
+  serve(workers=1)
+  idle, busy = connect(_cfg("token")), connect(_cfg("token"))
+  assert RemoteBackend(busy).fetch_release(kind="release", id=7).id == 7
+  idle.close()
+  busy.close()
+
+
+def test_errors_reach_every_merged_caller_and_are_not_remembered(server, monkeypatch):
+  calls = []
+
+  def failing(cfg, *, kind, id):
+    calls.append(id)
+    time.sleep(FETCH_SECONDS)
+    raise RuntimeError("Discogs said no")
+
+  monkeypatch.setattr(discogs, "fetch_release", failing)
+  clients = [connect(_cfg("token")) for _ in range(3)]
+
+  def call(c):
+    with pytest.raises(RuntimeError, match="Discogs said no"):
+      RemoteBackend(c).fetch_release(kind="release", id=9)
+
+  with ThreadPoolExecutor(max_workers=3) as pool:
+    list(pool.map(call, clients))
+  assert calls == [9]
+  call(clients[0])
+  assert calls == [9, 9]
+  for c in clients:
+    c.close()
+
+
+def test_plan_times_the_fetched_release_in_the_daemon(server, fetch):
+  client = connect(_cfg("token"))
+  release, tracks = RemoteBackend(client).plan(kind="master", id=4, mode="ended", at=1_000)
+  assert release.album == "Album 4"
+  assert [(t.title, t.timestamp_unix) for t in tracks] == [("Track", 800)]
+  assert fetch.calls == [("token", "master", 4)]
+  client.close()
+
+
+def test_attach_resolves_the_config_from_the_clients_environment(server, fetch, monkeypatch):
+  monkeypatch.setenv("DISCOGS_TOKEN", "from-env")
+  cfg, remote = attach()
+  assert cfg.discogs.token == "from-env"
+  remote.fetch_release(kind="release", id=1)
+  assert fetch.calls == [("from-env", "release", 1)]
+  remote.client.close()
+
+
+def test_daemon_spans_come_back_to_a_tracing_client(server, monkeypatch):
+  def http():
+    with trace.span("fake.http"):
+      pass
+
+  def traced_fetch(cfg, *, kind, id):
+    with trace.span("fake.fetch"):
+      # Spans from the request's own pool threads are collected too.
+      with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(trace.bind(http)).result()
+    track = DiscogsTrack(position="A1", title="Track", duration_seconds=200)
+    return DiscogsRelease(id=id, kind=kind, artist="Artist", album="Album", year=None, tracks=[track])
+
+  merged = []
+  monkeypatch.setattr(discogs, "fetch_release", traced_fetch)
+  monkeypatch.setattr(trace, "_tracer", trace.Tracer())
+  monkeypatch.setattr(trace, "merge", lambda spans, origin: merged.extend(spans))
+  client = connect(_cfg("token"))
+  RemoteBackend(client).fetch_release(kind="release", id=1)
+  assert sorted(s["name"] for s in merged) == ["fake.fetch", "fake.http"]
+  assert all(s["start"] >= 0 for s in merged)
+  client.close()
+
+
+def test_the_client_side_doesnt_load_the_api_modules():
+  code = "import sys, scrobble_cli.daemon; print(sorted(m for m in ('scrobble_cli.discogs', 'scrobble_cli.lastfm') if m in sys.modules))"
+  out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+  assert out.strip() == "[]"
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import replace
+
+import pytest
+
+from scrobble_cli import discogs
+from scrobble_cli.config import load_config
+from scrobble_cli.discogs import SEARCH_MAX_PAGES, lookup_identifier, search_query
+
+
+def _item(id: int, title: str, kind: str, year: int = 1970) -> dict:
+  return {"id": id, "type": kind, "title": title, "year": str(year), "format": ["Vinyl", "LP"], "label": ["X"]}
+
+
+class FakeSearch:
+  """Stands in for `discogs._get` on /database/search: `pages[kind]` is a list of result pages."""
+
+  def __init__(self, pages: dict[str, list[list[dict]]], delay: dict[str, float] | None = None):
+    self.pages = pages
+    self.delay = delay or {}
+    self.requests: list[tuple[str, int]] = []
+    self._lock = threading.Lock()
+
+  def __call__(self, cfg, path, params=None):
+    assert path == "/database/search"
+    kind, page = params["type"], int(params.get("page", 1))
+    with self._lock:
+      self.requests.append((kind, page))
+    time.sleep(self.delay.get(kind, 0.0))
+    pages = self.pages.get(kind) or []
+    results = pages[page - 1] if page <= len(pages) else []
+    return {"results": results, "pagination": {"page": page, "pages": max(1, len(pages))}}
+
+
+def _filler(page: int, kind: str) -> list[dict]:
+  return [_item(page * 10 + i, f"Someone Else - Other Record {page}{i}", kind) for i in range(5)]
+
+
+@pytest.fixture
+def cfg():
+  cfg = load_config()
+  return replace(cfg, discogs=replace(cfg.discogs, token="token", collection=False, offline_index=False))
+
+
+def _search(cfg, query: str, **kwargs):
+  return search_query(cfg, query=query, vinyl_only=False, limit=5, **kwargs)
+
+
+def test_a_confident_first_page_stops_pagination(cfg, monkeypatch):
+  first = _filler(1, "master")
+  first[2] = _item(999, "John Coltrane - A Love Supreme", "master", 1965)
+  fake = FakeSearch({"master": [first] + [_filler(p, "master") for p in range(2, 6)]})
+  monkeypatch.setattr(discogs, "_get", fake)
+  results = _search(cfg, "john coltrane a love supreme", until_confident=True)
+  assert fake.requests == [("master", 1)]
+  assert results[2].id == 999
+
+
+def test_a_confident_release_page_stops_the_fallback(cfg, monkeypatch):
+  first = _filler(1, "release")
+  first[0] = _item(999, "John Coltrane - A Love Supreme", "release", 1965)
+  fake = FakeSearch({"release": [first] + [_filler(p, "release") for p in range(2, 6)]})
+  monkeypatch.setattr(discogs, "_get", fake)
+  _search(cfg, "john coltrane a love supreme", until_confident=True)
+  assert fake.requests == [("master", 1), ("release", 1)]
+
+
+def test_pages_are_read_until_confident_and_ranked(cfg, monkeypatch):
+  pages = [_filler(p, "master") for p in range(1, 6)]
+  pages[2][4] = _item(999, "John Coltrane - A Love Supreme", "master", 1965)
+  fake = FakeSearch({"master": pages})
+  monkeypatch.setattr(discogs, "_get", fake)
+  results = _search(cfg, "john coltrane a love supreme", until_confident=True)
+  assert fake.requests == [("master", 1), ("master", 2), ("master", 3)]
+  assert len(results) == 5 and results[0].id == 999
+
+
+def test_pagination_is_capped(cfg, monkeypatch):
+  fake = FakeSearch({"master": [_filler(p, "master") for p in range(1, 10)]})
+  monkeypatch.setattr(discogs, "_get", fake)
+  _search(cfg, "john coltrane a love supreme", until_confident=True)
+  assert fake.requests == [("master", p) for p in range(1, SEARCH_MAX_PAGES + 1)]
+
+
+def test_without_until_confident_only_the_first_page_is_read(cfg, monkeypatch):
+  fake = FakeSearch({"master": [_filler(p, "master") for p in range(1, 10)]})
+  monkeypatch.setattr(discogs, "_get", fake)
+  assert [r.id for r in _search(cfg, "john coltrane a love supreme")] == [10, 11, 12, 13, 14]
+  assert fake.requests == [("master", 1)]
+
+
+def test_speculation_spends_nothing_when_masters_answer_quickly(cfg, monkeypatch):
+  fake = FakeSearch({"master": [_filler(1, "master")]})
+  monkeypatch.setattr(discogs, "_get", fake)
+  _search(cfg, "someone else", speculative=True)
+  time.sleep(discogs.SPECULATION_DELAY_SECONDS + 0.1)
+  assert fake.requests == [("master", 1)]
+
+
+def test_speculation_overlaps_a_slow_master_miss(cfg, monkeypatch):
+  fake = FakeSearch({"release": [_filler(1, "release")]}, delay={"master": 0.6, "release": 0.6})
+  monkeypatch.setattr(discogs, "_get", fake)
+  started = time.monotonic()
+  results = _search(cfg, "someone else", speculative=True)
+  elapsed = time.monotonic() - started
+  assert [r.kind for r in results] == ["release"] * 5
+  assert sorted(fake.requests) == [("master", 1), ("release", 1)]
+  # Sequential would take 1.2s: the release query went out SPECULATION_DELAY_SECONDS in.
+  assert elapsed < 0.6 + discogs.SPECULATION_DELAY_SECONDS + 0.3
+
+
+def test_a_barcode_without_digits_falls_back_to_the_catalog_number(cfg, monkeypatch):
+  requests = []
+
+  def get(cfg, path, params=None):
+    requests.append(dict(params))
+    item = _item(7, "Miles Davis - Kind Of Blue", "release", 1959)
+    return {"results": [{**item, "catno": "CL 1355"}], "pagination": {"pages": 1}}
+
+  monkeypatch.setattr(discogs, "_get", get)
+  match, _ = lookup_identifier(cfg, barcode="n/a", catno="cl-1355", vinyl_only=True, limit=5)
+  assert match.id == 7
+  assert "barcode" not in requests[0] and requests[0]["catno"] == "cl-1355"
+  # The match was remembered under the catalog number.
+  assert lookup_identifier(cfg, barcode="", catno="CL 1355", vinyl_only=True, limit=5)[0].id == 7
+  assert len(requests) == 1
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import replace
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+from scrobble_cli import transport
+from scrobble_cli.config import load_config
+from scrobble_cli.discogs import ENRICH_DEADLINE_SECONDS, DiscogsRelease, DiscogsTrack, enrich_durations
+from scrobble_cli.ratelimit import discogs_bucket
+
+
+def _tracklist(*durations: str) -> list[dict]:
+  return [
+    {"position": f"A{i + 1}", "title": f"Track {i + 1}", "duration": d, "type_": "track"} for i, d in enumerate(durations)
+  ]
+
+
+class Response:
+  def __init__(self, body: dict):
+    self.status_code = 200
+    self.headers: dict[str, str] = {}
+    self._body = body
+    self.content = b"{}"
+
+  def json(self) -> dict:
+    return self._body
+
+  def raise_for_status(self) -> None:
+    pass
+
+
+class FakeSession:
+  """Stands in for the Discogs session: `bodies` by path, each answered after `delay` seconds."""
+
+  def __init__(self, bodies: dict[str, dict], delay: float = 0.0, on_request=None):
+    self.bodies = bodies
+    self.delay = delay
+    self.on_request = on_request
+    self.paths: list[str] = []
+    self._lock = threading.Lock()
+
+  def request(self, method, url, *, headers=None, params=None, data=None, timeout=None):
+    path = urlsplit(url).path
+    with self._lock:
+      self.paths.append(path)
+    if self.on_request is not None:
+      self.on_request(path)
+    if self.delay:
+      time.sleep(min(self.delay, timeout[1]))
+      if self.delay > timeout[1]:
+        raise requests.Timeout("read timed out")
+    return Response(self.bodies[path])
+
+
+MASTER = {"id": 10, "title": "Album", "main_release": 100, "tracklist": _tracklist("", "")}
+VERSIONS = {"versions": [{"id": 101}, {"id": 102}]}
+PRESSINGS = {
+  "/releases/100": {"id": 100, "master_id": 10, "tracklist": _tracklist("3:00", "4:00")},
+  "/releases/101": {"id": 101, "master_id": 10, "tracklist": _tracklist("3:02", "4:00")},
+  "/releases/102": {"id": 102, "master_id": 10, "tracklist": _tracklist("", "4:10")},
+  "/releases/200": {"id": 200, "master_id": 10, "tracklist": _tracklist("", "")},
+}
+BODIES = {"/masters/10": MASTER, "/masters/10/versions": VERSIONS, **PRESSINGS}
+
+
+@pytest.fixture
+def cfg():
+  cfg = load_config()
+  discogs_cfg = replace(cfg.discogs, token="token", api_url="http://discogs.test", collection=False, offline_index=False)
+  return replace(cfg, discogs=discogs_cfg, cache=replace(cfg.cache, enabled=False))
+
+
+def _release(kind: str, id: int) -> DiscogsRelease:
+  tracks = [DiscogsTrack(position=f"A{i}", title=f"Track {i}", duration_seconds=None) for i in (1, 2)]
+  return DiscogsRelease(id=id, kind=kind, artist="Artist", album="Album", year=None, tracks=tracks)
+
+
+def _serve(monkeypatch, session: FakeSession) -> FakeSession:
+  monkeypatch.setattr(transport, "session_for", lambda url: session)
+  return session
+
+
+def test_master_durations_come_from_the_main_release_and_versions(cfg, monkeypatch):
+  session = _serve(monkeypatch, FakeSession(BODIES))
+  enriched = enrich_durations(cfg, _release("master", 10))
+  assert [t.duration_seconds for t in enriched.tracks] == [181, 240]
+  assert "/releases/100" in session.paths
+
+
+def test_a_release_also_gets_its_masters_main_release(cfg, monkeypatch):
+  session = _serve(monkeypatch, FakeSession(BODIES))
+  enriched = enrich_durations(cfg, _release("release", 200))
+  assert {"/masters/10", "/releases/100"} <= set(session.paths)
+  assert [t.duration_seconds for t in enriched.tracks] == [181, 240]
+
+
+def test_a_slow_server_is_cut_off_at_the_deadline(cfg, monkeypatch):
+  _serve(monkeypatch, FakeSession(BODIES, delay=3.0))
+  started = time.monotonic()
+  enriched = enrich_durations(cfg, _release("master", 10))
+  assert time.monotonic() - started < ENRICH_DEADLINE_SECONDS + 0.3
+  assert [t.duration_seconds for t in enriched.tracks] == [None, None]
+
+
+def test_waiting_for_rate_limit_tokens_doesnt_outlive_the_deadline(cfg, monkeypatch):
+  bucket = discogs_bucket(cfg.discogs.requests_per_minute)
+
+  def drain_after_the_master(path: str) -> None:
+    # Another process spends the whole budget while we look at the master.
+    if path == "/masters/10":
+      bucket.drain()
+
+  _serve(monkeypatch, FakeSession(BODIES, on_request=drain_after_the_master))
+  started = time.monotonic()
+  enrich_durations(cfg, _release("master", 10))
+  assert time.monotonic() - started < ENRICH_DEADLINE_SECONDS + 0.3
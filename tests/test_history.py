@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from scrobble_cli.history import OVERLAP_GRACE_SECONDS, REPLAY_WINDOW_SECONDS, get_history
+from scrobble_cli.lastfm import ScrobbleTrack
+
+T0 = 1_800_000_000
+
+
+def _album(album: str, start: int, *durations: int, release: str | None = None) -> list[ScrobbleTrack]:
+  tracks, at = [], start
+  for i, d in enumerate(durations, start=1):
+    tracks.append(
+      ScrobbleTrack(
+        artist="Artist",
+        title=f"{album} {i}",
+        album=album,
+        album_artist="Artist",
+        timestamp_unix=at,
+        duration_seconds=d,
+        discogs_release=release,
+      )
+    )
+    at += d
+  return tracks
+
+
+def test_a_play_overlapping_the_planned_one_is_caught():
+  history = get_history()
+  history.record(_album("Earlier", T0, 600, 600))
+  dup = history.check(_album("Other", T0 + 900, 300))
+  assert [e.track.title for e in dup.overlapping] == ["Earlier 2"]
+  assert not dup.replays
+
+
+def test_back_to_back_albums_within_the_grace_dont_count():
+  history = get_history()
+  history.record(_album("Earlier", T0, 600))
+  assert not history.check(_album("Next", T0 + 600 - OVERLAP_GRACE_SECONDS + 1, 300))
+
+
+def test_the_same_album_later_that_day_is_a_replay():
+  history = get_history()
+  history.record(_album("Album", T0, 300, 300, release="release/1"))
+  dup = history.check(_album("Album", T0 + 3600, 300, 300))
+  assert not dup.overlapping
+  assert [e.track.title for e in dup.replays] == ["Album 1", "Album 2"]
+  # The same Discogs release under another title (e.g. an edited album name) is a replay too.
+  assert history.check(_album("Album (Remastered)", T0 + 3600, 300, release="release/1")).replays
+  assert not history.check(_album("Album", T0 + REPLAY_WINDOW_SECONDS + 1000, 300))
+
+
+def test_recording_twice_keeps_one_row_and_recorded_finds_it():
+  history = get_history()
+  tracks = _album("Album", T0, 300, 300)
+  history.record(tracks)
+  history.record(tracks)
+  assert history.count() == 2
+  assert history.recorded(tracks + _album("Other", T0 + 5000, 300)) == {("Artist", t.title, t.timestamp_unix) for t in tracks}
+  assert [e.track.title for e in history.between(T0, T0 + 300, limit=10)] == ["Album 1"]
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import csv
+import time
+from dataclasses import replace
+
+import pytest
+
+from scrobble_cli import importer
+from scrobble_cli.config import load_config
+from scrobble_cli.history import get_history
+from scrobble_cli.importer import DAILY_LIMIT_CODE, load_checkpoint, run_import
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, ScrobbleTrack
+
+
+START = int(time.time()) - 6 * 60 * 60
+
+
+def _write(path, n: int, *, skip_rows: tuple[int, ...] = (), album: str = "Album") -> None:
+  """`n` plays from the last few hours; the rows in `skip_rows` are too short to scrobble."""
+  with path.open("w", newline="") as f:
+    w = csv.writer(f)
+    w.writerow(["artist", "track", "album", "timestamp", "duration"])
+    for row in range(1, n + 1):
+      w.writerow(["Artist", f"Track {row}", album, START + 60 * row, 10 if row in skip_rows else 200])
+
+
+def _answer(batch: list[ScrobbleTrack], *, limit_from: int | None = None) -> dict:
+  def code(i: int) -> str:
+    return DAILY_LIMIT_CODE if limit_from is not None and i >= limit_from else "0"
+
+  return {
+    "scrobbles": {
+      "scrobble": [
+        {"timestamp": str(t.timestamp_unix), "track": {"#text": t.title}, "ignoredMessage": {"code": code(i)}}
+        for i, t in enumerate(batch)
+      ]
+    }
+  }
+
+
+class FakeSubmit:
+  """Stands in for `lastfm.submit_batch`: batch `fail_at` raises, or hits the daily limit at `limit_at`."""
+
+  def __init__(self, fail_at: int | None = None, *, limit_at: tuple[int, int] | None = None):
+    self.fail_at = fail_at
+    self.limit_at = limit_at
+    self.batches: list[list[str]] = []
+
+  def __call__(self, cfg, batch, pacer):
+    i = len(self.batches)
+    self.batches.append([t.title for t in batch])
+    if i == self.fail_at:
+      raise ConnectionError("Last.fm is down")
+    if self.limit_at is not None and i == self.limit_at[0]:
+      return _answer(batch, limit_from=self.limit_at[1])
+    return _answer(batch)
+
+  @property
+  def sent(self) -> list[str]:
+    return [title for batch in self.batches for title in batch]
+
+
+@pytest.fixture
+def cfg():
+  cfg = load_config()
+  lastfm = replace(cfg.lastfm, api_key="key", api_secret="secret", session_key="session", max_in_flight=1)
+  return replace(cfg, lastfm=lastfm)
+
+
+def _titles(rows) -> list[str]:
+  return [f"Track {row}" for row in rows]
+
+
+def test_rerun_resumes_after_the_last_acknowledged_batch(cfg, tmp_path, monkeypatch):
+  path = tmp_path / "plays.csv"
+  _write(path, 120)
+
+  first = FakeSubmit(fail_at=1)
+  monkeypatch.setattr(importer, "submit_batch", first)
+  progress = run_import(cfg, path)
+  assert progress.error == "Last.fm is down"
+  assert (progress.row, progress.accepted) == (SCROBBLE_BATCH_SIZE, SCROBBLE_BATCH_SIZE)
+  assert load_checkpoint(path, "default").row == SCROBBLE_BATCH_SIZE
+
+  second = FakeSubmit()
+  monkeypatch.setattr(importer, "submit_batch", second)
+  progress = run_import(cfg, path)
+  assert second.sent == _titles(range(51, 121))
+  assert progress.error is None
+  assert (progress.resumed_from, progress.row, progress.accepted) == (50, 120, 120)
+  assert get_history().count() == 120
+
+
+def test_daily_limit_checkpoints_before_the_first_refused_play(cfg, tmp_path, monkeypatch):
+  path = tmp_path / "plays.csv"
+  _write(path, 80, skip_rows=(3, 30))
+
+  monkeypatch.setattr(importer, "submit_batch", FakeSubmit(limit_at=(0, 20)))
+  progress = run_import(cfg, path)
+  assert progress.error == "Last.fm's daily scrobble limit was reached"
+  # The first batch held rows 1-52 minus the two skipped ones; its 21st track is row 22.
+  assert (progress.row, progress.accepted) == (21, 20)
+
+  resumed = FakeSubmit()
+  monkeypatch.setattr(importer, "submit_batch", resumed)
+  progress = run_import(cfg, path)
+  assert resumed.sent == [t for t in _titles(range(22, 81)) if t != "Track 30"]
+  assert (progress.row, progress.accepted, progress.skipped) == (80, 78, 2)
+
+
+def test_grown_file_continues_and_changed_file_starts_over(cfg, tmp_path, monkeypatch):
+  path = tmp_path / "plays.csv"
+  _write(path, 30)
+  monkeypatch.setattr(importer, "submit_batch", FakeSubmit())
+  run_import(cfg, path)
+
+  # Appending rows keeps the first bytes, so only the new rows go out.
+  with path.open("a", newline="") as f:
+    csv.writer(f).writerow(["Artist", "Track 31", "Album", START + 60 * 31, 200])
+  grown = FakeSubmit()
+  monkeypatch.setattr(importer, "submit_batch", grown)
+  assert run_import(cfg, path).row == 31
+  assert grown.sent == ["Track 31"]
+
+  # A rewritten file doesn't match the checkpoint; its plays are already in the history, though.
+  _write(path, 30, album="Album (Remastered)")
+  rewritten = FakeSubmit()
+  monkeypatch.setattr(importer, "submit_batch", rewritten)
+  progress = run_import(cfg, path)
+  assert progress.resumed_from == 0
+  assert rewritten.sent == []
+  assert progress.duplicates == 30
+
+
+def test_restart_ignores_the_checkpoint(cfg, tmp_path, monkeypatch):
+  path = tmp_path / "plays.csv"
+  _write(path, 10)
+  monkeypatch.setattr(importer, "submit_batch", FakeSubmit())
+  run_import(cfg, path)
+
+  progress = run_import(cfg, path, restart=True)
+  assert progress.resumed_from == 0
+  assert (progress.read, progress.duplicates) == (10, 10)
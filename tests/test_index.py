@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+
+from scrobble_cli import index
+
+RELEASES = """<releases>
+<release id="100" status="Accepted">
+  <artists><artist><id>1</id><name>John Coltrane (2)</name></artist></artists>
+  <title>A Love Supreme</title>
+  <labels><label name="Impulse!" catno="A-77" id="5"/></labels>
+  <formats><format name="Vinyl" qty="1"><descriptions><description>LP</description><description>Album</description></descriptions></format></formats>
+  <country>US</country>
+  <released>1965-02-00</released>
+  <master_id is_main_release="true">10</master_id>
+  <tracklist>
+    <track><position></position><title>Side One</title><duration></duration></track>
+    <track><position>A</position><title>Part I - Acknowledgement</title><duration>7:47</duration></track>
+    <track><position>B</position><title>Part II - Resolution</title><duration>7:25</duration></track>
+  </tracklist>
+</release>
+<release id="200" status="Accepted">
+  <artists><artist><id>2</id><name>Miles Davis</name></artist></artists>
+  <title>Kind Of Blue</title>
+  <labels><label name="Columbia" catno="CL 1355" id="6"/></labels>
+  <formats><format name="CD" qty="1"></format></formats>
+  <released>1997</released>
+  <tracklist><track><position>1</position><title>So What</title><duration>9:22</duration></track></tracklist>
+</release>
+</releases>
+"""
+
+MASTERS = """<masters>
+<master id="10">
+  <main_release>100</main_release>
+  <artists><artist><id>1</id><name>John Coltrane (2)</name></artist></artists>
+  <title>A Love Supreme</title>
+  <year>1965</year>
+</master>
+</masters>
+"""
+
+
+@pytest.fixture
+def dumps(tmp_path, monkeypatch):
+  monkeypatch.setattr(index, "_conn", None)
+  releases = tmp_path / "discogs_releases.xml.gz"
+  releases.write_bytes(gzip.compress(RELEASES.encode()))
+  masters = tmp_path / "discogs_masters.xml"
+  masters.write_text(MASTERS, encoding="utf-8")
+  return [releases, masters]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_dumps_are_indexed_and_masters_borrow_from_their_main_release(dumps, workers):
+  stats = index.build(dumps, workers=workers, chunk_bytes=256)
+  assert [s.records for s in stats] == [2, 1]
+  assert index.stats() == {"master": 1, "release": 2}
+
+  [master] = index.search("coltrane love supreme", vinyl_only=True, limit=5)
+  assert (master.kind, master.id, master.title, master.label, master.catno) == (
+    "master",
+    10,
+    "John Coltrane - A Love Supreme",
+    "Impulse!",
+    "A-77",
+  )
+  release = index.fetch_release(kind="master", id=10)
+  assert [(t.position, t.duration_seconds) for t in release.tracks] == [("A", 467), ("B", 445)]
+  assert (release.artist, release.year) == ("John Coltrane", 1965)
+
+
+def test_vinyl_only_skips_other_formats_and_falls_back_to_releases(dumps):
+  index.build(dumps, workers=1)
+  assert index.search("kind of blue", vinyl_only=True, limit=5) == []
+  [hit] = index.search("miles davis kind of blue", vinyl_only=False, limit=5)
+  assert (hit.kind, hit.id, hit.year) == ("release", 200, 1997)
+
+
+def test_nothing_is_answered_before_an_index_is_built(monkeypatch):
+  monkeypatch.setattr(index, "_conn", None)
+  assert index.search("anything", vinyl_only=False, limit=5) == []
+  assert index.fetch_release(kind="release", id=1) is None
+  assert not index.exists()
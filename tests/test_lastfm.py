@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import replace
+
+import pytest
+import requests
+
+from scrobble_cli import lastfm, transport
+from scrobble_cli.config import load_config
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, ScrobbleTrack, scrobble_album
+
+
+class Response:
+  def __init__(self, status_code: int, body: dict | None):
+    self.status_code = status_code
+    self._body = body
+
+  def json(self) -> dict:
+    if self._body is None:
+      raise ValueError("no JSON")
+    return self._body
+
+  def raise_for_status(self) -> None:
+    if self.status_code >= 400:
+      raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+
+def _tracks(n: int) -> list[ScrobbleTrack]:
+  return [
+    ScrobbleTrack(artist="Artist", title=f"Track {i}", album="Album", album_artist="Artist", timestamp_unix=1_700_000_000 + 300 * i)
+    for i in range(n)
+  ]
+
+
+def _accepted(n: int) -> dict:
+  return {"scrobbles": {"@attr": {"accepted": n, "ignored": 0}, "scrobble": []}}
+
+
+@pytest.fixture
+def cfg(monkeypatch):
+  monkeypatch.setattr(lastfm.Pacer, "wait", lambda self: None)
+  cfg = load_config()
+  return replace(cfg, lastfm=replace(cfg.lastfm, api_key="key", api_secret="secret", session_key="sk", max_in_flight=1))
+
+
+def test_an_error_payload_sent_with_a_4xx_is_retried(cfg, monkeypatch):
+  answers = [Response(429, {"error": 29, "message": "Rate limit exceeded"}), Response(200, _accepted(3))]
+  monkeypatch.setattr(transport, "request", lambda *a, **kw: answers.pop(0))
+  res = scrobble_album(cfg, _tracks(3))
+  assert res["batches"] == [_accepted(3)]
+  assert answers == []
+
+
+def test_a_failed_response_without_an_error_payload_raises(cfg, monkeypatch):
+  monkeypatch.setattr(transport, "request", lambda *a, **kw: Response(502, None))
+  with pytest.raises(requests.HTTPError):
+    scrobble_album(cfg, _tracks(3))
+
+
+def test_the_next_batch_is_signed_while_one_is_sent(cfg, monkeypatch):
+  events: list[tuple[str, int, float, str]] = []
+  lock = threading.Lock()
+  sign = lastfm._scrobble_params
+
+  def signing(cfg, batch):
+    with lock:
+      events.append(("sign", batch[0].timestamp_unix, time.monotonic(), threading.current_thread().name))
+    return sign(cfg, batch)
+
+  def request(method, url, http, *, data, **kw):
+    with lock:
+      events.append(("post", int(data["timestamp[0]"]), time.monotonic(), ""))
+    time.sleep(0.05)
+    with lock:
+      events.append(("posted", int(data["timestamp[0]"]), time.monotonic(), ""))
+    return Response(200, _accepted(SCROBBLE_BATCH_SIZE))
+
+  monkeypatch.setattr(lastfm, "_scrobble_params", signing)
+  monkeypatch.setattr(transport, "request", request)
+  tracks = _tracks(3 * SCROBBLE_BATCH_SIZE)
+  scrobble_album(cfg, tracks)
+
+  firsts = [tracks[i].timestamp_unix for i in range(0, len(tracks), SCROBBLE_BATCH_SIZE)]
+  at = {(kind, ts): when for kind, ts, when, _ in events}
+  assert all(name.startswith("lastfm-sign") for kind, _, _, name in events if kind == "sign")
+  # Sends never overlap, and batch i+1 was signed before batch i was answered.
+  for prev, nxt in zip(firsts, firsts[1:]):
+    assert at[("posted", prev)] <= at[("post", nxt)]
+    assert at[("sign", nxt)] < at[("posted", prev)]
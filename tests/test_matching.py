@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+from scrobble_cli import matching
+from scrobble_cli.discogs import DiscogsSearchResult
+from scrobble_cli.matching import AUTO_PICK_CONFIDENCE, RunningBest, auto_pick, rank
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+import matching as benchmark  # noqa: E402
+
+
+def _result(i: int, title: str, kind: str = "release", year: int | None = 1965, fmt: str = "Vinyl, LP, Album"):
+  return DiscogsSearchResult(id=i, kind=kind, title=title, year=year, country=None, label=None, catno=None, format=fmt)
+
+
+@pytest.mark.parametrize("kind", ["master", "release"])
+def test_exact_match_auto_picks_whatever_its_kind(kind):
+  results = [_result(1, "John Coltrane - A Love Supreme", kind)]
+  assert rank(results, query="john coltrane a love supreme", vinyl_only=True)[0].confidence >= AUTO_PICK_CONFIDENCE
+  assert auto_pick(results, query="john coltrane a love supreme", vinyl_only=True) is results[0]
+
+
+def test_pressings_of_a_release_only_list_share_the_album():
+  results = [
+    _result(1, "Nick Drake - Pink Moon", year=1972),
+    _result(2, "Nick Drake - Pink Moon", year=2013, fmt="Vinyl, LP, Album, Reissue"),
+    _result(3, "Nick Drake - Bryter Layter", year=1971),
+  ]
+  assert auto_pick(results, query="x", artist="Nick Drake", album="Pink Moon", vinyl_only=True).id == 1
+
+
+def test_release_only_list_of_other_albums_goes_to_the_picker():
+  results = [_result(1, "Beach House - Depression Cherry", year=2015), _result(2, "Beach House - Teen Dream", year=2010)]
+  assert auto_pick(results, query="beach house bloom", vinyl_only=True) is None
+
+
+def test_no_wrong_auto_picks_on_the_labelled_cases():
+  acc = benchmark.accuracy(benchmark.load_cases(benchmark.CASES), verbose=False)
+  assert acc["wrong_auto_picks"] == 0
+  assert acc["top1_accuracy"] == 1.0
+
+
+def test_running_best_agrees_with_rank():
+  for case in benchmark.load_cases(benchmark.CASES):
+    kwargs = dict(query=case["query"], artist=case.get("artist"), album=case.get("album"), vinyl_only=True)
+    running = RunningBest(**kwargs)
+    for r in case["results"]:
+      running.add(r)
+    expected = rank(case["results"], **kwargs)[0]
+    assert running.best().result is expected.result
+    assert running.best().confidence == pytest.approx(expected.confidence)
+
+
+def test_confidence_functions_are_deprecated_wrappers():
+  with pytest.warns(DeprecationWarning):
+    c = matching.discogs_query_confidence(query="radiohead ok computer", discogs_title="Radiohead - OK Computer")
+  assert c >= AUTO_PICK_CONFIDENCE
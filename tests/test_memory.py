@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from scrobble_cli import memory
+from scrobble_cli.memory import ResolutionMemory
+
+
+class Clock:
+  """Moves a second forward on every read, so "least recently used" never ties."""
+
+  def __init__(self, now: float = 1_800_000_000.0):
+    self.now = now
+
+  def time(self) -> float:
+    self.now += 1
+    return self.now
+
+
+@pytest.fixture
+def mem(monkeypatch) -> ResolutionMemory:
+  monkeypatch.setattr(memory, "time", Clock())
+  mem = ResolutionMemory()
+  mem.remember("John Coltrane - A Love Supreme", vinyl_only=True, kind="master", id=1, title="A Love Supreme")
+  mem.remember("miles davis live evil vol 1", vinyl_only=True, kind="release", id=2, title="Live-Evil Vol. 1")
+  mem.remember("led zeppelin iii", vinyl_only=True, kind="master", id=3, title="Led Zeppelin III")
+  return mem
+
+
+def test_the_same_words_resolve_without_a_search(mem):
+  hit = mem.get("john coltrane love supreme", vinyl_only=True)
+  assert (hit.id, hit.close) == (1, False)
+  hit = mem.get("A Love Supreme, John Coltrane", vinyl_only=True)
+  assert (hit.id, hit.close) == (1, False)
+  assert mem.get("john coltrane a love supreme", vinyl_only=False) is None
+
+
+def test_a_typo_is_only_a_suggestion(mem):
+  hit = mem.get("john coltrane a love suprme", vinyl_only=True)
+  assert (hit.id, hit.close) == (1, True)
+
+
+def test_different_numbers_and_short_words_dont_match(mem):
+  assert mem.get("miles davis live evil vol 2", vinyl_only=True) is None
+  assert mem.get("led zeppelin ii", vinyl_only=True) is None
+  stats = mem.stats()
+  assert (stats.hits, stats.close_hits, stats.misses) == (0, 0, 2)
+
+
+def test_repeat_picks_are_counted_until_the_pick_changes(mem):
+  mem.remember("john coltrane a love supreme", vinyl_only=True, kind="master", id=1, title="A Love Supreme")
+  assert mem.get("john coltrane a love supreme", vinyl_only=True).picks == 2
+  mem.remember("john coltrane a love supreme", vinyl_only=True, kind="release", id=9, title="A Love Supreme")
+  hit = mem.get("john coltrane a love supreme", vinyl_only=True)
+  assert (hit.id, hit.picks) == (9, 1)
+
+
+def test_least_recently_used_entries_are_forgotten(mem, monkeypatch):
+  monkeypatch.setattr(memory, "MAX_ENTRIES", 3)
+  mem.get("john coltrane a love supreme", vinyl_only=True)
+  mem.remember("nina simone pastel blues", vinyl_only=True, kind="master", id=4, title="Pastel Blues")
+  assert mem.stats().entries == 3
+  assert mem.get("miles davis live evil vol 1", vinyl_only=True) is None
+  assert mem.get("john coltrane a love supreme", vinyl_only=True) is not None
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import pytest
+
+from scrobble_cli import metrics, store
+
+
+@pytest.fixture(autouse=True)
+def recording(monkeypatch):
+  monkeypatch.setattr(metrics, "_enabled", True)
+  monkeypatch.setattr(metrics, "_counters", {})
+  monkeypatch.setattr(metrics, "_hists", {})
+
+
+def test_flushes_add_up_in_the_store():
+  metrics.inc("lastfm_tracks_total", 3, result="accepted")
+  metrics.observe("discogs_request_seconds", 0.2, endpoint="search", result="miss")
+  metrics.flush()
+  # What a second process (or a later flush of this one) records is added, not overwritten.
+  metrics.inc("lastfm_tracks_total", 2, result="accepted")
+  metrics.inc("lastfm_tracks_total", 1, result="ignored")
+  metrics.observe("discogs_request_seconds", 0.4, endpoint="search", result="hit")
+  metrics.flush()
+
+  snap = metrics.snapshot()
+  assert snap.since is not None
+  assert snap.counter("lastfm_tracks_total", result="accepted") == 5
+  assert snap.counter("lastfm_tracks_total") == 6
+  h = snap.histogram("discogs_request_seconds", endpoint="search")
+  assert (h.count, round(h.sum, 6)) == (2, 0.6)
+  assert snap.histogram("discogs_request_seconds", result=("hit", "revalidated")).count == 1
+  assert snap.label_values("discogs_request_seconds", "result") == ["hit", "miss"]
+
+
+def test_quantiles_are_read_off_the_buckets_within_their_width():
+  for ms in range(1, 1001):
+    metrics.observe("discogs_request_seconds", ms / 1000.0, endpoint="release", result="miss")
+  h = metrics.snapshot().histogram("discogs_request_seconds")
+  assert h.quantile(0.5) == pytest.approx(0.5, rel=0.25)
+  assert h.quantile(0.99) == pytest.approx(0.99, rel=0.25)
+
+
+def test_a_failing_store_doesnt_raise(monkeypatch):
+  def broken(*args, **kwargs):
+    raise OSError("read-only file system")
+
+  monkeypatch.setattr(store, "open_db", broken)
+  metrics.inc("lastfm_tracks_total", 1, result="accepted")
+  metrics.flush()
+
+
+def test_prometheus_output_is_cumulative_with_escaped_labels():
+  metrics.inc("lastfm_tracks_total", 4, result='odd "one"')
+  metrics.observe("ratelimit_headroom_tokens", 3, buckets=metrics.TOKENS, bucket="discogs")
+  metrics.observe("ratelimit_headroom_tokens", 500, buckets=metrics.TOKENS, bucket="discogs")
+  text = metrics.prometheus_text(metrics.snapshot())
+  lines = text.splitlines()
+
+  assert "# TYPE scrobble_lastfm_tracks_total counter" in lines
+  assert 'scrobble_lastfm_tracks_total{result="odd \\"one\\""} 4' in lines
+  assert lines.count("# TYPE scrobble_ratelimit_headroom_tokens histogram") == 1
+  buckets = [line for line in lines if line.startswith("scrobble_ratelimit_headroom_tokens_bucket")]
+  assert len(buckets) == len(metrics.TOKENS) + 1
+  assert 'scrobble_ratelimit_headroom_tokens_bucket{bucket="discogs",le="2"} 0' in lines
+  assert 'scrobble_ratelimit_headroom_tokens_bucket{bucket="discogs",le="5"} 1' in lines
+  assert 'scrobble_ratelimit_headroom_tokens_bucket{bucket="discogs",le="+Inf"} 2' in lines
+  assert 'scrobble_ratelimit_headroom_tokens_sum{bucket="discogs"} 503' in lines
+  assert 'scrobble_ratelimit_headroom_tokens_count{bucket="discogs"} 2' in lines
+  counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+  assert counts == sorted(counts)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from scrobble_cli import outbox
+from scrobble_cli.config import load_config
+from scrobble_cli.history import get_history
+from scrobble_cli.lastfm import SCROBBLE_BATCH_SIZE, ScrobbleTrack
+from scrobble_cli.outbox import ACCEPTED, PENDING, SENDING, UNKNOWN, get_outbox
+
+
+def _tracks(n: int, start: int = 1_700_000_000) -> list[ScrobbleTrack]:
+  return [
+    ScrobbleTrack(artist="Artist", title=f"Track {i}", album="Album", album_artist="Artist", timestamp_unix=start + 300 * i)
+    for i in range(n)
+  ]
+
+
+def _accepted(batch: list[ScrobbleTrack]) -> dict:
+  return {
+    "scrobbles": {
+      "@attr": {"accepted": len(batch), "ignored": 0},
+      "scrobble": [
+        {"timestamp": str(t.timestamp_unix), "track": {"#text": t.title}, "ignoredMessage": {"code": "0"}} for t in batch
+      ],
+    }
+  }
+
+
+class FakeLastfm:
+  """Stands in for `lastfm.scrobble_album`: answers batches in order, failing from `fail_at` on."""
+
+  def __init__(self, fail_at: int | None = None, *, raises: bool = False):
+    self.fail_at = fail_at
+    self.raises = raises
+    self.sent: list[ScrobbleTrack] = []
+
+  def __call__(self, cfg, tracks, *, on_batch=None):
+    for i, offset in enumerate(range(0, len(tracks), SCROBBLE_BATCH_SIZE)):
+      batch = tracks[offset : offset + SCROBBLE_BATCH_SIZE]
+      if self.fail_at is not None and i >= self.fail_at:
+        if self.raises:
+          raise ConnectionError("Last.fm is down")
+        on_batch(offset, {"error": 16, "message": "Service temporarily unavailable"})
+        return {}
+      self.sent.extend(batch)
+      on_batch(offset, _accepted(batch))
+    return {}
+
+
+@pytest.fixture
+def cfg():
+  return load_config()
+
+
+def test_interrupted_flush_resumes_with_only_unacknowledged_rows(cfg, monkeypatch):
+  box = get_outbox()
+  tracks = _tracks(120)
+  ids = box.enqueue(tracks)
+
+  first = FakeLastfm(fail_at=1, raises=True)
+  monkeypatch.setattr(outbox, "scrobble_album", first)
+  result = box.flush(cfg, ids=ids)
+  assert result.accepted == SCROBBLE_BATCH_SIZE
+  assert result.errors == ["Last.fm is down"]
+  assert result.remaining == 70
+  assert box.count(SENDING) == 0
+
+  # Enqueueing the same plays again (a rerun of the command) doesn't duplicate them.
+  assert box.enqueue(tracks) == ids
+  second = FakeLastfm()
+  monkeypatch.setattr(outbox, "scrobble_album", second)
+  result = box.flush(cfg, ids=ids)
+  assert [t.title for t in second.sent] == [t.title for t in tracks[SCROBBLE_BATCH_SIZE:]]
+  assert result.accepted == 70
+  assert result.remaining == 0
+  assert box.count(ACCEPTED) == 120
+  assert get_history().count() == 120
+
+
+def test_error_response_leaves_the_batch_pending(cfg, monkeypatch):
+  box = get_outbox()
+  box.enqueue(_tracks(60))
+  monkeypatch.setattr(outbox, "scrobble_album", FakeLastfm(fail_at=1))
+  result = box.flush(cfg)
+  assert result.errors == ["Service temporarily unavailable"]
+  assert (box.count(ACCEPTED), box.count(PENDING)) == (50, 10)
+
+
+def test_rows_missing_from_the_answer_are_checked_against_the_history_before_resending(cfg, monkeypatch):
+  box = get_outbox()
+  tracks = _tracks(3)
+  box.enqueue(tracks)
+
+  def answers_only_the_first(cfg, sent, *, on_batch=None):
+    on_batch(0, _accepted(sent[:1]))
+    return {}
+
+  monkeypatch.setattr(outbox, "scrobble_album", answers_only_the_first)
+  result = box.flush(cfg)
+  assert (result.accepted, result.remaining) == (1, 2)
+  assert (box.count(UNKNOWN), box.count(PENDING)) == (2, 0)
+
+  # Another run recorded the second play meanwhile; only the third is sent again.
+  get_history().record([tracks[1]])
+  fake = FakeLastfm()
+  monkeypatch.setattr(outbox, "scrobble_album", fake)
+  result = box.flush(cfg)
+  assert [t.title for t in fake.sent] == ["Track 2"]
+  assert (box.count(ACCEPTED), box.count(UNKNOWN), result.remaining) == (3, 0, 0)
+
+
+def _claim_as(box: outbox.Outbox, pid: int, started: str | None, claimed_at: float) -> None:
+  box._conn.execute(
+    "UPDATE outbox SET status = ?, claim = 'other', claimed_at = ?, claim_pid = ?, claim_started = ?",
+    (SENDING, claimed_at, pid, started),
+  )
+
+
+def _dead_pid() -> int:
+  child = subprocess.Popen([sys.executable, "-c", "pass"])
+  child.wait()
+  return child.pid
+
+
+@pytest.mark.skipif(os.name == "nt", reason="owner liveness isn't checked on Windows")
+def test_rows_claimed_by_a_dead_process_are_resent_right_away(cfg, monkeypatch):
+  box = get_outbox()
+  box.enqueue(_tracks(5))
+  _claim_as(box, _dead_pid(), None, time.time())
+  fake = FakeLastfm()
+  monkeypatch.setattr(outbox, "scrobble_album", fake)
+  result = box.flush(cfg)
+  assert len(fake.sent) == 5
+  assert result.accepted == 5
+
+
+@pytest.mark.skipif(os.name == "nt", reason="owner liveness isn't checked on Windows")
+def test_rows_claimed_by_a_running_process_are_left_alone(cfg, monkeypatch):
+  box = get_outbox()
+  box.enqueue(_tracks(5))
+  parent = os.getppid()
+  _claim_as(box, parent, outbox._process_started(parent), time.time() - 2 * outbox.STALE_CLAIM_SECONDS)
+  fake = FakeLastfm()
+  monkeypatch.setattr(outbox, "scrobble_album", fake)
+  box.flush(cfg)
+  assert fake.sent == []
+  assert box.count(SENDING) == 5
+
+
+def test_claims_without_an_owner_expire_after_the_stale_timeout(cfg, monkeypatch):
+  box = get_outbox()
+  box.enqueue(_tracks(4))
+  box._conn.execute("UPDATE outbox SET status = ?, claim = 'old', claimed_at = ?", (SENDING, time.time()))
+  box._conn.execute("UPDATE outbox SET claimed_at = ? WHERE id <= 2", (time.time() - 2 * outbox.STALE_CLAIM_SECONDS,))
+  fake = FakeLastfm()
+  monkeypatch.setattr(outbox, "scrobble_album", fake)
+  box.flush(cfg)
+  assert [t.title for t in fake.sent] == ["Track 0", "Track 1"]
+
+
+def test_flushing_many_ids_stays_under_the_variable_limit(cfg, monkeypatch):
+  box = get_outbox()
+  ids = box.enqueue(_tracks(3 * outbox.IDS_PER_STATEMENT + 7))
+  fake = FakeLastfm()
+  monkeypatch.setattr(outbox, "scrobble_album", fake)
+  result = box.flush(cfg, ids=ids)
+  assert result.accepted == len(ids)
+
+
+def test_failed_transaction_is_rolled_back(cfg):
+  box = get_outbox()
+  with pytest.raises(RuntimeError):
+    with box._transaction() as conn:
+      conn.execute("UPDATE outbox SET status = 'x'")
+      raise RuntimeError("boom")
+  # The shared connection is usable again (no transaction left open).
+  assert box.enqueue(_tracks(1)) == [1]
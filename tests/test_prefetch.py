@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from scrobble_cli.discogs import DiscogsRelease, DiscogsSearchResult
+from scrobble_cli.main import PREFETCH_CANDIDATES, PREFETCH_WORKERS, _prefetch_releases
+
+
+def _result(id: int) -> DiscogsSearchResult:
+  return DiscogsSearchResult(id=id, kind="release", title=f"Artist - Album {id}", year=None, country=None, label=None, catno=None, format=None)
+
+
+class SlowBackend:
+  """Answers `fetch_release` after `delay` seconds and records how many ran at once."""
+
+  def __init__(self, delay: float):
+    self.delay = delay
+    self.running = 0
+    self.max_running = 0
+    self.fetched: list[int] = []
+    self._lock = threading.Lock()
+
+  def fetch_release(self, *, kind: str, id: int) -> DiscogsRelease:
+    with self._lock:
+      self.running += 1
+      self.max_running = max(self.max_running, self.running)
+      self.fetched.append(id)
+    time.sleep(self.delay)
+    with self._lock:
+      self.running -= 1
+    return DiscogsRelease(id=id, kind=kind, artist="Artist", album=f"Album {id}", year=None, tracks=[])
+
+
+def test_the_top_candidates_are_fetched_in_the_background():
+  be = SlowBackend(0.1)
+  pool, futures = _prefetch_releases(be, [_result(i) for i in range(10)])
+  try:
+    assert sorted(futures) == list(range(PREFETCH_CANDIDATES))
+    assert [futures[i].result(timeout=2).id for i in range(PREFETCH_CANDIDATES)] == list(range(PREFETCH_CANDIDATES))
+  finally:
+    pool.shutdown(wait=True)
+  assert sorted(be.fetched) == list(range(PREFETCH_CANDIDATES))
+  assert be.max_running == min(PREFETCH_WORKERS, PREFETCH_CANDIDATES)
+
+
+def test_prefetches_not_started_are_dropped_once_a_release_is_picked():
+  be = SlowBackend(0.2)
+  pool, futures = _prefetch_releases(be, [_result(i) for i in range(10)])
+  deadline = time.monotonic() + 2
+  while be.running < PREFETCH_WORKERS and time.monotonic() < deadline:
+    time.sleep(0.005)
+  pool.shutdown(wait=True, cancel_futures=True)
+  assert sorted(be.fetched) == list(range(PREFETCH_WORKERS))
+  assert sum(f.cancelled() for f in futures.values()) == PREFETCH_CANDIDATES - PREFETCH_WORKERS
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from scrobble_cli import ratelimit
+from scrobble_cli.ratelimit import TokenBucket, discogs_bucket
+
+
+class Clock:
+  """
+  Replaces the `time` module inside ratelimit: `sleep` just moves the clock forward, by at least a
+  millisecond like a real sleep (float rounding can leave a wait of a few femtoseconds).
+  """
+
+  def __init__(self, now: float = 1000.0):
+    self.now = now
+    self.slept: list[float] = []
+
+  def time(self) -> float:
+    return self.now
+
+  def monotonic(self) -> float:
+    return self.now
+
+  def sleep(self, seconds: float) -> None:
+    self.slept.append(seconds)
+    self.now += max(seconds, 0.001)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(ratelimit, "time", clock)
+  return clock
+
+
+def test_burst_then_wait_for_refill(clock):
+  bucket = TokenBucket("bucket.json", 60)
+  assert (bucket.capacity, bucket.refill_per_second) == (10, 50 / 60)
+  assert [bucket.try_acquire() for _ in range(10)] == [0.0] * 10
+  assert bucket.try_acquire() == pytest.approx(1.2)
+
+  clock.now += 0.6
+  assert bucket.try_acquire() == pytest.approx(0.6)
+  clock.now += 0.7
+  assert bucket.try_acquire() == 0.0
+
+
+def test_refill_is_capped_at_capacity(clock):
+  bucket = TokenBucket("bucket.json", 60)
+  bucket.try_acquire()
+  clock.now += 3600
+  assert bucket.available() == 10
+
+
+def test_no_window_exceeds_the_per_minute_budget(clock):
+  bucket = TokenBucket("bucket.json", 60)
+  start = clock.now
+  taken = 0
+  while clock.now - start < 60:
+    bucket.acquire()
+    taken += 1
+  # The request that ended the loop was made at or after the 60s mark.
+  assert taken - 1 <= 60
+
+
+def test_acquire_reports_and_accumulates_its_wait(clock):
+  bucket = TokenBucket("bucket.json", 6)
+  assert bucket.acquire() == 0.0
+  assert bucket.acquire() == pytest.approx(12.0)
+  # Sleeps are capped at a second so tokens refilled for other processes are noticed.
+  assert max(clock.slept) == 1.0
+  assert (bucket.waits, bucket.waited_seconds) == (1, pytest.approx(12.0))
+
+
+def test_drain_and_state_are_shared_through_the_file(clock):
+  one = TokenBucket("bucket.json", 60)
+  other = TokenBucket("bucket.json", 60)
+  one.try_acquire()
+  assert other.available() == 9
+  other.drain()
+  assert one.try_acquire() > 0
+
+
+def test_unreadable_state_starts_full(clock, config_home):
+  bucket = TokenBucket("bucket.json", 60)
+  config_home.mkdir(parents=True, exist_ok=True)
+  bucket.path.write_text("not json")
+  assert bucket.available() == 10
+
+
+def test_discogs_bucket_is_one_per_rate():
+  assert discogs_bucket(60) is discogs_bucket(60)
+  assert discogs_bucket(60) is not discogs_bucket(25)
+
+
+@pytest.mark.skipif(ratelimit.fcntl is None, reason="needs flock")
+def test_processes_draw_from_one_budget(config_home):
+  # Ten processes race for a 60/minute bucket (burst of 10): together they get exactly the burst.
+  script = textwrap.dedent(
+    f"""
+    from scrobble_cli import config, ratelimit
+    from pathlib import Path
+    config.user_config_path = lambda name: Path({str(config_home.parent)!r}) / name
+    bucket = ratelimit.TokenBucket("bucket.json", 60)
+    print(sum(bucket.try_acquire() == 0.0 for _ in range(3)))
+    """
+  )
+  procs = [
+    subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True, env={**os.environ, "SCROBBLE_METRICS": "0"})
+    for _ in range(10)
+  ]
+  got = [int(p.communicate(timeout=30)[0]) for p in procs]
+  # A few tokens may refill while the processes start up (50/minute), never a second burst.
+  assert 10 <= sum(got) <= 13
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import pytest
+
+from scrobble_cli import searches
+from scrobble_cli.discogs import DiscogsSearchResult
+from scrobble_cli.store import db_path
+
+
+class Clock:
+  def __init__(self, now: float = 1_800_000_000.0):
+    self.now = now
+
+  def time(self) -> float:
+    return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+  monkeypatch.setattr(searches, "_conn", None)
+  clock = Clock()
+  monkeypatch.setattr(searches, "time", clock)
+  return clock
+
+
+def _result(id: int) -> DiscogsSearchResult:
+  return DiscogsSearchResult(
+    id=id, kind="master", title=f"Artist - Album {id}", year=1970, country=None, label="X", catno=None, format="Vinyl"
+  )
+
+
+RESULTS = [_result(1), _result(2)]
+
+
+def test_a_handle_gives_back_exactly_what_was_shown():
+  handle = searches.save("Coltrane  A Love Supreme", RESULTS, vinyl_only=True, limit=10)
+  assert searches.load(handle) == RESULTS
+  assert searches.load(f" {handle.upper()} ") == RESULTS
+  assert searches.load("000000") is None
+
+
+def test_handles_expire(clock):
+  handle = searches.save("coltrane", RESULTS, vinyl_only=True, limit=10)
+  clock.now += searches.HANDLE_TTL_SECONDS + 1
+  assert searches.load(handle) is None
+  assert searches.latest("coltrane", vinyl_only=True, limit=10) is None
+
+
+def test_the_latest_search_is_found_by_query_and_options(clock):
+  searches.save("coltrane a love supreme", RESULTS[:1], vinyl_only=True, limit=10)
+  clock.now += 1
+  searches.save("Coltrane   A Love Supreme", RESULTS, vinyl_only=True, limit=10)
+  assert searches.latest("coltrane a love supreme", vinyl_only=True, limit=10) == RESULTS
+  assert searches.latest("coltrane a love supreme", vinyl_only=False, limit=10) is None
+  assert searches.latest("coltrane a love supreme", vinyl_only=True, limit=5) is None
+
+
+def test_looking_up_a_handle_doesnt_create_the_database():
+  assert searches.load("abcdef") is None
+  assert searches.latest("coltrane", vinyl_only=True, limit=10) is None
+  assert not db_path(searches.SEARCHES_DB).exists()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = ("requests", "rich", "questionary", "prompt_toolkit", "httpx", "asyncio")
+
+# Runs the CLI like the console script does, with a canned Discogs `_get`, and reports which heavy
+# modules were loaded by the time it exits.
+DRIVER = r"""
+import atexit, json, sys
+atexit.register(lambda: print(json.dumps(sorted(m for m in HEAVY if m in sys.modules))))
+import scrobble_cli.discogs as d
+def _get(cfg, path, params=None):
+  if path.startswith("/database/search"):
+    return {"results": [{"id": 1, "type": "master", "title": "John Coltrane - A Love Supreme", "year": "1965",
+                         "format": ["Vinyl", "LP"], "label": ["Impulse!"], "catno": "A-77"}]}
+  return {"title": "A Love Supreme", "artists": [{"name": "John Coltrane"}], "year": 1965,
+          "tracklist": [{"type_": "track", "position": "A1", "title": "Acknowledgement", "duration": "7:47"}]}
+d._get = _get
+from scrobble_cli.main import app
+sys.argv[0] = "scrobble"
+app()
+"""
+
+
+@pytest.mark.parametrize(
+  "args",
+  [
+    ["status"],
+    ["cache", "stats"],
+    ["album", "coltrane", "a", "love", "supreme", "--search-only"],
+    ["album", "coltrane", "a", "love", "supreme", "--pick", "1", "-y", "--dry-run"],
+  ],
+)
+def test_non_interactive_commands_skip_the_heavy_imports(tmp_path, args):
+  env = {
+    **os.environ,
+    "XDG_CONFIG_HOME": str(tmp_path),
+    "SCROBBLE_HEADLESS": "1",
+    "SCROBBLE_DAEMON": "0",
+    "SCROBBLE_CACHE": "0",
+    "SCROBBLE_METRICS": "0",
+    "DISCOGS_OFFLINE_INDEX": "0",
+    "DISCOGS_TOKEN": "test",
+    "LASTFM_API_KEY": "test",
+    "LASTFM_API_SECRET": "test",
+    "LASTFM_SESSION_KEY": "test",
+    "LASTFM_USERNAME": "test",
+  }
+  code = f"HEAVY = {HEAVY!r}\n{DRIVER}"
+  p = subprocess.run([sys.executable, "-c", code, *args], env=env, capture_output=True, text=True)
+  assert p.returncode == 0, p.stderr
+  assert json.loads(p.stdout.strip().splitlines()[-1]) == []
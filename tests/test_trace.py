@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scrobble_cli import trace
+
+
+@pytest.fixture
+def tracer(monkeypatch) -> trace.Tracer:
+  tracer = trace.Tracer()
+  monkeypatch.setattr(trace, "_tracer", tracer)
+  return tracer
+
+
+def test_spans_cost_nothing_when_tracing_is_off(monkeypatch):
+  monkeypatch.setattr(trace, "_tracer", None)
+  with trace.span("http", host="api.discogs.com") as s:
+    assert not s
+    s.set(status=200)
+
+
+def test_the_summary_rolls_up_calls_and_attributes(tracer):
+  for status in (200, 200, 429):
+    with trace.span("http", host="api.discogs.com") as s:
+      s.set(status=status, bytes_in=100)
+  with pytest.raises(ValueError), trace.span("discogs.parse"):
+    raise ValueError("bad JSON")
+
+  rows = {row["name"]: row for row in tracer.summary()}
+  assert list(rows) == ["http", "discogs.parse"]
+  assert rows["http"]["calls"] == 3
+  assert rows["http"]["sums"]["bytes_in"] == 300
+  assert rows["http"]["counts"]["status"] == {"200": 2, "429": 1}
+  assert rows["discogs.parse"]["counts"]["error"] == {"ValueError": 1}
+
+
+def test_sinks_write_json_and_chrome_traces(tracer, tmp_path):
+  with trace.span("lastfm.batch", tracks=50):
+    pass
+  tracer.sinks = [str(tmp_path / "plain.json"), f"chrome:{tmp_path}"]
+  trace._write()
+
+  plain = json.loads((tmp_path / "plain.json").read_text())
+  assert [s["name"] for s in plain["spans"]] == ["lastfm.batch"]
+  assert plain["spans"][0]["attrs"] == {"tracks": 50}
+  [chrome] = tmp_path.glob("scrobble-*.trace.json")
+  event = json.loads(chrome.read_text())["traceEvents"][0]
+  assert (event["name"], event["cat"], event["ph"]) == ("lastfm.batch", "lastfm", "X")
+
+
+def test_collect_sees_spans_from_bound_pool_threads(tracer):
+  def work() -> None:
+    with trace.span("discogs.get"):
+      pass
+
+  with trace.collect() as recorder:
+    with ThreadPoolExecutor(max_workers=2) as pool:
+      list(pool.map(lambda f: f(), [trace.bind(work), work]))
+  # The unbound call reports to the process tracer only.
+  assert [s["name"] for s in recorder.to_wire()] == ["discogs.get"]
+  assert len(tracer.spans()) == 2
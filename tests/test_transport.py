@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from scrobble_cli import flow, transport
+from scrobble_cli.config import HttpConfig
+from scrobble_cli.ratelimit import TokenBucket
+
+HTTP = HttpConfig(connect_timeout=5.0, read_timeout=30.0, retries=3, backoff=0.5)
+URL = "http://api.test/resource"
+
+
+class Response:
+  def __init__(self, status_code: int, headers: dict[str, str] | None = None):
+    self.status_code = status_code
+    self.headers = headers or {}
+
+
+class FakeSession:
+  """Stands in for the per-host session: answers with `answers` in order (an exception is raised)."""
+
+  def __init__(self, *answers):
+    self.answers = list(answers)
+    self.calls = 0
+
+  def request(self, method, url, **kw):
+    self.calls += 1
+    answer = self.answers.pop(0)
+    if isinstance(answer, Exception):
+      raise answer
+    return answer
+
+
+@pytest.fixture
+def slept(monkeypatch) -> list[float]:
+  slept: list[float] = []
+  monkeypatch.setattr(flow.Sleep, "run", lambda self: slept.append(self.seconds))
+  return slept
+
+
+def _serve(monkeypatch, session: FakeSession) -> FakeSession:
+  monkeypatch.setattr(transport, "session_for", lambda url: session)
+  return session
+
+
+def test_retry_after_seconds_are_waited_out(monkeypatch, slept):
+  session = _serve(monkeypatch, FakeSession(Response(429, {"Retry-After": "7"}), Response(200)))
+  assert transport.request("GET", URL, HTTP).status_code == 200
+  assert slept == [7.0] and session.calls == 2
+
+
+def test_retry_after_as_a_date(monkeypatch, slept):
+  when = formatdate(time.time() + 20, usegmt=True)
+  _serve(monkeypatch, FakeSession(Response(503, {"Retry-After": when}), Response(200)))
+  transport.request("GET", URL, HTTP)
+  assert 18 <= slept[0] <= 20
+
+
+def test_retry_after_is_capped(monkeypatch, slept):
+  _serve(monkeypatch, FakeSession(Response(429, {"Retry-After": "86400"}), Response(200)))
+  transport.request("GET", URL, HTTP)
+  assert slept == [transport.MAX_RETRY_AFTER_SECONDS]
+
+
+def test_without_retry_after_the_backoff_is_jittered_and_grows(monkeypatch, slept):
+  _serve(monkeypatch, FakeSession(Response(502), Response(502), Response(502), Response(502)))
+  assert transport.request("GET", URL, HTTP).status_code == 502
+  assert len(slept) == HTTP.retries
+  assert all(0 <= s <= HTTP.backoff * 2**i for i, s in enumerate(slept))
+
+
+def test_a_post_is_only_retried_when_it_clearly_wasnt_processed(monkeypatch, slept):
+  session = _serve(monkeypatch, FakeSession(Response(502)))
+  assert transport.request("POST", URL, HTTP, idempotent=False).status_code == 502
+  assert session.calls == 1
+
+  session = _serve(monkeypatch, FakeSession(requests.ReadTimeout("read timed out")))
+  with pytest.raises(requests.ReadTimeout):
+    transport.request("POST", URL, HTTP, idempotent=False)
+
+  session = _serve(monkeypatch, FakeSession(Response(503, {"Retry-After": "1"}), requests.ConnectTimeout(), Response(200)))
+  assert transport.request("POST", URL, HTTP, idempotent=False).status_code == 200
+  assert session.calls == 3
+
+
+def test_a_429_empties_the_shared_bucket(monkeypatch, slept):
+  bucket = TokenBucket("test-bucket.json", 60)
+  _serve(monkeypatch, FakeSession(Response(429, {"Retry-After": "0"}), Response(200)))
+  monkeypatch.setattr(bucket, "acquire", lambda timeout=None: 0.0)
+  transport.request("GET", URL, HTTP, limiter=bucket)
+  assert bucket.available() < 1
+
+
+def test_a_retry_after_past_the_deadline_gives_up(monkeypatch, slept):
+  _serve(monkeypatch, FakeSession(Response(429, {"Retry-After": "30"}), Response(200)))
+  with pytest.raises(TimeoutError):
+    transport.request("GET", URL, HTTP, deadline=time.monotonic() + 5)
+  assert slept == []